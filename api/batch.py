@@ -0,0 +1,624 @@
+"""
+Ingestão em lote pela Batch API (fechamento do mês).
+
+BatchIngestion prepara os JSONL a partir dos PDFs, envia pelo backend
+(OpenAIBatchBackend ou LocalBatchBackend, que executa as linhas com o
+cliente normal) e salva os resultados quando os lotes terminam. Importado
+no fim de api.index, cujas rotas /api/upload-batch usam get_batch_ingestion.
+"""
+
+import os
+import re
+import json
+import time
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from openai.types.chat import ChatCompletion
+from openai.types.responses import Response as OpenAIResponse
+
+from .index import (
+    analysis_cache, analysis_cache_key, build_analysis_messages, cached_page_groups, compat_response,
+    continuation_text, document_header, fingerprint_document, hash_pdf_file, iter_pdf_page_groups, match_layout,
+    merge_partial_analyses, normalize_layout_text, openai_client, openai_request_params, parse_analysis_response,
+    parse_codigos_obra, persist_upload, plan_output_budget, planned_output_budget, run_layout_fast_path,
+    save_ingested_pdf, section_fast_path, section_prompt_text, should_retry, split_obra_sections,
+    ANALYSIS_CACHE_ENABLED, ANALYSIS_JSON_SCHEMA, BATCH_BACKEND, BATCH_COMPLETION_WINDOW, BATCH_FOLDER,
+    BATCH_LOCAL_CONCURRENCY, BATCH_MAX_FILE_BYTES, BATCH_MAX_REQUESTS, BATCH_POLL_INTERVAL, CHARS_PER_TOKEN,
+    LAYOUT_FAST_PATH_ENABLED, OBRA_SPLIT_ENABLED, OPENAI_MAX_CONCURRENCY, OPENAI_TIMEOUT, PDF_EXTRACTOR,
+    PDF_PAGE_GROUP_CHARS, STRUCTURED_OUTPUT_ENABLED
+)
+
+# ================================
+# INGESTÃO EM LOTE (BATCH API)
+# ================================
+
+BATCH_ENDPOINTS = {'responses': '/v1/responses', 'chat': '/v1/chat/completions'}
+BATCH_FINAL_STATUSES = ('completed', 'failed', 'expired', 'cancelled')
+
+def batch_document_items(page_groups):
+    """
+    Itens de um documento para o lote, com o mesmo roteamento de
+    analyze_page_groups, mas sem chamar a API:
+    ('analise', resultado) quando o fast path de layout resolve e
+    ('texto', prompt) para o que vai para a OpenAI.
+    """
+    grupos = [g for g in page_groups if g and len(g) >= 10]
+    if not grupos:
+        return []
+    
+    if OBRA_SPLIT_ENABLED and len(parse_codigos_obra(normalize_layout_text(grupos[0]))) >= 2:
+        secoes = split_obra_sections('\n'.join(grupos))
+        if secoes:
+            itens = []
+            for codigo, texto in secoes['secoes']:
+                analysis = section_fast_path(codigo, texto, secoes)
+                if analysis is not None:
+                    itens.append(('analise', analysis))
+                else:
+                    itens.append(('texto', section_prompt_text(codigo, texto, secoes)))
+            return itens
+    
+    layout = match_layout(fingerprint_document(grupos[0])) if LAYOUT_FAST_PATH_ENABLED else None
+    if layout:
+        analysis = run_layout_fast_path(layout, '\n'.join(grupos))
+        if analysis is not None:
+            return [('analise', analysis)]
+    
+    cabecalho = document_header(grupos[0])
+    return [('texto', grupos[0])] + [
+        ('texto', continuation_text(parte, cabecalho, grupo)) for parte, grupo in enumerate(grupos[1:], start=2)
+    ]
+
+def batch_request_lines(custom_id, texto, model):
+    """Linhas JSONL de um texto (uma por parte do orçamento de saída), com os parâmetros do tempo real"""
+    max_tokens, partes = planned_output_budget(texto, model)
+    schema = ANALYSIS_JSON_SCHEMA if STRUCTURED_OUTPUT_ENABLED else None
+    linhas = []
+    
+    for k, parte in enumerate(partes):
+        if len(partes) > 1:
+            max_tokens = plan_output_budget(parte, model)['max_tokens']
+        api, params = openai_request_params(build_analysis_messages(parte), model, max_tokens, schema)
+        params.pop('timeout', None)  # Opção do cliente, não do corpo da requisição
+        linhas.append({'custom_id': f"{custom_id}-p{k}", 'method': 'POST', 'url': BATCH_ENDPOINTS[api], 'body': params})
+    return linhas
+
+def batch_line_response(linha, model):
+    """(CompatResponse, erro) de uma linha do arquivo de saída do lote"""
+    resposta = linha.get('response') or {}
+    if linha.get('error') or resposta.get('status_code') != 200:
+        erro = linha.get('error') or (resposta.get('body') or {}).get('error') or 'sem resposta no lote'
+        return None, str(erro)[:300]
+    
+    body = resposta.get('body') or {}
+    if 'choices' in body:
+        return compat_response('chat', model, ChatCompletion.construct(**body)), None
+    return compat_response('responses', model, OpenAIResponse.construct(**body)), None
+
+def execute_batch_line(linha):
+    """Executar uma linha do JSONL com o cliente OpenAI normal; devolve a linha de saída no formato do lote"""
+    body = linha['body']
+    attempt = 0
+    while True:
+        try:
+            if linha['url'] == BATCH_ENDPOINTS['responses']:
+                resposta = openai_client.responses.create(**body)
+            else:
+                resposta = openai_client.chat.completions.create(timeout=OPENAI_TIMEOUT, **body)
+            return {
+                'custom_id': linha['custom_id'],
+                'response': {'status_code': 200, 'body': resposta.model_dump()},
+                'error': None
+            }
+        except Exception as e:
+            espera = should_retry(e, attempt)
+            if espera is None:
+                return {
+                    'custom_id': linha['custom_id'],
+                    'response': None,
+                    'error': {'code': type(e).__name__, 'message': str(e)[:300]}
+                }
+            time.sleep(espera)
+            attempt += 1
+
+class LocalBatchBackend:
+    """
+    Substituto local da Batch API: executa as linhas do JSONL com o cliente
+    OpenAI normal (OPENAI_BASE_URL, RetryPolicy) em BATCH_LOCAL_CONCURRENCY
+    threads e grava a saída no formato da OpenAI. Serve para o mock
+    (python -m api.mock_llm) e para ambientes sem acesso à Batch API.
+    Lotes em andamento não sobrevivem a um reinício do processo.
+    """
+    
+    name = 'local'
+    resumable = False
+    
+    def __init__(self, concurrency):
+        self.concurrency = max(1, concurrency)
+        self._batches = {}
+        self._lock = threading.Lock()
+    
+    def submit(self, input_path, endpoint):
+        batch_id = f"local_{os.urandom(6).hex()}"
+        estado = {
+            'status': 'in_progress',
+            'output_path': input_path[:-len('.jsonl')] + '_output.jsonl',
+            'request_counts': {'total': 0, 'completed': 0, 'failed': 0}
+        }
+        with self._lock:
+            self._batches[batch_id] = estado
+        
+        threading.Thread(
+            target=self._run, args=(estado, input_path), daemon=True, name=f"batch-{batch_id}"
+        ).start()
+        return batch_id
+    
+    def _run(self, estado, input_path):
+        try:
+            with open(input_path, encoding='utf-8') as f:
+                linhas = [json.loads(l) for l in f if l.strip()]
+            estado['request_counts']['total'] = len(linhas)
+            
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor, \
+                    open(estado['output_path'], 'w', encoding='utf-8') as saida:
+                for resultado in executor.map(execute_batch_line, linhas):
+                    saida.write(json.dumps(resultado, ensure_ascii=False) + '\n')
+                    with self._lock:
+                        estado['request_counts']['failed' if resultado['error'] else 'completed'] += 1
+            estado['status'] = 'completed'
+        except Exception as e:
+            print(f"❌ Lote local falhou: {e}")
+            estado['status'] = 'failed'
+    
+    def status(self, batch_id):
+        with self._lock:
+            estado = self._batches.get(batch_id)
+            if estado is None:
+                return {'status': 'expired', 'request_counts': {}}
+            return {'status': estado['status'], 'request_counts': dict(estado['request_counts'])}
+    
+    def results(self, batch_id):
+        with self._lock:
+            estado = self._batches.get(batch_id)
+        if estado is None or not os.path.exists(estado['output_path']):
+            return
+        with open(estado['output_path'], encoding='utf-8') as f:
+            for linha in f:
+                if linha.strip():
+                    yield json.loads(linha)
+
+class OpenAIBatchBackend:
+    """Batch API da OpenAI: arquivo enviado com purpose='batch', janela BATCH_COMPLETION_WINDOW"""
+    
+    name = 'openai'
+    resumable = True
+    
+    def submit(self, input_path, endpoint):
+        with open(input_path, 'rb') as f:
+            arquivo = openai_client.files.create(file=f, purpose='batch')
+        lote = openai_client.batches.create(
+            input_file_id=arquivo.id, endpoint=endpoint, completion_window=BATCH_COMPLETION_WINDOW
+        )
+        return lote.id
+    
+    def status(self, batch_id):
+        lote = openai_client.batches.retrieve(batch_id)
+        contagem = lote.request_counts.model_dump() if lote.request_counts else {}
+        return {'status': lote.status, 'request_counts': contagem}
+    
+    def results(self, batch_id):
+        # Lotes expirados também trazem as linhas que chegaram a concluir
+        lote = openai_client.batches.retrieve(batch_id)
+        for file_id in (lote.output_file_id, lote.error_file_id):
+            if not file_id:
+                continue
+            for linha in openai_client.files.content(file_id).text.splitlines():
+                if linha.strip():
+                    yield json.loads(linha)
+
+BATCH_BACKENDS = {
+    'local': lambda: LocalBatchBackend(BATCH_LOCAL_CONCURRENCY),
+    'openai': OpenAIBatchBackend
+}
+
+class BatchIngestion:
+    """
+    Execuções de ingestão em lote (fechamento do mês).
+    
+    Os PDFs de uma execução vão para BATCH_FOLDER/<run_id>/ e a preparação
+    (extração + JSONL) roda em uma thread, então a rota responde com o
+    run_id sem esperar a extração. As requisições de análise são juntadas em
+    arquivos JSONL (até BATCH_MAX_REQUESTS linhas / BATCH_MAX_FILE_BYTES
+    cada), enviadas pelo backend de lote e um poller em segundo plano
+    acompanha até o fim: as respostas são unidas por documento e salvas com
+    save_analysis_to_db. O ritmo é o da capacidade de lote do provedor, não o
+    de workers HTTP.
+    
+    O manifesto de cada execução fica em BATCH_FOLDER/<run_id>.json. Só
+    execuções já enviadas a um backend retomável (OpenAI) continuam sendo
+    acompanhadas após um reinício; as demais ficam como 'interrompido'.
+    """
+    
+    def __init__(self, backend, folder, poll_interval):
+        self.backend = backend
+        self.folder = folder
+        self.poll_interval = poll_interval
+        self.runs = {}
+        self._lock = threading.RLock()
+        self._poller = None
+        self._polling = set()
+        os.makedirs(folder, exist_ok=True)
+        self._load_pending()
+    
+    def _load_pending(self):
+        """Retomar execuções enviadas antes de um reinício (e encerrar as que não dá para retomar)"""
+        for nome in sorted(os.listdir(self.folder)):
+            if not nome.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.folder, nome), encoding='utf-8') as f:
+                    run = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if run.get('status') not in ('preparando', 'enviado') or run.get('backend') != self.backend.name:
+                continue
+            
+            if run['status'] == 'enviado' and self.backend.resumable:
+                self.runs[run['run_id']] = run
+                continue
+            
+            # Preparação ou lote local perdidos com o processo: o usuário reenvia os PDFs
+            run.update(status='interrompido', message='Processo reiniciado antes do fim; envie os PDFs de novo')
+            for doc in run['documentos']:
+                doc.pop('itens', None)
+                if doc['status'] == 'pendente':
+                    doc.update(status='error', message='interrompido')
+            self._discard_pdfs(run)
+            self._save(run)
+            print(f"⚠️ Lote {run['run_id']}: interrompido pelo reinício")
+        
+        if self.runs:
+            print(f"📬 Lote: {len(self.runs)} execução(ões) pendente(s) retomada(s)")
+            self._ensure_poller()
+    
+    def _save(self, run):
+        caminho = os.path.join(self.folder, f"{run['run_id']}.json")
+        with open(caminho + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(run, f, ensure_ascii=False)
+        os.replace(caminho + '.tmp', caminho)
+    
+    def _discard_pdfs(self, run):
+        """Apagar as cópias dos PDFs guardadas para a preparação"""
+        for doc in run['documentos']:
+            caminho = doc.pop('caminho', None)
+            if caminho and os.path.dirname(caminho) == os.path.join(self.folder, run['run_id']):
+                try:
+                    os.remove(caminho)
+                except OSError:
+                    pass
+        try:
+            os.rmdir(os.path.join(self.folder, run['run_id']))
+        except OSError:
+            pass
+    
+    def create_run(self, documentos, model, extractor=None, chunk_size=None):
+        """
+        Registrar uma execução e preparar/enviar em segundo plano.
+        
+        Args:
+            documentos: lista de (nome, arquivo) - upload do Flask ou caminho
+        
+        Returns:
+            Manifesto da execução (dict), ainda com status 'preparando'
+        """
+        extractor = extractor or PDF_EXTRACTOR
+        run_id = f"lote_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{os.urandom(3).hex()}"
+        pasta = os.path.join(self.folder, run_id)
+        os.makedirs(pasta, exist_ok=True)
+        run = {
+            'run_id': run_id, 'backend': self.backend.name, 'model': model, 'status': 'preparando',
+            'extractor': extractor,
+            'max_chars': chunk_size * CHARS_PER_TOKEN if chunk_size else PDF_PAGE_GROUP_CHARS,
+            'criado_em': time.time(), 'documentos': [], 'lotes': [], 'requisicoes': 0
+        }
+        
+        # O upload precisa sair do ciclo de vida da requisição antes de a rota responder
+        for i, (nome, file) in enumerate(documentos):
+            caminho = file if isinstance(file, str) else persist_upload(file, os.path.join(pasta, f"{i:04d}.pdf"))
+            run['documentos'].append({'filename': nome, 'status': 'pendente', 'caminho': caminho})
+        
+        with self._lock:
+            self.runs[run_id] = run
+            self._save(run)
+        
+        threading.Thread(target=self._prepare, args=(run,), daemon=True, name=f"batch-prep-{run_id}").start()
+        return run
+    
+    def _plan(self, run):
+        """
+        Extrair os PDFs e montar as linhas do lote (fast path e cache de
+        análises já resolvem parte dos documentos sem requisição).
+        
+        Returns:
+            (documentos atualizados, linhas JSONL)
+        """
+        model, extractor, max_chars = run['model'], run['extractor'], run['max_chars']
+        documentos = []
+        linhas = []
+        
+        for i, original in enumerate(run['documentos']):
+            doc = dict(original, itens=[])
+            documentos.append(doc)
+            try:
+                doc['pdf_hash'] = pdf_hash = hash_pdf_file(doc['caminho'])
+                doc['cache_key'] = analysis_cache_key(pdf_hash, model, extractor, max_chars)
+                
+                cached = analysis_cache.get(doc['cache_key']) if ANALYSIS_CACHE_ENABLED else None
+                if cached is not None:
+                    itens = [('analise', cached)]
+                else:
+                    page_groups = (
+                        cached_page_groups(doc['caminho'], pdf_hash, extractor, None, max_chars) if ANALYSIS_CACHE_ENABLED
+                        else iter_pdf_page_groups(doc['caminho'], max_chars=max_chars, extractor=extractor)
+                    )
+                    itens = batch_document_items(page_groups)
+                
+                if not itens:
+                    doc.update(status='error', message='PDF sem texto extraível')
+                    continue
+                
+                for j, (tipo, valor) in enumerate(itens):
+                    if tipo == 'analise':
+                        doc['itens'].append({'analise': valor})
+                        continue
+                    novas = batch_request_lines(f"d{i}-t{j}", valor, model)
+                    doc['itens'].append({'partes': [l['custom_id'] for l in novas]})
+                    linhas.extend(novas)
+            except Exception as e:
+                print(f"    ❌ Lote: erro ao preparar {doc['filename']}: {str(e)[:100]}")
+                doc.update(status='error', message=str(e)[:200], itens=[])
+        
+        return documentos, linhas
+    
+    def _prepare(self, run):
+        """Thread de preparação: extrair, gravar os JSONL e enviar ao backend"""
+        try:
+            documentos, linhas = self._plan(run)
+            arquivos = self._write_batch_files(run['run_id'], linhas)
+            with self._lock:
+                run['documentos'] = documentos
+                run['requisicoes'] = len(linhas)
+                self._save(run)
+            
+            for numero, arquivo in enumerate(arquivos):
+                batch_id = self.backend.submit(arquivo, linhas[0]['url'])
+                with self._lock:
+                    run['lotes'].append({'batch_id': batch_id, 'arquivo': arquivo, 'status': 'validating', 'request_counts': {}})
+                    self._save(run)
+                print(f"📬 Lote {numero + 1} enviado ({self.backend.name}): {batch_id}")
+        except Exception as e:
+            print(f"❌ Lote {run['run_id']}: erro ao preparar ({str(e)[:100]})")
+            with self._lock:
+                run.update(status='error', message=f'Erro ao preparar lote: {str(e)[:200]}')
+                self._discard_pdfs(run)
+                self._save(run)
+            return
+        
+        with self._lock:
+            run['status'] = 'enviado'
+            self._discard_pdfs(run)
+            self._save(run)
+        
+        if not run['lotes']:
+            self._finalize(run)  # Tudo resolvido por cache/fast path
+        else:
+            self._ensure_poller()
+    
+    def _write_batch_files(self, run_id, linhas):
+        """Gravar os JSONL respeitando os limites de linhas e bytes por lote"""
+        arquivos = []
+        atual = None
+        contagem = tamanho = 0
+        
+        for linha in linhas:
+            conteudo = (json.dumps(linha, ensure_ascii=False) + '\n').encode('utf-8')
+            if atual is None or contagem >= BATCH_MAX_REQUESTS or tamanho + len(conteudo) > BATCH_MAX_FILE_BYTES:
+                if atual is not None:
+                    atual.close()
+                arquivos.append(os.path.join(self.folder, f"{run_id}_{len(arquivos) + 1}.jsonl"))
+                atual = open(arquivos[-1], 'wb')
+                contagem = tamanho = 0
+            atual.write(conteudo)
+            contagem += 1
+            tamanho += len(conteudo)
+        
+        if atual is not None:
+            atual.close()
+        return arquivos
+    
+    def get_run(self, run_id):
+        """Execução deste processo ou, se outro worker a criou, o manifesto em disco"""
+        with self._lock:
+            run = self.runs.get(run_id)
+        if run is not None or not re.fullmatch(r'lote_[\w]+', run_id):
+            return run
+        try:
+            with open(os.path.join(self.folder, f"{run_id}.json"), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    def poll_run(self, run_id):
+        """Atualizar o estado dos lotes da execução; ao terminarem todos, salvar os resultados"""
+        with self._lock:
+            run = self.runs.get(run_id)
+            if run is None:
+                return self.get_run(run_id)
+            if run['status'] != 'enviado' or run_id in self._polling:
+                return run
+            self._polling.add(run_id)
+            pendentes = [lote['batch_id'] for lote in run['lotes'] if lote['status'] not in BATCH_FINAL_STATUSES]
+        
+        try:
+            # Consultas ao backend fora do lock: as rotas continuam respondendo
+            estados = {}
+            for batch_id in pendentes:
+                try:
+                    estados[batch_id] = self.backend.status(batch_id)
+                except Exception as e:
+                    print(f"⚠️ Lote {batch_id}: erro ao consultar status ({str(e)[:100]})")
+            
+            with self._lock:
+                for lote in run['lotes']:
+                    lote.update(estados.get(lote['batch_id'], {}))
+                terminou = all(lote['status'] in BATCH_FINAL_STATUSES for lote in run['lotes'])
+                self._save(run)
+            
+            if terminou:
+                self._finalize(run)
+        finally:
+            with self._lock:
+                self._polling.discard(run_id)
+        return run
+    
+    def _finalize(self, run):
+        """
+        Unir as respostas por documento, salvar no banco e no cache de análises.
+        Partes sem linha de saída ou com erro no lote são refeitas em tempo
+        real; se ainda falharem, o documento fica com erro indicando a parte.
+        Download e gravações acontecem sem o lock; só o manifesto é trocado com ele.
+        """
+        respostas = {}
+        for lote in run['lotes']:
+            try:
+                for linha in self.backend.results(lote['batch_id']):
+                    respostas[linha['custom_id']] = linha
+            except Exception as e:
+                print(f"⚠️ Lote {lote['batch_id']}: erro ao baixar resultados ({str(e)[:100]})")
+        
+        faltando = {
+            cid for doc in run['documentos'] if doc['status'] == 'pendente'
+            for item in doc.get('itens', []) for cid in item.get('partes', [])
+            if batch_line_response(respostas.get(cid) or {}, run['model'])[1]
+        }
+        if faltando:
+            self._retry_realtime(run, faltando, respostas)
+        
+        documentos = []
+        for original in run['documentos']:
+            doc = {k: v for k, v in original.items() if k != 'itens'}
+            documentos.append(doc)
+            if doc['status'] != 'pendente':
+                continue
+            try:
+                analyses = []
+                for item in original['itens']:
+                    if 'analise' in item:
+                        analyses.append(item['analise'])
+                        continue
+                    parciais = []
+                    for cid in item['partes']:
+                        resposta, erro = batch_line_response(respostas.get(cid) or {}, run['model'])
+                        if erro:
+                            raise ValueError(f"Parte {cid} sem resposta válida (lote e tempo real): {erro}")
+                        parciais.append(parse_analysis_response(resposta, None))
+                    analyses.append(merge_partial_analyses(parciais))
+                
+                analysis = merge_partial_analyses(analyses)
+                if ANALYSIS_CACHE_ENABLED:
+                    analysis_cache.set(doc['cache_key'], analysis)
+                obra = save_ingested_pdf(analysis, doc.get('pdf_hash'), doc['filename'], run['model'])
+                doc.update(status='success', codigo_obra=obra.get('codigo_obra'), competencia=obra.get('competencia'))
+            except Exception as e:
+                print(f"    ❌ Lote: erro em {doc['filename']}: {str(e)[:100]}")
+                doc.update(status='error', message=str(e)[:200])
+        
+        with self._lock:
+            run['documentos'] = documentos
+            run['status'] = 'concluido'
+            run['concluido_em'] = time.time()
+            run['processing_time'] = round(run['concluido_em'] - run['criado_em'], 2)
+            self._save(run)
+        sucesso = sum(1 for d in documentos if d['status'] == 'success')
+        print(f"✅ Lote {run['run_id']} concluído: {sucesso}/{len(documentos)} PDF(s) salvos "
+              f"em {run['processing_time']:.0f}s")
+    
+    def _retry_realtime(self, run, faltando, respostas):
+        """
+        Refazer em tempo real as partes sem linha de saída ou com erro no lote
+        (a requisição original é lida do JSONL de entrada).
+        """
+        print(f"🔁 Lote {run['run_id']}: {len(faltando)} parte(s) sem resposta válida - refeitas em tempo real")
+        linhas = []
+        for lote in run['lotes']:
+            try:
+                with open(lote['arquivo'], encoding='utf-8') as f:
+                    linhas.extend(l for l in map(json.loads, filter(str.strip, f)) if l['custom_id'] in faltando)
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Lote {lote['batch_id']}: entrada ilegível ({str(e)[:100]})")
+        
+        with ThreadPoolExecutor(max_workers=min(max(len(linhas), 1), OPENAI_MAX_CONCURRENCY)) as executor:
+            for resultado in executor.map(execute_batch_line, linhas):
+                if not resultado['error']:
+                    respostas[resultado['custom_id']] = resultado
+    
+    def _ensure_poller(self):
+        with self._lock:
+            if self._poller is None or not self._poller.is_alive():
+                self._poller = threading.Thread(target=self._poll_loop, daemon=True, name='batch-poller')
+                self._poller.start()
+    
+    def _poll_loop(self):
+        while True:
+            time.sleep(self.poll_interval)
+            with self._lock:
+                pendentes = [run_id for run_id, run in self.runs.items() if run['status'] == 'enviado']
+                if not pendentes:
+                    self._poller = None
+                    return
+            for run_id in pendentes:
+                try:
+                    self.poll_run(run_id)
+                except Exception as e:
+                    print(f"⚠️ Poller de lote: {run_id}: {str(e)[:100]}")
+    
+    def summary(self, run):
+        """Manifesto sem os itens internos nem caminhos no disco (para as rotas)"""
+        with self._lock:
+            resumo = {k: v for k, v in run.items() if k != 'documentos'}
+            resumo['documentos'] = [
+                {k: v for k, v in d.items() if k not in ('itens', 'caminho')} for d in run['documentos']
+            ]
+        return resumo
+    
+    def list_runs(self):
+        """Resumo das execuções deste processo (para as rotas)"""
+        with self._lock:
+            return [self.summary(run) for run in self.runs.values()]
+    
+    def info(self):
+        with self._lock:
+            status = [run['status'] for run in self.runs.values()]
+        return {
+            'backend': self.backend.name,
+            'poll_interval': self.poll_interval,
+            'total_runs': len(status),
+            'preparing': status.count('preparando'),
+            'pending': status.count('enviado')
+        }
+
+_batch_ingestion = None
+_batch_ingestion_pid = None
+_batch_ingestion_lock = threading.Lock()
+
+def get_batch_ingestion():
+    """Ingestão em lote do processo (backend BATCH_BACKEND, recriada após fork)"""
+    global _batch_ingestion, _batch_ingestion_pid
+    with _batch_ingestion_lock:
+        if _batch_ingestion is None or _batch_ingestion_pid != os.getpid():
+            backend = BATCH_BACKENDS.get(BATCH_BACKEND, BATCH_BACKENDS['local'])()
+            _batch_ingestion = BatchIngestion(backend, BATCH_FOLDER, BATCH_POLL_INTERVAL)
+            _batch_ingestion_pid = os.getpid()
+        return _batch_ingestion
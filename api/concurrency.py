@@ -0,0 +1,153 @@
+"""
+Concorrência adaptativa (AIMD) da ingestão.
+
+O limite do processo (concurrency_limiter) é alimentado por
+record_openai_latency e should_retry, em api.index, que importa este
+módulo no fim.
+"""
+
+import time
+import threading
+from collections import deque
+
+from openai import APITimeoutError
+
+from .index import (
+    openai_latency,
+    ADAPTIVE_CONCURRENCY_ENABLED, ADAPTIVE_CONCURRENCY_INITIAL, ADAPTIVE_CONCURRENCY_MIN, ADAPTIVE_CONCURRENCY_MAX,
+    ADAPTIVE_BACKOFF_FACTOR, ADAPTIVE_LATENCY_FACTOR, ADAPTIVE_DECREASE_COOLDOWN, ADAPTIVE_MIN_SAMPLES
+)
+
+# ================================
+# CONCORRÊNCIA ADAPTATIVA (AIMD)
+# ================================
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Quantos PDFs processar ao mesmo tempo, ajustado por AIMD a partir dos
+    sinais das chamadas OpenAI da ingestão (ingestion_context: pipeline e
+    consumidores da fila deste processo):
+    
+    - chamada concluída em até ADAPTIVE_LATENCY_FACTOR × p50 do modelo, com
+      o limite todo em uso: limite += 1/limite (≈ +1 a cada 'limite' sucessos)
+    - chamada lenta (acima do fator): limite mantido
+    - 429, timeout ou sobrecarga (503/529): limite × ADAPTIVE_BACKOFF_FACTOR,
+      no máximo uma redução a cada ADAPTIVE_DECREASE_COOLDOWN segundos (as
+      chamadas já em voo falham juntas e não devem derrubar o limite em cascata)
+    
+    As últimas decisões ficam em decisions (GET /api/concurrency).
+    """
+    
+    def __init__(self, initial, minimo, maximo, backoff, latency_factor, cooldown):
+        self.minimo = max(1, minimo)
+        self.maximo = max(self.minimo, maximo)
+        self.limit = float(min(max(initial, self.minimo), self.maximo))
+        self.backoff = backoff
+        self.latency_factor = latency_factor
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.decisions = deque(maxlen=50)
+        self.stats = {'increases': 0, 'decreases': 0, 'holds': 0, 'acquired': 0, 'waited': 0}
+        self._ultima_reducao = 0.0
+        self._cond = threading.Condition()
+    
+    def configure(self, initial=None, maximo=None):
+        """Redefinir limite inicial/máximo (p.ex. python -m api.worker --threads)"""
+        with self._cond:
+            if maximo is not None:
+                self.maximo = max(self.minimo, maximo)
+            if initial is not None:
+                self.limit = float(initial)
+            self.limit = min(max(self.limit, self.minimo), self.maximo)
+            self._cond.notify_all()
+    
+    def acquire(self, stop_event=None):
+        """Esperar uma vaga dentro do limite; False se stop_event disparar antes"""
+        with self._cond:
+            esperou = False
+            while self.in_flight >= int(self.limit):
+                if stop_event is not None and stop_event.is_set():
+                    return False
+                esperou = True
+                self._cond.wait(0.5)
+            self.in_flight += 1
+            self.stats['acquired'] += 1
+            self.stats['waited'] += esperou
+            return True
+    
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+    
+    def on_success(self, model, seconds):
+        """Chamada OpenAI concluída em seconds"""
+        p50 = openai_latency.quantile(model, 0.5, ADAPTIVE_MIN_SAMPLES)
+        with self._cond:
+            if p50 is not None and seconds > p50 * self.latency_factor:
+                self.stats['holds'] += 1
+                return
+            # Só cresce quando o limite é o gargalo (todas as vagas ocupadas)
+            if self.in_flight < int(self.limit) or self.limit >= self.maximo:
+                return
+            
+            antigo = self.limit
+            self.limit = min(self.maximo, self.limit + 1 / self.limit)
+            if int(self.limit) > int(antigo):
+                self.stats['increases'] += 1
+                self._decide(antigo, f"{model} saudável ({seconds:.1f}s, p50 {p50:.1f}s)" if p50 else f"{model} saudável")
+                self._cond.notify_all()
+    
+    def on_error(self, error):
+        """Falha de chamada OpenAI: reduz o limite se for sinal de congestionamento"""
+        motivo = self.congestion_reason(error)
+        if motivo is None:
+            return
+        
+        with self._cond:
+            agora = time.time()
+            if agora - self._ultima_reducao < self.cooldown or self.limit <= self.minimo:
+                return
+            antigo = self.limit
+            self.limit = max(self.minimo, self.limit * self.backoff)
+            self._ultima_reducao = agora
+            self.stats['decreases'] += 1
+            self._decide(antigo, motivo)
+    
+    @staticmethod
+    def congestion_reason(error):
+        if isinstance(error, APITimeoutError):
+            return 'timeout'
+        status = getattr(error, 'status_code', None)
+        if status == 429:
+            return '429 rate limit'
+        if status in (503, 529):
+            return f"sobrecarga {status}"
+        return None
+    
+    def _decide(self, antigo, motivo):
+        self.decisions.append({
+            'timestamp': round(time.time(), 1),
+            'de': round(antigo, 2),
+            'para': round(self.limit, 2),
+            'motivo': motivo
+        })
+        print(f"🎚️ Concorrência: {int(antigo)} → {int(self.limit)} PDF(s) em paralelo ({motivo})")
+    
+    def info(self):
+        with self._cond:
+            return {
+                'enabled': ADAPTIVE_CONCURRENCY_ENABLED,
+                'limit': int(self.limit),
+                'limit_exact': round(self.limit, 3),
+                'in_flight': self.in_flight,
+                'min': self.minimo,
+                'max': self.maximo,
+                **self.stats,
+                'decisions': list(self.decisions)
+            }
+
+concurrency_limiter = AdaptiveConcurrencyLimiter(
+    ADAPTIVE_CONCURRENCY_INITIAL, ADAPTIVE_CONCURRENCY_MIN, ADAPTIVE_CONCURRENCY_MAX,
+    ADAPTIVE_BACKOFF_FACTOR, ADAPTIVE_LATENCY_FACTOR, ADAPTIVE_DECREASE_COOLDOWN
+)
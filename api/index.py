@@ -8,20 +8,34 @@ import sys
 import io
 import sqlite3
 import signal
+import multiprocessing
 import time
 import threading
 from contextlib import contextmanager
+from collections import deque, OrderedDict
 from datetime import datetime
 
+if __name__ == '__main__':
+    # python api/index.py: carregar como api.index, porque pipeline, fila, lote
+    # e concorrência ficam em módulos irmãos que importam deste
+    sys.path[0] = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    from api.index import run_dev_server
+    run_dev_server()
+    sys.exit(0)
+
 # ================================
 # CONFIGURAÇÃO E INICIALIZAÇÃO
 # ================================
 
+def get_db_path():
+    """Caminho do SQLite: DATABASE_PATH ou data/historico_riviera.db"""
+    return os.getenv('DATABASE_PATH') or os.path.join(os.path.dirname(__file__), '..', 'data', 'historico_riviera.db')
+
 def init_db():
     """Inicializar banco de dados com tabelas necessárias"""
     try:
-        db_path = os.path.join(os.path.dirname(__file__), '..', 'data', 'historico_riviera.db')
-        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        db_path = get_db_path()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
         
         conn = sqlite3.connect(db_path, timeout=10)
         cursor = conn.cursor()
@@ -75,6 +89,76 @@ def init_db():
             )
         ''')
         
+        # Cache de extração/análise endereçado por conteúdo (SHA-256 do PDF)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS cache_analises (
+                chave TEXT PRIMARY KEY,
+                tipo TEXT NOT NULL,
+                valor TEXT NOT NULL,
+                tamanho_bytes INTEGER NOT NULL,
+                ultimo_acesso REAL NOT NULL,
+                data_criacao DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_cache_analises_acesso
+            ON cache_analises (ultimo_acesso)
+        ''')
+        
+        # Fila durável de ingestão (jobs do /api/upload, consumidos por qualquer processo)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS jobs_ingestao (
+                job_id TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                extractor TEXT,
+                chunk_size INTEGER,
+                erros_validacao TEXT,
+                criado_em REAL NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS fila_ingestao (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id TEXT NOT NULL,
+                indice INTEGER NOT NULL,
+                filename TEXT NOT NULL,
+                path TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'na_fila',
+                tentativas INTEGER NOT NULL DEFAULT 0,
+                disponivel_em REAL NOT NULL,
+                lease_owner TEXT,
+                lease_expira REAL,
+                heartbeat_em REAL,
+                iniciado_em REAL,
+                concluido_em REAL,
+                resultado TEXT,
+                versao INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_fila_ingestao_status
+            ON fila_ingestao (status, disponivel_em)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_fila_ingestao_job
+            ON fila_ingestao (job_id)
+        ''')
+        
+        # PDFs já gravados (pipeline, fila ou lote; hash do conteúdo), para retomar ingestões em massa
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS pdfs_ingeridos (
+                pdf_hash TEXT PRIMARY KEY,
+                filename TEXT,
+                model TEXT,
+                codigo_obra TEXT,
+                competencia TEXT,
+                ingerido_em REAL NOT NULL
+            )
+        ''')
+        
+        # WAL: leitores (rotas, stream SSE) não bloqueiam os workers que gravam
+        cursor.execute('PRAGMA journal_mode=WAL')
+        
         conn.commit()
         conn.close()
         print("✅ Banco de dados inicializado com sucesso")
@@ -89,8 +173,7 @@ def get_db_connection():
     """Context manager para gerenciar conexões com banco de dados"""
     conn = None
     try:
-        db_path = os.path.join(os.path.dirname(__file__), '..', 'data', 'historico_riviera.db')
-        conn = sqlite3.connect(db_path, timeout=10)
+        conn = sqlite3.connect(get_db_path(), timeout=10)
         conn.row_factory = sqlite3.Row
         yield conn
     except Exception as e:
@@ -102,25 +185,39 @@ def get_db_connection():
         if conn:
             conn.close()
 
-# Inicializar banco
-init_db()
-
 # ================================
 # IMPORTS FLASK
 # ================================
 
-from flask import Flask, request, jsonify, send_from_directory, send_file
+from flask import Flask, Request, Response, request, jsonify, send_from_directory, send_file
 from flask_cors import CORS
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI, APIConnectionError, APITimeoutError
 from dotenv import load_dotenv
 import gc
 import json
+import tempfile
+import mmap
+import hashlib
+import re
+import itertools
+import unicodedata
+import asyncio
+import contextvars
+import queue
+import copy
+import math
+import random
+from email.utils import parsedate_to_datetime
 import PyPDF2
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import pdfplumber
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor, BrokenExecutor
 
 # Carregar variáveis de ambiente
 load_dotenv()
 
+# Inicializar banco (depois do .env, que pode definir DATABASE_PATH)
+init_db()
+
 # Inicializar Flask
 app = Flask(__name__, static_folder='../static', template_folder='../templates')
 
@@ -146,17 +243,185 @@ CORS(app,
 # Configurações
 REQUEST_TIMEOUT = 120
 OPENAI_TIMEOUT = 90
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL') or None  # Ex: http://localhost:8001/v1 (python -m api.mock_llm)
 UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER', './uploads')
 MAX_FILE_SIZE = int(os.getenv('MAX_FILE_SIZE', 52428800))  # 50MB
+PDF_PAGE_GROUP_CHARS = int(os.getenv('PDF_PAGE_GROUP_CHARS', 60000))  # Texto máximo por grupo de páginas
+DEFAULT_CHUNK_SIZE = 8000  # Tokens por chunk de análise (sobrescrito por /api/settings)
+CHARS_PER_TOKEN = 4
+ANALYSIS_STREAM_WORKERS = int(os.getenv('ANALYSIS_STREAM_WORKERS', 2))  # Grupos analisados em paralelo
+PDF_EXTRACTION_MODE = os.getenv('PDF_EXTRACTION_MODE', 'auto')  # 'auto' | 'process' | 'single'
+PDF_PROCESS_MIN_PAGES = int(os.getenv('PDF_PROCESS_MIN_PAGES', 40))  # Abaixo disso, fork/pickle não compensa
+PDF_PROCESS_WORKERS = int(os.getenv('PDF_PROCESS_WORKERS', os.cpu_count() or 2))
+PDF_PROCESS_CHUNK_PAGES = int(os.getenv('PDF_PROCESS_CHUNK_PAGES', 20))  # Páginas por tarefa do pool
+PDF_EXTRACTORS = ['pypdf2', 'tables']
+PDF_EXTRACTOR = os.getenv('PDF_EXTRACTOR', 'pypdf2')  # 'tables' = pdfplumber com tabelas em TSV
+ANALYSIS_CACHE_ENABLED = os.getenv('ANALYSIS_CACHE_ENABLED', 'True').lower() == 'true'
+ANALYSIS_CACHE_MAX_BYTES = int(os.getenv('ANALYSIS_CACHE_MAX_BYTES', 200 * 1024 * 1024))  # 200MB
+ANALYSIS_CACHE_MAX_TEXT_BYTES = int(os.getenv('ANALYSIS_CACHE_MAX_TEXT_BYTES', 5 * 1024 * 1024))  # Texto por PDF
+CHAT_CACHE_ENABLED = os.getenv('CHAT_CACHE_ENABLED', 'True').lower() == 'true'  # Respostas repetidas do /api/chat
+CHAT_CACHE_TTL = int(os.getenv('CHAT_CACHE_TTL', 3600))  # Segundos
+CHAT_CACHE_MAX_BYTES = int(os.getenv('CHAT_CACHE_MAX_BYTES', 20 * 1024 * 1024))  # 20MB em memória
+CHAT_STREAM_KEEPALIVE = float(os.getenv('CHAT_STREAM_KEEPALIVE', 15))  # Segundos entre comentários SSE sem tokens
+
+LAYOUT_FAST_PATH_ENABLED = os.getenv('LAYOUT_FAST_PATH_ENABLED', 'True').lower() == 'true'
+LAYOUT_FAST_PATH_MAX_CHARS = int(os.getenv('LAYOUT_FAST_PATH_MAX_CHARS', 1000000))  # Texto juntado para as regras
+PAGE_FILTER_ENABLED = os.getenv('PAGE_FILTER_ENABLED', 'True').lower() == 'true'  # Descartar capas/assinaturas
+OBRA_SPLIT_ENABLED = os.getenv('OBRA_SPLIT_ENABLED', 'True').lower() == 'true'  # Relatórios com várias obras
+OBRA_SECTION_WORKERS = int(os.getenv('OBRA_SECTION_WORKERS', 4))  # Seções de obra analisadas em paralelo
+OBRA_SECTION_MAX_CHARS = int(os.getenv('OBRA_SECTION_MAX_CHARS', 500000))  # Trecho de obra (e preâmbulo) em memória
+NUMBER_NORMALIZATION_ENABLED = os.getenv('NUMBER_NORMALIZATION_ENABLED', 'True').lower() == 'true'
+OPENAI_ASYNC_ENABLED = os.getenv('OPENAI_ASYNC_ENABLED', 'True').lower() == 'true'  # Chamadas no loop asyncio
+OPENAI_MAX_CONCURRENCY = int(os.getenv('OPENAI_MAX_CONCURRENCY', 16))  # Chamadas OpenAI em voo por processo
+OPENAI_MAX_RETRIES = int(os.getenv('OPENAI_MAX_RETRIES', 3))  # Novas tentativas em 429/5xx/timeout
+OPENAI_RETRY_BASE_DELAY = float(os.getenv('OPENAI_RETRY_BASE_DELAY', 1.0))  # Segundos (dobra a cada tentativa)
+OPENAI_RETRY_MAX_DELAY = float(os.getenv('OPENAI_RETRY_MAX_DELAY', 30.0))
+OPENAI_HEDGE_ENABLED = os.getenv('OPENAI_HEDGE_ENABLED', 'False').lower() == 'true'  # 2ª chamada se a 1ª passar do p95
+OPENAI_HEDGE_QUANTILE = float(os.getenv('OPENAI_HEDGE_QUANTILE', 0.95))
+OPENAI_HEDGE_MIN_SAMPLES = int(os.getenv('OPENAI_HEDGE_MIN_SAMPLES', 20))  # Latências vistas antes de ativar
+STRUCTURED_OUTPUT_ENABLED = os.getenv('STRUCTURED_OUTPUT_ENABLED', 'True').lower() == 'true'  # JSON com schema
+ANALYSIS_STREAMING_ENABLED = os.getenv('ANALYSIS_STREAMING_ENABLED', 'True').lower() == 'true'  # Obras parseadas ao chegar
+OUTPUT_BUDGET_ENABLED = os.getenv('OUTPUT_BUDGET_ENABLED', 'True').lower() == 'true'  # max tokens pelo tamanho do documento
+OUTPUT_TOKENS_PER_ROW = int(os.getenv('OUTPUT_TOKENS_PER_ROW', 45))  # Uma despesa/receita no JSON
+OUTPUT_TOKENS_PER_OBRA = int(os.getenv('OUTPUT_TOKENS_PER_OBRA', 600))  # Campos fixos de uma obra
+OUTPUT_BUDGET_MIN = int(os.getenv('OUTPUT_BUDGET_MIN', 1500))
+OUTPUT_BUDGET_MAX = int(os.getenv('OUTPUT_BUDGET_MAX', 16000))  # Acima disso o texto é dividido em partes
+MODEL_CASCADE_ENABLED = os.getenv('MODEL_CASCADE_ENABLED', 'True').lower() == 'true'  # Modelo rápido primeiro
+MODEL_CASCADE_FAST_MODEL = os.getenv('MODEL_CASCADE_FAST_MODEL', '')  # Vazio = CASCADE_FAST_MODELS
+SALDO_IDENTITY_TOLERANCE = float(os.getenv('SALDO_IDENTITY_TOLERANCE', 1.00))  # R$ na conferência de saldo
+INGESTION_JOB_WORKERS = int(os.getenv('INGESTION_JOB_WORKERS', 3))  # Consumidores da fila por processo web (0 = só api.worker)
+INGESTION_JOB_TTL = int(os.getenv('INGESTION_JOB_TTL', 24 * 3600))  # Segundos que um job concluído fica consultável
+JOBS_FOLDER = os.getenv('JOBS_FOLDER', os.path.join(UPLOAD_FOLDER, 'jobs'))  # PDFs aguardando processamento (disco compartilhado)
+JOB_EVENTS_POLL_INTERVAL = float(os.getenv('JOB_EVENTS_POLL_INTERVAL', 1.0))  # Segundos entre consultas do stream SSE
+JOB_EVENTS_MAX_SECONDS = float(os.getenv('JOB_EVENTS_MAX_SECONDS', 90))  # Vida máxima de um stream (abaixo do timeout do gunicorn)
+JOB_EVENTS_KEEPALIVE = float(os.getenv('JOB_EVENTS_KEEPALIVE', 15))  # Segundos entre comentários SSE sem mudança no job
+JOB_EVENTS_RETRY_MS = int(os.getenv('JOB_EVENTS_RETRY_MS', 1000))  # 'retry:' do SSE - espera do navegador para reconectar
+WORK_QUEUE_LEASE_SECONDS = float(os.getenv('WORK_QUEUE_LEASE_SECONDS', 120))  # Sem heartbeat por este tempo = item retomado
+WORK_QUEUE_MAX_ATTEMPTS = int(os.getenv('WORK_QUEUE_MAX_ATTEMPTS', 3))
+WORK_QUEUE_RETRY_DELAY = float(os.getenv('WORK_QUEUE_RETRY_DELAY', 30))  # Segundos (dobra a cada tentativa)
+WORK_QUEUE_POLL_INTERVAL = float(os.getenv('WORK_QUEUE_POLL_INTERVAL', 2.0))  # Espera de um consumidor com a fila vazia
+ADAPTIVE_CONCURRENCY_ENABLED = os.getenv('ADAPTIVE_CONCURRENCY_ENABLED', 'True').lower() == 'true'  # AIMD nos consumidores
+ADAPTIVE_CONCURRENCY_INITIAL = int(os.getenv('ADAPTIVE_CONCURRENCY_INITIAL', INGESTION_JOB_WORKERS or 3))
+ADAPTIVE_CONCURRENCY_MIN = int(os.getenv('ADAPTIVE_CONCURRENCY_MIN', 1))
+ADAPTIVE_CONCURRENCY_MAX = int(os.getenv('ADAPTIVE_CONCURRENCY_MAX', 32))  # Threads de consumo por processo
+ADAPTIVE_BACKOFF_FACTOR = float(os.getenv('ADAPTIVE_BACKOFF_FACTOR', 0.5))  # Redução multiplicativa em 429/timeout
+ADAPTIVE_LATENCY_FACTOR = float(os.getenv('ADAPTIVE_LATENCY_FACTOR', 2.0))  # Acima de N × p50 o limite não sobe
+ADAPTIVE_DECREASE_COOLDOWN = float(os.getenv('ADAPTIVE_DECREASE_COOLDOWN', 5.0))  # Segundos entre reduções
+ADAPTIVE_MIN_SAMPLES = int(os.getenv('ADAPTIVE_MIN_SAMPLES', 10))  # Latências vistas antes de usar o p50
+PIPELINE_ENABLED = os.getenv('PIPELINE_ENABLED', 'True').lower() == 'true'  # Extração → análise → gravação em estágios
+PIPELINE_EXTRACT_WORKERS = int(os.getenv('PIPELINE_EXTRACT_WORKERS', min(4, os.cpu_count() or 2)))  # Processos
+PIPELINE_ANALYSIS_WORKERS = int(os.getenv('PIPELINE_ANALYSIS_WORKERS', 16))  # Threads de I/O (OpenAI)
+PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', 8))  # Itens por fila entre estágios
+BATCH_BACKEND = os.getenv('BATCH_BACKEND', 'local')  # 'local' (executa aqui) | 'openai' (Batch API)
+BATCH_FOLDER = os.getenv('BATCH_FOLDER', os.path.join(UPLOAD_FOLDER, 'batches'))  # JSONL + manifestos
+BATCH_POLL_INTERVAL = float(os.getenv('BATCH_POLL_INTERVAL', 30))  # Segundos entre consultas de status
+BATCH_COMPLETION_WINDOW = os.getenv('BATCH_COMPLETION_WINDOW', '24h')
+BATCH_MAX_REQUESTS = int(os.getenv('BATCH_MAX_REQUESTS', 50000))  # Linhas por arquivo de lote (limite da OpenAI)
+BATCH_MAX_FILE_BYTES = int(os.getenv('BATCH_MAX_FILE_BYTES', 200 * 1024 * 1024))  # 200MB por arquivo
+BATCH_LOCAL_CONCURRENCY = int(os.getenv('BATCH_LOCAL_CONCURRENCY', OPENAI_MAX_CONCURRENCY))  # Backend local
+
+# Versão do prompt de análise - alterar sempre que o prompt mudar (invalida o cache)
+ANALYSIS_PROMPT_VERSION = '2025.11-9'
 
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 # Inicializar cliente OpenAI global
 openai_client = OpenAI(
     api_key=os.getenv('OPENAI_API_KEY'),
-    timeout=OPENAI_TIMEOUT
+    base_url=OPENAI_BASE_URL,
+    timeout=OPENAI_TIMEOUT,
+    max_retries=0  # Retentativas ficam com RetryPolicy (backoff com jitter + Retry-After)
 )
 
+# ================================
+# UPLOADS EM DISCO COM LIMITE DE TAMANHO
+# ================================
+
+class SpooledUpload:
+    """
+    Destino de cada arquivo multipart: grava direto em um temporário no disco
+    e para de gravar assim que passa de MAX_FILE_SIZE (too_large=True).
+    
+    O restante do upload é lido e descartado, então nem a memória do worker
+    nem o disco crescem além do limite. O arquivo é apagado no close().
+    """
+    
+    def __init__(self, limit, filename=None):
+        fd, self.path = tempfile.mkstemp(prefix='upload-', suffix='.pdf', dir=UPLOAD_FOLDER)
+        self._file = os.fdopen(fd, 'w+b')
+        self.limit = limit
+        self.filename = filename
+        self.size = 0
+        self.too_large = False
+    
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.limit:
+            if not self.too_large:
+                self.too_large = True
+                self._file.truncate(0)
+                print(f"⚠️ Upload {self.filename} excedeu {self.limit / (1024 * 1024):.0f}MB - descartando")
+            return len(data)
+        return self._file.write(data)
+    
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+    
+    def __getattr__(self, name):
+        # read/seek/tell/flush etc. vão para o arquivo real
+        return getattr(self._file, name)
+
+class SpooledRequest(Request):
+    """Request do Flask que grava cada arquivo enviado em um SpooledUpload"""
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return SpooledUpload(MAX_FILE_SIZE, filename)
+
+app.request_class = SpooledRequest
+
+def upload_path(file):
+    """Caminho em disco de um upload spooled (ou None)"""
+    stream = getattr(file, 'stream', file)
+    if isinstance(stream, SpooledUpload):
+        stream.flush()
+        return stream.path
+    return None
+
+def upload_too_large(file):
+    """True se o upload passou do limite durante a leitura"""
+    stream = getattr(file, 'stream', file)
+    if isinstance(stream, SpooledUpload):
+        return stream.too_large
+    return bool(file.content_length and file.content_length > MAX_FILE_SIZE)
+
+def rejected_upload_status(files):
+    """413 se todos os arquivos foram recusados por tamanho, senão 400"""
+    return 413 if files and all(upload_too_large(f) for f in files) else 400
+
+@contextmanager
+def open_pdf_source(file):
+    """
+    Fonte de leitura para os extratores: arquivos em disco (caminho ou upload
+    spooled) são abertos via mmap, sem copiar o PDF para a memória do processo.
+    """
+    path = file if isinstance(file, (str, os.PathLike)) else upload_path(file)
+    
+    if not path:
+        if hasattr(file, 'seek'):
+            file.seek(0)
+        yield file
+        return
+    
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield f
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            yield view
+
 # ================================
 # MIDDLEWARE E HANDLERS
 # ================================
@@ -293,54 +558,62 @@ def get_resumo():
 # FUNÇÕES AUXILIARES - PROCESSAMENTO PARALELO
 # ================================
 
-def process_single_pdf(file_obj, model):
+def process_single_pdf(file_obj, model, extractor=None, chunk_size=None, filename=None):
     """
     Processa um único PDF de forma independente (para parallelização)
     
+    As páginas são extraídas e analisadas em streaming: cada grupo de páginas
+    vai para a OpenAI assim que é decodificado, sem montar o documento inteiro.
+    
     Args:
-        file_obj: Objeto de arquivo
+        file_obj: Objeto de arquivo ou caminho do PDF em disco
         model: Modelo a usar
+        extractor: 'pypdf2' ou 'tables' (padrão: PDF_EXTRACTOR)
+        chunk_size: Tokens por chunk de análise, convertidos com CHARS_PER_TOKEN
+                    (padrão: PDF_PAGE_GROUP_CHARS caracteres)
+        filename: Nome original (padrão: file_obj.filename)
     
     Returns:
         Dict com resultado ou erro
     """
+    filename = filename or getattr(file_obj, 'filename', None) or os.path.basename(str(file_obj))
     try:
-        filename = file_obj.filename
         print(f"  🔄 Iniciando: {filename}")
+        pdf_hash = hash_pdf_file(file_obj)
         
-        # Extrair texto
-        pdf_text = extract_pdf_text(file_obj)
+        # Extrair e analisar página a página (ou reaproveitar do cache)
+        paginas = {}
+        analysis = analyze_pdf_document(
+            file_obj, model, document_type='relatório financeiro', extractor=extractor, report=paginas,
+            chunk_size=chunk_size, pdf_hash=pdf_hash
+        )
         
-        if not pdf_text or len(pdf_text.strip()) < 10:
+        if analysis is None:
             return {
                 'status': 'error',
                 'filename': filename,
                 'message': 'PDF sem texto extraível'
             }
         
-        print(f"    ✅ Texto extraído: {filename}")
-        
-        # Analisar com OpenAI
-        analysis = analyze_with_openai(pdf_text, document_type='relatório financeiro', model=model)
-        
         print(f"    ✅ Análise concluída: {filename}")
         
-        # Salvar no banco
-        save_analysis_to_db(analysis)
-        
+        # Salvar no banco (e o hash, para a ingestão em massa pular o PDF)
+        obra = save_ingested_pdf(analysis, pdf_hash, filename, model)
         return {
             'status': 'success',
             'filename': filename,
-            'codigo_obra': analysis.get('codigo_obra'),
-            'competencia': analysis.get('competencia')
+            'codigo_obra': obra.get('codigo_obra'),
+            'competencia': obra.get('competencia'),
+            'paginas': paginas
         }
     
     except Exception as e:
-        print(f"    ❌ Erro em {file_obj.filename}: {str(e)[:100]}")
+        print(f"    ❌ Erro em {filename}: {str(e)[:100]}")
         return {
             'status': 'error',
-            'filename': file_obj.filename,
-            'message': str(e)[:200]
+            'filename': filename,
+            'message': str(e)[:200],
+            'retryable': is_retryable_error(e)
         }
 
 # ================================
@@ -349,7 +622,14 @@ def process_single_pdf(file_obj, model):
 
 @app.route('/api/upload', methods=['POST'])
 def upload_pdf():
-    """Receber e processar múltiplos PDFs em paralelo"""
+    """
+    Receber múltiplos PDFs e enfileirar um job de ingestão.
+    
+    A requisição só valida e grava os arquivos: responde 202 com o job_id
+    e o processamento segue pela fila durável (WorkQueue). Progresso e
+    resultados em GET /api/upload/jobs/<job_id> ou no stream SSE
+    /api/upload/jobs/<job_id>/events.
+    """
     start_time = time.time()
     
     try:
@@ -373,81 +653,42 @@ def upload_pdf():
         if model not in modelos_suportados:
             model = 'gpt-5'
         
-        print(f"\n{'='*60}")
-        print(f"📦 PROCESSAMENTO EM PARALELO DE {len(files)} PDFs")
-        print(f"🤖 Modelo: {model}")
-        print(f"⏱️ Início: {datetime.now().strftime('%H:%M:%S')}")
-        print(f"{'='*60}")
+        # Obter extrator de texto
+        extractor = request.form.get('extractor', PDF_EXTRACTOR)
+        if extractor not in PDF_EXTRACTORS:
+            extractor = PDF_EXTRACTOR
         
-        # Validar e filtrar arquivos
-        arquivos_validos = []
-        erros_validacao = []
+        # Tamanho do chunk salvo em /api/settings
+        chunk_size = get_chunk_size(request.headers.get('X-API-Key') or request.form.get('api_key', 'default'))
         
-        for file in files:
-            if file.filename == '':
-                erros_validacao.append('Arquivo sem nome')
-                continue
-            
-            if not file.filename.lower().endswith('.pdf'):
-                erros_validacao.append(f'{file.filename} - tipo inválido')
-                continue
-            
-            if file.content_length and file.content_length > MAX_FILE_SIZE:
-                erros_validacao.append(f'{file.filename} - muito grande (>{MAX_FILE_SIZE/(1024*1024)}MB)')
-                continue
-            
-            arquivos_validos.append(file)
+        # Validar e filtrar arquivos
+        arquivos_validos, erros_validacao = validate_upload_files(files)
         
-        print(f"✅ {len(arquivos_validos)} arquivo(s) válido(s)")
+        print(f"\n📦 UPLOAD: {len(arquivos_validos)} PDF(s) válido(s) | {model} | {extractor} | chunk {chunk_size}")
         if erros_validacao:
             print(f"⚠️ {len(erros_validacao)} arquivo(s) descartado(s)")
         
-        # ⭐ PROCESSAMENTO PARALELO com ThreadPoolExecutor
-        resultados = []
-        erros = erros_validacao.copy()
-        
-        if arquivos_validos:
-            print(f"\n🔄 Iniciando processamento paralelo...")
-            # Usar 3 workers (bom para 3 PDFs)
-            max_workers = min(3, len(arquivos_validos))
-            
-            with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                # Submeter todos os PDFs para processamento
-                futures = {
-                    executor.submit(process_single_pdf, file, model): file.filename 
-                    for file in arquivos_validos
-                }
-                
-                # Coletar resultados conforme completam
-                for future in as_completed(futures):
-                    filename = futures[future]
-                    try:
-                        resultado = future.result(timeout=300)  # 5 minutos max por PDF
-                        resultados.append(resultado)
-                        
-                        if resultado['status'] == 'error':
-                            erros.append(f"{filename}: {resultado.get('message', 'Erro desconhecido')}")
-                    except Exception as e:
-                        erros.append(f"{filename}: {str(e)[:100]}")
-        
-        processing_time = time.time() - start_time
+        if not arquivos_validos:
+            return jsonify({
+                'status': 'error',
+                'message': 'Nenhum PDF válido',
+                'erros': erros_validacao,
+                'processing_time': round(time.time() - start_time, 2)
+            }), rejected_upload_status(files)
         
-        print(f"\n{'='*60}")
-        print(f"✅ Processamento completo!")
-        print(f"📊 Resultados: {len([r for r in resultados if r['status'] == 'success'])} sucesso(s)")
-        if erros:
-            print(f"❌ Erros: {len(erros)}")
-        print(f"⏱️ Tempo total: {processing_time:.2f}s")
-        print(f"{'='*60}\n")
+        job = enqueue_upload_job(arquivos_validos, model, extractor, chunk_size, erros_validacao)
         
         return jsonify({
-            'status': 'success' if resultados else 'error',
-            'message': f'Processados {len(resultados)} PDF(s)',
+            'status': 'success',
+            'message': f"{job['total']} PDF(s) na fila",
+            'job_id': job['job_id'],
             'model': model,
-            'processados': [r for r in resultados if r['status'] == 'success'],
-            'erros': erros,
-            'processing_time': round(processing_time, 2)
-        }), 200 if resultados else 400
+            'total': job['total'],
+            'erros': erros_validacao,
+            'status_url': f"/api/upload/jobs/{job['job_id']}",
+            'events_url': f"/api/upload/jobs/{job['job_id']}/events",
+            'processing_time': round(time.time() - start_time, 2)
+        }), 202
     
     except Exception as e:
         processing_time = time.time() - start_time
@@ -459,6 +700,264 @@ def upload_pdf():
             'processing_time': round(processing_time, 2)
         }), 500
 
+# ================================
+# PDFS INGERIDOS (HASH NO SQLITE)
+# ================================
+
+def record_ingested_pdf(pdf_hash, filename, model, obra):
+    """Registrar o hash de um PDF gravado (base do --resume da ingestão em massa)"""
+    with get_db_connection() as conn:
+        conn.execute('''
+            INSERT OR REPLACE INTO pdfs_ingeridos (pdf_hash, filename, model, codigo_obra, competencia, ingerido_em)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (pdf_hash, filename, model, obra.get('codigo_obra'), obra.get('competencia'), time.time()))
+        conn.commit()
+
+def save_ingested_pdf(analysis, pdf_hash, filename, model):
+    """
+    Gravar a análise de um PDF e registrar o hash em pdfs_ingeridos - etapa
+    comum a process_single_pdf, ao pipeline e ao lote.
+    
+    Returns:
+        Primeira obra da análise
+    """
+    save_analysis_to_db(analysis)
+    obra = primeira_obra(analysis)
+    if pdf_hash:
+        record_ingested_pdf(pdf_hash, filename, model, obra)
+    return obra
+
+def ingested_pdf_hashes(hashes):
+    """Quais destes hashes já foram gravados"""
+    hashes = list(hashes)
+    encontrados = set()
+    with get_db_connection() as conn:
+        for i in range(0, len(hashes), 500):
+            bloco = hashes[i:i + 500]
+            encontrados.update(row[0] for row in conn.execute(
+                f"SELECT pdf_hash FROM pdfs_ingeridos WHERE pdf_hash IN ({','.join('?' * len(bloco))})", bloco
+            ))
+    return encontrados
+
+# IngestionPipeline e o pipeline do processo (get_ingestion_pipeline, ingest_pdf): api/pipeline.py
+
+# ================================
+# FILA DURÁVEL DE INGESTÃO (SQLITE)
+# ================================
+
+def persist_upload(file, destino):
+    """Levar o upload para destino, fora do ciclo de vida da requisição"""
+    path = upload_path(file)
+    if path:
+        # SpooledUpload.close() não encontra mais o temporário e só fecha o descritor
+        os.replace(path, destino)
+    else:
+        file.save(destino)
+    return destino
+
+# WorkQueue, work_queue e QueueWorker: api/jobs.py
+
+_queue_worker = None
+_queue_worker_pid = None
+_queue_worker_lock = threading.Lock()
+
+def get_queue_worker():
+    """Consumidores da fila neste processo web (None com INGESTION_JOB_WORKERS=0)"""
+    global _queue_worker, _queue_worker_pid
+    if INGESTION_JOB_WORKERS <= 0:
+        return None
+    with _queue_worker_lock:
+        if _queue_worker is None or _queue_worker_pid != os.getpid():
+            limiter = concurrency_limiter if ADAPTIVE_CONCURRENCY_ENABLED else None
+            _queue_worker = QueueWorker(work_queue, INGESTION_JOB_WORKERS, limiter=limiter).start()
+            _queue_worker_pid = os.getpid()
+        return _queue_worker
+
+def enqueue_upload_job(arquivos, model, extractor=None, chunk_size=None, erros=None):
+    """Gravar os uploads em JOBS_FOLDER e registrar o job na fila"""
+    work_queue.prune(INGESTION_JOB_TTL)
+    job_id = os.urandom(8).hex()
+    pasta = os.path.join(JOBS_FOLDER, job_id)
+    os.makedirs(pasta, exist_ok=True)
+    
+    salvos = [
+        (file.filename, persist_upload(file, os.path.join(pasta, f"{i:04d}.pdf")))
+        for i, file in enumerate(arquivos)
+    ]
+    work_queue.enqueue_job(job_id, model, extractor or PDF_EXTRACTOR, chunk_size, salvos, erros)
+    get_queue_worker()
+    print(f"📥 Job {job_id}: {len(salvos)} PDF(s) na fila")
+    return work_queue.job_snapshot(job_id)
+
+@app.route('/api/upload/jobs', methods=['GET'])
+def list_upload_jobs():
+    """Jobs de upload mais recentes e o estado da fila"""
+    return jsonify({
+        'status': 'success',
+        'queue': work_queue.info(),
+        'jobs': [work_queue.job_snapshot(job_id) for job_id in work_queue.recent_jobs()]
+    }), 200
+
+@app.route('/api/upload/jobs/<job_id>', methods=['GET'])
+def get_upload_job(job_id):
+    """Estado de um job: status, progresso por arquivo e resultados"""
+    job = work_queue.job_snapshot(job_id)
+    if job is None:
+        return jsonify({
+            'status': 'error',
+            'message': f'Job {job_id} não encontrado'
+        }), 404
+    return jsonify({'status': 'success', 'job': job}), 200
+
+@app.route('/api/upload/jobs/<job_id>/events', methods=['GET'])
+def stream_upload_job(job_id):
+    """
+    Progresso do job em server-sent events: 'progress' com o estado completo
+    a cada mudança e 'done' quando todos os PDFs terminam. O job pode estar
+    sendo processado por outro processo, então a mudança é detectada
+    consultando a fila a cada JOB_EVENTS_POLL_INTERVAL segundos.
+    
+    O stream fecha depois de JOB_EVENTS_MAX_SECONDS (abaixo do timeout do
+    gunicorn) e o EventSource reconecta sozinho após o 'retry:' enviado no
+    início, recebendo de novo o estado atual. O caminho principal para
+    clientes que não são navegador é o polling de GET /api/upload/jobs/<id>.
+    """
+    if work_queue.job_version(job_id) is None:
+        return jsonify({
+            'status': 'error',
+            'message': f'Job {job_id} não encontrado'
+        }), 404
+    
+    def eventos():
+        versao = None
+        inicio = ultimo_envio = time.time()
+        yield f"retry: {JOB_EVENTS_RETRY_MS}\n\n"
+        while time.time() - inicio < JOB_EVENTS_MAX_SECONDS:
+            atual = work_queue.job_version(job_id)
+            if atual is None:
+                yield sse_event('error', {'error': f'Job {job_id} não encontrado'})
+                return
+            
+            if atual != versao:
+                job = work_queue.job_snapshot(job_id)
+                versao = job['versao']
+                ultimo_envio = time.time()
+                if job['status'] == 'concluido':
+                    yield sse_event('done', job)
+                    return
+                yield sse_event('progress', job)
+            elif time.time() - ultimo_envio >= JOB_EVENTS_KEEPALIVE:
+                ultimo_envio = time.time()
+                yield ': keep-alive\n\n'
+            
+            time.sleep(JOB_EVENTS_POLL_INTERVAL)
+    
+    return sse_response(eventos())
+
+# ================================
+# INGESTÃO EM LOTE (BATCH API)
+# ================================
+
+def validate_upload_files(files):
+    """Separar os PDFs aceitos dos descartados (sem nome, extensão, tamanho)"""
+    arquivos_validos = []
+    erros_validacao = []
+    
+    for file in files:
+        if file.filename == '':
+            erros_validacao.append('Arquivo sem nome')
+            continue
+        
+        if not file.filename.lower().endswith('.pdf'):
+            erros_validacao.append(f'{file.filename} - tipo inválido')
+            continue
+        
+        if upload_too_large(file):
+            erros_validacao.append(f'{file.filename} - muito grande (>{MAX_FILE_SIZE/(1024*1024)}MB)')
+            continue
+        
+        arquivos_validos.append(file)
+    
+    return arquivos_validos, erros_validacao
+
+# Preparação dos JSONL, backends de lote, BatchIngestion e get_batch_ingestion: api/batch.py
+
+@app.route('/api/upload-batch', methods=['POST'])
+def upload_batch():
+    """
+    Ingestão em lote: os PDFs são guardados e a extração e o envio das
+    análises em um único lote (Batch API) seguem em segundo plano. Responde
+    202 com o run_id; o resultado é salvo no banco quando o lote termina
+    (GET /api/upload-batch/<run_id>).
+    """
+    start_time = time.time()
+    
+    try:
+        files = request.files.getlist('files')
+        if not files:
+            return jsonify({
+                'status': 'error',
+                'message': 'Nenhum arquivo enviado'
+            }), 400
+        
+        model = request.form.get('model', 'gpt-5')
+        if model not in ['gpt-5', 'gpt-4o', 'gpt-4', 'gpt-3.5-turbo']:
+            model = 'gpt-5'
+        
+        extractor = request.form.get('extractor', PDF_EXTRACTOR)
+        if extractor not in PDF_EXTRACTORS:
+            extractor = PDF_EXTRACTOR
+        
+        chunk_size = get_chunk_size(request.headers.get('X-API-Key') or request.form.get('api_key', 'default'))
+        arquivos_validos, erros = validate_upload_files(files)
+        
+        if not arquivos_validos:
+            return jsonify({
+                'status': 'error',
+                'message': 'Nenhum PDF válido',
+                'erros': erros
+            }), rejected_upload_status(files)
+        
+        print(f"\n📬 INGESTÃO EM LOTE: {len(arquivos_validos)} PDF(s) | {model} | backend {BATCH_BACKEND}")
+        ingestion = get_batch_ingestion()
+        run = ingestion.create_run(
+            [(file.filename, file) for file in arquivos_validos], model, extractor, chunk_size
+        )
+        
+        return jsonify({
+            'status': 'success',
+            'message': f"{len(arquivos_validos)} PDF(s) em preparação para o lote",
+            'erros': erros,
+            'processing_time': round(time.time() - start_time, 2),
+            'execucao': ingestion.summary(run)
+        }), 202
+    
+    except Exception as e:
+        print(f"❌ ERRO NO LOTE: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': f'Erro ao preparar lote: {str(e)[:200]}',
+            'processing_time': round(time.time() - start_time, 2)
+        }), 500
+
+@app.route('/api/upload-batch', methods=['GET'])
+def list_upload_batches():
+    """Execuções de lote conhecidas por este processo"""
+    ingestion = get_batch_ingestion()
+    return jsonify({'status': 'success', **ingestion.info(), 'execucoes': ingestion.list_runs()}), 200
+
+@app.route('/api/upload-batch/<run_id>', methods=['GET'])
+def get_upload_batch(run_id):
+    """Estado de uma execução (consulta o backend na hora, sem esperar o poller; manifesto em disco se for de outro worker)"""
+    ingestion = get_batch_ingestion()
+    run = ingestion.poll_run(run_id)
+    if run is None:
+        return jsonify({
+            'status': 'error',
+            'message': f'Execução {run_id} não encontrada'
+        }), 404
+    return jsonify({'status': 'success', 'execucao': ingestion.summary(run)}), 200
+
 # ================================
 # ROTAS - CONFIGURAÇÃO
 # ================================
@@ -816,133 +1315,2929 @@ def download_relatorio(competencia):
             download_name=f'Riviera_Relatorio_{competencia}.html'
         )
     
-    except Exception as e:
-        print(f"❌ Erro ao fazer download do relatório: {e}")
-        return jsonify({
-            'status': 'error',
-            'message': str(e)
-        }), 500
+    except Exception as e:
+        print(f"❌ Erro ao fazer download do relatório: {e}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+# ================================
+# FASE 2.1 - ANÁLISE COM OpenAI
+# ================================
+
+_extraction_pool = None
+_extraction_pool_lock = threading.Lock()
+
+def _extraction_process_init():
+    # Ctrl+C é do processo pai, que termina os PDFs em andamento
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def new_extraction_pool(workers):
+    """
+    Pool de processos para extração. Usa 'spawn': o processo que cria o pool
+    (worker do gunicorn, pipeline) já tem threads, e um fork copiaria locks
+    presos por elas.
+    """
+    return ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context('spawn'), initializer=_extraction_process_init
+    )
+
+def get_extraction_pool():
+    """Pool de processos compartilhado para extração (criado sob demanda)"""
+    global _extraction_pool
+    with _extraction_pool_lock:
+        if _extraction_pool is None:
+            print(f"⚙️ Criando pool de extração com {PDF_PROCESS_WORKERS} processo(s)")
+            _extraction_pool = new_extraction_pool(PDF_PROCESS_WORKERS)
+        return _extraction_pool
+
+def extract_page_range(pdf_path, start, end, extractor='pypdf2'):
+    """Extrair texto das páginas [start, end) - executado em processo separado"""
+    if extractor == 'tables':
+        with pdfplumber.open(pdf_path) as pdf:
+            return [extract_page_with_tables(pdf.pages[i]) for i in range(start, end)]
+    
+    pdf_reader = PyPDF2.PdfReader(pdf_path)
+    return [pdf_reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+@contextmanager
+def pdf_path_for(file):
+    """Garantir um caminho em disco para o PDF (processos não recebem FileStorage)"""
+    if isinstance(file, (str, os.PathLike)):
+        yield file
+        return
+    
+    if upload_path(file):
+        yield upload_path(file)
+        return
+    
+    file.seek(0)
+    fd, path = tempfile.mkstemp(suffix='.pdf', dir=UPLOAD_FOLDER)
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            while True:
+                bloco = file.read(1024 * 1024)
+                if not bloco:
+                    break
+                tmp.write(bloco)
+        yield path
+    finally:
+        os.remove(path)
+
+def iter_pdf_pages_parallel(file, total_pages, extractor='pypdf2', pool=None):
+    """
+    Extrair páginas em paralelo em todos os núcleos (PyPDF2 é preso ao GIL).
+    
+    O PDF é dividido em faixas de PDF_PROCESS_CHUNK_PAGES páginas e as faixas
+    são entregues na ordem original conforme ficam prontas. Só
+    PDF_PROCESS_WORKERS faixas ficam em voo: a próxima é enviada quando o
+    consumidor pega uma, então páginas prontas não se acumulam na memória.
+    """
+    with pdf_path_for(file) as pdf_path:
+        pool = pool or get_extraction_pool()
+        faixas = iter(range(0, total_pages, PDF_PROCESS_CHUNK_PAGES))
+        pending = deque()
+        
+        def enviar_proxima():
+            start = next(faixas, None)
+            if start is not None:
+                pending.append(pool.submit(
+                    extract_page_range, pdf_path, start,
+                    min(start + PDF_PROCESS_CHUNK_PAGES, total_pages), extractor
+                ))
+        
+        try:
+            for _ in range(max(1, PDF_PROCESS_WORKERS)):
+                enviar_proxima()
+            while pending:
+                paginas = pending.popleft().result()
+                enviar_proxima()
+                yield from paginas
+        finally:
+            for future in pending:
+                future.cancel()
+
+# Cabeçalhos típicos das tabelas de despesas/receitas dos relatórios Praias SP
+FINANCIAL_TABLE_KEYWORDS = (
+    'DESCRI', 'HISTÓRICO', 'HISTORICO', 'FORNECEDOR', 'VALOR', 'NOTA', 'DOCUMENTO',
+    'CATEGORIA', 'SALDO', 'RECEITA', 'DESPESA', 'APORTE', 'RENDIMENTO', 'TOTAL'
+)
+BR_MONEY_RE = re.compile(r'^\(?-?(R\$\s*)?-?\d{1,3}(\.\d{3})*,\d{2}\)?-?$')
+
+def clean_table_cell(cell):
+    """Normalizar espaços/quebras de linha de uma célula"""
+    return ' '.join(str(cell).split()) if cell is not None else ''
+
+def table_to_tsv(table):
+    """
+    Converter uma tabela do pdfplumber em linhas TSV compactas.
+    
+    Colunas vazias são descartadas e o cabeçalho é a primeira linha sem
+    valores monetários. Retorna (é_financeira, linhas) - a tabela é
+    considerada de despesas/receitas se o cabeçalho tiver palavras-chave
+    ou se houver uma coluna de valores em formato brasileiro.
+    """
+    rows = [[clean_table_cell(c) for c in row] for row in table if row and any(row)]
+    if not rows:
+        return False, []
+    
+    ncols = max(len(r) for r in rows)
+    rows = [r + [''] * (ncols - len(r)) for r in rows]
+    manter = [i for i in range(ncols) if any(r[i] for r in rows)]
+    rows = [[r[i] for i in manter] for r in rows]
+    
+    valores = sum(1 for r in rows for c in r if BR_MONEY_RE.match(c))
+    header = next((r for r in rows if not any(BR_MONEY_RE.match(c) for c in r)), [])
+    header_upper = ' '.join(header).upper()
+    
+    is_financial = valores >= 2 or any(k in header_upper for k in FINANCIAL_TABLE_KEYWORDS)
+    return is_financial, ['\t'.join(r) for r in rows]
+
+def extract_page_with_tables(page):
+    """
+    Extrair uma página com pdfplumber: tabelas financeiras em TSV, resto como texto.
+    
+    O texto que está dentro das tabelas detectadas não é repetido, o que
+    reduz bastante os tokens de relatórios de despesas.
+    """
+    partes = []
+    pagina_texto = page
+    
+    try:
+        tabelas = page.find_tables()
+    except Exception as e:
+        print(f"⚠️ Falha ao detectar tabelas na página {page.page_number}: {e}")
+        tabelas = []
+    
+    for n, tabela in enumerate(tabelas, start=1):
+        is_financial, linhas = table_to_tsv(tabela.extract())
+        if not is_financial or not linhas:
+            continue
+        partes.append(f"[TABELA p.{page.page_number} #{n}]\n" + '\n'.join(linhas))
+        pagina_texto = pagina_texto.outside_bbox(tabela.bbox)
+    
+    texto = pagina_texto.extract_text() or ""
+    return '\n'.join([texto.strip()] + partes).strip()
+
+def iter_pdf_pages(file, extractor=None, pool=None):
+    """
+    Gerador que extrai o texto de um PDF página a página.
+    
+    Extratores: 'pypdf2' (texto corrido) ou 'tables' (pdfplumber com as
+    tabelas de despesas/receitas em TSV). Cada página é liberada assim que
+    o texto é entregue, então a memória não cresce com o número de páginas.
+    Em PDF_EXTRACTION_MODE 'process' (ou 'auto' com pelo menos
+    PDF_PROCESS_MIN_PAGES páginas) a extração roda no pool de processos;
+    com pool informado (pipeline de ingestão), sempre nele.
+    """
+    extractor = extractor or PDF_EXTRACTOR
+    
+    try:
+        with open_pdf_source(file) as source:
+            pdf_reader = PyPDF2.PdfReader(source)
+            total_pages = len(pdf_reader.pages)
+            
+            usar_processos = pool is not None or PDF_EXTRACTION_MODE == 'process' or (
+                PDF_EXTRACTION_MODE == 'auto' and total_pages >= PDF_PROCESS_MIN_PAGES
+            )
+            
+            if usar_processos and (total_pages > 1 or pool is not None):
+                if pool is None:
+                    print(f"⚡ Extração em paralelo ({extractor}): {total_pages} páginas em {PDF_PROCESS_WORKERS} processo(s)")
+                del pdf_reader
+                yield from iter_pdf_pages_parallel(file, total_pages, extractor, pool)
+                return
+            
+            if extractor == 'tables':
+                del pdf_reader
+                source.seek(0)
+                with pdfplumber.open(source) as pdf:
+                    for page in pdf.pages:
+                        yield extract_page_with_tables(page)
+                        page.close()
+                return
+            
+            for page in pdf_reader.pages:
+                yield page.extract_text() or ""
+    except Exception as e:
+        print(f"❌ Erro ao extrair PDF: {e}")
+        raise
+
+def split_text_chunks(text, max_chars):
+    """
+    Quebrar um texto maior que max_chars respeitando a estrutura: primeiro
+    nos blocos [TABELA] e parágrafos, depois por linha. Tabelas quebradas
+    repetem título e cabeçalho em cada pedaço.
+    """
+    if len(text) <= max_chars:
+        return [text]
+    
+    blocos = re.split(r'\n(?=\[TABELA )|\n\s*\n', text)
+    pedacos = []
+    
+    for bloco in blocos:
+        if len(bloco) <= max_chars:
+            pedacos.append(bloco)
+            continue
+        
+        linhas = bloco.splitlines()
+        prefixo = '\n'.join(linhas[:2]) + '\n' if bloco.startswith('[TABELA ') else ''
+        corpo = linhas[2:] if prefixo else linhas
+        atual = []
+        tamanho = len(prefixo)
+        
+        for linha in corpo:
+            while len(prefixo) + len(linha) > max_chars:
+                # Linha sozinha maior que o chunk: corte seco
+                corte = max(max_chars - len(prefixo), 1)
+                if atual:
+                    pedacos.append(prefixo + '\n'.join(atual))
+                    atual, tamanho = [], len(prefixo)
+                pedacos.append(prefixo + linha[:corte])
+                linha = linha[corte:]
+            if atual and tamanho + len(linha) + 1 > max_chars:
+                pedacos.append(prefixo + '\n'.join(atual))
+                atual, tamanho = [], len(prefixo)
+            atual.append(linha)
+            tamanho += len(linha) + 1
+        
+        if atual:
+            pedacos.append(prefixo + '\n'.join(atual))
+    
+    # Reagrupar blocos pequenos até o limite
+    chunks = []
+    for pedaco in pedacos:
+        if chunks and len(chunks[-1]) + len(pedaco) + 1 <= max_chars:
+            chunks[-1] += '\n' + pedaco
+        else:
+            chunks.append(pedaco)
+    return chunks
+
+def iter_pdf_page_groups(file, max_chars=None, extractor=None, report=None, pool=None):
+    """
+    Agrupar páginas consecutivas em blocos (chunks) de até max_chars caracteres.
+    
+    Documentos pequenos saem em um único grupo (mesmo prompt de antes);
+    relatórios grandes liberam o primeiro grupo sem esperar a última página.
+    Páginas maiores que o limite são quebradas em tabelas/parágrafos/linhas.
+    Com PAGE_FILTER_ENABLED, páginas sem conteúdo financeiro são descartadas
+    antes e o resumo do descarte é gravado em report (dict), se informado.
+    """
+    max_chars = max_chars or PDF_PAGE_GROUP_CHARS
+    grupo = []
+    tamanho = 0
+    
+    pages = iter_pdf_pages(file, extractor=extractor, pool=pool)
+    if PAGE_FILTER_ENABLED:
+        pages = iter_relevant_pages(pages, report)
+    
+    for page_text in pages:
+        for pedaco in split_text_chunks(page_text, max_chars):
+            if grupo and tamanho + len(pedaco) > max_chars:
+                yield "\n".join(grupo).strip()
+                grupo = []
+                tamanho = 0
+            grupo.append(pedaco)
+            tamanho += len(pedaco) + 1
+    
+    if grupo:
+        yield "\n".join(grupo).strip()
+
+def extract_pdf_text(file, extractor=None):
+    """Extrair texto de PDF (PyPDF2 ou pdfplumber com tabelas)"""
+    return "\n".join(iter_pdf_pages(file, extractor=extractor)).strip()
+
+# ================================
+# CLASSIFICADOR DE PÁGINAS (DESCARTE DE BOILERPLATE)
+# ================================
+
+RELEVANT_PAGE_KEYWORDS = (
+    'SALDO', 'APORTE', 'DESPESA', 'RECEITA', 'RENTABILIDADE', 'RENDIMENTO',
+    'REEMBOLSO', 'POSICAO FINANC', 'CONCILIA', 'TOTAL'
+)
+BOILERPLATE_PAGE_KEYWORDS = (
+    'ASSINATURA', 'ASSINADO', 'TESTEMUNHA', 'LEGENDA', 'DECLARAMOS', 'RESPONSAVEL TECNICO'
+)
+BR_VALUE_RE = re.compile(r'\d{1,3}(?:\.\d{3})*,\d{2}\b')
+
+TOKEN_PIECE_RE = re.compile(r'\d+|[^\W\d_]+|[^\w\s]')
+
+def estimate_tokens(text):
+    """
+    Estimativa de tokens sem tokenizer: palavras em português ~4 caracteres
+    por token, números ~3 dígitos por token, pontuação 1 token cada.
+    """
+    tokens = 0
+    for peca in TOKEN_PIECE_RE.findall(text or ''):
+        if peca[0].isdigit():
+            tokens += (len(peca) + 2) // 3
+        elif len(peca) > 1 or peca.isalpha():
+            tokens += (len(peca) + 3) // 4
+        else:
+            tokens += 1
+    return tokens
+
+def classify_page(text, vistas=None):
+    """
+    Decidir se uma página vai para o prompt.
+    
+    Mantém páginas com tabelas, valores monetários junto de termos
+    financeiros (saldos, aportes, despesas) ou a identificação da obra.
+    Descarta páginas vazias, de assinatura/legenda e repetições sem valores.
+    
+    Returns:
+        Tuple (relevante, motivo)
+    """
+    text_norm = normalize_layout_text(text).strip()
+    if not text_norm:
+        return False, 'vazia'
+    
+    valores = len(BR_VALUE_RE.findall(text_norm))
+    
+    if vistas is not None:
+        assinatura = hashlib.sha1(re.sub(r'[\d\s]+', '', text_norm).encode('utf-8')).hexdigest()
+        if assinatura in vistas and valores < 2:
+            return False, 'repetida'
+        vistas.add(assinatura)
+    
+    if '[TABELA ' in text_norm:
+        return True, 'tabela'
+    if valores >= 3:
+        return True, 'valores'
+    if valores >= 1 and any(k in text_norm for k in RELEVANT_PAGE_KEYWORDS):
+        return True, 'termos financeiros'
+    if parse_codigos_obra(text_norm):
+        return True, 'identificação da obra'
+    if any(k in text_norm for k in BOILERPLATE_PAGE_KEYWORDS):
+        return False, 'assinatura/legenda'
+    
+    digitos = sum(c.isdigit() for c in text_norm)
+    if digitos / len(text_norm) > 0.05:
+        return True, 'densidade numérica'
+    return False, 'sem dados financeiros'
+
+def iter_relevant_pages(pages, report=None):
+    """
+    Filtrar páginas irrelevantes antes do prompt, contando o que foi descartado.
+    
+    Se nenhuma página passar, a primeira é mantida para não perder o documento.
+    """
+    report = report if report is not None else {}
+    report.update({'paginas_total': 0, 'paginas_descartadas': 0, 'tokens_descartados': 0, 'motivos': {}})
+    vistas = set()
+    primeira_descartada = None
+    mantidas = 0
+    
+    for page_text in pages:
+        report['paginas_total'] += 1
+        relevante, motivo = classify_page(page_text, vistas)
+        
+        if relevante:
+            mantidas += 1
+            yield page_text
+            continue
+        
+        report['paginas_descartadas'] += 1
+        report['tokens_descartados'] += estimate_tokens(page_text)
+        report['motivos'][motivo] = report['motivos'].get(motivo, 0) + 1
+        if primeira_descartada is None:
+            primeira_descartada = page_text
+    
+    if not mantidas and primeira_descartada:
+        report['paginas_descartadas'] -= 1
+        report['tokens_descartados'] -= estimate_tokens(primeira_descartada)
+        yield primeira_descartada
+    
+    if report['paginas_descartadas']:
+        print(f"✂️ Páginas descartadas: {report['paginas_descartadas']}/{report['paginas_total']} "
+              f"(~{report['tokens_descartados']} tokens) {report['motivos']}")
+
+def analyze_pdf_stream(page_groups, document_type='relatório', model='gpt-4o', max_workers=None):
+    """
+    Consumir grupos de páginas conforme são extraídos e analisar cada um com OpenAI.
+    
+    Mantém no máximo max_workers análises em andamento (memória limitada) e
+    entrega os resultados na ordem das páginas. Grupos sem texto são ignorados.
+    Com OPENAI_ASYNC_ENABLED as chamadas vão para o loop assíncrono e a janela
+    padrão sobe para OPENAI_MAX_CONCURRENCY (sem uma thread por chamada).
+    """
+    max_workers = max_workers or (OPENAI_MAX_CONCURRENCY if OPENAI_ASYNC_ENABLED else ANALYSIS_STREAM_WORKERS)
+    cabecalho = None
+    
+    with analysis_submitter(model, document_type, max_workers) as submit:
+        pending = deque()
+        
+        for parte, group_text in enumerate(page_groups, start=1):
+            if not group_text or len(group_text) < 10:
+                continue
+            
+            # Chunks de continuação recebem o cabeçalho do documento (competência, obra)
+            if cabecalho is None:
+                cabecalho = document_header(group_text)
+            else:
+                group_text = continuation_text(parte, cabecalho, group_text)
+            
+            # Limitar análises em voo antes de extrair mais páginas
+            while len(pending) >= max_workers:
+                yield pending.popleft().result()
+            
+            print(f"📄 Chunk {parte} pronto ({len(group_text)} caracteres) - enviando para {model}")
+            pending.append(submit(group_text))
+        
+        while pending:
+            yield pending.popleft().result()
+
+@contextmanager
+def analysis_submitter(model, document_type, max_workers):
+    """
+    Função submit(texto) -> Future para analisar textos com OpenAI: no loop
+    assíncrono compartilhado (OPENAI_ASYNC_ENABLED) ou em threads próprias.
+    Com a cascata de modelos ligada, cada texto passa por analyze_chunk_cascade.
+    """
+    rota = cascade_route(model)
+    
+    if OPENAI_ASYNC_ENABLED:
+        engine = get_async_engine()
+        if len(rota) > 1:
+            yield lambda texto: engine.submit(analyze_chunk_cascade_async(texto, document_type, rota))
+        else:
+            yield lambda texto: engine.submit(analyze_with_openai_async(texto, document_type, model))
+        return
+    
+    funcao, alvo = (analyze_chunk_cascade, rota) if len(rota) > 1 else (analyze_with_openai, model)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        yield lambda texto: executor.submit(
+            contextvars.copy_context().run, funcao, texto, document_type, alvo
+        )
+
+def completed_future(result):
+    """Future já resolvido (resultado obtido sem chamar a OpenAI)"""
+    future = Future()
+    future.set_result(result)
+    return future
+
+def document_header(text, max_linhas=6, max_chars=500):
+    """
+    Primeiras linhas não vazias do documento (título, obra, competência).
+    Linhas com valores ficam de fora: repetidas no contexto, virariam despesas em dobro.
+    """
+    linhas = [l.strip() for l in text[:20000].splitlines() if l.strip() and not VALUE_LINE_RE.search(l)][:max_linhas]
+    return '\n'.join(linhas)[:max_chars]
+
+def continuation_text(parte, cabecalho, group_text):
+    """Chunk de continuação com o cabeçalho da primeira parte como contexto"""
+    return (
+        f"[PARTE {parte} DO DOCUMENTO - cabeçalho da primeira parte:]\n{cabecalho}\n"
+        f"[CONTINUAÇÃO:]\n{group_text}"
+    )
+
+def get_chunk_size(api_key='default'):
+    """chunk_size (tokens) salvo em /api/settings para a API Key, ou o padrão"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT chunk_size FROM configuracoes WHERE api_key = ?', (api_key,))
+            row = cursor.fetchone()
+        if row and row[0]:
+            return int(row[0])
+    except Exception as e:
+        print(f"⚠️ Erro ao ler chunk_size: {e}")
+    return DEFAULT_CHUNK_SIZE
+
+def primeira_obra(analysis):
+    """Retornar o primeiro objeto de obra de uma análise (lista ou dict)"""
+    if isinstance(analysis, list):
+        return analysis[0] if analysis else {}
+    return analysis or {}
+
+QUALIDADE_ORDEM = ('❌', '⚠️', '✅')
+
+def is_informado(valor):
+    return valor not in (None, '', 'não_informado')
+
+def merge_partial_analyses(analyses):
+    """
+    Juntar análises parciais (uma por chunk/grupo de páginas) em uma única análise.
+    
+    Com um único chunk o resultado é devolvido sem alterações. Com vários, a
+    junção é determinística, na ordem dos chunks:
+    - obras com mesmo código são unidas; itens sem código (chunks de
+      continuação) vão para a última obra identificada
+    - listas de despesas e receitas são concatenadas e os totais recalculados
+      a partir delas (ou somados, se o chunk não listou itens)
+    - saldo inicial = primeiro informado, saldo final = último informado
+    - aportes_pool do primeiro chunk que trouxer o pool, com a parte desta
+      obra recalculada sobre o total de despesas unido
+    - alertas e observações sem repetição; qualidade = pior dos chunks
+    """
+    if len(analyses) == 1:
+        return analyses[0]
+    
+    items = []
+    for analysis in analyses:
+        items.extend(analysis if isinstance(analysis, list) else [analysis])
+    items = [coerce_analysis_numbers(item) for item in items if isinstance(item, dict)]
+    
+    obras = {}
+    sem_codigo = []
+    ultima = None
+    
+    for item in items:
+        codigo = item.get('codigo_obra')
+        if is_informado(codigo):
+            if codigo not in obras:
+                # Partes sem código vistas antes da primeira obra pertencem a ela
+                obras[codigo] = sem_codigo
+                sem_codigo = []
+            ultima = codigo
+        elif ultima is None:
+            sem_codigo.append(item)
+            continue
+        obras[ultima].append(item)
+    
+    if not obras:
+        return [merge_obra_parts(sem_codigo)] if sem_codigo else []
+    
+    return [merge_obra_parts(partes) for partes in obras.values()]
+
+def merge_obra_parts(partes):
+    """Unir as partes de uma mesma obra (ver merge_partial_analyses)"""
+    obra = {}
+    for parte in partes:
+        for campo, valor in parte.items():
+            if not is_informado(obra.get(campo)) and is_informado(valor):
+                obra[campo] = valor
+    
+    for campo in ('despesas', 'receitas', 'movimentos'):
+        lista = [x for parte in partes for x in (parte.get(campo) or [])]
+        if lista or campo in obra:
+            obra[campo] = lista
+    
+    for campo, lista in (('despesas_total', 'despesas'), ('receitas_total', 'receitas')):
+        com_itens = [p for p in partes if p.get(lista)]
+        sem_itens = [p for p in partes if not p.get(lista) and isinstance(p.get(campo), (int, float))]
+        if com_itens or sem_itens:
+            total = sum(x.get('valor', 0) for p in com_itens for x in p[lista] if isinstance(x.get('valor'), (int, float)))
+            total += sum(p[campo] for p in sem_itens)
+            obra[campo] = round(total, 2)
+    
+    saldos_iniciais = [p['saldo_inicial'] for p in partes if isinstance(p.get('saldo_inicial'), (int, float))]
+    saldos_finais = [p['saldo_final'] for p in partes if isinstance(p.get('saldo_final'), (int, float))]
+    if saldos_iniciais:
+        obra['saldo_inicial'] = saldos_iniciais[0]
+    if saldos_finais:
+        obra['saldo_final'] = saldos_finais[-1]
+    
+    pools = [p['aportes_pool'] for p in partes if isinstance(p.get('aportes_pool'), dict)]
+    pool = next((dict(x) for x in pools if x.get('valor_total_pool')), dict(pools[0]) if pools else None)
+    if pool is not None:
+        despesas_obra = obra.get('despesas_total', pool.get('despesas_esta_obra'))
+        pool['despesas_esta_obra'] = despesas_obra
+        todas = pool.get('despesas_todas_obras')
+        if isinstance(todas, (int, float)) and todas and isinstance(despesas_obra, (int, float)):
+            pool['taxa_rateio_percentual'] = despesas_obra / todas
+            if isinstance(pool.get('valor_total_pool'), (int, float)):
+                pool['valor_rateado_esta_obra'] = round(pool['valor_total_pool'] * despesas_obra / todas, 2)
+        obra['aportes_pool'] = pool
+    
+    alertas = []
+    for parte in partes:
+        for alerta in (parte.get('validacoes') or {}).get('alertas') or []:
+            if alerta not in alertas:
+                alertas.append(alerta)
+    if alertas or 'validacoes' in obra:
+        obra['validacoes'] = dict(obra.get('validacoes') or {}, alertas=alertas)
+    
+    observacoes = []
+    for parte in partes:
+        if is_informado(parte.get('observacoes')) and parte['observacoes'] not in observacoes:
+            observacoes.append(parte['observacoes'])
+    if observacoes:
+        obra['observacoes'] = ' | '.join(observacoes)
+    
+    qualidades = [str(p.get('qualidade_extracao', '')) for p in partes if p.get('qualidade_extracao')]
+    for marca in QUALIDADE_ORDEM:
+        pior = next((q for q in qualidades if q.startswith(marca)), None)
+        if pior:
+            obra['qualidade_extracao'] = pior
+            break
+    
+    return obra
+
+# ================================
+# CACHE DE EXTRAÇÃO E ANÁLISE (SHA-256 DO PDF)
+# ================================
+
+class AnalysisCache:
+    """
+    Cache endereçado por conteúdo guardado no SQLite (tabela cache_analises).
+    
+    Guarda o texto extraído (chave: SHA-256 do PDF) e o JSON da análise
+    (chave: SHA-256 + modelo + versão do prompt). Quando o total passa de
+    max_bytes, as entradas acessadas há mais tempo são removidas (LRU).
+    """
+    
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0}
+    
+    def _count(self, campo, n=1):
+        with self._lock:
+            self.stats[campo] += n
+    
+    def get(self, chave):
+        """Retornar o valor salvo (ou None) e atualizar o último acesso"""
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT tipo, valor FROM cache_analises WHERE chave = ?', (chave,))
+            row = cursor.fetchone()
+            
+            if not row:
+                self._count('misses')
+                return None
+            
+            cursor.execute(
+                'UPDATE cache_analises SET ultimo_acesso = ? WHERE chave = ?',
+                (time.time(), chave)
+            )
+            conn.commit()
+        
+        self._count('hits')
+        return json.loads(row['valor']) if row['tipo'] == 'analise' else row['valor']
+    
+    def set(self, chave, valor, tipo='analise'):
+        """Salvar valor e aplicar o limite de tamanho"""
+        conteudo = json.dumps(valor, ensure_ascii=False) if tipo == 'analise' else valor
+        tamanho = len(conteudo.encode('utf-8'))
+        
+        if tamanho > self.max_bytes:
+            return False
+        
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT OR REPLACE INTO cache_analises (chave, tipo, valor, tamanho_bytes, ultimo_acesso)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (chave, tipo, conteudo, tamanho, time.time()))
+            conn.commit()
+            self._count('writes')
+            self._evict(conn)
+        
+        return True
+    
+    def _evict(self, conn):
+        """Remover as entradas menos usadas até caber em max_bytes"""
+        cursor = conn.cursor()
+        cursor.execute('SELECT COALESCE(SUM(tamanho_bytes), 0) FROM cache_analises')
+        excesso = cursor.fetchone()[0] - self.max_bytes
+        
+        if excesso <= 0:
+            return
+        
+        cursor.execute('SELECT chave, tamanho_bytes FROM cache_analises ORDER BY ultimo_acesso ASC')
+        remover = []
+        for row in cursor.fetchall():
+            if excesso <= 0:
+                break
+            remover.append((row[0],))
+            excesso -= row[1]
+        
+        cursor.executemany('DELETE FROM cache_analises WHERE chave = ?', remover)
+        conn.commit()
+        self._count('evictions', len(remover))
+        print(f"🧹 Cache: {len(remover)} entrada(s) removida(s) por LRU")
+    
+    def clear(self):
+        with get_db_connection() as conn:
+            conn.execute('DELETE FROM cache_analises')
+            conn.commit()
+    
+    def info(self):
+        """Contadores de hit/miss e ocupação atual"""
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT COUNT(*), COALESCE(SUM(tamanho_bytes), 0) FROM cache_analises')
+            entradas, tamanho = cursor.fetchone()
+        
+        with self._lock:
+            stats = dict(self.stats)
+        
+        consultas = stats['hits'] + stats['misses']
+        stats.update({
+            'enabled': ANALYSIS_CACHE_ENABLED,
+            'entries': entradas,
+            'size_bytes': tamanho,
+            'max_bytes': self.max_bytes,
+            'hit_rate': round(stats['hits'] / consultas, 3) if consultas else 0.0,
+            'prompt_version': ANALYSIS_PROMPT_VERSION
+        })
+        return stats
+
+analysis_cache = AnalysisCache(ANALYSIS_CACHE_MAX_BYTES)
+
+class ChatResponseCache:
+    """
+    Cache em memória das respostas do /api/chat, com TTL e limite em bytes.
+    
+    A chave é o SHA-256 de (modelo, mensagens normalizadas, max_tokens): o
+    mesmo documento reenviado pelo frontend volta sem chamar a OpenAI.
+    Acima de max_bytes saem as entradas usadas há mais tempo (LRU).
+    """
+    
+    def __init__(self, ttl, max_bytes):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # chave -> (criado_em, tamanho, payload)
+        self._size = 0
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0, 'expired': 0}
+    
+    @staticmethod
+    def key(model, messages, max_tokens):
+        """Chave independente de espaços nas pontas, quebras de linha CRLF e ordem dos campos"""
+        normalizadas = [
+            {
+                'role': str(msg.get('role', 'user')),
+                'content': '\n'.join(
+                    linha.rstrip() for linha in str(msg.get('content', '')).replace('\r\n', '\n').strip().split('\n')
+                )
+            }
+            for msg in messages
+        ]
+        bruto = json.dumps([model, normalizadas, max_tokens], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(bruto.encode('utf-8')).hexdigest()
+    
+    def get(self, chave):
+        """(payload, idade_em_segundos) ou None"""
+        with self._lock:
+            entrada = self._entries.get(chave)
+            if entrada is None:
+                self.stats['misses'] += 1
+                return None
+            
+            criado_em, tamanho, payload = entrada
+            idade = time.time() - criado_em
+            if idade > self.ttl:
+                self._remove(chave)
+                self.stats['expired'] += 1
+                self.stats['misses'] += 1
+                return None
+            
+            self._entries.move_to_end(chave)
+            self.stats['hits'] += 1
+            return payload, idade
+    
+    def set(self, chave, payload):
+        tamanho = len(json.dumps(payload, ensure_ascii=False).encode('utf-8'))
+        if tamanho > self.max_bytes:
+            return False
+        
+        with self._lock:
+            if chave in self._entries:
+                self._remove(chave)
+            self._entries[chave] = (time.time(), tamanho, payload)
+            self._size += tamanho
+            self.stats['writes'] += 1
+            
+            while self._size > self.max_bytes:
+                antiga = next(iter(self._entries))
+                self._remove(antiga)
+                self.stats['evictions'] += 1
+        return True
+    
+    def _remove(self, chave):
+        _, tamanho, _ = self._entries.pop(chave)
+        self._size -= tamanho
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+    
+    def info(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats.update({
+                'enabled': CHAT_CACHE_ENABLED,
+                'entries': len(self._entries),
+                'size_bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl
+            })
+        consultas = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / consultas, 3) if consultas else 0.0
+        return stats
+
+chat_cache = ChatResponseCache(CHAT_CACHE_TTL, CHAT_CACHE_MAX_BYTES)
+
+def hash_pdf_file(file):
+    """SHA-256 dos bytes do PDF (lido em blocos, sem carregar tudo)"""
+    sha = hashlib.sha256()
+    path = file if isinstance(file, (str, os.PathLike)) else upload_path(file)
+    
+    if path:
+        with open(path, 'rb') as f:
+            for bloco in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(bloco)
+        return sha.hexdigest()
+    
+    file.seek(0)
+    for bloco in iter(lambda: file.read(1024 * 1024), b''):
+        sha.update(bloco)
+    file.seek(0)
+    return sha.hexdigest()
+
+def analysis_cache_key(pdf_hash, model, extractor, max_chars):
+    """Chave da análise: conteúdo do PDF + extrator + chunk + modelo + versão do prompt"""
+    return f"analise:{pdf_hash}:{extractor}:{max_chars}:{model}:{ANALYSIS_PROMPT_VERSION}"
+
+def cascade_cache_key(pdf_hash, model, extractor, max_chars):
+    """Chave da análise feita pela cascata de modelos a partir de model"""
+    return analysis_cache_key(pdf_hash, '>'.join(cascade_route(model)), extractor, max_chars)
+
+def cached_page_groups(file, pdf_hash, extractor, report=None, max_chars=None, pool=None):
+    """
+    Grupos de páginas vindos do cache de texto, ou extraídos e salvos no cache.
+    
+    Os grupos são guardados como lista JSON (nenhum caractere do texto
+    extraído serve de separador) e só se o texto, em bytes UTF-8, couber em
+    ANALYSIS_CACHE_MAX_TEXT_BYTES.
+    """
+    filtro = 'filtrado' if PAGE_FILTER_ENABLED else 'completo'
+    chave_texto = f"paginas:{pdf_hash}:{extractor}:{filtro}:{max_chars or PDF_PAGE_GROUP_CHARS}"
+    texto = analysis_cache.get(chave_texto)
+    
+    if texto is not None:
+        grupos = json.loads(texto)
+        print(f"⚡ Cache: texto extraído reaproveitado ({len(grupos)} grupo(s), {len(texto)} caracteres)")
+        if report is not None:
+            report['cache'] = True
+        yield from grupos
+        return
+    
+    grupos = []
+    tamanho = 0
+    for grupo in iter_pdf_page_groups(file, max_chars=max_chars, extractor=extractor, report=report, pool=pool):
+        if grupos is not None:
+            tamanho += len(grupo.encode('utf-8'))
+            grupos = grupos if tamanho <= ANALYSIS_CACHE_MAX_TEXT_BYTES else None
+            if grupos is not None:
+                grupos.append(grupo)
+        yield grupo
+    
+    if grupos:
+        analysis_cache.set(chave_texto, json.dumps(grupos, ensure_ascii=False), tipo='texto')
+
+def analyze_page_groups(page_groups, model, document_type='relatório financeiro'):
+    """
+    Analisar os grupos de páginas de um documento.
+    
+    O primeiro grupo é usado para identificar o layout: se for conhecido, o
+    documento é extraído por regras e o LLM só é chamado se a validação falhar.
+    Layouts desconhecidos seguem em streaming para a OpenAI.
+    
+    A memória acompanha o grupo, não o documento: relatórios consolidados
+    são divididos por obra conforme os grupos chegam e o fast path de layout
+    junta no máximo LAYOUT_FAST_PATH_MAX_CHARS - acima disso o documento
+    segue em streaming para a OpenAI.
+    """
+    page_groups = iter(page_groups)
+    primeiro = next((g for g in page_groups if g and len(g) >= 10), None)
+    
+    if primeiro is None:
+        return None
+    
+    # Relatório consolidado ("562 601 603 e 604"): separar por obra antes do LLM
+    codigos = obra_title_codes(normalize_layout_text(primeiro)) if OBRA_SPLIT_ENABLED else []
+    if len(codigos) >= 2:
+        analysis, page_groups = analyze_obra_sections_stream(
+            codigos, itertools.chain([primeiro], page_groups), model, document_type
+        )
+        if page_groups is None:
+            return analysis
+        primeiro = next(page_groups)
+    
+    layout = match_layout(fingerprint_document(primeiro)) if LAYOUT_FAST_PATH_ENABLED else None
+    
+    if layout:
+        grupos = [primeiro]
+        tamanho = len(primeiro)
+        for grupo in page_groups:
+            grupos.append(grupo)
+            tamanho += len(grupo)
+            if tamanho > LAYOUT_FAST_PATH_MAX_CHARS:
+                print(f"↪️ Layout {layout['nome']}: documento acima de {LAYOUT_FAST_PATH_MAX_CHARS} caracteres "
+                      f"- segue em streaming para a OpenAI")
+                break
+        else:
+            analysis = run_layout_fast_path(layout, '\n'.join(grupos))
+            if analysis is not None:
+                return analysis
+        page_groups = itertools.chain(grupos, page_groups)
+    else:
+        page_groups = itertools.chain([primeiro], page_groups)
+    
+    analyses = list(analyze_pdf_stream(page_groups, document_type=document_type, model=model))
+    return merge_partial_analyses(analyses) if analyses else None
+
+# ================================
+# CASCATA DE MODELOS (RÁPIDO → FORTE)
+# ================================
+
+# Modelo mais barato/rápido tentado antes do pedido
+CASCADE_FAST_MODELS = {
+    'gpt-5': 'gpt-5-mini',
+    'gpt-4o': 'gpt-4o-mini',
+}
+
+cascade_stats = {}
+_cascade_stats_lock = threading.Lock()
+
+def cascade_route(model):
+    """Modelos na ordem em que serão tentados (só o pedido, sem cascata)"""
+    if not MODEL_CASCADE_ENABLED:
+        return [model]
+    rapido = MODEL_CASCADE_FAST_MODEL or CASCADE_FAST_MODELS.get(model)
+    if not rapido or rapido == model:
+        return [model]
+    return [rapido, model]
+
+def check_saldo_identity(obra):
+    """
+    saldo_final ≈ saldo_inicial + receitas − despesas (±SALDO_IDENTITY_TOLERANCE).
+    
+    Returns:
+        (True/False, diferença) ou (None, None) se algum valor não foi informado
+    """
+    valores = [obra.get(c) for c in ('saldo_inicial', 'receitas_total', 'despesas_total', 'saldo_final')]
+    if not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in valores):
+        return None, None
+    
+    saldo_inicial, receitas, despesas, saldo_final = valores
+    diferenca = round(saldo_final - (saldo_inicial + receitas - abs(despesas)), 2)
+    return abs(diferenca) <= SALDO_IDENTITY_TOLERANCE, diferenca
+
+def validate_analysis_result(analysis):
+    """
+    Conferir a análise de um chunk antes de aceitá-la na cascata, em cada
+    obra extraída pelo LLM (obras de layout conhecido já foram validadas
+    pelas regras).
+    
+    Um chunk de continuação não traz o documento inteiro, então só reprova o
+    que veio errado: aportes_pool preenchido pela metade ou com rateio
+    inconsistente e saldo que não fecha quando os quatro valores vieram.
+    Campo ausente não reprova.
+    
+    Returns:
+        (ok, motivos)
+    """
+    obras = analysis if isinstance(analysis, list) else [analysis]
+    motivos = []
+    
+    if not obras:
+        return False, ['nenhuma obra extraída']
+    
+    for obra in obras:
+        if not isinstance(obra, dict):
+            motivos.append('obra em formato inválido')
+            continue
+        if str(obra.get('metodo_extracao', '')).startswith('layout:'):
+            continue
+        
+        codigo = obra.get('codigo_obra', '?')
+        pool = obra.get('aportes_pool')
+        # Cópia: os alertas da validação só valem para a análise aceita
+        if isinstance(pool, dict) and any(v is not None for v in pool.values()):
+            if not validate_aportes_pool(copy.deepcopy(obra)):
+                motivos.append(f"obra {codigo}: aportes_pool incompleto/inconsistente")
+        
+        ok, diferenca = check_saldo_identity(obra)
+        if ok is False:
+            motivos.append(f"obra {codigo}: saldo não fecha (diferença {diferenca:.2f})")
+    
+    return not motivos, motivos
+
+class UsageMeter:
+    """Tokens gastos por uma análise (somados por record_openai_usage no contexto atual)"""
+    
+    def __init__(self):
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.calls = 0
+        self._lock = threading.Lock()
+    
+    def add(self, resumo):
+        with self._lock:
+            self.calls += 1
+            self.input_tokens += resumo['input_tokens']
+            self.output_tokens += resumo['output_tokens']
+
+openai_usage_meter = contextvars.ContextVar('openai_usage_meter', default=None)
+
+def count_cascade_stat(rota, modelo, aceito, segundos, meter, escalou, novo_chunk):
+    with _cascade_stats_lock:
+        stats = cascade_stats.setdefault(rota, {'documents': 0, 'chunks': 0, 'escalations': 0, 'tiers': {}})
+        stats['chunks'] += novo_chunk
+        tier = stats['tiers'].setdefault(modelo, {
+            'runs': 0, 'accepted': 0, 'rejected': 0, 'latency_total': 0.0,
+            'input_tokens': 0, 'output_tokens': 0, 'openai_calls': 0
+        })
+        tier['runs'] += 1
+        tier['accepted' if aceito else 'rejected'] += 1
+        tier['latency_total'] += segundos
+        tier['input_tokens'] += meter.input_tokens
+        tier['output_tokens'] += meter.output_tokens
+        tier['openai_calls'] += meter.calls
+        if escalou:
+            stats['escalations'] += 1
+
+def cascade_info():
+    """Estatísticas por rota: taxa de escalonamento (por chunk) e latência/tokens médios por modelo"""
+    with _cascade_stats_lock:
+        stats = copy.deepcopy(cascade_stats)
+    
+    for rota in stats.values():
+        rota['escalation_rate'] = round(rota['escalations'] / rota['chunks'], 3) if rota['chunks'] else 0.0
+        for tier in rota['tiers'].values():
+            runs = tier['runs'] or 1
+            tier['avg_latency'] = round(tier['latency_total'] / runs, 2)
+            tier['avg_input_tokens'] = round(tier['input_tokens'] / runs)
+            tier['avg_output_tokens'] = round(tier['output_tokens'] / runs)
+            tier['latency_total'] = round(tier['latency_total'], 2)
+    return stats
+
+def cascade_accept(chave_rota, nivel, rota, analysis, inicio, meter):
+    """Validar o resultado de um nível da cascata para um chunk e registrar; True = aceito"""
+    modelo = rota[nivel]
+    ultimo = nivel == len(rota) - 1
+    ok, motivos = validate_analysis_result(analysis) if analysis is not None else (False, ['sem resultado'])
+    count_cascade_stat(chave_rota, modelo, ok or ultimo, time.time() - inicio, meter, not ok and not ultimo, nivel == 0)
+    
+    if ok or ultimo:
+        for obra in (analysis if isinstance(analysis, list) else [analysis]):
+            if isinstance(obra, dict):
+                obra.setdefault('metodo_extracao', f"llm:{modelo}")
+        if not ok:
+            print(f"🪜 Cascata {chave_rota}: aceito {modelo} (último nível, validação falhou: {'; '.join(motivos)})")
+        return True
+    
+    print(f"🪜 Cascata {chave_rota}: {modelo} reprovado no chunk ({'; '.join(motivos)}) - escalando")
+    return False
+
+def analyze_chunk_cascade(texto, document_type, rota):
+    """
+    Um chunk pela cascata: o modelo rápido primeiro e, se validate_analysis_result
+    reprovar, o mesmo chunk (só ele) vai para o próximo modelo. A resposta do
+    último modelo é sempre aceita.
+    """
+    chave_rota = '>'.join(rota)
+    for nivel, modelo in enumerate(rota):
+        meter = UsageMeter()
+        token = openai_usage_meter.set(meter)
+        inicio = time.time()
+        try:
+            analysis = analyze_with_openai(texto, document_type, modelo)
+        except Exception as e:
+            if nivel == len(rota) - 1:
+                raise
+            print(f"⚠️ Cascata: {modelo} falhou ({e}) - escalando")
+            analysis = None
+        finally:
+            openai_usage_meter.reset(token)
+        
+        if cascade_accept(chave_rota, nivel, rota, analysis, inicio, meter):
+            return analysis
+
+async def analyze_chunk_cascade_async(texto, document_type, rota):
+    """analyze_chunk_cascade no motor assíncrono"""
+    chave_rota = '>'.join(rota)
+    for nivel, modelo in enumerate(rota):
+        # A tarefa tem o próprio contexto: o medidor vale só para este chunk
+        meter = UsageMeter()
+        openai_usage_meter.set(meter)
+        inicio = time.time()
+        try:
+            analysis = await analyze_with_openai_async(texto, document_type, modelo)
+        except Exception as e:
+            if nivel == len(rota) - 1:
+                raise
+            print(f"⚠️ Cascata: {modelo} falhou ({e}) - escalando")
+            analysis = None
+        
+        if cascade_accept(chave_rota, nivel, rota, analysis, inicio, meter):
+            return analysis
+
+def analyze_with_cascade(page_groups, model, document_type='relatório financeiro'):
+    """
+    analyze_page_groups com a cascata de modelos. A cascata roda por chunk
+    (analysis_submitter → analyze_chunk_cascade): só os chunks reprovados
+    são reenviados ao modelo pedido, e o documento segue em streaming, sem
+    guardar o texto inteiro para uma segunda rodada.
+    """
+    rota = cascade_route(model)
+    if len(rota) > 1:
+        with _cascade_stats_lock:
+            cascade_stats.setdefault(
+                '>'.join(rota), {'documents': 0, 'chunks': 0, 'escalations': 0, 'tiers': {}}
+            )['documents'] += 1
+    return analyze_page_groups(page_groups, model, document_type)
+
+# ================================
+# RELATÓRIOS COM VÁRIAS OBRAS
+# ================================
+
+def split_obra_sections(text):
+    """
+    Separar um relatório consolidado em uma seção por obra.
+    
+    Os códigos vêm do título ("OBRAS 562 601 603 E 604"); uma seção começa
+    em cada linha que abre com um desses códigos ("OBRA 601 - ...",
+    "603 - Shopping"). O texto antes da primeira seção (cabeçalho, aportes
+    do pool, totais consolidados) é repetido como contexto de todas.
+    
+    Returns:
+        Dict {'codigos', 'preambulo', 'secoes': [(codigo, texto)]} ou None
+        se não houver pelo menos duas seções distintas
+    """
+    codigos = obra_title_codes(normalize_layout_text(text))
+    if len(codigos) < 2:
+        return None
+    
+    inicio_secao = obra_section_start_re(codigos)
+    
+    preambulo = []
+    trechos = []
+    for linha in text.splitlines():
+        match = inicio_secao.match(normalize_layout_text(linha))
+        if match and (not trechos or trechos[-1][0] != match.group(1)):
+            trechos.append((match.group(1), [linha]))
+        elif trechos:
+            trechos[-1][1].append(linha)
+        else:
+            preambulo.append(linha)
+    
+    # Trechos de uma linha só são linhas de quadro-resumo ("603 - Shopping 7.319.079,56"):
+    # ficam no preâmbulo. Trechos repetidos da mesma obra são unidos.
+    secoes = {}
+    for codigo, linhas in trechos:
+        if len(linhas) == 1:
+            preambulo.extend(linhas)
+        else:
+            secoes.setdefault(codigo, []).extend(linhas)
+    
+    if len(secoes) < 2:
+        return None
+    
+    return {
+        'codigos': codigos,
+        'preambulo': '\n'.join(preambulo).strip(),
+        'secoes': [(codigo, '\n'.join(linhas).strip()) for codigo, linhas in secoes.items()]
+    }
+
+def obra_title_codes(text_norm):
+    """Códigos do título mais longo ('OBRAS 562 601 603 E 604' → ['562', '601', '603', '604'])"""
+    titulos = [re.findall(r'\d{3}|BCO', m.group(1)) for m in CODIGOS_OBRA_RE.finditer(text_norm)]
+    return max(titulos, key=len, default=[])
+
+def obra_section_start_re(codigos):
+    """Linha que abre a seção de uma das obras ('OBRA 601 - ...', '603 - Shopping')"""
+    return re.compile(
+        r'^\s*(?:OBRA\s*(?:N\.?\s*[O°º]?\.?\s*)?[:\-]?\s*)?(' + '|'.join(codigos) + r')\b\s*(?:[-–:]|$)'
+    )
+
+class ObraSectionStream:
+    """
+    Versão em streaming de split_obra_sections: os grupos de páginas entram
+    por feed() e saem os trechos (codigo, texto) já fechados, para a análise
+    começar sem o documento inteiro em memória.
+    
+    Um trecho fecha quando começa a seção de outra obra ou quando passa de
+    max_chars (o restante segue como outro trecho da mesma obra; as partes
+    são unidas pelo código em merge_partial_analyses). Linhas antes da
+    primeira seção e trechos de uma linha (quadro-resumo) formam o
+    preâmbulo, repetido como contexto, até max_chars.
+    
+    Nada sai antes de começar a seção de uma segunda obra: até lá os grupos
+    ficam em original. Se isso não acontecer (confirmado False no fim) ou o
+    texto retido passar de max_chars (excedido), quem chama analisa original
+    e o restante como um documento simples.
+    """
+    
+    def __init__(self, codigos, max_chars):
+        self.codigos = codigos
+        self.max_chars = max_chars
+        self.inicio_secao = obra_section_start_re(codigos)
+        self.preambulo = []
+        self.tamanho_preambulo = 0
+        self.atual = None  # [codigo, linhas, tamanho, continuação]
+        self.retidos = []
+        self.original = []
+        self.tamanho_original = 0
+        self.confirmado = False
+        self.excedido = False
+    
+    def contexto(self):
+        """Formato de split_obra_sections para section_fast_path / section_prompt_text"""
+        return {'codigos': self.codigos, 'preambulo': '\n'.join(self.preambulo).strip()}
+    
+    def feed(self, grupo):
+        if not self.confirmado:
+            self.original.append(grupo)
+            self.tamanho_original += len(grupo)
+        
+        fechados = []
+        for linha in grupo.splitlines():
+            fechados.extend(self._linha(linha))
+        self.excedido = not self.confirmado and self.tamanho_original > self.max_chars
+        return fechados
+    
+    def finish(self):
+        return self._fechar() if self.confirmado else []
+    
+    def _linha(self, linha):
+        match = self.inicio_secao.match(normalize_layout_text(linha))
+        if match and (self.atual is None or self.atual[0] != match.group(1)):
+            fechados = self._fechar()
+            self.atual = [match.group(1), [linha], len(linha), False]
+            return fechados
+        
+        if self.atual is None:
+            self._preambulo(linha)
+            return []
+        
+        codigo, linhas = self.atual[0], self.atual[1]
+        linhas.append(linha)
+        self.atual[2] += len(linha) + 1
+        if not self.confirmado and len(linhas) == 2 and any(c != codigo for c, _ in self.retidos):
+            # Seção de uma segunda obra: daqui em diante os trechos saem conforme fecham
+            self.confirmado = True
+            self.original = []
+            fechados, self.retidos = self.retidos, []
+            return fechados
+        if self.confirmado and self.atual[2] > self.max_chars:
+            fechados = self._fechar()
+            self.atual = [codigo, [], 0, True]
+            return fechados
+        return []
+    
+    def _fechar(self):
+        if self.atual is None:
+            return []
+        codigo, linhas, _, continuacao = self.atual
+        self.atual = None
+        if len(linhas) == 1 and not continuacao:
+            self._preambulo(linhas[0])
+            return []
+        
+        trecho = (codigo, '\n'.join(linhas).strip())
+        if not trecho[1]:
+            return []
+        if self.confirmado:
+            return [trecho]
+        self.retidos.append(trecho)
+        return []
+    
+    def _preambulo(self, linha):
+        if self.tamanho_preambulo < self.max_chars:
+            self.preambulo.append(linha)
+            self.tamanho_preambulo += len(linha) + 1
+
+def analyze_obra_sections_stream(codigos, page_groups, model, document_type='relatório financeiro'):
+    """
+    Relatório consolidado em streaming (ObraSectionStream): cada trecho de
+    obra vai para o fast path de layout ou para a OpenAI assim que fecha, com
+    no máximo OBRA_SECTION_WORKERS análises em voo.
+    
+    Returns:
+        (análise, None) ou (None, grupos) quando o documento não tem seções
+        de duas obras (ou passou de OBRA_SECTION_MAX_CHARS antes delas): grupos
+        repete o que foi lido e continua o restante, para o caminho simples
+    """
+    page_groups = iter(page_groups)
+    secoes = ObraSectionStream(codigos, OBRA_SECTION_MAX_CHARS)
+    max_workers = max(1, OBRA_SECTION_WORKERS)
+    resultados = []
+    trechos = 0
+    
+    with analysis_submitter(model, document_type, max_workers) as submit:
+        pending = deque()
+        
+        def enviar(fechados):
+            nonlocal trechos
+            contexto = secoes.contexto()
+            for codigo, texto in fechados:
+                trechos += 1
+                while len(pending) >= max_workers:
+                    resultados.append(pending.popleft().result())
+                analysis = section_fast_path(codigo, texto, contexto)
+                if analysis is not None:
+                    pending.append(completed_future(analysis))
+                else:
+                    pending.append(submit(section_prompt_text(codigo, texto, contexto)))
+        
+        for grupo in page_groups:
+            enviar(secoes.feed(grupo))
+            if secoes.excedido:
+                print(f"🧱 Relatório consolidado sem seções de duas obras em {OBRA_SECTION_MAX_CHARS} caracteres "
+                      f"- análise como documento simples")
+                return None, itertools.chain(secoes.original, page_groups)
+        enviar(secoes.finish())
+        
+        if not secoes.confirmado:
+            return None, iter(secoes.original)
+        
+        while pending:
+            resultados.append(pending.popleft().result())
+    
+    print(f"🧱 Relatório consolidado: {trechos} trecho(s) de obra ({', '.join(codigos)})")
+    analyses = [r for r in resultados if r is not None]
+    return (merge_partial_analyses(analyses) if analyses else None), None
+
+def section_fast_path(codigo, texto, secoes):
+    """Fast path de layout para a seção de uma obra, com o código já conhecido (ou None)"""
+    if not LAYOUT_FAST_PATH_ENABLED:
+        return None
+    
+    preambulo = secoes['preambulo']
+    layout = match_layout(fingerprint_document(f"{preambulo}\n{texto}"))
+    if not layout:
+        return None
+    return run_layout_fast_path(layout, texto, codigo=codigo, contexto=preambulo)
+
+def section_prompt_text(codigo, texto, secoes):
+    """Texto enviado à OpenAI para a seção de uma obra, com o preâmbulo como contexto"""
+    prompt_text = (
+        f"[SEÇÃO DA OBRA {codigo} - relatório consolidado das obras {', '.join(secoes['codigos'])}]\n"
+        f"{secoes['preambulo']}\n{texto}"
+    )
+    return prompt_text.strip()
+
+def analyze_pdf_document(file, model, document_type='relatório financeiro', extractor=None, report=None,
+                         chunk_size=None, pdf_hash=None):
+    """
+    Pipeline completo de um PDF: cache → extração em streaming → filtro de
+    páginas → layout conhecido ou OpenAI → merge.
+    
+    Um hit no cache devolve a análise salva sem chamar process_openai_request.
+    Com MODEL_CASCADE_ENABLED, o modelo rápido analisa cada chunk primeiro e
+    o pedido só recebe os chunks reprovados (ver analyze_with_cascade).
+    Se report (dict) for informado, recebe o resumo de páginas descartadas.
+    chunk_size (tokens, de /api/settings) define o tamanho de cada chunk
+    analisado em paralelo; sem ele vale PDF_PAGE_GROUP_CHARS. pdf_hash evita
+    ler o PDF de novo quando quem chama já calculou o hash.
+    
+    Returns:
+        Análise (dict ou lista de obras) ou None se o PDF não tem texto extraível
+    """
+    extractor = extractor or PDF_EXTRACTOR
+    max_chars = chunk_size * CHARS_PER_TOKEN if chunk_size else PDF_PAGE_GROUP_CHARS
+    
+    if not ANALYSIS_CACHE_ENABLED:
+        return analyze_with_cascade(
+            iter_pdf_page_groups(file, max_chars=max_chars, extractor=extractor, report=report), model, document_type
+        )
+    
+    pdf_hash = pdf_hash or hash_pdf_file(file)
+    chave = cascade_cache_key(pdf_hash, model, extractor, max_chars)
+    
+    analysis = analysis_cache.get(chave)
+    if analysis is not None:
+        print(f"⚡ Cache HIT: análise de {pdf_hash[:12]}… ({model})")
+        if report is not None:
+            report['cache'] = True
+        return analysis
+    
+    analysis = analyze_with_cascade(
+        cached_page_groups(file, pdf_hash, extractor, report, max_chars), model, document_type
+    )
+    
+    if analysis is not None:
+        analysis_cache.set(chave, analysis)
+    return analysis
+
+# ================================
+# NORMALIZAÇÃO DE NÚMEROS E DATAS (PADRÃO BRASILEIRO)
+# ================================
+
+MESES = {
+    'JANEIRO': 1, 'FEVEREIRO': 2, 'MARCO': 3, 'ABRIL': 4, 'MAIO': 5, 'JUNHO': 6,
+    'JULHO': 7, 'AGOSTO': 8, 'SETEMBRO': 9, 'OUTUBRO': 10, 'NOVEMBRO': 11, 'DEZEMBRO': 12,
+    'JAN': 1, 'FEV': 2, 'MAR': 3, 'ABR': 4, 'MAI': 5, 'JUN': 6,
+    'JUL': 7, 'AGO': 8, 'SET': 9, 'OUT': 10, 'NOV': 11, 'DEZ': 12
+}
+
+MESES_PATTERN = r'(?P<mes>' + '|'.join(sorted(MESES, key=len, reverse=True)) + r')\b\.?'
+# Mês por extenso com ano: 'SET/25', 'SETEMBRO DE 2025', 'SET 2025'. Ano de 2 dígitos
+# só com separador - 'JUN 15' num histórico é dia, não competência
+COMPETENCIA_MES_RE = re.compile(
+    r'\b' + MESES_PATTERN + r'(?:\s*(?:DE\s+|/|-)\s*|\s*(?=20\d{2}\b))(?P<ano>\d{4}|\d{2})\b'
+)
+# 'SETEMBRO 25' (forma do título dos relatórios) só depois de um rótulo de competência
+COMPETENCIA_CONTEXTO_RE = re.compile(
+    r'\b(?:COMPETENCIA|REFERENCIA|PERIODO|MES)\b\s*:?\s*(?:DE\s+)?' + MESES_PATTERN
+    + r'\s*(?:DE\s+|/|-)?\s*(?P<ano>\d{4}|\d{2})\b'
+)
+COMPETENCIA_NUM_RE = re.compile(r'(?<![\d/])(0[1-9]|1[0-2])/(20\d{2})\b')
+BR_DATE_RE = re.compile(r'^(\d{2})/(\d{2})/(\d{4}|\d{2})$')
+BR_MONEY_TEXT_RE = re.compile(
+    r'(?<![\d.,])(?P<abre>\()?(?P<neg1>-)?(?:R\$\s*)?(?P<neg2>-)?'
+    r'(?P<inteiro>\d{1,3}(?:\.\d{3})+|\d+),(?P<decimal>\d{2})(?![\d,])'
+    r'(?P<fecha>\))?(?P<neg3>-(?!\d))?'
+)
+
+def parse_br_number(valor):
+    """Converter '7.319.162,16', '(82,60)', '82,60-' ou '-R$ 1,00' para float (None se inválido)"""
+    if valor is None:
+        return None
+    if isinstance(valor, (int, float)):
+        return float(valor)
+    texto = str(valor).strip().replace('R$', '').replace(' ', '')
+    negativo = texto.startswith('-') or texto.endswith('-') or (texto.startswith('(') and texto.endswith(')'))
+    texto = texto.strip('()-')
+    if ',' not in texto and texto.count('.') == 1:
+        texto = texto.replace('.', ',')  # Já em formato 1234.56
+    try:
+        numero = float(texto.replace('.', '').replace(',', '.'))
+    except ValueError:
+        return None
+    return -numero if negativo else numero
+
+def parse_br_date(valor):
+    """'31/08/2025' ou '31/08/25' → '2025-08-31' (None se não for data)"""
+    match = BR_DATE_RE.match(str(valor).strip())
+    if not match:
+        return None
+    dia, mes, ano = match.groups()
+    ano = f"20{ano}" if len(ano) == 2 else ano
+    try:
+        return datetime(int(ano), int(mes), int(dia)).strftime('%Y-%m-%d')
+    except ValueError:
+        return None
+
+def search_competencia_mes(text_norm):
+    """Competência com mês por extenso no texto (com rótulo ou com separador/ano completo)"""
+    return COMPETENCIA_CONTEXTO_RE.search(text_norm) or COMPETENCIA_MES_RE.search(text_norm)
+
+def parse_competencia(text_norm):
+    """Encontrar a competência ('COMPETÊNCIA: SETEMBRO 25', 'SET/2025', '09/2025') no formato MM/YYYY"""
+    match = search_competencia_mes(text_norm)
+    if match:
+        ano = match.group('ano')
+        ano = f"20{ano}" if len(ano) == 2 else ano
+        return f"{MESES[match.group('mes')]:02d}/{ano}"
+    
+    match = COMPETENCIA_NUM_RE.search(text_norm)
+    if match:
+        return f"{match.group(1)}/{match.group(2)}"
+    return None
+
+def normalize_br_value(valor):
+    """
+    Converter uma célula/valor para o tipo certo: float para valores
+    monetários, 'YYYY-MM-DD' para datas, 'MM/YYYY' para competências.
+    Códigos de obra e textos ficam como string.
+    """
+    if not isinstance(valor, str):
+        return valor
+    texto = valor.strip()
+    if BR_MONEY_TEXT_RE.fullmatch(texto):
+        return parse_br_number(texto)
+    data = parse_br_date(texto)
+    if data:
+        return data
+    texto_norm = normalize_layout_text(texto)
+    if COMPETENCIA_MES_RE.fullmatch(texto_norm) or COMPETENCIA_NUM_RE.fullmatch(texto_norm):
+        return parse_competencia(texto_norm)
+    return texto
+
+def normalize_br_text(text):
+    """
+    Reescrever o texto extraído com números já normalizados.
+    
+    '7.319.162,16' → '7319162.16', '(82,60)' e '82,60-' → '-82.60', sem 'R$';
+    competências por extenso ganham a forma numérica ('SETEMBRO/25 [09/2025]').
+    Datas dd/mm/aaaa ficam como estão.
+    """
+    def money(match):
+        negativo = bool(match.group('neg1') or match.group('neg2') or match.group('neg3')
+                        or (match.group('abre') and match.group('fecha')))
+        numero = f"{'-' if negativo else ''}{match.group('inteiro').replace('.', '')}.{match.group('decimal')}"
+        if match.group('abre') and not match.group('fecha'):
+            numero = '(' + numero
+        if match.group('fecha') and not match.group('abre'):
+            numero += ')'
+        return numero
+    
+    text = BR_MONEY_TEXT_RE.sub(money, text)
+    
+    linhas = []
+    for linha in text.splitlines():
+        competencia = search_competencia_mes(normalize_layout_text(linha))
+        if competencia:
+            linha = f"{linha} [{parse_competencia(competencia.group(0))}]"
+        linhas.append(linha)
+    return '\n'.join(linhas)
+
+def parse_tsv_tables(text):
+    """
+    Ler os blocos [TABELA ...] do extrator 'tables' com células tipadas.
+    
+    Returns:
+        Lista de {'titulo', 'cabecalho', 'linhas'} - linhas são dicts
+        cabeçalho → valor normalizado
+    """
+    tabelas = []
+    atual = None
+    
+    for linha in text.splitlines():
+        if linha.startswith('[TABELA '):
+            atual = {'titulo': linha.strip('[]'), 'cabecalho': None, 'linhas': []}
+            tabelas.append(atual)
+            continue
+        if atual is None:
+            continue
+        if '\t' not in linha:
+            # Linha sem TAB depois do cabeçalho encerra a tabela
+            if atual['cabecalho'] is not None:
+                atual = None
+            continue
+        celulas = linha.split('\t')
+        if atual['cabecalho'] is None:
+            atual['cabecalho'] = [c.strip() or f'coluna_{i + 1}' for i, c in enumerate(celulas)]
+            continue
+        atual['linhas'].append({
+            coluna: normalize_br_value(celula)
+            for coluna, celula in zip(atual['cabecalho'], celulas)
+        })
+    
+    return tabelas
+
+# Campos numéricos do JSON de análise (o LLM às vezes devolve "7.319.162,16")
+ANALYSIS_NUMBER_FIELDS = (
+    'saldo_inicial', 'saldo_final', 'despesas_total', 'receitas_total', 'rentabilidade_mensal'
+)
+APORTES_POOL_NUMBER_FIELDS = (
+    'valor_total_pool', 'despesas_todas_obras', 'despesas_esta_obra',
+    'taxa_rateio_percentual', 'valor_rateado_esta_obra'
+)
+
+def coerce_analysis_numbers(analysis):
+    """Converter para float os valores numéricos que vierem como texto (in place)"""
+    if isinstance(analysis, list):
+        for item in analysis:
+            coerce_analysis_numbers(item)
+        return analysis
+    if not isinstance(analysis, dict):
+        return analysis
+    
+    def coerce(container, campo):
+        valor = container.get(campo)
+        if isinstance(valor, str):
+            numero = parse_br_number(valor)
+            if numero is not None:
+                container[campo] = numero
+    
+    for campo in ANALYSIS_NUMBER_FIELDS:
+        coerce(analysis, campo)
+    for item in analysis.get('despesas') or []:
+        if isinstance(item, dict):
+            coerce(item, 'valor')
+    for item in analysis.get('receitas') or []:
+        if isinstance(item, dict):
+            coerce(item, 'valor')
+    if isinstance(analysis.get('aportes_pool'), dict):
+        for campo in APORTES_POOL_NUMBER_FIELDS:
+            coerce(analysis['aportes_pool'], campo)
+    return analysis
+
+# ================================
+# FAST PATH - LAYOUTS CONHECIDOS (SEM LLM)
+# ================================
+
+BR_VALUE_PATTERN = r'\(?-?\s*(?:R\$\s*)?-?\d{1,3}(?:\.\d{3})*,\d{2}\)?-?'
+BR_VALUE_END_RE = re.compile(r'(' + BR_VALUE_PATTERN + r')\s*$')
+# Códigos na mesma linha do título; '200,00' depois de 'MÃO DE OBRA' é valor, não código
+CODIGO_OBRA_PATTERN = r'(?:\d{3}|BCO)(?![.,]?\d)'
+CODIGOS_OBRA_RE = re.compile(
+    r'\bOBRAS?[ \t]*(?:N\.?[ \t]*[O°º]?\.?[ \t]*)?[:\-]?[ \t]*(' + CODIGO_OBRA_PATTERN
+    + r'(?:(?:[ \t]*(?:,|/|-|\bE\b)[ \t]*|[ \t]+)' + CODIGO_OBRA_PATTERN + r'\b)*)'
+)
+SALDO_DATA_RE = re.compile(r'SALDO\s+(?:EM|ATE)\s+(\d{2})/(\d{2})/(\d{4})\s*:?\s*(' + BR_VALUE_PATTERN + r')')
+
+def normalize_layout_text(text):
+    """Maiúsculas sem acentos - base para fingerprint e regras"""
+    text = unicodedata.normalize('NFKD', text or '')
+    return ''.join(c for c in text if not unicodedata.combining(c)).upper()
+
+def parse_codigos_obra(text_norm):
+    """Códigos de obra citados nos títulos ('OBRA 616', 'OBRAS 562, 601 E 603')"""
+    codigos = []
+    for match in CODIGOS_OBRA_RE.finditer(text_norm):
+        for codigo in re.findall(r'\d{3}|BCO', match.group(1)):
+            if codigo not in codigos:
+                codigos.append(codigo)
+    return codigos
+
+def parse_nome_obra(text, codigo):
+    """Nome da obra na linha do título ('OBRA 616 - Fiação Enterrada ...')"""
+    for linha in text.splitlines():
+        match = re.search(r'\b' + re.escape(codigo) + r'\s*[-–:]\s*(.+)$', linha)
+        if match and 'OBRA' in normalize_layout_text(linha):
+            return match.group(1).strip()
+    return None
+
+def iter_valued_lines(text):
+    """Linhas (ou linhas TSV) que terminam com um valor em formato brasileiro"""
+    for linha in text.splitlines():
+        linha = linha.strip()
+        match = BR_VALUE_END_RE.search(linha)
+        if not match:
+            continue
+        rotulo = linha[:match.start()].strip(' \t:-')
+        yield rotulo, normalize_layout_text(rotulo), parse_br_number(match.group(1))
+
+def classificar_despesa(descricao_norm):
+    """Categoria da despesa pelas palavras da descrição"""
+    if 'MATERIA' in descricao_norm:
+        return 'Material'
+    if 'MAO DE OBRA' in descricao_norm or re.search(r'\bM\.?O\b', descricao_norm):
+        return 'MO'
+    if 'LOCACAO' in descricao_norm or 'ALUGUEL' in descricao_norm:
+        return 'Locacao'
+    if 'SERVICO' in descricao_norm:
+        return 'Servicos'
+    return 'Outros'
+
+def layout_base_result(layout, competencia, codigo, text):
+    """Estrutura JSON igual à do prompt, preenchida pelas regras"""
+    return {
+        'competencia': competencia,
+        'codigo_obra': codigo,
+        'nome_obra': parse_nome_obra(text, codigo) or 'não_informado',
+        'tipo_documento': layout['tipo_documento'],
+        'saldo_inicial': 'não_informado',
+        'saldo_final': 'não_informado',
+        'despesas': [],
+        'despesas_total': 0.0,
+        'receitas': [],
+        'receitas_total': 0.0,
+        'aportes_pool': {
+            'valor_total_pool': None,
+            'despesas_todas_obras': None,
+            'despesas_esta_obra': None,
+            'taxa_rateio_percentual': None,
+            'valor_rateado_esta_obra': None,
+            'metodo_calculo': 'Proporcional às despesas mensais'
+        },
+        'rentabilidade_mensal': 0.0,
+        'validacoes': {'saldo_auditoria': {'status': 'não_verificado'}, 'alertas': []},
+        'observacoes': f"Extraído por regras do layout {layout['nome']} (sem LLM).",
+        'qualidade_extracao': '✅ Completa',
+        'metodo_extracao': f"layout:{layout['nome']}"
+    }
+
+def is_despesas_todas_obras(rotulo_norm):
+    """Rótulo do total de despesas consolidado (base do rateio), não o da obra"""
+    return 'DESPESA' in rotulo_norm and any(p in rotulo_norm for p in ('TODAS', 'CONSOLIDAD', 'GERAL'))
+
+def parse_layout_aportes(result, text):
+    """
+    Preencher aportes_pool com os valores do documento (ou do preâmbulo do
+    consolidado): aportes recebidos no pool e despesas de todas as obras.
+    A taxa e o valor rateado saem da conta - o rateado informado, se houver,
+    é conferido depois por validate_aportes_pool.
+    
+    Returns:
+        True se o rateio pôde ser montado
+    """
+    pool = result['aportes_pool']
+    for rotulo, rotulo_norm, valor in iter_valued_lines(text):
+        if valor is None:
+            continue
+        if 'APORTE' in rotulo_norm and 'RATEAD' in rotulo_norm:
+            pool['valor_rateado_esta_obra'] = abs(valor)
+        elif 'APORTE' in rotulo_norm and ('POOL' in rotulo_norm or 'RECEBID' in rotulo_norm):
+            pool['valor_total_pool'] = abs(valor)
+        elif is_despesas_todas_obras(rotulo_norm):
+            pool['despesas_todas_obras'] = abs(valor)
+    
+    pool['despesas_esta_obra'] = result['despesas_total']
+    if not pool['valor_total_pool'] or not pool['despesas_todas_obras']:
+        return False
+    
+    pool['taxa_rateio_percentual'] = pool['despesas_esta_obra'] / pool['despesas_todas_obras']
+    if pool['valor_rateado_esta_obra'] is None:
+        pool['valor_rateado_esta_obra'] = round(pool['valor_total_pool'] * pool['taxa_rateio_percentual'], 2)
+    return True
+
+def parse_layout_posicao_financeira(layout, text, text_norm, competencia, codigo):
+    """POSIÇÃO FINANC.: saldos datados, receitas (aportes/rentabilidade) e total de despesas"""
+    result = layout_base_result(layout, competencia, codigo, text)
+    
+    # Um saldo por data (a primeira ocorrência vale); inicial = data mais antiga
+    saldos = {}
+    for m in SALDO_DATA_RE.finditer(text_norm):
+        saldos.setdefault((m.group(3), m.group(2), m.group(1)), parse_br_number(m.group(4)))
+    if len(saldos) >= 2:
+        datas = sorted(saldos)
+        result['saldo_inicial'] = saldos[datas[0]]
+        result['saldo_final'] = saldos[datas[-1]]
+    
+    for rotulo, rotulo_norm, valor in iter_valued_lines(text):
+        if valor is None or 'SALDO' in rotulo_norm:
+            continue
+        if 'APORTE' in rotulo_norm and any(p in rotulo_norm for p in ('POOL', 'RECEBID', 'RATEAD')):
+            continue  # Rateio do pool: parse_layout_aportes
+        if is_despesas_todas_obras(rotulo_norm):
+            continue
+        if 'DESPESA' in rotulo_norm:
+            result['despesas_total'] = abs(valor)
+        elif 'TOTAL' in rotulo_norm:
+            continue
+        elif 'RENTABILIDADE' in rotulo_norm or 'RENDIMENTO' in rotulo_norm:
+            result['receitas'].append({'tipo': 'Rentabilidade', 'valor': abs(valor)})
+            result['rentabilidade_mensal'] += abs(valor)
+        elif 'APORTE' in rotulo_norm:
+            result['receitas'].append({'tipo': 'Aporte', 'valor': abs(valor)})
+        elif 'REEMBOLSO' in rotulo_norm:
+            result['receitas'].append({'tipo': 'Reembolso', 'valor': abs(valor)})
+    
+    result['receitas_total'] = round(sum(r['valor'] for r in result['receitas']), 2)
+    return result
+
+def split_header_cells(linha):
+    """Células de uma linha de cabeçalho: TAB (TSV) ou 2+ espaços (texto com colunas)"""
+    return [c.strip() for c in re.split(r'\t| {2,}', linha.strip()) if c.strip()]
+
+def header_fingerprint(colunas):
+    """Hash dos nomes das colunas de um cabeçalho, na ordem (normalizados)"""
+    assinatura = '|'.join(normalize_layout_text(c).strip() for c in colunas)
+    return hashlib.sha1(assinatura.encode('utf-8')).hexdigest()[:16]
+
+def find_layout_header(layout, text):
+    """
+    Localizar no texto o cabeçalho declarado do layout.
+    
+    Returns:
+        (índice da linha, spans) - spans são (campo, início) das colunas na
+        linha de texto, ou None se o cabeçalho veio de uma tabela TSV;
+        (None, None) se o cabeçalho não está no texto
+    """
+    linhas = text.splitlines()
+    for i, linha in enumerate(linhas):
+        if header_fingerprint(split_header_cells(linha)) != layout['fingerprint']:
+            continue
+        if '\t' in linha:
+            return i, None
+        
+        linha_norm = normalize_layout_text(linha)
+        spans, inicio = [], 0
+        for campo, cabecalho in layout['colunas']:
+            inicio = linha_norm.index(cabecalho, inicio)
+            spans.append((campo, inicio))
+            inicio += len(cabecalho)
+        return i, spans
+    return None, None
+
+def parse_despesas_tables(layout, text):
+    """
+    Lançamentos das tabelas TSV (extrator 'tables') cujo cabeçalho é o do
+    layout, com células já tipadas por parse_tsv_tables.
+    
+    Returns:
+        (despesas, total_informado)
+    """
+    despesas = []
+    total_informado = None
+    campos = dict(layout['colunas'])
+    
+    for tabela in parse_tsv_tables(text):
+        cabecalho = tabela['cabecalho'] or []
+        if header_fingerprint(cabecalho) != layout['fingerprint']:
+            continue
+        coluna = {campo: cabecalho[i] for i, (campo, _) in enumerate(layout['colunas'])}
+        
+        for linha in tabela['linhas']:
+            valor = linha.get(coluna['valor'])
+            if not isinstance(valor, float):
+                continue
+            textos = ' '.join(str(v) for v in linha.values() if isinstance(v, str))
+            if 'TOTAL' in normalize_layout_text(textos):
+                total_informado = abs(valor)
+                continue
+            despesas.append(layout_despesa(
+                {campo: linha.get(coluna[campo]) for campo in campos if campo != 'valor'}, valor
+            ))
+    
+    return despesas, total_informado
+
+def parse_despesas_text(layout, text):
+    """
+    Lançamentos do texto corrido, recortados pelas posições das colunas do
+    cabeçalho declarado. Só as linhas entre o cabeçalho e a linha de TOTAL
+    entram; o valor é o número no fim da linha (alinhado à direita).
+    
+    Returns:
+        (despesas, total_informado)
+    """
+    inicio, spans = find_layout_header(layout, text)
+    if inicio is None or spans is None:
+        return [], None
+    
+    despesas = []
+    linhas = text.splitlines()
+    colunas = [(campo, pos) for campo, pos in spans if campo != 'valor']
+    
+    for linha in linhas[inicio + 1:]:
+        if linha.startswith('[TABELA '):
+            break
+        match = BR_VALUE_END_RE.search(linha.rstrip())
+        if not match:
+            continue  # Quebra de descrição ou linha sem lançamento
+        valor = parse_br_number(match.group(1))
+        prefixo = linha[:match.start()]
+        if 'TOTAL' in normalize_layout_text(prefixo):
+            return despesas, abs(valor)
+        
+        celulas = {}
+        for k, (campo, pos) in enumerate(colunas):
+            fim = colunas[k + 1][1] if k + 1 < len(colunas) else len(prefixo)
+            celulas[campo] = prefixo[pos:fim].strip(' \t:-')
+        despesas.append(layout_despesa(celulas, valor))
+    
+    return despesas, None
+
+def layout_despesa(celulas, valor):
+    """Lançamento no formato do prompt a partir das células da linha"""
+    descricao = str(celulas.get('descricao') or '').strip()
+    fornecedor = str(celulas.get('fornecedor') or '').strip()
+    return {
+        'descricao': descricao,
+        'valor': abs(valor),
+        'categoria': classificar_despesa(normalize_layout_text(descricao)),
+        'fornecedor': fornecedor or descricao
+    }
+
+def parse_layout_despesas(layout, text, text_norm, competencia, codigo):
+    """DESPESAS: lançamentos nas colunas declaradas do layout, conferidos contra a linha de TOTAL"""
+    result = layout_base_result(layout, competencia, codigo, text)
+    
+    # Extrator 'tables': cabeçalho TSV, valores já convertidos; senão, colunas do texto
+    result['despesas'], total_informado = parse_despesas_tables(layout, text)
+    if not result['despesas']:
+        result['despesas'], total_informado = parse_despesas_text(layout, text)
+    
+    result['despesas_total'] = round(sum(d['valor'] for d in result['despesas']), 2)
+    result['total_informado'] = total_informado
+    return result
+
+def validate_layout_posicao_financeira(result):
+    """Saldo_Final ≈ Saldo_Inicial + Receitas - Despesas (±R$1,00)"""
+    if not isinstance(result['saldo_inicial'], float) or not isinstance(result['saldo_final'], float):
+        return False, 'saldos não encontrados'
+    
+    esperado = result['saldo_inicial'] + result['receitas_total'] - result['despesas_total']
+    diferenca = round(result['saldo_final'] - esperado, 2)
+    
+    if abs(diferenca) > 1.0:
+        return False, f'saldo não fecha (diferença {diferenca:.2f})'
+    
+    result['validacoes']['saldo_auditoria'] = {'status': 'OK', 'diferenca_permitida': abs(diferenca)}
+    return True, None
+
+def validate_layout_despesas(result):
+    """Soma dos lançamentos deve bater com a linha de TOTAL do relatório (±R$1,00)"""
+    total_informado = result.pop('total_informado', None)
+    
+    if not result['despesas']:
+        return False, 'nenhum lançamento encontrado'
+    if total_informado is None:
+        return False, 'linha de TOTAL não encontrada'
+    
+    diferenca = round(result['despesas_total'] - total_informado, 2)
+    if abs(diferenca) > 1.0:
+        return False, f'soma das despesas difere do TOTAL em {diferenca:.2f}'
+    return True, None
+
+# Registro de layouts conhecidos - a ordem importa (o primeiro que casar vence).
+# marcadores: textos do cabeçalho do relatório que precisam estar presentes;
+# colunas: (campo, cabeçalho) da tabela de lançamentos, na ordem do relatório -
+# o hash desse cabeçalho é a impressão digital que o documento precisa ter
+LAYOUT_REGISTRY = [
+    {
+        'nome': 'posicao_financeira_v1',
+        'tipo_documento': 'POSICAO_FINANCEIRA',
+        'marcadores': ['POSICAO FINANC', 'SALDO EM', 'APORTE'],
+        'colunas': [],
+        'parser': parse_layout_posicao_financeira,
+        'validador': validate_layout_posicao_financeira
+    },
+    {
+        'nome': 'despesas_v1',
+        'tipo_documento': 'DETALHAMENTO_DESPESAS',
+        'marcadores': ['DESPESAS', 'OBRA'],
+        'colunas': [('data', 'DATA'), ('fornecedor', 'FORNECEDOR'), ('descricao', 'DESCRICAO'), ('valor', 'VALOR')],
+        'parser': parse_layout_despesas,
+        'validador': validate_layout_despesas
+    },
+]
+
+for _layout in LAYOUT_REGISTRY:
+    _layout['fingerprint'] = header_fingerprint([c for _, c in _layout['colunas']]) if _layout['colunas'] else None
+
+LAYOUT_MARKERS = sorted(
+    {m for layout in LAYOUT_REGISTRY for m in layout['marcadores']}
+    | {'RECEITAS', 'APORTE', 'RENTABILIDADE', 'BRADESCO', 'CONCILIA', 'FORNECEDOR', 'VALOR'}
+)
+
+layout_stats = {}
+_layout_stats_lock = threading.Lock()
+
+def count_layout_stat(nome, campo):
+    with _layout_stats_lock:
+        stats = layout_stats.setdefault(nome, {'matches': 0, 'fast_path': 0, 'fallback_llm': 0})
+        stats[campo] += 1
+
+def fingerprint_document(text):
+    """
+    Impressão digital da estrutura do documento: marcadores de cabeçalho
+    presentes e o hash de cada cabeçalho de tabela (TSV ou linha de texto
+    com colunas que tenha VALOR).
+    """
+    text_norm = normalize_layout_text(text)
+    marcadores = [m for m in LAYOUT_MARKERS if m in text_norm]
+    
+    cabecalhos = {}
+    linhas = text_norm.splitlines()
+    for i, linha in enumerate(linhas):
+        if linha.startswith('[TABELA ') and i + 1 < len(linhas):
+            celulas = split_header_cells(linhas[i + 1])
+        elif 'VALOR' in linha and not BR_VALUE_END_RE.search(linha.rstrip()):
+            celulas = split_header_cells(linha)
+        else:
+            continue
+        if len(celulas) >= 2:
+            cabecalhos[header_fingerprint(celulas)] = celulas
+    
+    assinatura = '|'.join(marcadores) + '#' + '|'.join(sorted(cabecalhos))
+    return {
+        'marcadores': marcadores,
+        'cabecalhos': cabecalhos,
+        'hash': hashlib.sha1(assinatura.encode('utf-8')).hexdigest()[:16]
+    }
+
+def match_layout(fingerprint):
+    """Layout registrado com todos os marcadores no documento e, se declarar colunas, o mesmo cabeçalho"""
+    for layout in LAYOUT_REGISTRY:
+        if not all(m in fingerprint['marcadores'] for m in layout['marcadores']):
+            continue
+        if layout['fingerprint'] and layout['fingerprint'] not in fingerprint['cabecalhos']:
+            continue
+        count_layout_stat(layout['nome'], 'matches')
+        print(f"🧩 Layout reconhecido: {layout['nome']} (fingerprint {fingerprint['hash']})")
+        return layout
+    return None
+
+def run_layout_fast_path(layout, text, codigo=None, contexto=''):
+    """
+    Extrair por regras um documento de layout conhecido.
+    
+    Retorna a análise (mesma estrutura do LLM) ou None quando o documento
+    tem várias obras, faltam campos obrigatórios, a validação falha ou o
+    rateio de aportes não pode ser montado - nesses casos o chamador segue
+    para a OpenAI. Para seções de relatórios consolidados, o código da obra
+    é informado e a competência e o pool podem vir do contexto (cabeçalho
+    do relatório).
+    """
+    inicio = time.time()
+    text_norm = normalize_layout_text(text)
+    
+    competencia = parse_competencia(text_norm) or parse_competencia(normalize_layout_text(contexto))
+    codigos = [codigo] if codigo else parse_codigos_obra(text_norm)
+    
+    motivo = None
+    if not competencia:
+        motivo = 'competência não encontrada'
+    elif len(codigos) != 1:
+        motivo = f'{len(codigos)} códigos de obra encontrados'
+    
+    if not motivo:
+        result = layout['parser'](layout, text, text_norm, competencia, codigos[0])
+        valido, motivo = layout['validador'](result)
+        if valido and not parse_layout_aportes(result, f"{contexto}\n{text}"):
+            valido, motivo = False, 'aportes do pool / despesas de todas as obras não encontrados'
+        elif valido and not validate_aportes_pool(copy.deepcopy(result)):
+            valido, motivo = False, 'rateio de aportes inconsistente'
+        if valido:
+            count_layout_stat(layout['nome'], 'fast_path')
+            print(f"⚡ Fast path {layout['nome']}: {codigos[0]} {competencia} em {(time.time() - inicio) * 1000:.1f}ms")
+            return result
+    
+    count_layout_stat(layout['nome'], 'fallback_llm')
+    print(f"↪️ Layout {layout['nome']} sem validação ({motivo}) - usando LLM")
+    return None
+
+# ================================
+# UTILITÁRIO - COMPATIBILIDADE COM RESPONSES API (GPT-5)
+# ================================
+
+class CompatResponse:
+    """Classe para compatibilidade entre Responses API (GPT-5) e Chat Completions API"""
+    class Choice:
+        class Message:
+            def __init__(self, content):
+                self.content = content
+        
+        def __init__(self, content, finish_reason="stop"):
+            self.message = self.Message(content)
+            self.finish_reason = finish_reason
+    
+    def __init__(self, content, finish_reason="stop", usage=None):
+        self.choices = [self.Choice(content, finish_reason)]
+        self.usage = usage
+
+# Tokens de entrada por modelo: quanto veio do cache de prompt da OpenAI
+openai_usage_stats = {}
+_openai_usage_lock = threading.Lock()
+
+def record_openai_usage(model, usage):
+    """
+    Normalizar o usage das duas APIs e somar nas estatísticas do modelo.
+    
+    Responses: input_tokens / input_tokens_details.cached_tokens / output_tokens
+    Chat:      prompt_tokens / prompt_tokens_details.cached_tokens / completion_tokens
+    """
+    if usage is None:
+        return None
+    
+    entrada = getattr(usage, 'input_tokens', None)
+    if entrada is None:
+        entrada = getattr(usage, 'prompt_tokens', 0)
+    detalhes = getattr(usage, 'input_tokens_details', None) or getattr(usage, 'prompt_tokens_details', None)
+    saida = getattr(usage, 'output_tokens', None)
+    if saida is None:
+        saida = getattr(usage, 'completion_tokens', 0)
+    
+    entrada = entrada or 0
+    cacheados = (getattr(detalhes, 'cached_tokens', 0) or 0) if detalhes is not None else 0
+    resumo = {
+        'input_tokens': entrada,
+        'cached_tokens': cacheados,
+        'uncached_tokens': entrada - cacheados,
+        'output_tokens': saida or 0
+    }
+    
+    meter = openai_usage_meter.get()
+    if meter is not None:
+        meter.add(resumo)
+    
+    with _openai_usage_lock:
+        stats = openai_usage_stats.setdefault(
+            model, {'calls': 0, 'input_tokens': 0, 'cached_tokens': 0, 'uncached_tokens': 0, 'output_tokens': 0}
+        )
+        stats['calls'] += 1
+        for campo, valor in resumo.items():
+            stats[campo] += valor
+    
+    print(f"🧮 Tokens {model}: entrada {entrada} (cache {cacheados}, sem cache {entrada - cacheados}) | saída {resumo['output_tokens']}")
+    return resumo
+
+def openai_usage_info():
+    """Estatísticas de tokens por modelo, com a fração de entrada vinda do cache"""
+    with _openai_usage_lock:
+        stats = {model: dict(v) for model, v in openai_usage_stats.items()}
+    for v in stats.values():
+        v['cached_ratio'] = round(v['cached_tokens'] / v['input_tokens'], 4) if v['input_tokens'] else 0.0
+    return stats
+
+def openai_request_params(messages, model, max_tokens, schema=None, stream=False):
+    """
+    Montar a chamada OpenAI: ('responses', kwargs) para GPT-5 ou ('chat', kwargs)
+    para os demais. Usado pelos caminhos síncrono e assíncrono.
+    
+    schema (dict) pede saída JSON restrita ao schema nos modelos que suportam;
+    stream=True pede a resposta em eventos incrementais.
+    """
+    if schema is not None and not supports_structured_output(model):
+        schema = None
+    # ⭐ GPT-5 usa Responses API, não Chat Completions!
+    if model.startswith('gpt-5'):
+        # Mesmas mensagens (mesmo prefixo) do Chat Completions: o cache de
+        # prompt da OpenAI só reaproveita prefixos idênticos
+        input_messages = [
+            {"role": msg.get("role", "user"), "content": msg.get("content", "")}
+            for msg in messages
+        ]
+        
+        for msg in input_messages:
+            print(f"📝 {msg['role']} length: {len(msg['content'])} chars")
+        
+        # ✅ Responses API com parâmetros corretos para GPT-5
+        # IMPORTANTE: reasoning com effort LOW para economizar tempo e memória!
+        params = {
+            'model': model,
+            'input': input_messages,
+            'max_output_tokens': max_tokens,
+            'reasoning': {"effort": "low"},  # ⭐ LOW, não HIGH (evita timeout/memória)
+            'text': {"verbosity": "high"}
+        }
+        if schema is not None:
+            params['text']['format'] = {'type': 'json_schema', **schema}
+        if stream:
+            params['stream'] = True
+        return 'responses', params
+    
+    # Chat Completions API para outros modelos (GPT-4o, GPT-4, etc)
+    params = {
+        'model': model,
+        'messages': messages,
+        'max_completion_tokens': max_tokens,
+        'temperature': 0.7,
+        'timeout': OPENAI_TIMEOUT
+    }
+    if schema is not None:
+        params['response_format'] = {'type': 'json_schema', 'json_schema': schema}
+    if stream:
+        params['stream'] = True
+        params['stream_options'] = {'include_usage': True}
+    return 'chat', params
+
+def supports_structured_output(model):
+    """Modelos com response_format json_schema (structured outputs)"""
+    return model.startswith(('gpt-5', 'gpt-4o', 'gpt-4.1', 'o3', 'o4'))
+
+def compat_response(api, model, response):
+    """Converter a resposta de qualquer das APIs em CompatResponse (com usage)"""
+    usage = record_openai_usage(model, getattr(response, 'usage', None))
+    
+    if api == 'responses':
+        finish_reason = 'length' if getattr(response, 'status', None) == 'incomplete' else 'stop'
+        return CompatResponse(response.output_text, finish_reason, usage)
+    
+    if not response.choices:
+        return CompatResponse(None, None, usage)
+    choice = response.choices[0]
+    return CompatResponse(choice.message.content, choice.finish_reason, usage)
+
+# ================================
+# RETENTATIVAS E HEDGING (OPENAI)
+# ================================
+
+class RetryPolicy:
+    """
+    Backoff exponencial com jitter ("full jitter") para erros transitórios da
+    OpenAI: 408/409/429/5xx, timeout e falha de conexão. Se a resposta trouxer
+    Retry-After (ou retry-after-ms), esse prazo é respeitado.
+    """
+    RETRYABLE_STATUS = {408, 409, 429}
+    
+    def __init__(self, max_retries, base_delay, max_delay):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+    
+    def is_retryable(self, error):
+        if isinstance(error, (APIConnectionError, APITimeoutError)):
+            return True
+        status = getattr(error, 'status_code', None)
+        return status is not None and (status in self.RETRYABLE_STATUS or status >= 500)
+    
+    def retry_after(self, error):
+        """Segundos pedidos pelo servidor (Retry-After), ou None"""
+        headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+        try:
+            if headers.get('retry-after-ms'):
+                return float(headers['retry-after-ms']) / 1000
+            valor = headers.get('retry-after')
+            if not valor:
+                return None
+            try:
+                return max(float(valor), 0.0)
+            except ValueError:
+                pass
+            quando = parsedate_to_datetime(valor)
+            return max((quando - datetime.now(quando.tzinfo)).total_seconds(), 0.0)
+        except (TypeError, ValueError):
+            return None
+    
+    def delay(self, attempt, error):
+        """Espera antes da tentativa attempt+1 (attempt começa em 0)"""
+        teto = min(self.max_delay, self.base_delay * (2 ** attempt))
+        espera = random.uniform(0, teto)
+        servidor = self.retry_after(error)
+        if servidor is not None:
+            # Nunca antes do prazo do servidor; jitter pequeno evita rajada sincronizada
+            espera = min(servidor, self.max_delay) + random.uniform(0, self.base_delay)
+        return espera
+
+retry_policy = RetryPolicy(OPENAI_MAX_RETRIES, OPENAI_RETRY_BASE_DELAY, OPENAI_RETRY_MAX_DELAY)
+
+class OpenAIErrorMessage(str):
+    """Mensagem de erro da OpenAI (segue sendo str) que guarda se a falha era transitória"""
+    
+    def __new__(cls, error):
+        mensagem = super().__new__(cls, str(error))
+        mensagem.transient = retry_policy.is_retryable(error)
+        return mensagem
+
+class OpenAIAnalysisError(ValueError):
+    """Análise sem resposta da OpenAI; transient = timeout, 429/5xx ou conexão"""
+    
+    def __init__(self, mensagem, transient=False):
+        super().__init__(mensagem)
+        self.transient = transient
+
+def is_retryable_error(error):
+    """
+    Vale tentar o PDF de novo (fila durável)? Só falhas transitórias: timeout,
+    429/5xx e conexão com a OpenAI, banco ocupado ou pool de extração quebrado.
+    PDF corrompido, JSON irrecuperável e erros de validação falhariam igual
+    (e pagariam as chamadas ao LLM de novo).
+    """
+    if isinstance(error, OpenAIAnalysisError):
+        return error.transient
+    if isinstance(error, (TimeoutError, ConnectionError, sqlite3.OperationalError, BrokenExecutor)):
+        return True
+    return retry_policy.is_retryable(error)
+
+class LatencyTracker:
+    """Latências recentes das chamadas por modelo, para o orçamento de hedging (p95)"""
+    
+    def __init__(self, window=200):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+    
+    def record(self, model, seconds):
+        with self._lock:
+            self._samples.setdefault(model, deque(maxlen=self.window)).append(seconds)
+    
+    def quantile(self, model, q=None, min_samples=None):
+        """Latência no quantil q, ou None com menos de min_samples amostras"""
+        q = OPENAI_HEDGE_QUANTILE if q is None else q
+        min_samples = OPENAI_HEDGE_MIN_SAMPLES if min_samples is None else min_samples
+        with self._lock:
+            amostras = sorted(self._samples.get(model, ()))
+        if not amostras or len(amostras) < min_samples:
+            return None
+        return amostras[min(int(q * len(amostras)), len(amostras) - 1)]
+    
+    def info(self):
+        with self._lock:
+            modelos = list(self._samples)
+        return {
+            model: {
+                'samples': len(self._samples[model]),
+                'p50': self.quantile(model, 0.5, 1),
+                'p95': self.quantile(model, 0.95, 1)
+            }
+            for model in modelos
+        }
+
+openai_latency = LatencyTracker()
+
+# AdaptiveConcurrencyLimiter e concurrency_limiter: api/concurrency.py
+
+# Chamadas feitas pela ingestão (pipeline e consumidores da fila): só elas
+# ajustam o limite - /api/chat e as rotas síncronas não medem a vazão de PDFs
+ingestion_context = contextvars.ContextVar('ingestion_context', default=False)
+
+def record_openai_latency(model, seconds):
+    """Latência de uma chamada concluída: hedging (p95) e, na ingestão, limite adaptativo"""
+    openai_latency.record(model, seconds)
+    if ingestion_context.get():
+        concurrency_limiter.on_success(model, seconds)
+
+retry_stats = {'retries': 0, 'gave_up': 0}
+_retry_stats_lock = threading.Lock()
+
+def count_retry_stat(campo):
+    with _retry_stats_lock:
+        retry_stats[campo] += 1
+
+def should_retry(error, attempt):
+    """Registrar a falha e decidir se vale nova tentativa (devolve a espera ou None)"""
+    if ingestion_context.get():
+        concurrency_limiter.on_error(error)
+    if attempt >= retry_policy.max_retries or not retry_policy.is_retryable(error):
+        if attempt > 0:
+            count_retry_stat('gave_up')
+        return None
+    espera = retry_policy.delay(attempt, error)
+    count_retry_stat('retries')
+    print(f"🔁 {type(error).__name__} ({getattr(error, 'status_code', '-')}): "
+          f"tentativa {attempt + 2}/{retry_policy.max_retries + 1} em {espera:.1f}s")
+    return espera
+
+def process_openai_request(messages, model, max_tokens, schema=None):
+    """
+    Processa requisição OpenAI com suporte a GPT-5 (Responses API) e compatibilidade com outros modelos
+    
+    Args:
+        messages: Lista de mensagens com roles 'system' e 'user'
+        model: Nome do modelo ('gpt-5', 'gpt-4o', etc)
+        max_tokens: Máximo de tokens na resposta
+        schema: JSON schema da saída (structured outputs), opcional
+    
+    Returns:
+        Tuple (response, error_message)
+    
+    Erros transitórios são repetidos conforme retry_policy. Com
+    OPENAI_HEDGE_ENABLED a chamada vai para o motor assíncrono, que dispara
+    a requisição de reserva (hedge) quando a primeira passa do p95.
+    """
+    if OPENAI_HEDGE_ENABLED and OPENAI_ASYNC_ENABLED:
+        engine = get_async_engine()
+        return engine.submit(engine.request(messages, model, max_tokens, schema)).result()
+    
+    attempt = 0
+    while True:
+        response, error, espera = _process_openai_request_once(messages, model, max_tokens, attempt, schema)
+        if espera is None:
+            return response, error
+        time.sleep(espera)
+        attempt += 1
+
+def _process_openai_request_once(messages, model, max_tokens, attempt, schema=None):
+    """Uma tentativa de process_openai_request: (response, error, espera_para_repetir)"""
+    try:
+        print(f"🔄 Preparando requisição para {model}...")
+        print(f"   Max Tokens: {max_tokens}")
+        
+        api, params = openai_request_params(messages, model, max_tokens, schema)
+        inicio = time.time()
+        
+        if api == 'responses':
+            print("🔄 Usando Responses API para GPT-5...")
+            response = openai_client.responses.create(**params)
+            print(f"✅ Resposta GPT-5 recebida | Output tokens: {max_tokens}")
+        
+        else:
+            print(f"🔄 Usando Chat Completions API para {model}...")
+            
+            try:
+                # Tentar com max_completion_tokens (novo SDK)
+                response = openai_client.chat.completions.create(**params)
+                print(f"✅ Usando max_completion_tokens: {max_tokens}")
+            except TypeError:
+                # Fallback para max_tokens (SDK antigo ou modelos antigos)
+                params['max_tokens'] = params.pop('max_completion_tokens')
+                response = openai_client.chat.completions.create(**params)
+                print(f"✅ Usando max_tokens (compatibilidade): {max_tokens}")
+        
+        record_openai_latency(model, time.time() - inicio)
+        return compat_response(api, model, response), None, None
+    
+    except Exception as e:
+        print(f"❌ ERRO em process_openai_request: {type(e).__name__}: {str(e)}")
+        espera = should_retry(e, attempt)
+        if espera is not None:
+            return None, OpenAIErrorMessage(e), espera
+        import traceback
+        traceback.print_exc()
+        return None, OpenAIErrorMessage(e), None
+
+def stream_event_parts(api, event):
+    """(texto_delta, usage, finish_reason) de um evento de streaming de qualquer das APIs"""
+    if api == 'responses':
+        tipo = getattr(event, 'type', '')
+        if tipo == 'response.output_text.delta':
+            return event.delta, None, None
+        if tipo in ('response.completed', 'response.incomplete'):
+            resposta = getattr(event, 'response', None)
+            return None, getattr(resposta, 'usage', None), 'stop' if tipo == 'response.completed' else 'length'
+        if tipo in ('response.failed', 'error'):
+            raise RuntimeError(f"Streaming da Responses API falhou: {tipo}")
+        return None, None, None
+    
+    choices = getattr(event, 'choices', None) or []
+    delta = choices[0].delta.content if choices and choices[0].delta else None
+    finish = choices[0].finish_reason if choices else None
+    return delta, getattr(event, 'usage', None), finish
+
+def process_openai_stream(messages, model, max_tokens, schema=None, on_delta=None):
+    """
+    process_openai_request em streaming: on_delta(texto) recebe cada pedaço
+    assim que chega. Retentativas só antes do primeiro pedaço; uma queda no
+    meio devolve o texto parcial com finish_reason 'interrupted'.
+    
+    Returns:
+        Tuple (response, error_message)
+    """
+    if OPENAI_ASYNC_ENABLED:
+        engine = get_async_engine()
+        return engine.submit(engine.request_stream(messages, model, max_tokens, schema, on_delta)).result()
+    
+    attempt = 0
+    while True:
+        partes = []
+        usage = None
+        finish_reason = None
+        try:
+            api, params = openai_request_params(messages, model, max_tokens, schema, stream=True)
+            print(f"🔄 Streaming {model} via {'Responses' if api == 'responses' else 'Chat Completions'} API...")
+            inicio = time.time()
+            
+            if api == 'responses':
+                eventos = openai_client.responses.create(**params)
+            else:
+                try:
+                    eventos = openai_client.chat.completions.create(**params)
+                except TypeError:
+                    params['max_tokens'] = params.pop('max_completion_tokens')
+                    eventos = openai_client.chat.completions.create(**params)
+            
+            for evento in eventos:
+                delta, evento_usage, evento_finish = stream_event_parts(api, evento)
+                if delta:
+                    partes.append(delta)
+                    if on_delta:
+                        on_delta(delta)
+                usage = evento_usage or usage
+                finish_reason = evento_finish or finish_reason
+            
+            record_openai_latency(model, time.time() - inicio)
+            return CompatResponse(''.join(partes), finish_reason or 'stop', record_openai_usage(model, usage)), None
+        
+        except Exception as e:
+            print(f"❌ ERRO em process_openai_stream: {type(e).__name__}: {str(e)}")
+            if partes:
+                return CompatResponse(''.join(partes), 'interrupted', record_openai_usage(model, usage)), None
+            espera = should_retry(e, attempt)
+            if espera is None:
+                return None, OpenAIErrorMessage(e)
+            time.sleep(espera)
+            attempt += 1
+
+# ================================
+# MOTOR ASSÍNCRONO DE ANÁLISE (OPENAI)
+# ================================
+
+class AsyncAnalysisEngine:
+    """
+    Loop asyncio em uma thread própria com um AsyncOpenAI compartilhado.
+    
+    Qualquer thread do Flask entrega corrotinas com submit() e recebe um
+    concurrent.futures.Future; até max_concurrency chamadas ficam em voo ao
+    mesmo tempo no processo, sem ocupar uma thread por chamada.
+    """
+    
+    def __init__(self, max_concurrency):
+        self.max_concurrency = max_concurrency
+        self.client = AsyncOpenAI(
+            api_key=os.getenv('OPENAI_API_KEY'), base_url=OPENAI_BASE_URL, timeout=OPENAI_TIMEOUT, max_retries=0
+        )
+        self.loop = asyncio.new_event_loop()
+        self.semaphore = None
+        self.stats = {
+            'submitted': 0, 'completed': 0, 'errors': 0, 'in_flight': 0, 'peak_in_flight': 0, 'waiting': 0,
+            'hedges': 0, 'hedge_wins': 0
+        }
+        self._lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run, name='openai-async', daemon=True)
+        self.thread.start()
+    
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.loop.run_forever()
+    
+    def _count(self, campo, delta=1):
+        with self._lock:
+            self.stats[campo] += delta
+            if campo == 'in_flight':
+                self.stats['peak_in_flight'] = max(self.stats['peak_in_flight'], self.stats['in_flight'])
+    
+    def submit(self, coro):
+        """Agendar a corrotina no loop (thread-safe), levando o medidor de tokens e o contexto de ingestão de quem chamou"""
+        self._count('submitted')
+        meter = openai_usage_meter.get()
+        ingestao = ingestion_context.get()
+        if meter is not None or ingestao:
+            coro = self._with_context(coro, meter, ingestao)
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+    
+    @staticmethod
+    async def _with_context(coro, meter, ingestao):
+        openai_usage_meter.set(meter)
+        ingestion_context.set(ingestao)
+        return await coro
+    
+    async def request(self, messages, model, max_tokens, schema=None):
+        """Versão assíncrona de process_openai_request: (response, error), com retentativas"""
+        api, params = openai_request_params(messages, model, max_tokens, schema)
+        print(f"🔄 [async] {model} via {'Responses' if api == 'responses' else 'Chat Completions'} API...")
+        
+        attempt = 0
+        while True:
+            try:
+                response = await self._hedged_call(api, dict(params), model)
+                self._count('completed')
+                return compat_response(api, model, response), None
+            except Exception as e:
+                print(f"❌ ERRO em AsyncAnalysisEngine.request: {type(e).__name__}: {str(e)}")
+                espera = should_retry(e, attempt)
+                if espera is None:
+                    self._count('errors')
+                    return None, OpenAIErrorMessage(e)
+                # A espera não ocupa vaga do semáforo
+                await asyncio.sleep(espera)
+                attempt += 1
+    
+    async def request_stream(self, messages, model, max_tokens, schema=None, on_delta=None):
+        """Versão assíncrona de process_openai_stream (sem hedging: o texto já começou a chegar)"""
+        api, params = openai_request_params(messages, model, max_tokens, schema, stream=True)
+        print(f"🔄 [async] Streaming {model} via {'Responses' if api == 'responses' else 'Chat Completions'} API...")
+        
+        attempt = 0
+        while True:
+            partes = []
+            usage = None
+            finish_reason = None
+            self._count('waiting')
+            async with self.semaphore:
+                self._count('waiting', -1)
+                self._count('in_flight')
+                inicio = time.time()
+                try:
+                    chamada = dict(params)
+                    if api == 'responses':
+                        eventos = await self.client.responses.create(**chamada)
+                    else:
+                        try:
+                            eventos = await self.client.chat.completions.create(**chamada)
+                        except TypeError:
+                            chamada['max_tokens'] = chamada.pop('max_completion_tokens')
+                            eventos = await self.client.chat.completions.create(**chamada)
+                    
+                    async for evento in eventos:
+                        delta, evento_usage, evento_finish = stream_event_parts(api, evento)
+                        if delta:
+                            partes.append(delta)
+                            if on_delta:
+                                on_delta(delta)
+                        usage = evento_usage or usage
+                        finish_reason = evento_finish or finish_reason
+                    
+                    record_openai_latency(model, time.time() - inicio)
+                    self._count('completed')
+                    return CompatResponse(''.join(partes), finish_reason or 'stop', record_openai_usage(model, usage)), None
+                
+                except Exception as e:
+                    print(f"❌ ERRO em AsyncAnalysisEngine.request_stream: {type(e).__name__}: {str(e)}")
+                    if partes:
+                        self._count('completed')
+                        return CompatResponse(''.join(partes), 'interrupted', record_openai_usage(model, usage)), None
+                    espera = should_retry(e, attempt)
+                    if espera is None:
+                        self._count('errors')
+                        return None, OpenAIErrorMessage(e)
+                finally:
+                    self._count('in_flight', -1)
+            
+            # A espera não ocupa vaga do semáforo
+            await asyncio.sleep(espera)
+            attempt += 1
+    
+    async def _hedged_call(self, api, params, model):
+        """
+        Chamada com hedging: se a primeira passar do p95 recente do modelo,
+        dispara uma segunda igual; vale a primeira que terminar com sucesso
+        e a outra é cancelada.
+        """
+        orcamento = openai_latency.quantile(model) if OPENAI_HEDGE_ENABLED else None
+        if orcamento is None:
+            return await self._call(api, params, model)
+        
+        principal = asyncio.ensure_future(self._call(api, params, model))
+        done, _ = await asyncio.wait({principal}, timeout=orcamento)
+        if done:
+            return principal.result()
+        
+        self._count('hedges')
+        print(f"🪃 Hedge {model}: primeira chamada passou de {orcamento:.1f}s (p{int(OPENAI_HEDGE_QUANTILE * 100)})")
+        reserva = asyncio.ensure_future(self._call(api, dict(params), model))
+        tarefas = {principal, reserva}
+        erro = None
+        
+        try:
+            while tarefas:
+                done, tarefas = await asyncio.wait(tarefas, return_when=asyncio.FIRST_COMPLETED)
+                for tarefa in done:
+                    if tarefa.exception() is None:
+                        if tarefa is reserva:
+                            self._count('hedge_wins')
+                        return tarefa.result()
+                    erro = tarefa.exception()
+            raise erro
+        finally:
+            for tarefa in tarefas:
+                tarefa.cancel()
+    
+    async def _call(self, api, params, model):
+        """Uma chamada à OpenAI ocupando uma vaga do semáforo"""
+        self._count('waiting')
+        async with self.semaphore:
+            self._count('waiting', -1)
+            self._count('in_flight')
+            inicio = time.time()
+            try:
+                if api == 'responses':
+                    response = await self.client.responses.create(**params)
+                else:
+                    try:
+                        response = await self.client.chat.completions.create(**params)
+                    except TypeError:
+                        params['max_tokens'] = params.pop('max_completion_tokens')
+                        response = await self.client.chat.completions.create(**params)
+                record_openai_latency(model, time.time() - inicio)
+                return response
+            finally:
+                self._count('in_flight', -1)
+    
+    def info(self):
+        with self._lock:
+            return {'max_concurrency': self.max_concurrency, **self.stats}
 
-# ================================
-# FASE 2.1 - ANÁLISE COM OpenAI
-# ================================
+_async_engine = None
+_async_engine_pid = None
+_async_engine_lock = threading.Lock()
 
-def extract_pdf_text(file):
-    """Extrair texto de PDF usando PyPDF2"""
-    try:
-        pdf_reader = PyPDF2.PdfReader(file)
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n"
-        return text.strip()
-    except Exception as e:
-        print(f"❌ Erro ao extrair PDF: {e}")
-        raise
+def get_async_engine():
+    """Motor assíncrono do processo (recriado após fork, p.ex. workers do gunicorn)"""
+    global _async_engine, _async_engine_pid
+    with _async_engine_lock:
+        if _async_engine is None or _async_engine_pid != os.getpid():
+            _async_engine = AsyncAnalysisEngine(OPENAI_MAX_CONCURRENCY)
+            _async_engine_pid = os.getpid()
+        return _async_engine
 
 # ================================
-# UTILITÁRIO - COMPATIBILIDADE COM RESPONSES API (GPT-5)
+# SAÍDA ESTRUTURADA E PARSER INCREMENTAL DE JSON
 # ================================
 
-class CompatResponse:
-    """Classe para compatibilidade entre Responses API (GPT-5) e Chat Completions API"""
-    class Choice:
-        class Message:
-            def __init__(self, content):
-                self.content = content
-        
-        def __init__(self, content):
-            self.message = self.Message(content)
-            self.finish_reason = "stop"
-    
-    def __init__(self, content):
-        self.choices = [self.Choice(content)]
+def _schema_objeto(propriedades):
+    """Objeto no formato exigido pelo modo strict: todos os campos obrigatórios, nada extra"""
+    return {
+        'type': 'object',
+        'properties': propriedades,
+        'required': list(propriedades),
+        'additionalProperties': False
+    }
+
+_SCHEMA_TEXTO = {'type': ['string', 'null']}
+_SCHEMA_VALOR = {'type': ['number', 'string', 'null']}  # string = "não_informado"
+
+ANALYSIS_JSON_SCHEMA = {
+    'name': 'analise_obras',
+    'strict': True,
+    'schema': _schema_objeto({
+        'obras': {
+            'type': 'array',
+            'items': _schema_objeto({
+                'competencia': _SCHEMA_TEXTO,
+                'codigo_obra': _SCHEMA_TEXTO,
+                'nome_obra': _SCHEMA_TEXTO,
+                'tipo_documento': _SCHEMA_TEXTO,
+                'saldo_inicial': _SCHEMA_VALOR,
+                'saldo_final': _SCHEMA_VALOR,
+                'despesas': {'type': 'array', 'items': _schema_objeto({
+                    'descricao': _SCHEMA_TEXTO,
+                    'valor': _SCHEMA_VALOR,
+                    'categoria': _SCHEMA_TEXTO,
+                    'fornecedor': _SCHEMA_TEXTO
+                })},
+                'despesas_total': _SCHEMA_VALOR,
+                'receitas': {'type': 'array', 'items': _schema_objeto({
+                    'tipo': _SCHEMA_TEXTO,
+                    'valor': _SCHEMA_VALOR
+                })},
+                'receitas_total': _SCHEMA_VALOR,
+                'aportes_pool': _schema_objeto({
+                    'valor_total_pool': _SCHEMA_VALOR,
+                    'despesas_todas_obras': _SCHEMA_VALOR,
+                    'despesas_esta_obra': _SCHEMA_VALOR,
+                    'taxa_rateio_percentual': _SCHEMA_VALOR,
+                    'valor_rateado_esta_obra': _SCHEMA_VALOR,
+                    'metodo_calculo': _SCHEMA_TEXTO
+                }),
+                'rentabilidade_mensal': _SCHEMA_VALOR,
+                'conciliacao_bancaria': _schema_objeto({
+                    'saldo_banco': _SCHEMA_VALOR,
+                    'saldo_sistema': _SCHEMA_VALOR,
+                    'diferenca': _SCHEMA_VALOR,
+                    'status': _SCHEMA_TEXTO
+                }),
+                'validacoes': _schema_objeto({
+                    'saldo_auditoria': _schema_objeto({
+                        'status': _SCHEMA_TEXTO,
+                        'diferenca_permitida': _SCHEMA_VALOR
+                    }),
+                    'alertas': {'type': 'array', 'items': {'type': 'string'}}
+                }),
+                'observacoes': _SCHEMA_TEXTO,
+                'qualidade_extracao': _SCHEMA_TEXTO
+            })
+        }
+    })
+}
+
+OBRAS_KEY_RE = re.compile(r'"obras"\s*:\s*$')
 
-def process_openai_request(messages, model, max_tokens):
+class JsonItemStream:
     """
-    Processa requisição OpenAI com suporte a GPT-5 (Responses API) e compatibilidade com outros modelos
-    
-    Args:
-        messages: Lista de mensagens com roles 'system' e 'user'
-        model: Nome do modelo ('gpt-5', 'gpt-4o', etc)
-        max_tokens: Máximo de tokens na resposta
+    Parser incremental da resposta: recebe o texto em pedaços (feed) e entrega
+    cada obra assim que o objeto dela fecha, sem esperar o fim da resposta.
     
-    Returns:
-        Tuple (response, error_message)
+    Aceita a lista pura ([{...}, ...]), o objeto do schema ({"obras": [...]})
+    ou uma obra solta ({...}). Texto antes do JSON (markdown, narrativa) e
+    depois dele é ignorado. Em resposta truncada, finish() mantém as obras
+    completas e recupera a obra interrompida até o último item inteiro.
     """
-    try:
-        print(f"🔄 Preparando requisição para {model}...")
-        print(f"   Max Tokens: {max_tokens}")
+    
+    def __init__(self, on_item=None):
+        self.on_item = on_item
+        self.text = ''
+        self.pos = 0
+        self.stack = []
+        self.in_string = False
+        self.escape = False
+        self.root_start = None
+        self.root_end = None
+        self.obras_open = False
+        self.item_start = None
+        self.items = []
+    
+    def _at_items(self):
+        """Posição atual é a lista de obras (nível dos itens)"""
+        if not self.stack:
+            return False
+        if self.stack[0] == '[':
+            return len(self.stack) == 1
+        return self.obras_open and len(self.stack) == 2 and self.stack[1] == '['
+    
+    def feed(self, chunk):
+        """Consumir mais texto; devolve as obras completadas neste pedaço"""
+        self.text += chunk
+        novos = []
+        text = self.text
         
-        # ⭐ GPT-5 usa Responses API, não Chat Completions!
-        if model.startswith('gpt-5'):
-            print("🔄 Usando Responses API para GPT-5...")
-            
-            # Extrair system prompt e user message
-            system_content = ""
-            user_message = ""
-            for msg in messages:
-                if msg.get("role") == "system":
-                    system_content = msg.get("content", "")
-                elif msg.get("role") == "user":
-                    user_message = msg.get("content", "")
+        for i in range(self.pos, len(text)):
+            c = text[i]
+            if self.root_end is not None:
+                break
             
-            # Concatenar para Responses API (requer input único)
-            combined_input = f"INSTRUÇÕES:\n{system_content}\n\nCONTEÚDO:\n{user_message}"
-            
-            print(f"📝 System prompt length: {len(system_content)} chars")
-            print(f"📝 User message length: {len(user_message)} chars")
-            print(f"📝 Combined input length: {len(combined_input)} chars")
+            if self.root_start is None:
+                if c in '[{':
+                    self.root_start = i
+                    self.stack.append(c)
+                continue
             
-            # ✅ Responses API com parâmetros corretos para GPT-5
-            # IMPORTANTE: reasoning com effort LOW para economizar tempo e memória!
-            response = openai_client.responses.create(
-                model=model,
-                input=combined_input,
-                max_output_tokens=max_tokens,
-                reasoning={"effort": "low"},  # ⭐ LOW, não HIGH (evita timeout/memória)
-                text={"verbosity": "high"}
-            )
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif c == '\\':
+                    self.escape = True
+                elif c == '"':
+                    self.in_string = False
+                continue
             
-            print(f"✅ Resposta GPT-5 recebida | Output tokens: {max_tokens}")
-            return CompatResponse(response.output_text), None
+            if c == '"':
+                self.in_string = True
+            elif c in '[{':
+                if self._at_items() and self.item_start is None and c == '{':
+                    self.item_start = i
+                elif c == '[' and self.stack == ['{'] and OBRAS_KEY_RE.search(text[self.root_start:i]):
+                    self.obras_open = True
+                self.stack.append(c)
+            elif c in ']}':
+                self.stack.pop()
+                if not self.stack:
+                    self.root_end = i
+                elif self._at_items() and self.item_start is not None:
+                    novos.append(self._emit(text[self.item_start:i + 1]))
+                    self.item_start = None
+                elif self.stack == ['{'] and c == ']':
+                    self.obras_open = False
         
-        else:
-            # Chat Completions API para outros modelos (GPT-4o, GPT-4, etc)
-            print(f"🔄 Usando Chat Completions API para {model}...")
-            
-            try:
-                # Tentar com max_completion_tokens (novo SDK)
-                response = openai_client.chat.completions.create(
-                    model=model,
-                    messages=messages,
-                    max_completion_tokens=max_tokens,
-                    temperature=0.7,
-                    timeout=OPENAI_TIMEOUT
-                )
-                print(f"✅ Usando max_completion_tokens: {max_tokens}")
-                return response, None
-            except TypeError:
-                # Fallback para max_tokens (SDK antigo ou modelos antigos)
-                response = openai_client.chat.completions.create(
-                    model=model,
-                    messages=messages,
-                    max_tokens=max_tokens,
-                    temperature=0.7,
-                    timeout=OPENAI_TIMEOUT
-                )
-                print(f"✅ Usando max_tokens (compatibilidade): {max_tokens}")
-                return response, None
+        self.pos = len(text)
+        return [item for item in novos if item is not None]
     
-    except Exception as e:
-        print(f"❌ ERRO em process_openai_request: {type(e).__name__}: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return None, str(e)
+    def _emit(self, fragmento):
+        try:
+            item = json.loads(fragmento)
+        except ValueError:
+            return None
+        item = coerce_analysis_numbers(item)
+        self.items.append(item)
+        if self.on_item:
+            self.on_item(item)
+        return item
+    
+    def finish(self, truncated=False):
+        """
+        Resultado final: lista de obras (ou a obra solta). Se o JSON não fechou,
+        a obra em andamento é recuperada até o último item completo e marcada.
+        """
+        if self.root_start is None:
+            return None
+        
+        if self.root_end is not None:
+            if self.stack == [] and self.text[self.root_start] == '{' and not self.items:
+                try:
+                    raiz = json.loads(self.text[self.root_start:self.root_end + 1])
+                except ValueError:
+                    return None
+                if isinstance(raiz, dict) and isinstance(raiz.get('obras'), list):
+                    return [coerce_analysis_numbers(o) for o in raiz['obras'] if isinstance(o, dict)]
+                return coerce_analysis_numbers(raiz)
+            return list(self.items)
+        
+        # JSON incompleto (max tokens, queda do streaming)
+        inicio = self.item_start
+        solta = self.text[self.root_start] == '{' and not self.obras_open and not self.items
+        if inicio is None and solta:
+            inicio = self.root_start
+        
+        parcial = repair_truncated_json(self.text[inicio:]) if inicio is not None else None
+        motivo = 'resposta truncada' if truncated else 'JSON incompleto'
+        
+        if isinstance(parcial, dict) and parcial:
+            parcial = coerce_analysis_numbers(parcial)
+            parcial.setdefault('validacoes', {}).setdefault('alertas', []).append(
+                f"⚠️ OBRA PARCIAL: {motivo} - itens após o último completo foram perdidos"
+            )
+            parcial['qualidade_extracao'] = "⚠️ Parcial - campos faltantes"
+            if solta:
+                return parcial
+            self.items.append(parcial)
+        
+        print(f"⚠️ {motivo.capitalize()}: {len(self.items)} obra(s) aproveitada(s)")
+        return list(self.items) if self.items else None
 
-def analyze_with_openai(pdf_text, document_type='relatório', model='gpt-4o'):
-    """Analisar texto com OpenAI (GPT-5, GPT-4o, etc) - Lógica CEO Financeiro"""
+def repair_truncated_json(fragmento):
+    """
+    Fechar um objeto JSON cortado no meio: volta até o último ponto em que só
+    havia itens completos (sem elemento de lista pela metade) e fecha as
+    chaves/colchetes abertos. Devolve o objeto ou None.
+    """
+    pilha = []  # (caractere, é elemento de lista)
+    em_string = escape = False
+    corte = None
+    pilha_corte = None
+    
+    def pode_cortar():
+        # Elementos de lista pela metade (uma despesa sem valor) não entram
+        return not any(c == '{' and elemento for c, elemento in pilha[1:])
+    
+    for i, c in enumerate(fragmento):
+        if em_string:
+            if escape:
+                escape = False
+            elif c == '\\':
+                escape = True
+            elif c == '"':
+                em_string = False
+            continue
+        
+        if c == '"':
+            em_string = True
+        elif c in '[{':
+            pilha.append((c, bool(pilha) and pilha[-1][0] == '['))
+            if pode_cortar():
+                corte, pilha_corte = i + 1, list(pilha)
+        elif c in ']}':
+            if not pilha:
+                break
+            pilha.pop()
+            if not pilha:
+                corte, pilha_corte = i + 1, []
+                break
+            if pode_cortar():
+                corte, pilha_corte = i + 1, list(pilha)
+        elif c == ',' and pilha and pode_cortar():
+            corte, pilha_corte = i, list(pilha)
+    
+    if corte is None:
+        return None
+    
+    fechamento = ''.join('}' if c == '{' else ']' for c, _ in reversed(pilha_corte))
+    texto = fragmento[:corte].rstrip().rstrip(',') + fechamento
     try:
-        prompt = f"""🎯 VOCÊ É UM AUDITOR FINANCEIRO SÊNIOR - RIVIERA EMPREENDIMENTOS
+        return json.loads(texto)
+    except ValueError:
+        return None
+
+# ================================
+# PROMPT DE ANÁLISE (PREFIXO FIXO)
+# ================================
+
+# Instruções e esquema JSON ficam fora do f-string: o mesmo texto, byte a byte,
+# abre toda requisição (Responses e Chat Completions), e a OpenAI reaproveita
+# esse prefixo do cache dela. O documento vai sempre na última mensagem.
+ANALYSIS_INSTRUCTIONS = """🎯 VOCÊ É UM AUDITOR FINANCEIRO SÊNIOR - RIVIERA EMPREENDIMENTOS
 
 MISSÃO CRÍTICA:
 Processar PDFs mensais de Praias SP com PRECISÃO ABSOLUTA. Cada número errado custará MILHARES.
@@ -984,6 +4279,8 @@ EXTRAÇÃO OBRIGATÓRIA DE CAMPOS:
      * fornecedor: "Nome Exato do Fornecedor"
    - TOTALIZE: despesas_total = SUM(todas despesas)
    - VALIDAR: Se há tabelas, leia TODA a coluna de valores
+   - Tabelas podem vir como blocos "[TABELA p.N #M]" em TSV: colunas separadas
+     por TAB, primeira linha = cabeçalho, uma linha por lançamento
    - SE HOUVER DÚVIDA: indique com "⚠️" no JSON
 
 5️⃣ RECEITAS (tudo que entra)
@@ -1065,7 +4362,7 @@ REGRAS NÃO-NEGOCIÁVEIS:
 RETORNE ESTE JSON (sem markdown, sem explicações):
 
 [
-  {{
+  {
     "competencia": "09/2025",
     "codigo_obra": "616",
     "nome_obra": "Extra Contratual - Fiação Enterrada Av. Riviera Mod. 17 e 18",
@@ -1073,127 +4370,267 @@ RETORNE ESTE JSON (sem markdown, sem explicações):
     "saldo_inicial": 282995.57,
     "saldo_final": 355854.25,
     "despesas": [
-      {{"descricao": "Descrição exata", "valor": 123.45, "categoria": "Servicos", "fornecedor": "Nome Fornecedor"}}
+      {"descricao": "Descrição exata", "valor": 123.45, "categoria": "Servicos", "fornecedor": "Nome Fornecedor"}
     ],
     "despesas_total": 82.60,
     "receitas": [
-      {{"tipo": "Aporte", "valor": 1000.00}},
-      {{"tipo": "Rentabilidade", "valor": 72941.28}}
+      {"tipo": "Aporte", "valor": 1000.00},
+      {"tipo": "Rentabilidade", "valor": 72941.28}
     ],
     "receitas_total": 72941.28,
-    "aportes_pool": {{
+    "aportes_pool": {
       "valor_total_pool": 5483433.37,
       "despesas_todas_obras": 7319162.16,
       "despesas_esta_obra": 82.60,
       "taxa_rateio_percentual": 0.001129,
       "valor_rateado_esta_obra": 61.87,
       "metodo_calculo": "Proporcional às despesas mensais"
-    }},
+    },
     "rentabilidade_mensal": 72941.28,
-    "conciliacao_bancaria": {{
+    "conciliacao_bancaria": {
       "saldo_banco": 355854.25,
       "saldo_sistema": 355854.25,
       "diferenca": 0.00,
       "status": "conciliado"
-    }},
-    "validacoes": {{
-      "saldo_auditoria": {{"status": "OK", "diferenca_permitida": 0.00}},
+    },
+    "validacoes": {
+      "saldo_auditoria": {"status": "OK", "diferenca_permitida": 0.00},
       "alertas": []
-    }},
+    },
     "observacoes": "Texto se houver algo relevante",
     "qualidade_extracao": "✅ Completa" | "⚠️ Parcial - campos faltantes" | "❌ Erro - campo crítico ausente"
-  }}
+  }
 ]
 
-═════════════════════════════════════════════════════════════════════════════
+═════════════════════════════════════════════════════════════════════════════"""
 
-DOCUMENTO A PROCESSAR:
-{pdf_text}"""
-        
-        messages = [
-            {
-                "role": "system",
-                "content": "VOCÊ DEVE RETORNAR APENAS JSON VÁLIDO. NÃO RETORNE MARKDOWN, NÃO RETORNE NARRATIVA, NÃO RETORNE EXPLICAÇÕES. APENAS JSON PURO E VÁLIDO."
-            },
-            {
-                "role": "user",
-                "content": prompt
-            }
-        ]
-        
-        # Usar função unificada com suporte a GPT-5
-        print(f"🤖 Analisando com {model}...")
-        response, error = process_openai_request(messages, model, max_tokens=6000)
-        
-        if error:
-            print(f"❌ Erro ao chamar OpenAI: {error}")
-            raise ValueError(f"Erro na API OpenAI: {error}")
-        
-        # Extrair conteúdo
-        response_text = response.choices[0].message.content.strip()
-        
-        # ⭐ AGRESSIVAMENTE remover markdown e narrativa
-        print(f"📝 Resposta bruta ({len(response_text)} chars): {response_text[:100]}...")
-        
-        # Remover markdown code blocks
-        if response_text.startswith('```'):
-            response_text = response_text.split('```')[1]
-            if response_text.startswith('json'):
-                response_text = response_text[4:]
-            elif response_text.startswith('\n'):
-                response_text = response_text[1:]
-        
-        # Remover trailing markdown
-        if response_text.endswith('```'):
-            response_text = response_text[:-3]
-        
-        # Procurar por [ ou { para começar o JSON
-        start_idx = response_text.find('[')
-        if start_idx == -1:
-            start_idx = response_text.find('{')
-        
-        if start_idx > 0:
-            print(f"⚠️ Encontrou narrativa antes do JSON. Removendo primeiros {start_idx} chars...")
-            response_text = response_text[start_idx:]
-        
-        # Procurar pelo final do JSON
-        end_idx = max(response_text.rfind(']'), response_text.rfind('}'))
-        if end_idx > 0 and end_idx < len(response_text) - 1:
-            print(f"⚠️ Encontrou narrativa após JSON. Removendo últimos {len(response_text) - end_idx - 1} chars...")
-            response_text = response_text[:end_idx + 1]
-        
-        # Tentar parse JSON com retry
-        try:
-            result = json.loads(response_text)
-            print(f"✅ JSON parseado com sucesso!")
-            return result
-        except json.JSONDecodeError as e:
-            print(f"❌ Erro ao fazer parse JSON na primeira tentativa: {e}")
-            print(f"📄 Conteúdo: {response_text[:200]}...")
-            
-            # RETRY: Se for array, tentar extrair primeiro elemento
-            try:
-                result = json.loads(response_text)
-                return result
-            except:
-                raise ValueError(f"Resposta não é JSON válido. Resposta: {response_text[:500]}")
-    
-    except json.JSONDecodeError as e:
-        print(f"❌ Erro ao fazer parse JSON da resposta OpenAI: {e}")
-        raise ValueError(f"Resposta inválida do OpenAI: {str(e)}")
-    except Exception as e:
-        print(f"❌ Erro ao analisar com OpenAI: {e}")
-        raise
+ANALYSIS_SYSTEM_PROMPT = (
+    "VOCÊ DEVE RETORNAR APENAS JSON VÁLIDO. NÃO RETORNE MARKDOWN, NÃO RETORNE NARRATIVA, "
+    "NÃO RETORNE EXPLICAÇÕES. APENAS JSON PURO E VÁLIDO. "
+    "SE O FORMATO DE RESPOSTA EXIGIR UM OBJETO, A LISTA DE OBRAS VAI NO CAMPO \"obras\".\n\n"
+    + ANALYSIS_INSTRUCTIONS
+)
+
+# Só vai no prompt quando build_analysis_messages normaliza o documento
+NUMBER_NORMALIZATION_NOTE = """
+
+NÚMEROS JÁ NORMALIZADOS NO DOCUMENTO:
+- Valores monetários já vêm como 1234567.89 (ponto decimal, sem R$, sem milhar)
+- Negativos já vêm com sinal: -82.60 (eram "(82,60)" ou "82,60-")
+- Competências por extenso vêm acompanhadas da forma numérica: "SETEMBRO/25 [09/2025]"
+- COPIE esses valores como estão, sem reconverter
+
+═════════════════════════════════════════════════════════════════════════════"""
+
+if NUMBER_NORMALIZATION_ENABLED:
+    ANALYSIS_SYSTEM_PROMPT += NUMBER_NORMALIZATION_NOTE
+
+# ================================
+# ORÇAMENTO DE TOKENS POR DOCUMENTO
+# ================================
+
+# Limites por modelo (prefixo do nome): janela de contexto e saída máxima
+MODEL_TOKEN_LIMITS = {
+    'gpt-5': {'context': 400000, 'output': 128000, 'reasoning': 2000},
+    'gpt-4.1': {'context': 1047576, 'output': 32768, 'reasoning': 0},
+    'gpt-4o': {'context': 128000, 'output': 16384, 'reasoning': 0},
+    'gpt-4': {'context': 8192, 'output': 4096, 'reasoning': 0},
+    'gpt-3.5-turbo': {'context': 16385, 'output': 4096, 'reasoning': 0},
+}
+
+VALUE_LINE_RE = re.compile(r'\d{1,3}(?:\.\d{3})*,\d{2}\b|(?<![\d,])-?\d+\.\d{2}\b')
+
+def model_token_limits(model):
+    """Limites do modelo (o prefixo mais longo que casar; padrão conservador)"""
+    for prefixo in sorted(MODEL_TOKEN_LIMITS, key=len, reverse=True):
+        if model.startswith(prefixo):
+            return MODEL_TOKEN_LIMITS[prefixo]
+    return {'context': 8192, 'output': 4096, 'reasoning': 0}
+
+def count_value_rows(text):
+    """Linhas com valor monetário (cada uma vira uma despesa/receita no JSON)"""
+    return sum(1 for linha in (text or '').splitlines() if VALUE_LINE_RE.search(linha))
+
+def plan_output_budget(text, model):
+    """
+    Planejar a chamada de análise a partir do texto:
+    - input_tokens: prompt fixo + documento
+    - max_tokens: saída esperada (linhas com valor × tokens por item + campos
+      fixos por obra + raciocínio do modelo), com 25% de folga
+    - partes: 1 se cabe em uma chamada; mais se a saída passaria de
+      OUTPUT_BUDGET_MAX/limite do modelo ou a entrada não caberia no contexto
+    """
+    limites = model_token_limits(model)
+    linhas = count_value_rows(text)
+    obras = max(len(parse_codigos_obra(normalize_layout_text(text[:3000]))), 1)
+    input_tokens = estimate_tokens(ANALYSIS_SYSTEM_PROMPT) + estimate_tokens(text)
+    
+    saida = (linhas * OUTPUT_TOKENS_PER_ROW + obras * OUTPUT_TOKENS_PER_OBRA) * 1.25 + limites['reasoning']
+    teto = min(OUTPUT_BUDGET_MAX, limites['output'])
+    max_tokens = int(min(max(saida, OUTPUT_BUDGET_MIN), teto))
+    
+    partes = 1
+    if saida > teto:
+        partes = math.ceil(saida / teto)
+    if input_tokens + max_tokens > limites['context']:
+        disponivel = max(limites['context'] - max_tokens - estimate_tokens(ANALYSIS_SYSTEM_PROMPT), 1000)
+        partes = max(partes, math.ceil(estimate_tokens(text) / disponivel))
+    
+    return {
+        'input_tokens': input_tokens,
+        'linhas_valor': linhas,
+        'obras': obras,
+        'max_tokens': max_tokens,
+        'partes': partes
+    }
+
+def split_for_budget(text, partes):
+    """Dividir o texto em ~partes pedaços (tabelas repetem o cabeçalho); continuações levam o cabeçalho"""
+    pedacos = split_text_chunks(text, max(len(text) // partes + 1, 1000))
+    
+    # Título/cabeçalho sem valores não vira chamada própria: vai junto da 1ª parte
+    while len(pedacos) > 1 and not count_value_rows(pedacos[0]):
+        titulo = pedacos.pop(0)
+        pedacos[0] = f"{titulo}\n{pedacos[0]}"
+    # Sobra pequena no fim (< 10% de uma parte) vai junto da anterior
+    if len(pedacos) > 1 and count_value_rows(pedacos[-1]) * 10 < count_value_rows(pedacos[-2]):
+        sobra = pedacos.pop()
+        pedacos[-1] = f"{pedacos[-1]}\n{sobra}"
+    if len(pedacos) <= 1:
+        return pedacos
+    
+    cabecalho = document_header(pedacos[0])
+    return [pedacos[0]] + [
+        f"[PARTE {n} DO DOCUMENTO - cabeçalho da primeira parte:]\n{cabecalho}\n[CONTINUAÇÃO:]\n{pedaco}"
+        for n, pedaco in enumerate(pedacos[1:], start=2)
+    ]
+
+def planned_output_budget(pdf_text, model):
+    """(max_tokens, partes_do_texto) para analyze_with_openai"""
+    if not OUTPUT_BUDGET_ENABLED:
+        return 6000, [pdf_text]
+    
+    plano = plan_output_budget(pdf_text, model)
+    print(f"🧮 Orçamento {model}: entrada ~{plano['input_tokens']} tokens, {plano['linhas_valor']} linha(s) "
+          f"com valor, {plano['obras']} obra(s) → saída {plano['max_tokens']} tokens em {plano['partes']} parte(s)")
+    
+    if plano['partes'] <= 1:
+        return plano['max_tokens'], [pdf_text]
+    return plano['max_tokens'], split_for_budget(pdf_text, plano['partes'])
+
+def build_analysis_messages(pdf_text):
+    """Mensagens da análise: prefixo fixo (system) + documento (user, por último)"""
+    # Números e competências já normalizados localmente (menos trabalho para o modelo)
+    if NUMBER_NORMALIZATION_ENABLED:
+        pdf_text = normalize_br_text(pdf_text)
+    
+    return [
+        {"role": "system", "content": ANALYSIS_SYSTEM_PROMPT},
+        # Documento por último: tudo antes dele é prefixo fixo (cacheável)
+        {"role": "user", "content": f"DOCUMENTO A PROCESSAR:\n{pdf_text}"}
+    ]
+
+def analyze_with_openai(pdf_text, document_type='relatório', model='gpt-4o'):
+    """Analisar texto com OpenAI (GPT-5, GPT-4o, etc) - Lógica CEO Financeiro"""
+    max_tokens, partes = planned_output_budget(pdf_text, model)
+    if len(partes) > 1:
+        # Saída não caberia em uma chamada: uma análise por parte, unidas na ordem do texto.
+        # Esta função já roda em threads de chunks/workers: as partes só vão em paralelo
+        # pelo motor assíncrono (limite OPENAI_MAX_CONCURRENCY do processo), senão em sequência
+        if OPENAI_ASYNC_ENABLED:
+            engine = get_async_engine()
+            futures = [engine.submit(analyze_text_part_async(parte, document_type, model)) for parte in partes]
+            return merge_partial_analyses([future.result() for future in futures])
+        return merge_partial_analyses([analyze_text_part(parte, document_type, model) for parte in partes])
+    return analyze_text_part(pdf_text, document_type, model, max_tokens)
+
+def analyze_text_part(pdf_text, document_type='relatório', model='gpt-4o', max_tokens=None):
+    """Uma chamada de análise (o texto já cabe no orçamento)"""
+    if max_tokens is None:
+        max_tokens = plan_output_budget(pdf_text, model)['max_tokens'] if OUTPUT_BUDGET_ENABLED else 6000
+    messages = build_analysis_messages(pdf_text)
+    schema = ANALYSIS_JSON_SCHEMA if STRUCTURED_OUTPUT_ENABLED else None
+    parser = JsonItemStream(on_item=log_obra_recebida)
+    
+    # Usar função unificada com suporte a GPT-5
+    print(f"🤖 Analisando com {model}...")
+    if ANALYSIS_STREAMING_ENABLED:
+        response, error = process_openai_stream(messages, model, max_tokens, schema, parser.feed)
+    else:
+        response, error = process_openai_request(messages, model, max_tokens=max_tokens, schema=schema)
+    return parse_analysis_response(response, error, parser if ANALYSIS_STREAMING_ENABLED else None)
+
+async def analyze_with_openai_async(pdf_text, document_type='relatório', model='gpt-4o'):
+    """analyze_with_openai no motor assíncrono (limite OPENAI_MAX_CONCURRENCY)"""
+    max_tokens, partes = planned_output_budget(pdf_text, model)
+    if len(partes) > 1:
+        analyses = await asyncio.gather(*(
+            analyze_text_part_async(parte, document_type, model) for parte in partes
+        ))
+        return merge_partial_analyses(list(analyses))
+    return await analyze_text_part_async(pdf_text, document_type, model, max_tokens)
+
+async def analyze_text_part_async(pdf_text, document_type='relatório', model='gpt-4o', max_tokens=None):
+    """analyze_text_part no motor assíncrono"""
+    if max_tokens is None:
+        max_tokens = plan_output_budget(pdf_text, model)['max_tokens'] if OUTPUT_BUDGET_ENABLED else 6000
+    messages = build_analysis_messages(pdf_text)
+    schema = ANALYSIS_JSON_SCHEMA if STRUCTURED_OUTPUT_ENABLED else None
+    parser = JsonItemStream(on_item=log_obra_recebida)
+    engine = get_async_engine()
+    
+    print(f"🤖 Analisando com {model} (async)...")
+    if ANALYSIS_STREAMING_ENABLED:
+        response, error = await engine.request_stream(messages, model, max_tokens, schema, parser.feed)
+    else:
+        response, error = await engine.request(messages, model, max_tokens=max_tokens, schema=schema)
+    return parse_analysis_response(response, error, parser if ANALYSIS_STREAMING_ENABLED else None)
+
+def log_obra_recebida(obra):
+    """Obra completa chegou no streaming (antes do fim da resposta)"""
+    despesas = obra.get('despesas') if isinstance(obra, dict) else None
+    print(f"📦 Obra {obra.get('codigo_obra', '?')} recebida ({len(despesas or [])} despesa(s))")
+
+def parse_analysis_response(response, error, parser=None):
+    """
+    Extrair a análise da resposta OpenAI (ou levantar ValueError).
+    
+    parser é o JsonItemStream que já consumiu o streaming; sem ele, o texto
+    completo passa por um novo. Respostas truncadas (finish_reason 'length'
+    ou 'interrupted') mantêm as obras que chegaram completas.
+    """
+    if error:
+        print(f"❌ Erro ao chamar OpenAI: {error}")
+        raise OpenAIAnalysisError(f"Erro na API OpenAI: {error}", getattr(error, 'transient', False))
+    
+    response_text = response.choices[0].message.content or ''
+    finish_reason = response.choices[0].finish_reason
+    print(f"📝 Resposta bruta ({len(response_text)} chars, fim: {finish_reason}): {response_text[:100]}...")
+    
+    if parser is None:
+        parser = JsonItemStream()
+        parser.feed(response_text)
+    
+    result = parser.finish(truncated=finish_reason in ('length', 'interrupted'))
+    if result is None:
+        print(f"❌ Erro ao fazer parse JSON da resposta OpenAI")
+        print(f"📄 Conteúdo: {response_text[:200]}...")
+        raise ValueError(f"Resposta não é JSON válido. Resposta: {response_text[:500]}")
+    
+    print(f"✅ JSON parseado com sucesso!")
+    return result
 
 def validate_aportes_pool(analysis):
     """
     Validar que aportes_pool está presente com todos os campos obrigatórios.
     Se faltar, adicionar alerta.
     """
-    if isinstance(analysis, list) and len(analysis) > 0:
-        analysis = analysis[0]
+    if isinstance(analysis, list):
+        # Relatório consolidado: cada obra tem o seu rateio
+        resultados = [validate_aportes_pool(obra) for obra in analysis if isinstance(obra, dict)]
+        return bool(resultados) and all(resultados)
     
-    aportes_pool = analysis.get('aportes_pool', {})
+    aportes_pool = analysis.get('aportes_pool') or {}
     
     required_fields = [
         'valor_total_pool',
@@ -1206,6 +4643,36 @@ def validate_aportes_pool(analysis):
     
     missing_fields = [f for f in required_fields if f not in aportes_pool or aportes_pool[f] is None]
     
+    # Conferência aritmética do rateio (valores já normalizados para float)
+    inconsistencias = []
+    if not missing_fields:
+        coerce_analysis_numbers(analysis)
+        pool = analysis['aportes_pool']
+        numeros = [pool[f] for f in required_fields[:5]]
+        
+        if all(isinstance(n, (int, float)) for n in numeros):
+            total_pool, despesas_todas, despesas_obra, taxa, rateado = numeros
+            proporcao = despesas_obra / despesas_todas if despesas_todas else taxa
+            
+            # A taxa pode vir como fração (0.0000113) ou em % (0.00113), como no exemplo do prompt
+            if despesas_todas and not any(
+                abs(taxa - p) <= max(abs(p) * 0.01, 0.000001) for p in (proporcao, proporcao * 100)
+            ):
+                inconsistencias.append(
+                    f"taxa_rateio_percentual {taxa} ≠ {despesas_obra:.2f} / {despesas_todas:.2f}"
+                )
+            if abs(rateado - total_pool * proporcao) > 1.0:
+                inconsistencias.append(
+                    f"valor_rateado_esta_obra {rateado:.2f} ≠ {total_pool:.2f} × {proporcao:.6f}"
+                )
+    
+    if inconsistencias:
+        print(f"⚠️ ALERTA: Rateio inconsistente: {inconsistencias}")
+        analysis.setdefault('validacoes', {}).setdefault('alertas', []).append(
+            f"❌ RATEIO INCONSISTENTE: {'; '.join(inconsistencias)}"
+        )
+        return False
+    
     if missing_fields:
         print(f"⚠️ ALERTA: Campos faltantes em aportes_pool: {missing_fields}")
         
@@ -1294,16 +4761,19 @@ def gerar_alertas_desvio(analysis):
     Gerar alertas de desvio acima de 10% comparando custo realizado vs previsto.
     
     Args:
-        analysis (dict): Análise do PDF com dados financeiros
+        analysis (dict | list): Análise do PDF com dados financeiros (lista = uma por obra)
     
     Returns:
         list: Lista de alertas gerados
     """
-    alertas = []
+    if isinstance(analysis, list):
+        # Relatório consolidado: cada obra é comparada com o próprio orçamento
+        return [
+            alerta for obra in analysis if isinstance(obra, dict)
+            for alerta in gerar_alertas_desvio(obra)
+        ]
     
-    # Normalizar se for lista
-    if isinstance(analysis, list) and len(analysis) > 0:
-        analysis = analysis[0]
+    alertas = []
     
     # Inicializar estrutura de validações se não existir
     if 'validacoes' not in analysis:
@@ -1573,7 +5043,12 @@ def gerar_html_relatorio_executivo(competencia):
         return None
 
 def save_analysis_to_db(analysis):
-    """Salvar análise no banco de dados"""
+    """Salvar análise no banco de dados (aceita uma obra ou lista de obras)"""
+    if isinstance(analysis, list):
+        for item in analysis:
+            save_analysis_to_db(item)
+        return True
+    
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
@@ -1620,12 +5095,15 @@ def analyze_pdf_endpoint():
         - file: PDF file (multipart/form-data)
         - model: Modelo OpenAI (opcional, padrão: 'gpt-4o')
                Suportados: 'gpt-5', 'gpt-4o', 'gpt-4', 'gpt-3.5-turbo'
+        - extractor: Extrator de texto (opcional, padrão: PDF_EXTRACTOR)
+               'pypdf2' (texto corrido) ou 'tables' (tabelas em TSV)
     
     Response:
         {
             "status": "success|error",
             "data": {...análise extraída...},
             "model": "modelo usado",
+            "paginas": {...páginas/tokens descartados pelo classificador...},
             "message": "..."
         }
     """
@@ -1651,11 +5129,11 @@ def analyze_pdf_endpoint():
                 'message': 'Apenas arquivos PDF são aceitos'
             }), 400
         
-        if file.content_length and file.content_length > MAX_FILE_SIZE:
+        if upload_too_large(file):
             return jsonify({
                 'status': 'error',
-                'message': 'Arquivo muito grande (máximo 50MB)'
-            }), 400
+                'message': f'Arquivo muito grande (máximo {MAX_FILE_SIZE / (1024 * 1024):.0f}MB)'
+            }), 413
         
         # Obter modelo do parâmetro ou usar padrão
         model = request.form.get('model', 'gpt-4o')
@@ -1668,22 +5146,26 @@ def analyze_pdf_endpoint():
         
         print(f"🔧 Modelo selecionado: {model}")
         
-        # 1. Extrair texto do PDF
+        # Obter extrator de texto ('pypdf2' ou 'tables')
+        extractor = request.form.get('extractor', PDF_EXTRACTOR)
+        if extractor not in PDF_EXTRACTORS:
+            print(f"⚠️ Extrator '{extractor}' não suportado. Usando {PDF_EXTRACTOR}.")
+            extractor = PDF_EXTRACTOR
+        
+        # 1-2. Extrair páginas em streaming e analisar com OpenAI (ou cache, usando modelo selecionado)
         print(f"📄 Extraindo texto de: {file.filename}")
-        pdf_text = extract_pdf_text(file)
+        paginas = {}
+        analysis = analyze_pdf_document(
+            file, model, document_type='relatório financeiro', extractor=extractor, report=paginas,
+            chunk_size=get_chunk_size(request.headers.get('X-API-Key') or request.form.get('api_key', 'default'))
+        )
         
-        if not pdf_text or len(pdf_text.strip()) < 10:
+        if analysis is None:
             return jsonify({
                 'status': 'error',
                 'message': 'PDF não contém texto extraível'
             }), 400
         
-        print(f"✅ Texto extraído ({len(pdf_text)} caracteres)")
-        
-        # 2. Analisar com OpenAI (usando modelo selecionado)
-        print(f"🤖 Analisando com {model}...")
-        analysis = analyze_with_openai(pdf_text, document_type='relatório financeiro', model=model)
-        
         # 2.5 Validar rateio de aportes
         print("🔍 Validando rateio de aportes...")
         validate_aportes_pool(analysis)
@@ -1692,7 +5174,8 @@ def analyze_pdf_endpoint():
         print("📊 Gerando alertas de desvio orçamentário...")
         gerar_alertas_desvio(analysis)
         
-        print(f"✅ Análise concluída: {analysis.get('codigo_obra')} - {analysis.get('competencia')}")
+        for obra in (analysis if isinstance(analysis, list) else [analysis]):
+            print(f"✅ Análise concluída: {obra.get('codigo_obra')} - {obra.get('competencia')}")
         
         # 3. Salvar no banco de dados
         print("💾 Salvando no banco de dados...")
@@ -1704,6 +5187,7 @@ def analyze_pdf_endpoint():
             'status': 'success',
             'message': f'PDF analisado com sucesso usando {model}',
             'model': model,
+            'paginas': paginas,
             'data': analysis
         }), 200
     
@@ -1723,6 +5207,118 @@ def analyze_pdf_endpoint():
 # ENDPOINT - CHAT COM IA (COMPATÍVEL COM FRONTEND)
 # ================================
 
+def chat_output_budget(messages, model, pedido=None):
+    """
+    max_tokens do /api/chat: o pedido (ou o planejado para o conteúdo, se não
+    houver pedido), limitado à saída máxima do modelo e ao que sobra da janela
+    de contexto depois da entrada. Devolve (max_tokens, input_tokens).
+    """
+    limites = model_token_limits(model)
+    conteudo = '\n'.join(str(msg.get('content', '')) for msg in messages)
+    input_tokens = estimate_tokens(conteudo) + 4 * len(messages)
+    
+    if pedido:
+        max_tokens = int(pedido)
+    elif OUTPUT_BUDGET_ENABLED:
+        plano = plan_output_budget(conteudo, model)
+        max_tokens = max(plano['max_tokens'], OUTPUT_BUDGET_MIN)
+    else:
+        max_tokens = 6000 if model.startswith('gpt-5') else 2000
+    
+    # 5% de margem: a estimativa não é o tokenizer
+    disponivel = int(limites['context'] * 0.95) - input_tokens
+    return min(max_tokens, limites['output'], disponivel), input_tokens
+
+def sse_event(evento, dados):
+    """Um evento server-sent events com os dados em JSON"""
+    return f"event: {evento}\ndata: {json.dumps(dados, ensure_ascii=False)}\n\n"
+
+def sse_response(eventos):
+    """Resposta text/event-stream sem buffer (nginx/Render repassam cada evento)"""
+    return Response(eventos, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+def chat_event_stream(messages, model, max_tokens, start_time, chave_cache=None):
+    """
+    Eventos SSE do /api/chat em streaming.
+    
+    - delta: {"content": "..."} a cada pedaço gerado pela OpenAI
+    - done:  mesmos campos da resposta JSON (choices, model, processing_time,
+             usage, cached, cache_age) + finish_reason e first_token_time
+    - error: {"error": "..."}
+    
+    A chamada roda em uma thread com process_openai_stream (retentativas antes
+    do primeiro pedaço); enquanto nada chega, um comentário a cada
+    CHAT_STREAM_KEEPALIVE segundos mantém a conexão aberta.
+    """
+    fila = queue.Queue()
+    
+    def executar():
+        try:
+            resultado = process_openai_stream(
+                messages, model, max_tokens, on_delta=lambda delta: fila.put(('delta', delta))
+            )
+        except Exception as e:
+            resultado = (None, str(e))
+        fila.put(('fim', resultado))
+    
+    threading.Thread(target=executar, daemon=True, name='chat-stream').start()
+    
+    # Primeiro byte imediato: o cliente sabe que a requisição foi aceita
+    yield ': stream iniciado\n\n'
+    
+    partes = []
+    first_token_time = None
+    while True:
+        try:
+            tipo, valor = fila.get(timeout=CHAT_STREAM_KEEPALIVE)
+        except queue.Empty:
+            yield ': keep-alive\n\n'
+            continue
+        
+        if tipo == 'fim':
+            response, error = valor
+            break
+        
+        if first_token_time is None:
+            first_token_time = time.time() - start_time
+            print(f"⚡ Primeiro pedaço em {first_token_time:.2f}s")
+        partes.append(valor)
+        yield sse_event('delta', {'content': valor})
+    
+    if error or not response or not response.choices:
+        print(f"❌ ERRO na API OpenAI (stream): {error}")
+        yield sse_event('error', {'error': f'Erro na API OpenAI: {error or "resposta vazia"}'})
+        return
+    
+    content = ''.join(partes) or response.choices[0].message.content
+    finish_reason = response.choices[0].finish_reason
+    if not content:
+        content = "(Resposta vazia recebida da OpenAI)"
+        yield sse_event('delta', {'content': content})
+    elif chave_cache and finish_reason != 'interrupted':
+        chat_cache.set(chave_cache, {
+            'choices': [{'message': {'content': content}}],
+            'model': model
+        })
+    
+    processing_time = time.time() - start_time
+    print(f"✅ Stream concluído: {len(content)} caracteres em {processing_time:.2f}s (fim: {finish_reason})")
+    print("="*60 + "\n")
+    
+    yield sse_event('done', {
+        'choices': [{'message': {'content': content}}],
+        'model': model,
+        'processing_time': round(processing_time, 2),
+        'first_token_time': round(first_token_time, 2) if first_token_time is not None else None,
+        'finish_reason': finish_reason,
+        'usage': response.usage,
+        'cached': False,
+        'cache_age': None
+    })
+
 @app.route('/api/chat', methods=['POST', 'OPTIONS'])
 def chat_endpoint():
     """
@@ -1735,7 +5331,9 @@ def chat_endpoint():
                 {"role": "system", "content": "..."},
                 {"role": "user", "content": "..."}
             ],
-            "max_tokens": 6000
+            "max_tokens": 6000,
+            "cache": true (opcional; false força nova chamada),
+            "stream": false (opcional; true = server-sent events, ver chat_event_stream)
         }
     
     Response:
@@ -1746,7 +5344,9 @@ def chat_endpoint():
                 }
             }],
             "model": "modelo usado",
-            "processing_time": 1.23
+            "processing_time": 1.23,
+            "cached": false,
+            "cache_age": null (segundos desde a resposta original, se cached)
         }
     """
     
@@ -1787,11 +5387,12 @@ def chat_endpoint():
             print(f"⚠️ Modelo '{model}' não suportado. Usando padrão: gpt-5")
             model = 'gpt-5'
         
-        # CRÍTICO: Limites por modelo (copiar exatamente da referência)
-        if model.startswith('gpt-5'):
-            max_tokens = min(data.get('max_tokens', 6000), 12000)  # GPT-5: até 12k tokens
-        else:
-            max_tokens = min(data.get('max_tokens', 2000), 4000)   # Outros: até 4k tokens
+        # Orçamento de saída pelo tamanho da entrada e pelos limites do modelo
+        max_tokens, input_tokens = chat_output_budget(messages, model, data.get('max_tokens'))
+        if max_tokens <= 0:
+            return jsonify({
+                'error': f'Prompt muito longo para {model}: ~{input_tokens} tokens de entrada'
+            }), 400
         
         # Logging estruturado
         print("\n" + "="*60)
@@ -1802,6 +5403,33 @@ def chat_endpoint():
         print(f"📄 Tamanho do prompt: {len(messages_str)} caracteres")
         print("="*60)
         
+        # Streaming pedido no corpo ou pelo Accept do EventSource
+        streaming = data.get('stream') is True or 'text/event-stream' in request.headers.get('Accept', '')
+        
+        # Mesma requisição já respondida: devolver do cache sem chamar a OpenAI
+        usar_cache = CHAT_CACHE_ENABLED and data.get('cache', True) is not False
+        chave_cache = ChatResponseCache.key(model, messages, max_tokens) if usar_cache else None
+        if usar_cache:
+            hit = chat_cache.get(chave_cache)
+            if hit:
+                payload, idade = hit
+                print(f"⚡ Resposta do cache (idade {idade:.0f}s) - OpenAI não chamada")
+                print("="*60 + "\n")
+                resposta = {
+                    **payload,
+                    'processing_time': round(time.time() - start_time, 2),
+                    'usage': None,
+                    'cached': True,
+                    'cache_age': round(idade, 1)
+                }
+                if streaming:
+                    conteudo = payload['choices'][0]['message']['content']
+                    return sse_response([sse_event('delta', {'content': conteudo}), sse_event('done', resposta)])
+                return jsonify(resposta), 200
+        
+        if streaming:
+            return sse_response(chat_event_stream(messages, model, max_tokens, start_time, chave_cache))
+        
         # Chamar process_openai_request
         response, error = process_openai_request(messages, model, max_tokens)
         
@@ -1832,6 +5460,11 @@ def chat_endpoint():
             print("⚠️ WARNING: Content é None ou vazio!")
             print(f"   Finish reason: {response.choices[0].finish_reason}")
             content = "(Resposta vazia recebida da OpenAI)"
+        elif usar_cache:
+            chat_cache.set(chave_cache, {
+                'choices': [{'message': {'content': content}}],
+                'model': model
+            })
         
         processing_time = time.time() - start_time
         
@@ -1848,7 +5481,10 @@ def chat_endpoint():
                 }
             }],
             'model': model,
-            'processing_time': round(processing_time, 2)
+            'processing_time': round(processing_time, 2),
+            'usage': response.usage,
+            'cached': False,
+            'cache_age': None
         }), 200
     
     except Exception as e:
@@ -1879,11 +5515,13 @@ def health_check():
             cursor.execute('SELECT COUNT(*) FROM uploads')
             total_uploads = cursor.fetchone()[0]
         
+        pipeline = current_ingestion_pipeline()
         return jsonify({
             'status': 'ok',
             'service': 'PraiasSP-Tools API',
             'timestamp': datetime.now().isoformat(),
             'openai_configured': bool(os.getenv('OPENAI_API_KEY')),
+            'openai_base_url': OPENAI_BASE_URL or 'https://api.openai.com/v1',
             'database': {
                 'status': 'working',
                 'total_movimentos': total_movimentos,
@@ -1893,7 +5531,16 @@ def health_check():
                 'request_timeout_seconds': REQUEST_TIMEOUT,
                 'openai_timeout_seconds': OPENAI_TIMEOUT,
                 'max_file_size_mb': MAX_FILE_SIZE / (1024 * 1024)
-            }
+            },
+            'analysis_cache': analysis_cache.info(),
+            'chat_cache': chat_cache.info(),
+            'async_engine': get_async_engine().info() if OPENAI_ASYNC_ENABLED else None,
+            'openai_usage': openai_usage_info(),
+            'openai_retries': {**retry_stats, 'hedge_enabled': OPENAI_HEDGE_ENABLED, 'latency': openai_latency.info()},
+            'work_queue': work_queue.info(),
+            'concurrency': {k: v for k, v in concurrency_limiter.info().items() if k != 'decisions'},
+            'pipeline': pipeline.info() if pipeline is not None else {'enabled': PIPELINE_ENABLED},
+            'batch_ingestion': get_batch_ingestion().info()
         }), 200
     
     except Exception as e:
@@ -1902,12 +5549,90 @@ def health_check():
             'service': 'PraiasSP-Tools API',
             'timestamp': datetime.now().isoformat(),
             'openai_configured': bool(os.getenv('OPENAI_API_KEY')),
+            'openai_base_url': OPENAI_BASE_URL or 'https://api.openai.com/v1',
             'database': {
                 'status': 'error',
                 'error': str(e)
             }
         }), 500
 
+@app.route('/api/pipeline', methods=['GET'])
+def get_pipeline_stats():
+    """Estágios da ingestão: profundidade das filas, ocupação e gargalo"""
+    pipeline = current_ingestion_pipeline()
+    if not PIPELINE_ENABLED or pipeline is None:
+        return jsonify({'status': 'success', 'enabled': PIPELINE_ENABLED, 'stages': None}), 200
+    return jsonify({'status': 'success', **pipeline.info()}), 200
+
+@app.route('/api/concurrency', methods=['GET'])
+def get_concurrency():
+    """Limite adaptativo de PDFs em paralelo e as últimas decisões (subida/redução)"""
+    return jsonify({'status': 'success', **concurrency_limiter.info()}), 200
+
+@app.route('/api/cascade', methods=['GET'])
+def get_cascade_stats():
+    """Rotas da cascata de modelos: escalonamentos, latência e tokens por modelo"""
+    return jsonify({
+        'status': 'success',
+        'enabled': MODEL_CASCADE_ENABLED,
+        'fast_models': {modelo: cascade_route(modelo)[0] for modelo in ('gpt-5', 'gpt-4o')},
+        'tolerancia_saldo': SALDO_IDENTITY_TOLERANCE,
+        'routes': cascade_info()
+    }), 200
+
+@app.route('/api/layouts', methods=['GET'])
+def get_layouts():
+    """Layouts conhecidos pelo fast path e quantas vezes cada um evitou o LLM"""
+    with _layout_stats_lock:
+        stats = {nome: dict(v) for nome, v in layout_stats.items()}
+    
+    return jsonify({
+        'status': 'success',
+        'enabled': LAYOUT_FAST_PATH_ENABLED,
+        'layouts': [
+            {
+                'nome': layout['nome'],
+                'tipo_documento': layout['tipo_documento'],
+                'marcadores': layout['marcadores'],
+                'colunas': [cabecalho for _, cabecalho in layout['colunas']],
+                'fingerprint': layout['fingerprint'],
+                'stats': stats.get(layout['nome'], {'matches': 0, 'fast_path': 0, 'fallback_llm': 0})
+            }
+            for layout in LAYOUT_REGISTRY
+        ]
+    }), 200
+
+@app.route('/api/cache', methods=['GET'])
+def get_cache_stats():
+    """Estatísticas do cache de extração/análise e do cache do /api/chat"""
+    try:
+        return jsonify({
+            'status': 'success',
+            'cache': analysis_cache.info(),
+            'chat_cache': chat_cache.info()
+        }), 200
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+@app.route('/api/cache', methods=['DELETE'])
+def clear_cache():
+    """Esvaziar o cache de extração/análise e o cache do /api/chat"""
+    try:
+        analysis_cache.clear()
+        chat_cache.clear()
+        return jsonify({
+            'status': 'success',
+            'message': 'Cache esvaziado'
+        }), 200
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
 # ================================
 # ERROR HANDLERS
 # ================================
@@ -2016,14 +5741,31 @@ def save_settings():
         print(f"❌ Erro ao salvar configurações: {e}")
         return jsonify({'error': str(e)}), 500
 
+# ================================
+# MÓDULOS DA INGESTÃO
+# ================================
+
+# Importados por último: usam os helpers acima com `from .index import ...`
+# (como as views de um app Flask). Aqui só o que as rotas e a fila usam.
+from .pipeline import current_ingestion_pipeline
+from .jobs import QueueWorker, work_queue
+from .batch import get_batch_ingestion
+from .concurrency import concurrency_limiter
+
 # ================================
 # INICIALIZAÇÃO
 # ================================
 
-if __name__ == '__main__':
+def run_dev_server():
+    """Servidor de desenvolvimento do Flask (python api/index.py)"""
     port = int(os.getenv('PORT', 5000))
     debug = os.getenv('FLASK_DEBUG', 'False').lower() == 'true'
     
+    # Consumidores da fila durável (no gunicorn: post_worker_init em gunicorn.conf.py);
+    # com o reloader, só no processo que serve as requisições
+    if not debug or os.getenv('WERKZEUG_RUN_MAIN') == 'true':
+        get_queue_worker()
+    
     app.run(
         host='0.0.0.0',
         port=port,
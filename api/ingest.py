@@ -0,0 +1,240 @@
+"""
+Ingestão em massa de PDFs pela linha de comando, sem o processo web.
+
+Lê diretórios (recursivamente), arquivos ZIP ou PDFs avulsos e passa cada
+documento pelo mesmo pipeline em estágios do /api/upload (extração em
+processos → análise → gravação no SQLite). PDFs cujo hash já está em
+pdfs_ingeridos são pulados, então uma carga interrompida continua de onde
+parou ao rodar o mesmo comando de novo.
+
+Uso:
+    python -m api.ingest prestacoes_2025/ --model gpt-5
+    python -m api.ingest janeiro.zip fevereiro.zip --extract-workers 6 --analysis-workers 24
+    python -m api.ingest prestacoes_2025/ --force        (reprocessa mesmo já ingeridos)
+
+Progresso e resumo vão para stderr; os logs do pipeline ficam em stdout
+(`python -m api.ingest prestacoes_2025/ > ingestao.log`).
+"""
+
+import os
+import sys
+import time
+import zipfile
+import argparse
+import tempfile
+import threading
+from pathlib import Path
+from functools import partial
+
+from .index import (
+    LatencyTracker, hash_pdf_file, ingested_pdf_hashes,
+    PDF_EXTRACTORS, PDF_EXTRACTOR, PIPELINE_EXTRACT_WORKERS, PIPELINE_ANALYSIS_WORKERS, PIPELINE_QUEUE_SIZE
+)
+from .pipeline import IngestionPipeline
+
+# Mensagens da CLI em stderr, separadas dos logs do pipeline
+log = partial(print, file=sys.stderr)
+
+# ================================
+# COLETA DOS PDFS
+# ================================
+
+def is_pdf_name(nome):
+    return nome.lower().endswith('.pdf') and not os.path.basename(nome).startswith('.')
+
+def extract_zip_pdfs(zip_path, destino):
+    """Extrair só os PDFs do ZIP (nomes achatados, sem caminhos do arquivo)"""
+    caminhos = []
+    with zipfile.ZipFile(zip_path) as zf:
+        for i, info in enumerate(zf.infolist()):
+            if info.is_dir() or '__MACOSX' in info.filename or not is_pdf_name(info.filename):
+                continue
+            # Prefixo com o índice: nomes iguais em pastas diferentes do ZIP não colidem
+            caminho = os.path.join(destino, f"{i:05d}_{os.path.basename(info.filename)}")
+            with zf.open(info) as origem, open(caminho, 'wb') as saida:
+                while bloco := origem.read(1024 * 1024):
+                    saida.write(bloco)
+            caminhos.append((caminho, f"{Path(zip_path).name}:{info.filename}"))
+    return caminhos
+
+def collect_pdfs(entradas, temp_dir):
+    """Lista de (caminho no disco, nome para exibição) a partir de diretórios, ZIPs e PDFs"""
+    documentos = []
+    for entrada in entradas:
+        entrada = Path(entrada)
+        if entrada.is_dir():
+            documentos.extend(
+                (str(p), str(p.relative_to(entrada)))
+                for p in sorted(entrada.rglob('*')) if p.is_file() and is_pdf_name(p.name)
+            )
+        elif zipfile.is_zipfile(entrada):
+            destino = tempfile.mkdtemp(prefix=f"{entrada.stem}_", dir=temp_dir)
+            documentos.extend(extract_zip_pdfs(entrada, destino))
+        elif entrada.is_file() and is_pdf_name(entrada.name):
+            documentos.append((str(entrada), entrada.name))
+        else:
+            log(f"⚠️ Ignorado (não é diretório, ZIP nem PDF): {entrada}")
+    return documentos
+
+# ================================
+# PROGRESSO E RESUMO
+# ================================
+
+class Progress:
+    """Barra de progresso em stderr (uma linha por PDF quando não é terminal)"""
+    
+    def __init__(self, total, largura=30):
+        self.total = total
+        self.largura = largura
+        self.ok = 0
+        self.erros = 0
+        self.inicio = time.time()
+        self.tty = sys.stderr.isatty()
+        self._lock = threading.Lock()
+    
+    @property
+    def feitos(self):
+        return self.ok + self.erros
+    
+    def update(self, resultado):
+        with self._lock:
+            if resultado.get('status') == 'success':
+                self.ok += 1
+            else:
+                self.erros += 1
+            if not self.tty:
+                simbolo = '✅' if resultado.get('status') == 'success' else '❌'
+                sys.stderr.write(f"{self.linha()} {simbolo} {resultado.get('filename')}\n")
+                sys.stderr.flush()
+    
+    def linha(self):
+        feitos = self.feitos
+        fracao = feitos / self.total if self.total else 1
+        cheio = int(self.largura * fracao)
+        decorrido = time.time() - self.inicio
+        taxa = feitos / decorrido if decorrido > 0 else 0
+        eta = f"{(self.total - feitos) / taxa:.0f}s" if taxa else '--'
+        return (f"[{'#' * cheio}{'-' * (self.largura - cheio)}] {feitos}/{self.total} {fracao:4.0%} | "
+                f"{taxa:.2f} PDF/s | ETA {eta} | ✅ {self.ok} ❌ {self.erros}")
+    
+    def render(self):
+        if self.tty:
+            with self._lock:
+                sys.stderr.write('\r' + self.linha())
+                sys.stderr.flush()
+    
+    def close(self):
+        if self.tty:
+            self.render()
+            sys.stderr.write('\n')
+
+def print_summary(resultados, pulados, duracao, pipeline):
+    """Vazão, latências por PDF e por estágio, gargalo e os erros"""
+    latencias = LatencyTracker(window=max(len(resultados), 1))
+    for r in resultados:
+        latencias.record('total', r['tempo_total'])
+        for etapa, segundos in r.get('tempos', {}).items():
+            latencias.record(etapa, segundos)
+    
+    ok = [r for r in resultados if r.get('status') == 'success']
+    erros = [r for r in resultados if r.get('status') != 'success']
+    
+    log('\n📊 Resumo da ingestão')
+    log(f"   PDFs: {len(ok)} gravados | {len(erros)} com erro | {pulados} pulados (já ingeridos ou duplicados)")
+    log(f"   Tempo: {duracao:.1f}s | vazão {len(resultados) / duracao if duracao else 0:.2f} PDF/s")
+    if resultados:
+        log(f"   Latência por PDF: p50 {latencias.quantile('total', 0.5, 1):.2f}s | "
+            f"p95 {latencias.quantile('total', 0.95, 1):.2f}s | "
+            f"máx {max(r['tempo_total'] for r in resultados):.2f}s")
+        for etapa in ('fila_extracao', 'extracao', 'fila_analise', 'analise', 'fila_gravacao', 'gravacao'):
+            p50 = latencias.quantile(etapa, 0.5, 1)
+            if p50 is not None:
+                log(f"     {etapa:<14} p50 {p50:.2f}s | p95 {latencias.quantile(etapa, 0.95, 1):.2f}s")
+    
+    info = pipeline.info()
+    if info['bottleneck']:
+        ocupacao = info['stages'][info['bottleneck']]['utilization']
+        log(f"   Gargalo: {info['bottleneck']} ({ocupacao:.0%} de ocupação)")
+    
+    for r in erros:
+        log(f"   ❌ {r.get('filename')}: {r.get('message')}")
+
+# ================================
+# LINHA DE COMANDO
+# ================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Ingestão em massa de PDFs (diretórios e ZIPs) sem passar pelo HTTP')
+    parser.add_argument('entradas', nargs='+', help='Diretórios, arquivos .zip ou PDFs')
+    parser.add_argument('--model', default='gpt-5', help='Modelo da análise (mesmo padrão do /api/upload)')
+    parser.add_argument('--extractor', choices=PDF_EXTRACTORS, default=PDF_EXTRACTOR, help='Extrator de texto')
+    parser.add_argument('--chunk-size', type=int, default=None, help='Tokens por grupo de páginas')
+    parser.add_argument('--extract-workers', type=int, default=PIPELINE_EXTRACT_WORKERS,
+                        help='Processos de extração')
+    parser.add_argument('--analysis-workers', type=int, default=PIPELINE_ANALYSIS_WORKERS,
+                        help='Análises (chamadas OpenAI) em paralelo')
+    parser.add_argument('--queue-size', type=int, default=PIPELINE_QUEUE_SIZE, help='Itens por fila entre estágios')
+    parser.add_argument('--force', action='store_true', help='Reprocessar PDFs já ingeridos')
+    args = parser.parse_args(argv)
+    
+    with tempfile.TemporaryDirectory(prefix='ingestao_') as temp_dir:
+        documentos = collect_pdfs(args.entradas, temp_dir)
+        if not documentos:
+            log('❌ Nenhum PDF encontrado')
+            return 1
+        
+        # Retomada: hash de cada PDF contra pdfs_ingeridos (e duplicados dentro da própria carga)
+        log(f"🔎 {len(documentos)} PDF(s) encontrados; calculando hashes...")
+        vistos = {}
+        for caminho, nome in documentos:
+            vistos.setdefault(hash_pdf_file(caminho), (caminho, nome))
+        ja_ingeridos = set() if args.force else ingested_pdf_hashes(vistos)
+        pendentes = [doc for pdf_hash, doc in vistos.items() if pdf_hash not in ja_ingeridos]
+        pulados = len(documentos) - len(pendentes)
+        log(f"📥 {len(pendentes)} para ingerir | {pulados} pulado(s) (já ingeridos ou duplicados)")
+        if not pendentes:
+            return 0
+        
+        pipeline = IngestionPipeline(args.extract_workers, args.analysis_workers, args.queue_size)
+        progresso = Progress(len(pendentes))
+        resultados = []
+        parar = threading.Event()
+        enviados = []
+        
+        def concluido(future):
+            resultado = future.result()
+            resultados.append(resultado)
+            progresso.update(resultado)
+        
+        # submit() bloqueia com a fila de extração cheia: alimentar em outra thread
+        def alimentar():
+            for caminho, nome in pendentes:
+                if parar.is_set():
+                    break
+                future = pipeline.submit(caminho, args.model, args.extractor, args.chunk_size, filename=nome)
+                future.add_done_callback(concluido)
+                enviados.append(future)
+        
+        inicio = time.time()
+        alimentador = threading.Thread(target=alimentar, daemon=True, name='ingest-feeder')
+        alimentador.start()
+        
+        while alimentador.is_alive() or progresso.feitos < len(enviados):
+            try:
+                progresso.render()
+                time.sleep(0.2)
+            except KeyboardInterrupt:
+                if parar.is_set():
+                    raise
+                # 1º Ctrl+C: não enviar mais nada e terminar os PDFs em andamento
+                parar.set()
+                sys.stderr.write('\n🛑 Interrompido: terminando os PDFs em andamento (Ctrl+C de novo aborta)\n')
+        progresso.close()
+        
+        print_summary(resultados, pulados, time.time() - inicio, pipeline)
+        if parar.is_set():
+            log(f"⏸️ {len(pendentes) - len(enviados)} PDF(s) não enviados; rode o mesmo comando para retomar")
+        return 1 if progresso.erros else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,422 @@
+"""
+Fila durável de ingestão em SQLite (tabelas jobs_ingestao / fila_ingestao).
+
+WorkQueue guarda jobs e itens com lease, heartbeat e tentativas; QueueWorker
+consome a fila em threads, nos processos web (INGESTION_JOB_WORKERS) e em
+python -m api.worker. Importado no fim de api.index, cujas rotas de jobs
+usam a fila do processo (work_queue).
+"""
+
+import os
+import json
+import time
+import shutil
+import socket
+import threading
+
+from .index import (
+    get_db_connection, ingestion_context,
+    JOBS_FOLDER, WORK_QUEUE_LEASE_SECONDS, WORK_QUEUE_MAX_ATTEMPTS, WORK_QUEUE_POLL_INTERVAL, WORK_QUEUE_RETRY_DELAY
+)
+from .pipeline import ingest_pdf
+
+# ================================
+# FILA DURÁVEL DE INGESTÃO (SQLITE)
+# ================================
+
+JOB_FINAL_STATUSES = ('success', 'error')
+
+def discard_job_file(path):
+    """Apagar o PDF de um item concluído e a pasta do job quando ficar vazia"""
+    try:
+        os.remove(path)
+        os.rmdir(os.path.dirname(path))  # Só sai quando o job inteiro terminou
+    except OSError:
+        pass
+
+class WorkQueue:
+    """
+    Fila de PDFs em SQLite (tabelas jobs_ingestao e fila_ingestao), comum a
+    todos os processos que usam o mesmo banco: workers do gunicorn
+    (INGESTION_JOB_WORKERS threads cada) e python -m api.worker.
+    
+    Um item é reservado com lease (lease_owner / lease_expira), renovado por
+    heartbeat enquanto o PDF é processado. Se o processo morre (reciclagem
+    do gunicorn, SIGTERM, queda do nó), o lease expira e outro worker retoma
+    o item. Falhas transitórias voltam para a fila com espera crescente até
+    max_tentativas; depois disso o item fica como 'error'.
+    """
+    
+    def __init__(self, lease_seconds, max_tentativas, retry_delay, pasta=None):
+        self.lease_seconds = lease_seconds
+        self.max_tentativas = max(1, max_tentativas)
+        self.retry_delay = retry_delay
+        self.pasta = pasta  # JOBS_FOLDER: prune apaga <pasta>/<job_id>
+        self._lock = threading.Lock()
+        self.stats = {'claimed': 0, 'completed': 0, 'failed': 0, 'retried': 0, 'leases_expired': 0, 'leases_lost': 0}
+    
+    def _count(self, campo):
+        with self._lock:
+            self.stats[campo] += 1
+    
+    def enqueue_job(self, job_id, model, extractor, chunk_size, arquivos, erros=None):
+        """Registrar o job e um item por (filename, path)"""
+        agora = time.time()
+        with get_db_connection() as conn:
+            conn.execute('''
+                INSERT INTO jobs_ingestao (job_id, model, extractor, chunk_size, erros_validacao, criado_em)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (job_id, model, extractor, chunk_size, json.dumps(list(erros or []), ensure_ascii=False), agora))
+            conn.executemany('''
+                INSERT INTO fila_ingestao (job_id, indice, filename, path, disponivel_em)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [(job_id, i, nome, path, agora) for i, (nome, path) in enumerate(arquivos)])
+            conn.commit()
+    
+    def claim(self, worker_id):
+        """
+        Reservar o próximo item disponível (na fila ou com lease vencido).
+        
+        Returns:
+            Dict do item (com model/extractor/chunk_size do job) ou None
+        """
+        while True:
+            agora = time.time()
+            with get_db_connection() as conn:
+                conn.isolation_level = None
+                conn.execute('BEGIN IMMEDIATE')  # Um único worker reserva por vez
+                try:
+                    row = conn.execute('''
+                        SELECT f.*, j.model, j.extractor, j.chunk_size
+                        FROM fila_ingestao f JOIN jobs_ingestao j ON j.job_id = f.job_id
+                        WHERE (f.status = 'na_fila' AND f.disponivel_em <= ?)
+                           OR (f.status = 'processando' AND f.lease_expira < ?)
+                        ORDER BY f.id
+                        LIMIT 1
+                    ''', (agora, agora)).fetchone()
+                    
+                    if row is None:
+                        conn.execute('COMMIT')
+                        return None
+                    
+                    item = dict(row)
+                    if item['status'] == 'processando':
+                        self._count('leases_expired')
+                        print(f"♻️ Fila: lease de {item['lease_owner']} venceu - {item['filename']} retomado")
+                    
+                    # Item que derrubou workers demais: desistir em vez de entrar em loop
+                    if item['tentativas'] >= self.max_tentativas:
+                        resultado = {
+                            'status': 'error',
+                            'message': f"Desistência após {item['tentativas']} tentativa(s) (lease vencido)"
+                        }
+                        conn.execute('''
+                            UPDATE fila_ingestao
+                            SET status = 'error', resultado = ?, concluido_em = ?, lease_owner = NULL,
+                                lease_expira = NULL, versao = versao + 1
+                            WHERE id = ?
+                        ''', (json.dumps(resultado, ensure_ascii=False), agora, item['id']))
+                        conn.execute('COMMIT')
+                        self._count('failed')
+                        discard_job_file(item['path'])
+                        continue
+                    
+                    conn.execute('''
+                        UPDATE fila_ingestao
+                        SET status = 'processando', lease_owner = ?, lease_expira = ?, heartbeat_em = ?,
+                            iniciado_em = ?, tentativas = tentativas + 1, versao = versao + 1
+                        WHERE id = ?
+                    ''', (worker_id, agora + self.lease_seconds, agora, agora, item['id']))
+                    conn.execute('COMMIT')
+                except Exception:
+                    conn.execute('ROLLBACK')
+                    raise
+            
+            self._count('claimed')
+            item['tentativas'] += 1
+            return item
+    
+    def heartbeat(self, item_id, worker_id):
+        """Renovar o lease; False se outro worker já assumiu o item"""
+        agora = time.time()
+        with get_db_connection() as conn:
+            cursor = conn.execute('''
+                UPDATE fila_ingestao SET lease_expira = ?, heartbeat_em = ?
+                WHERE id = ? AND lease_owner = ? AND status = 'processando'
+            ''', (agora + self.lease_seconds, agora, item_id, worker_id))
+            conn.commit()
+            renovado = cursor.rowcount == 1
+        
+        if not renovado:
+            self._count('leases_lost')
+        return renovado
+    
+    def finish(self, item, worker_id, resultado):
+        """
+        Registrar o resultado de process_single_pdf.
+        
+        Returns:
+            'final' (success/error), 'retry' (volta para a fila) ou None se o
+            lease foi perdido (o item já é de outro worker)
+        """
+        agora = time.time()
+        retry = (
+            resultado.get('status') == 'error' and resultado.get('retryable')
+            and item['tentativas'] < self.max_tentativas
+        )
+        conteudo = json.dumps(
+            {k: v for k, v in resultado.items() if k not in ('filename', 'retryable')}, ensure_ascii=False
+        )
+        
+        with get_db_connection() as conn:
+            if retry:
+                espera = min(self.retry_delay * 2 ** (item['tentativas'] - 1), 900)
+                cursor = conn.execute('''
+                    UPDATE fila_ingestao
+                    SET status = 'na_fila', disponivel_em = ?, resultado = ?, lease_owner = NULL,
+                        lease_expira = NULL, versao = versao + 1
+                    WHERE id = ? AND lease_owner = ?
+                ''', (agora + espera, conteudo, item['id'], worker_id))
+            else:
+                cursor = conn.execute('''
+                    UPDATE fila_ingestao
+                    SET status = ?, resultado = ?, concluido_em = ?, lease_owner = NULL,
+                        lease_expira = NULL, versao = versao + 1
+                    WHERE id = ? AND lease_owner = ?
+                ''', (resultado.get('status', 'error'), conteudo, agora, item['id'], worker_id))
+            conn.commit()
+            
+            if cursor.rowcount != 1:
+                self._count('leases_lost')
+                print(f"⚠️ Fila: lease de {item['filename']} perdido - resultado descartado")
+                return None
+        
+        if retry:
+            self._count('retried')
+            print(f"🔁 Fila: {item['filename']} volta para a fila em {espera:.0f}s "
+                  f"(tentativa {item['tentativas']}/{self.max_tentativas})")
+            return 'retry'
+        
+        self._count('completed' if resultado.get('status') == 'success' else 'failed')
+        return 'final'
+    
+    def job_snapshot(self, job_id):
+        """Estado do job no formato das rotas (ou None)"""
+        with get_db_connection() as conn:
+            job = conn.execute('SELECT * FROM jobs_ingestao WHERE job_id = ?', (job_id,)).fetchone()
+            if job is None:
+                return None
+            rows = conn.execute(
+                'SELECT * FROM fila_ingestao WHERE job_id = ? ORDER BY indice', (job_id,)
+            ).fetchall()
+        
+        arquivos = []
+        for row in rows:
+            arquivo = {'filename': row['filename'], 'status': row['status'], 'tentativas': row['tentativas']}
+            if row['resultado']:
+                resultado = json.loads(row['resultado'])
+                resultado.pop('status', None)
+                arquivo.update(resultado)
+            if row['concluido_em'] and row['iniciado_em']:
+                arquivo['tempo'] = round(row['concluido_em'] - row['iniciado_em'], 2)
+            arquivos.append(arquivo)
+        
+        concluidos = [a for a in arquivos if a['status'] in JOB_FINAL_STATUSES]
+        terminou = len(concluidos) == len(arquivos)
+        concluido_em = max((row['concluido_em'] or 0 for row in rows), default=job['criado_em']) if terminou else None
+        
+        if terminou:
+            status = 'concluido'
+        elif any(a['status'] != 'na_fila' or a['tentativas'] for a in arquivos):
+            status = 'processando'
+        else:
+            status = 'na_fila'
+        
+        return {
+            'job_id': job_id,
+            'status': status,
+            'model': job['model'],
+            'criado_em': job['criado_em'],
+            'concluido_em': concluido_em,
+            'processing_time': round(concluido_em - job['criado_em'], 2) if concluido_em else None,
+            'versao': sum(row['versao'] for row in rows),
+            'arquivos': arquivos,
+            'total': len(arquivos),
+            'concluidos': len(concluidos),
+            'progresso': round(len(concluidos) / len(arquivos), 3) if arquivos else 1.0,
+            'processados': [a for a in arquivos if a['status'] == 'success'],
+            'erros': json.loads(job['erros_validacao'] or '[]') + [
+                f"{a['filename']}: {a.get('message', 'Erro desconhecido')}" for a in arquivos if a['status'] == 'error'
+            ]
+        }
+    
+    def job_version(self, job_id):
+        """Contador de mudanças do job (None se não existe)"""
+        with get_db_connection() as conn:
+            row = conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(versao), 0) FROM fila_ingestao WHERE job_id = ?', (job_id,)
+            ).fetchone()
+        return row[1] if row[0] else None
+    
+    def recent_jobs(self, limite=50):
+        with get_db_connection() as conn:
+            rows = conn.execute(
+                'SELECT job_id FROM jobs_ingestao ORDER BY criado_em DESC LIMIT ?', (limite,)
+            ).fetchall()
+        return [row['job_id'] for row in rows]
+    
+    def prune(self, ttl):
+        """Apagar jobs concluídos criados há mais de ttl segundos (registros e PDFs restantes)"""
+        with get_db_connection() as conn:
+            antigos = [row[0] for row in conn.execute('''
+                SELECT j.job_id FROM jobs_ingestao j
+                WHERE j.criado_em < ? AND NOT EXISTS (
+                    SELECT 1 FROM fila_ingestao f WHERE f.job_id = j.job_id AND f.status IN ('na_fila', 'processando')
+                )
+            ''', (time.time() - ttl,)).fetchall()]
+            conn.executemany('DELETE FROM fila_ingestao WHERE job_id = ?', [(j,) for j in antigos])
+            conn.executemany('DELETE FROM jobs_ingestao WHERE job_id = ?', [(j,) for j in antigos])
+            conn.commit()
+        
+        if self.pasta:
+            for job_id in antigos:
+                shutil.rmtree(os.path.join(self.pasta, job_id), ignore_errors=True)
+        return len(antigos)
+    
+    def info(self):
+        """Itens por status, idade do item mais antigo na fila e contadores deste processo"""
+        with get_db_connection() as conn:
+            por_status = dict(conn.execute('SELECT status, COUNT(*) FROM fila_ingestao GROUP BY status').fetchall())
+            mais_antigo = conn.execute(
+                "SELECT MIN(disponivel_em) FROM fila_ingestao WHERE status = 'na_fila'"
+            ).fetchone()[0]
+        
+        with self._lock:
+            stats = dict(self.stats)
+        stats.update({
+            'items': por_status,
+            'oldest_queued_seconds': round(max(0.0, time.time() - mais_antigo), 1) if mais_antigo else 0.0,
+            'lease_seconds': self.lease_seconds,
+            'max_attempts': self.max_tentativas
+        })
+        return stats
+
+work_queue = WorkQueue(WORK_QUEUE_LEASE_SECONDS, WORK_QUEUE_MAX_ATTEMPTS, WORK_QUEUE_RETRY_DELAY, JOBS_FOLDER)
+
+class QueueWorker:
+    """
+    Consumidor da fila em N threads: reserva um item, processa com
+    ingest_pdf renovando o lease e registra o resultado.
+    Usado pelos processos web (INGESTION_JOB_WORKERS) e por python -m api.worker.
+    
+    Com limiter (AdaptiveConcurrencyLimiter) sobem só as threads do limite
+    atual - novas threads nascem quando o limite cresce, até limiter.maximo -
+    e cada uma pega uma vaga antes de reservar um item: o paralelismo efetivo
+    é o limite adaptativo do momento. Com a fila vazia, uma única thread
+    consulta o SQLite a cada poll_interval; as outras esperam o resultado.
+    """
+    
+    def __init__(self, queue, threads, nome=None, poll_interval=None, limiter=None):
+        self.queue = queue
+        self.limiter = limiter
+        self.threads = max(1, threads)
+        self.worker_id = f"{nome or socket.gethostname()}:{os.getpid()}"
+        self.poll_interval = poll_interval or WORK_QUEUE_POLL_INTERVAL
+        self.stop_event = threading.Event()
+        self._threads = []
+        self._threads_lock = threading.Lock()
+        self._consulta = threading.Condition()
+        self._proxima_consulta = 0.0
+    
+    def _target_threads(self):
+        if self.limiter is None:
+            return self.threads
+        return min(self.limiter.maximo, max(1, int(self.limiter.limit)))
+    
+    def _grow(self):
+        """Subir threads até o alvo (limite adaptativo do momento ou o número fixo)"""
+        with self._threads_lock:
+            while len(self._threads) < self._target_threads() and not self.stop_event.is_set():
+                n = len(self._threads)
+                thread = threading.Thread(target=self._loop, args=(f"{self.worker_id}:{n}",), daemon=True,
+                                          name=f"fila-{n}")
+                thread.start()
+                self._threads.append(thread)
+    
+    def start(self):
+        self._grow()
+        maximo = f" (até {self.limiter.maximo} com o limite adaptativo)" if self.limiter else ''
+        print(f"👷 Fila: {len(self._threads)} consumidor(es) em {self.worker_id}{maximo}")
+        return self
+    
+    def stop(self, timeout=None):
+        """Parar de reservar itens e esperar os que estão em andamento"""
+        self.stop_event.set()
+        with self._consulta:
+            self._consulta.notify_all()
+        with self._threads_lock:
+            threads = list(self._threads)
+        for thread in threads:
+            thread.join(timeout)
+    
+    def _wait_turn(self):
+        """
+        True quando esta thread pode consultar a fila. Depois de uma consulta
+        vazia, as threads esperam o próximo intervalo em vez de consultar cada uma.
+        """
+        with self._consulta:
+            espera = self._proxima_consulta - time.time()
+            if espera <= 0:
+                self._proxima_consulta = time.time() + self.poll_interval
+                return True
+            self._consulta.wait(espera)
+            return False
+    
+    def _loop(self, worker_id):
+        # Só a ingestão alimenta o limite adaptativo (record_openai_latency / should_retry)
+        ingestion_context.set(True)
+        while not self.stop_event.is_set():
+            if not self._wait_turn():
+                continue
+            if self.limiter is not None and not self.limiter.acquire(self.stop_event):
+                return
+            item = None
+            try:
+                try:
+                    item = self.queue.claim(worker_id)
+                except Exception as e:
+                    print(f"⚠️ Fila: erro ao reservar item ({str(e)[:100]})")
+                if item is not None:
+                    # Pode haver mais itens: as outras threads consultam sem esperar
+                    with self._consulta:
+                        self._proxima_consulta = 0.0
+                        self._consulta.notify_all()
+                    self._grow()
+                    self.process(item, worker_id)
+            except Exception as e:
+                # O lease vence e o item volta para a fila; a thread continua consumindo
+                print(f"⚠️ Fila: erro ao processar {item['filename']} ({str(e)[:100]})")
+            finally:
+                if self.limiter is not None:
+                    self.limiter.release()
+    
+    def process(self, item, worker_id):
+        # Heartbeat a cada 1/3 do lease enquanto o PDF é processado
+        fim = threading.Event()
+        
+        def heartbeat():
+            while not fim.wait(self.queue.lease_seconds / 3):
+                if not self.queue.heartbeat(item['id'], worker_id):
+                    print(f"⚠️ Fila: lease de {item['filename']} perdido durante o processamento")
+                    return
+        
+        threading.Thread(target=heartbeat, daemon=True, name=f"heartbeat-{item['id']}").start()
+        try:
+            resultado = ingest_pdf(
+                item['path'], item['model'], item['extractor'], item['chunk_size'], filename=item['filename']
+            )
+        finally:
+            fim.set()
+        
+        if self.queue.finish(item, worker_id, resultado) == 'final':
+            discard_job_file(item['path'])
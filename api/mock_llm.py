@@ -0,0 +1,448 @@
+"""
+Servidor OpenAI simulado (offline) para medir o pipeline sem gastar tokens.
+
+Fala o subconjunto das APIs que o index.py usa:
+- POST /v1/responses          (GPT-5: input com mensagens, text.format, stream)
+- POST /v1/chat/completions   (demais modelos: response_format, stream + usage)
+
+Uso:
+    python -m api.mock_llm --port 8001 --latency lognormal:0.0,0.5 --error-429 0.05
+    OPENAI_BASE_URL=http://localhost:8001/v1 OPENAI_API_KEY=mock python api/index.py
+
+Respostas, por ordem de preferência:
+1. Gravação em --replay-dir com o hash do prompt (<hash>.json)
+2. Com --upstream (e --record), a chamada vai para a OpenAI real e é gravada
+3. Resposta sintética: JSON de obra válido para o schema da análise, ou
+   texto curto para o /api/chat
+"""
+
+import os
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+
+from flask import Flask, Response, request, jsonify
+
+# ================================
+# CONFIGURAÇÃO
+# ================================
+
+MOCK_CONFIG = {
+    'latency': os.getenv('MOCK_LLM_LATENCY', 'fixed:0.2'),
+    'error_429': float(os.getenv('MOCK_LLM_ERROR_429', 0)),
+    'error_500': float(os.getenv('MOCK_LLM_ERROR_500', 0)),
+    'timeout_rate': float(os.getenv('MOCK_LLM_TIMEOUT_RATE', 0)),
+    'timeout_seconds': float(os.getenv('MOCK_LLM_TIMEOUT_SECONDS', 120)),
+    'retry_after': float(os.getenv('MOCK_LLM_RETRY_AFTER', 1)),
+    'stream_chunk_chars': int(os.getenv('MOCK_LLM_STREAM_CHUNK_CHARS', 40)),
+    'synthetic_despesas': int(os.getenv('MOCK_LLM_SYNTHETIC_DESPESAS', 5)),
+    'replay_dir': os.getenv('MOCK_LLM_REPLAY_DIR', ''),
+    'record': os.getenv('MOCK_LLM_RECORD', 'False').lower() == 'true',
+    'upstream': os.getenv('MOCK_LLM_UPSTREAM', ''),
+    'seed': os.getenv('MOCK_LLM_SEED')
+}
+
+CACHE_BLOCK_TOKENS = 128  # Granularidade do cache de prompt simulado
+
+app = Flask(__name__)
+
+_rng = random.Random()
+_rng_lock = threading.Lock()
+_stats = {'requests': 0, 'replayed': 0, 'recorded': 0, 'synthetic': 0, 'errors_429': 0, 'errors_500': 0, 'timeouts': 0}
+_stats_lock = threading.Lock()
+_prefixos_vistos = set()
+
+def count_stat(campo):
+    with _stats_lock:
+        _stats[campo] += 1
+
+def random_value(fn):
+    with _rng_lock:
+        return fn(_rng)
+
+# ================================
+# LATÊNCIA E FALHAS
+# ================================
+
+def parse_latency(spec):
+    """
+    Distribuição de latência (segundos) a partir de 'tipo:parametros':
+    fixed:0.5 | uniform:0.2,1.5 | normal:0.8,0.2 | lognormal:mu,sigma | exponential:media
+    """
+    tipo, _, parametros = spec.partition(':')
+    valores = [float(v) for v in parametros.split(',') if v.strip()]
+
+    if tipo == 'fixed':
+        return lambda rng: valores[0]
+    if tipo == 'uniform':
+        return lambda rng: rng.uniform(valores[0], valores[1])
+    if tipo == 'normal':
+        return lambda rng: max(rng.gauss(valores[0], valores[1]), 0.0)
+    if tipo == 'lognormal':
+        return lambda rng: rng.lognormvariate(valores[0], valores[1])
+    if tipo == 'exponential':
+        return lambda rng: rng.expovariate(1 / valores[0])
+    raise ValueError(f"Distribuição de latência desconhecida: {spec}")
+
+def sample_latency():
+    return random_value(parse_latency(MOCK_CONFIG['latency']))
+
+def injected_failure():
+    """Resposta de erro sorteada conforme as taxas configuradas (ou None)"""
+    sorteio = random_value(lambda rng: rng.random())
+
+    if sorteio < MOCK_CONFIG['error_429']:
+        count_stat('errors_429')
+        resposta = jsonify({'error': {'message': 'Rate limit simulado', 'type': 'rate_limit_error', 'code': 'rate_limit_exceeded'}})
+        resposta.status_code = 429
+        resposta.headers['Retry-After'] = str(MOCK_CONFIG['retry_after'])
+        return resposta
+    sorteio -= MOCK_CONFIG['error_429']
+
+    if sorteio < MOCK_CONFIG['error_500']:
+        count_stat('errors_500')
+        resposta = jsonify({'error': {'message': 'Erro interno simulado', 'type': 'server_error'}})
+        resposta.status_code = 500
+        return resposta
+    sorteio -= MOCK_CONFIG['error_500']
+
+    if sorteio < MOCK_CONFIG['timeout_rate']:
+        # Segura a conexão além do timeout do cliente
+        count_stat('timeouts')
+        time.sleep(MOCK_CONFIG['timeout_seconds'])
+        resposta = jsonify({'error': {'message': 'Timeout simulado', 'type': 'timeout'}})
+        resposta.status_code = 504
+        return resposta
+
+    return None
+
+# ================================
+# CONTEÚDO: REPLAY, UPSTREAM OU SINTÉTICO
+# ================================
+
+def prompt_hash(messages):
+    """Hash do prompt (papéis + conteúdos), igual nas duas APIs"""
+    normalizadas = [[m.get('role', 'user'), m.get('content', '')] for m in messages]
+    return hashlib.sha256(json.dumps(normalizadas, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+def estimate_tokens(text):
+    return (len(text) + 3) // 4
+
+def load_recording(chave):
+    if not MOCK_CONFIG['replay_dir']:
+        return None
+    caminho = os.path.join(MOCK_CONFIG['replay_dir'], f"{chave}.json")
+    if not os.path.exists(caminho):
+        return None
+    with open(caminho, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_recording(chave, gravacao):
+    os.makedirs(MOCK_CONFIG['replay_dir'], exist_ok=True)
+    caminho = os.path.join(MOCK_CONFIG['replay_dir'], f"{chave}.json")
+    with open(caminho, 'w', encoding='utf-8') as f:
+        json.dump(gravacao, f, ensure_ascii=False, indent=2)
+
+def fetch_upstream(api, corpo):
+    """Repassar a chamada (sem streaming) para a OpenAI real: (texto, usage)"""
+    import httpx
+
+    corpo = {k: v for k, v in corpo.items() if k not in ('stream', 'stream_options')}
+    resposta = httpx.post(
+        f"{MOCK_CONFIG['upstream'].rstrip('/')}/{'responses' if api == 'responses' else 'chat/completions'}",
+        json=corpo,
+        headers={'Authorization': f"Bearer {os.getenv('OPENAI_UPSTREAM_API_KEY', '')}"},
+        timeout=MOCK_CONFIG['timeout_seconds']
+    )
+    resposta.raise_for_status()
+    dados = resposta.json()
+
+    if api == 'responses':
+        texto = ''.join(
+            parte.get('text', '')
+            for item in dados.get('output', []) if item.get('type') == 'message'
+            for parte in item.get('content', []) if parte.get('type') == 'output_text'
+        )
+    else:
+        texto = dados['choices'][0]['message']['content'] or ''
+    return texto, dados.get('usage')
+
+def synthetic_content(messages, structured):
+    """Resposta plausível: obras no formato da análise ou texto curto"""
+    documento = messages[-1].get('content', '') if messages else ''
+
+    if not structured and 'JSON' not in ''.join(m.get('content', '') for m in messages[:1]):
+        return f"Resposta simulada (mock) para o prompt {prompt_hash(messages)[:12]}."
+
+    codigo = next((p for p in documento.split() if p.isdigit() and len(p) == 3), '000')
+    despesas = [
+        {'descricao': f'Fornecedor {i} - Serviço', 'valor': round(100 + i * 10.5, 2), 'categoria': 'Servicos', 'fornecedor': f'Fornecedor {i}'}
+        for i in range(MOCK_CONFIG['synthetic_despesas'])
+    ]
+    total = round(sum(d['valor'] for d in despesas), 2)
+    obra = {
+        'competencia': '09/2025',
+        'codigo_obra': codigo,
+        'nome_obra': f'Obra {codigo} (mock)',
+        'tipo_documento': 'DETALHAMENTO_DESPESAS',
+        'saldo_inicial': 10000.0,
+        'saldo_final': round(10000.0 - total, 2),
+        'despesas': despesas,
+        'despesas_total': total,
+        'receitas': [],
+        'receitas_total': 0.0,
+        'aportes_pool': {
+            'valor_total_pool': 0.0,
+            'despesas_todas_obras': total,
+            'despesas_esta_obra': total,
+            'taxa_rateio_percentual': 1.0,
+            'valor_rateado_esta_obra': 0.0,
+            'metodo_calculo': 'Proporcional às despesas mensais'
+        },
+        'rentabilidade_mensal': 0.0,
+        'conciliacao_bancaria': {'saldo_banco': None, 'saldo_sistema': None, 'diferenca': None, 'status': 'não_informado'},
+        'validacoes': {'saldo_auditoria': {'status': 'OK', 'diferenca_permitida': 0.0}, 'alertas': []},
+        'observacoes': 'Resposta sintética do servidor mock',
+        'qualidade_extracao': '✅ Completa'
+    }
+    return json.dumps({'obras': [obra]} if structured else [obra], ensure_ascii=False)
+
+def resolve_content(api, corpo, messages, structured):
+    """(texto, usage_gravado) para o prompt"""
+    chave = prompt_hash(messages)
+
+    gravacao = load_recording(chave)
+    if gravacao is not None:
+        count_stat('replayed')
+        return gravacao['content'], gravacao.get('usage')
+
+    if MOCK_CONFIG['upstream']:
+        texto, usage = fetch_upstream(api, corpo)
+        if MOCK_CONFIG['record'] and MOCK_CONFIG['replay_dir']:
+            save_recording(chave, {'model': corpo.get('model'), 'content': texto, 'usage': usage})
+            count_stat('recorded')
+        return texto, usage
+
+    count_stat('synthetic')
+    return synthetic_content(messages, structured), None
+
+def simulated_usage(messages, texto):
+    """Tokens de entrada/saída, com cache de prompt simulado para system prompts repetidos"""
+    entrada = sum(estimate_tokens(m.get('content', '')) for m in messages)
+    sistema = ''.join(m.get('content', '') for m in messages if m.get('role') == 'system')
+    chave = hashlib.sha256(sistema.encode('utf-8')).hexdigest()
+
+    cacheados = 0
+    with _stats_lock:
+        if sistema and chave in _prefixos_vistos:
+            cacheados = estimate_tokens(sistema) // CACHE_BLOCK_TOKENS * CACHE_BLOCK_TOKENS
+        _prefixos_vistos.add(chave)
+
+    return entrada, cacheados, estimate_tokens(texto)
+
+# ================================
+# FORMATOS DE RESPOSTA
+# ================================
+
+def responses_body(model, texto, status, entrada, cacheados, saida):
+    return {
+        'id': f"resp_mock_{int(time.time() * 1000)}",
+        'object': 'response',
+        'created_at': int(time.time()),
+        'model': model,
+        'status': status,
+        'output': [{
+            'type': 'message',
+            'id': 'msg_mock',
+            'status': 'completed' if status == 'completed' else 'incomplete',
+            'role': 'assistant',
+            'content': [{'type': 'output_text', 'text': texto, 'annotations': []}]
+        }],
+        'usage': {
+            'input_tokens': entrada,
+            'input_tokens_details': {'cached_tokens': cacheados},
+            'output_tokens': saida,
+            'output_tokens_details': {'reasoning_tokens': 0},
+            'total_tokens': entrada + saida
+        }
+    }
+
+def chat_usage(entrada, cacheados, saida):
+    return {
+        'prompt_tokens': entrada,
+        'completion_tokens': saida,
+        'total_tokens': entrada + saida,
+        'prompt_tokens_details': {'cached_tokens': cacheados}
+    }
+
+def split_stream(texto):
+    tamanho = max(MOCK_CONFIG['stream_chunk_chars'], 1)
+    return [texto[i:i + tamanho] for i in range(0, len(texto), tamanho)] or ['']
+
+def sse(dados, evento=None):
+    prefixo = f"event: {evento}\n" if evento else ''
+    return f"{prefixo}data: {json.dumps(dados, ensure_ascii=False)}\n\n"
+
+def handle_request(api):
+    count_stat('requests')
+    corpo = request.get_json(force=True, silent=True) or {}
+    model = corpo.get('model', 'mock')
+
+    if api == 'responses':
+        entrada_bruta = corpo.get('input', '')
+        messages = entrada_bruta if isinstance(entrada_bruta, list) else [{'role': 'user', 'content': entrada_bruta}]
+        structured = bool((corpo.get('text') or {}).get('format'))
+        max_tokens = corpo.get('max_output_tokens')
+    else:
+        messages = corpo.get('messages', [])
+        structured = (corpo.get('response_format') or {}).get('type') == 'json_schema'
+        max_tokens = corpo.get('max_completion_tokens') or corpo.get('max_tokens')
+
+    falha = injected_failure()
+    if falha is not None:
+        return falha
+
+    try:
+        texto, usage_gravado = resolve_content(api, corpo, messages, structured)
+    except Exception as e:
+        return jsonify({'error': {'message': f"Upstream falhou: {e}", 'type': 'server_error'}}), 502
+
+    # max tokens curto: resposta truncada, como na API real
+    truncada = bool(max_tokens) and estimate_tokens(texto) > max_tokens
+    if truncada:
+        texto = texto[:max_tokens * 4]
+
+    entrada, cacheados, saida = simulated_usage(messages, texto)
+    if usage_gravado:
+        entrada = usage_gravado.get('input_tokens', usage_gravado.get('prompt_tokens', entrada))
+
+    latencia = sample_latency()
+
+    if not corpo.get('stream'):
+        time.sleep(latencia)
+        if api == 'responses':
+            return jsonify(responses_body(model, texto, 'incomplete' if truncada else 'completed', entrada, cacheados, saida))
+        return jsonify({
+            'id': f"chatcmpl-mock-{int(time.time() * 1000)}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': model,
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': texto},
+                'finish_reason': 'length' if truncada else 'stop'
+            }],
+            'usage': chat_usage(entrada, cacheados, saida)
+        })
+
+    pedacos = split_stream(texto)
+    intervalo = latencia / (len(pedacos) + 1)
+    incluir_usage = (corpo.get('stream_options') or {}).get('include_usage')
+
+    def gerar_responses():
+        time.sleep(intervalo)  # tempo até o primeiro token
+        for n, pedaco in enumerate(pedacos):
+            yield sse({
+                'type': 'response.output_text.delta', 'item_id': 'msg_mock', 'output_index': 0,
+                'content_index': 0, 'delta': pedaco, 'sequence_number': n
+            }, 'response.output_text.delta')
+            time.sleep(intervalo)
+        final = 'response.incomplete' if truncada else 'response.completed'
+        yield sse({
+            'type': final, 'sequence_number': len(pedacos),
+            'response': responses_body(model, texto, 'incomplete' if truncada else 'completed', entrada, cacheados, saida)
+        }, final)
+
+    def gerar_chat():
+        base = {'id': f"chatcmpl-mock-{int(time.time() * 1000)}", 'object': 'chat.completion.chunk',
+                'created': int(time.time()), 'model': model}
+        time.sleep(intervalo)
+        for pedaco in pedacos:
+            yield sse({**base, 'choices': [{'index': 0, 'delta': {'content': pedaco}, 'finish_reason': None}]})
+            time.sleep(intervalo)
+        yield sse({**base, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'length' if truncada else 'stop'}]})
+        if incluir_usage:
+            yield sse({**base, 'choices': [], 'usage': chat_usage(entrada, cacheados, saida)})
+        yield "data: [DONE]\n\n"
+
+    return Response(gerar_responses() if api == 'responses' else gerar_chat(), mimetype='text/event-stream')
+
+# ================================
+# ROTAS
+# ================================
+
+@app.route('/v1/responses', methods=['POST'])
+def mock_responses():
+    return handle_request('responses')
+
+@app.route('/v1/chat/completions', methods=['POST'])
+def mock_chat_completions():
+    return handle_request('chat')
+
+@app.route('/mock/stats', methods=['GET'])
+def mock_stats():
+    """Contadores do servidor e configuração em uso"""
+    with _stats_lock:
+        stats = dict(_stats)
+    return jsonify({'stats': stats, 'config': MOCK_CONFIG})
+
+@app.route('/mock/config', methods=['POST'])
+def mock_update_config():
+    """Alterar latência/taxas de erro sem reiniciar (útil entre rodadas de benchmark)"""
+    dados = request.get_json(force=True, silent=True) or {}
+    for campo, valor in dados.items():
+        if campo in MOCK_CONFIG:
+            MOCK_CONFIG[campo] = valor
+    if 'latency' in dados:
+        parse_latency(MOCK_CONFIG['latency'])
+    return jsonify({'config': MOCK_CONFIG})
+
+# ================================
+# LINHA DE COMANDO
+# ================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Servidor OpenAI simulado para testes de carga offline')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--latency', default=MOCK_CONFIG['latency'],
+                        help='fixed:S | uniform:A,B | normal:M,D | lognormal:MU,SIGMA | exponential:M')
+    parser.add_argument('--error-429', type=float, default=MOCK_CONFIG['error_429'], help='Fração de respostas 429')
+    parser.add_argument('--error-500', type=float, default=MOCK_CONFIG['error_500'], help='Fração de respostas 500')
+    parser.add_argument('--timeout-rate', type=float, default=MOCK_CONFIG['timeout_rate'], help='Fração de chamadas que travam')
+    parser.add_argument('--timeout-seconds', type=float, default=MOCK_CONFIG['timeout_seconds'])
+    parser.add_argument('--retry-after', type=float, default=MOCK_CONFIG['retry_after'], help='Retry-After dos 429')
+    parser.add_argument('--synthetic-despesas', type=int, default=MOCK_CONFIG['synthetic_despesas'])
+    parser.add_argument('--replay-dir', default=MOCK_CONFIG['replay_dir'], help='Gravações <hash do prompt>.json')
+    parser.add_argument('--upstream', default=MOCK_CONFIG['upstream'], help='URL da OpenAI real para prompts sem gravação')
+    parser.add_argument('--record', action='store_true', default=MOCK_CONFIG['record'], help='Gravar respostas do upstream')
+    parser.add_argument('--seed', default=MOCK_CONFIG['seed'], help='Semente para latências/erros reprodutíveis')
+    args = parser.parse_args(argv)
+
+    parse_latency(args.latency)
+    MOCK_CONFIG.update({
+        'latency': args.latency,
+        'error_429': args.error_429,
+        'error_500': args.error_500,
+        'timeout_rate': args.timeout_rate,
+        'timeout_seconds': args.timeout_seconds,
+        'retry_after': args.retry_after,
+        'synthetic_despesas': args.synthetic_despesas,
+        'replay_dir': args.replay_dir,
+        'upstream': args.upstream,
+        'record': args.record,
+        'seed': args.seed
+    })
+    if args.seed is not None:
+        _rng.seed(args.seed)
+
+    print(f"🧪 Mock OpenAI em http://{args.host}:{args.port}/v1")
+    print(f"   Latência: {args.latency} | 429: {args.error_429:.0%} | 500: {args.error_500:.0%} | timeout: {args.timeout_rate:.0%}")
+    print(f"   Replay: {args.replay_dir or '-'} | Upstream: {args.upstream or '-'}{' (gravando)' if args.record else ''}")
+    app.run(host=args.host, port=args.port, threaded=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,298 @@
+"""
+Pipeline de ingestão em estágios (extração → análise → gravação).
+
+Usado pelos consumidores da fila (api.jobs), por python -m api.ingest e,
+com PIPELINE_ENABLED, por ingest_pdf. Importado no fim de api.index, de
+onde vêm os helpers de extração, análise e gravação.
+"""
+
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+from .index import (
+    analysis_cache, analyze_page_groups, analyze_with_cascade, cached_page_groups, cascade_cache_key,
+    hash_pdf_file, ingestion_context, is_retryable_error, iter_pdf_page_groups, new_extraction_pool,
+    process_single_pdf, save_ingested_pdf,
+    ANALYSIS_CACHE_ENABLED, CHARS_PER_TOKEN, MODEL_CASCADE_ENABLED, PDF_EXTRACTOR, PDF_PAGE_GROUP_CHARS,
+    PIPELINE_ENABLED, PIPELINE_EXTRACT_WORKERS, PIPELINE_ANALYSIS_WORKERS, PIPELINE_QUEUE_SIZE
+)
+
+# ================================
+# PIPELINE DE INGESTÃO EM ESTÁGIOS
+# ================================
+
+class IngestionPipeline:
+    """
+    Ingestão de PDFs em três estágios ligados por filas limitadas:
+    
+    - extracao: PIPELINE_EXTRACT_WORKERS documentos por vez; as páginas são
+                extraídas em faixas num pool de processos próprio (CPU,
+                fora do GIL) e os grupos seguem por uma fila limitada do
+                documento, então a análise começa no primeiro grupo (e só
+                ocupa uma thread da análise a partir dele)
+    - analise:  PIPELINE_ANALYSIS_WORKERS threads (I/O; as chamadas OpenAI
+                vão para o motor assíncrono), com a cascata de modelos se
+                MODEL_CASCADE_ENABLED
+    - gravacao: uma única thread grava no SQLite (sem disputa de lock)
+    
+    Filas cheias bloqueiam o estágio anterior (backpressure), então o ritmo
+    é o do estágio mais lento, não a soma dos três. Tempo parado esperando
+    outro estágio (fila cheia adiante, grupo ainda não extraído) conta como
+    blocked_seconds, não como ocupação, e o gargalo é o estágio mais ocupado. O cache de análise é
+    consultado e gravado neste processo. submit() devolve um Future com o
+    mesmo resultado de process_single_pdf, mais os tempos por estágio.
+    """
+    
+    ESTAGIOS = ('extracao', 'analise', 'gravacao')
+    
+    def __init__(self, extract_workers, analysis_workers, queue_size):
+        self.queue_size = max(1, queue_size)
+        self.process_pool = new_extraction_pool(max(1, extract_workers))
+        self.filas = {nome: queue.Queue(maxsize=self.queue_size) for nome in self.ESTAGIOS}
+        workers = {'extracao': max(1, extract_workers), 'analise': max(1, analysis_workers), 'gravacao': 1}
+        self.stats = {
+            nome: {'workers': workers[nome], 'in_progress': 0, 'processed': 0, 'errors': 0,
+                   'busy_seconds': 0.0, 'blocked_seconds': 0.0, 'max_queue_depth': 0}
+            for nome in self.ESTAGIOS
+        }
+        self._lock = threading.Lock()
+        self.iniciado_em = time.time()
+        
+        # A extração encaminha o item sozinha, antes de terminar (ver _extract)
+        handlers = {'extracao': self._extract, 'analise': self._analyze, 'gravacao': self._write}
+        proximas = {'extracao': None, 'analise': 'gravacao', 'gravacao': None}
+        for nome in self.ESTAGIOS:
+            for n in range(workers[nome]):
+                threading.Thread(
+                    target=self._run_stage, args=(nome, handlers[nome], proximas[nome]),
+                    daemon=True, name=f"pipeline-{nome}-{n}"
+                ).start()
+        print(f"🏭 Pipeline: extração {workers['extracao']} processo(s) | análise {workers['analise']} "
+              f"thread(s) | gravação 1 | filas de {self.queue_size}")
+    
+    def submit(self, path, model, extractor=None, chunk_size=None, filename=None):
+        """Enfileirar um PDF em disco (bloqueia se a fila de extração estiver cheia)"""
+        item = {
+            'future': Future(),
+            'path': path,
+            'filename': filename or os.path.basename(str(path)),
+            'model': model,
+            'extractor': extractor or PDF_EXTRACTOR,
+            'max_chars': chunk_size * CHARS_PER_TOKEN if chunk_size else PDF_PAGE_GROUP_CHARS,
+            'cancelado': threading.Event(),
+            'bloqueado': dict.fromkeys(self.ESTAGIOS, 0.0),  # Por estágio: extração e análise correm juntas
+            'tempos': {},
+            'entrada': time.time()
+        }
+        self._put('extracao', item)
+        return item['future']
+    
+    def _put(self, nome, item):
+        item['na_fila_desde'] = time.time()
+        self.filas[nome].put(item)
+        profundidade = self.filas[nome].qsize()
+        with self._lock:
+            stats = self.stats[nome]
+            stats['max_queue_depth'] = max(stats['max_queue_depth'], profundidade)
+    
+    def _run_stage(self, nome, handler, proxima):
+        ingestion_context.set(True)  # Chamadas OpenAI do pipeline alimentam o limite adaptativo
+        while True:
+            item = self.filas[nome].get()
+            inicio = time.time()
+            item['tempos'][f"fila_{nome}"] = round(inicio - item['na_fila_desde'], 3)
+            with self._lock:
+                self.stats[nome]['in_progress'] += 1
+            
+            erro = None
+            try:
+                handler(item)
+            except Exception as e:
+                erro = e
+            
+            duracao = time.time() - inicio
+            bloqueado = min(item['bloqueado'][nome], duracao)
+            item['tempos'][nome] = round(duracao, 3)
+            with self._lock:
+                stats = self.stats[nome]
+                stats['in_progress'] -= 1
+                stats['processed'] += 1
+                # Tempo parado esperando outro estágio não é ocupação
+                stats['busy_seconds'] += duracao - bloqueado
+                stats['blocked_seconds'] += bloqueado
+                stats['errors'] += erro is not None
+            
+            if erro is not None:
+                print(f"    ❌ Pipeline ({nome}) {item['filename']}: {str(erro)[:100]}")
+                self._resolve(item, {
+                    'status': 'error',
+                    'message': str(erro)[:200],
+                    'retryable': is_retryable_error(erro)
+                })
+            elif proxima:
+                self._put(proxima, item)
+    
+    def _extract(self, item):
+        """
+        Hash, cache de análise e extração. O item vai para a análise com o
+        primeiro grupo de páginas: os demais chegam por item['grupos'] (fila
+        limitada) enquanto as faixas são extraídas no pool de processos.
+        """
+        print(f"  🔄 Extraindo: {item['filename']}")
+        paginas = item['paginas'] = {}
+        item['pdf_hash'] = hash_pdf_file(item['path'])
+        
+        if ANALYSIS_CACHE_ENABLED:
+            item['cache_key'] = cascade_cache_key(item['pdf_hash'], item['model'], item['extractor'], item['max_chars'])
+            analysis = analysis_cache.get(item['cache_key'])
+            if analysis is not None:
+                paginas['cache'] = True
+                item['analysis'] = analysis
+                self._forward(item)
+                return
+            grupos = cached_page_groups(
+                item['path'], item['pdf_hash'], item['extractor'], paginas, item['max_chars'], pool=self.process_pool
+            )
+        else:
+            grupos = iter_pdf_page_groups(
+                item['path'], max_chars=item['max_chars'], extractor=item['extractor'], report=paginas,
+                pool=self.process_pool
+            )
+        
+        item['grupos'] = queue.Queue(maxsize=self.queue_size)
+        encaminhado = False
+        
+        # Erros da extração seguem pela fila de grupos: o item é da análise
+        try:
+            for grupo in grupos:
+                if not self._put_group(item, ('grupo', grupo)):
+                    return
+                if not encaminhado:
+                    # Uma thread da análise só é ocupada quando já há texto para analisar
+                    self._forward(item)
+                    encaminhado = True
+            self._put_group(item, ('fim', None))
+        except Exception as e:
+            self._put_group(item, ('erro', e))
+        finally:
+            if not encaminhado:
+                self._forward(item)
+    
+    def _forward(self, item):
+        inicio = time.time()
+        self._put('analise', item)
+        item['bloqueado']['extracao'] += time.time() - inicio
+    
+    def _put_group(self, item, mensagem):
+        """Entregar um grupo à análise; False se ela desistiu do documento"""
+        inicio = time.time()
+        try:
+            while not item['cancelado'].is_set():
+                try:
+                    item['grupos'].put(mensagem, timeout=1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        finally:
+            item['bloqueado']['extracao'] += time.time() - inicio
+    
+    @staticmethod
+    def _iter_groups(item):
+        """Grupos do documento; a espera pela extração conta como tempo bloqueado da análise"""
+        fila = item['grupos']
+        while True:
+            inicio = time.time()
+            tipo, valor = fila.get()
+            item['bloqueado']['analise'] += time.time() - inicio
+            if tipo == 'erro':
+                raise valor
+            if tipo == 'fim':
+                return
+            yield valor
+    
+    def _analyze(self, item):
+        if 'analysis' in item:
+            return
+        
+        analisar = analyze_with_cascade if MODEL_CASCADE_ENABLED else analyze_page_groups
+        try:
+            item['analysis'] = analisar(self._iter_groups(item), item['model'], 'relatório financeiro')
+        finally:
+            # Libera a extração se a análise parou antes do último grupo
+            item['cancelado'].set()
+            item.pop('grupos', None)
+        
+        if item['analysis'] is not None and item.get('cache_key'):
+            analysis_cache.set(item['cache_key'], item['analysis'])
+    
+    def _write(self, item):
+        if item['analysis'] is None:
+            self._resolve(item, {'status': 'error', 'message': 'PDF sem texto extraível'})
+            return
+        
+        obra = save_ingested_pdf(item['analysis'], item['pdf_hash'], item['filename'], item['model'])
+        print(f"    ✅ Análise concluída: {item['filename']}")
+        self._resolve(item, {
+            'status': 'success',
+            'codigo_obra': obra.get('codigo_obra'),
+            'competencia': obra.get('competencia'),
+            'paginas': item.get('paginas', {})
+        })
+    
+    def _resolve(self, item, resultado):
+        resultado.update({
+            'filename': item['filename'],
+            'pdf_hash': item.get('pdf_hash'),
+            'tempo_total': round(time.time() - item['entrada'], 3),
+            'tempos': item['tempos']
+        })
+        item['future'].set_result(resultado)
+    
+    def info(self):
+        """Por estágio: profundidade da fila, em andamento, processados, tempo médio e ocupação"""
+        decorrido = max(time.time() - self.iniciado_em, 1e-9)
+        with self._lock:
+            stats = {nome: dict(s) for nome, s in self.stats.items()}
+        
+        for nome, s in stats.items():
+            s['queue_depth'] = self.filas[nome].qsize()
+            s['avg_seconds'] = round(s['busy_seconds'] / s['processed'], 3) if s['processed'] else None
+            s['utilization'] = round(s['busy_seconds'] / (s['workers'] * decorrido), 3)
+            s['busy_seconds'] = round(s['busy_seconds'], 2)
+            s['blocked_seconds'] = round(s['blocked_seconds'], 2)
+        
+        # Gargalo: o estágio com maior ocupação
+        gargalo = max(stats, key=lambda nome: stats[nome]['utilization']) if any(
+            s['processed'] for s in stats.values()
+        ) else None
+        return {'enabled': PIPELINE_ENABLED, 'stages': stats, 'bottleneck': gargalo}
+
+_ingestion_pipeline = None
+_ingestion_pipeline_pid = None
+_ingestion_pipeline_lock = threading.Lock()
+
+def get_ingestion_pipeline():
+    """Pipeline do processo (recriado após fork, p.ex. workers do gunicorn)"""
+    global _ingestion_pipeline, _ingestion_pipeline_pid
+    with _ingestion_pipeline_lock:
+        if _ingestion_pipeline is None or _ingestion_pipeline_pid != os.getpid():
+            _ingestion_pipeline = IngestionPipeline(
+                PIPELINE_EXTRACT_WORKERS, PIPELINE_ANALYSIS_WORKERS, PIPELINE_QUEUE_SIZE
+            )
+            _ingestion_pipeline_pid = os.getpid()
+        return _ingestion_pipeline
+
+def current_ingestion_pipeline():
+    """Pipeline já criado neste processo, sem criar um (None antes do primeiro PDF)"""
+    with _ingestion_pipeline_lock:
+        return _ingestion_pipeline if _ingestion_pipeline_pid == os.getpid() else None
+
+def ingest_pdf(path, model, extractor=None, chunk_size=None, filename=None):
+    """Um PDF em disco pelo pipeline em estágios (PIPELINE_ENABLED) ou pelo caminho serial"""
+    if PIPELINE_ENABLED:
+        return get_ingestion_pipeline().submit(path, model, extractor, chunk_size, filename).result()
+    return process_single_pdf(path, model, extractor, chunk_size, filename=filename)
@@ -0,0 +1,71 @@
+"""
+Worker de ingestão fora do processo web.
+
+Consome a fila durável (tabelas jobs_ingestao / fila_ingestao do SQLite)
+com o mesmo pipeline do /api/upload. Vários workers, em processos ou nós
+diferentes que enxergam o mesmo banco e o mesmo JOBS_FOLDER, drenam a fila
+em paralelo; um item cujo worker morreu volta para a fila quando o lease
+vence.
+
+Uso:
+    python -m api.worker --threads 4
+    INGESTION_JOB_WORKERS=0 gunicorn -c gunicorn.conf.py ...   (web só enfileira)
+"""
+
+import os
+import sys
+import signal
+import argparse
+
+from .index import WORK_QUEUE_POLL_INTERVAL, ADAPTIVE_CONCURRENCY_ENABLED, ADAPTIVE_CONCURRENCY_MAX
+from .jobs import QueueWorker, work_queue
+from .concurrency import concurrency_limiter
+
+# ================================
+# LINHA DE COMANDO
+# ================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Worker da fila de ingestão de PDFs (SQLite)')
+    parser.add_argument('--threads', type=int, default=int(os.getenv('WORKER_THREADS', 3)),
+                        help='PDFs em paralelo (limite inicial, se a concorrência adaptativa estiver ligada)')
+    parser.add_argument('--max-threads', type=int, default=ADAPTIVE_CONCURRENCY_MAX,
+                        help='Teto da concorrência adaptativa (AIMD)')
+    parser.add_argument('--fixed', action='store_true', help='Paralelismo fixo em --threads (sem AIMD)')
+    parser.add_argument('--name', default=os.getenv('WORKER_NAME'), help='Identificação nos leases (padrão: hostname)')
+    parser.add_argument('--poll-interval', type=float, default=WORK_QUEUE_POLL_INTERVAL,
+                        help='Segundos de espera com a fila vazia')
+    parser.add_argument('--drain', action='store_true', help='Sair quando a fila esvaziar')
+    args = parser.parse_args(argv)
+    
+    limiter = None
+    if ADAPTIVE_CONCURRENCY_ENABLED and not args.fixed:
+        limiter = concurrency_limiter
+        limiter.configure(initial=args.threads, maximo=max(args.threads, args.max_threads))
+    worker = QueueWorker(work_queue, args.threads, nome=args.name, poll_interval=args.poll_interval, limiter=limiter)
+    
+    # SIGTERM/SIGINT: parar de reservar e terminar os PDFs em andamento
+    # (um kill -9 também é seguro: o lease vence e outro worker retoma)
+    def parar(signum, frame):
+        print(f"\n🛑 Sinal {signum}: terminando os itens em andamento...")
+        worker.stop_event.set()
+    
+    signal.signal(signal.SIGTERM, parar)
+    signal.signal(signal.SIGINT, parar)
+    
+    worker.start()
+    while not worker.stop_event.is_set():
+        worker.stop_event.wait(args.poll_interval)
+        if args.drain:
+            itens = work_queue.info()['items']
+            if not itens.get('na_fila') and not itens.get('processando'):
+                break
+    
+    worker.stop()
+    print(f"👋 Worker {worker.worker_id} encerrado | {work_queue.info()}")
+    if limiter is not None:
+        print(f"🎚️ Concorrência final: {limiter.info()['limit']} | decisões: {len(limiter.decisions)}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -11,7 +11,9 @@ backlog = 2048
 
 # Worker processes
 workers = multiprocessing.cpu_count() * 2 + 1
-worker_class = "sync"
+# gthread: streams SSE (/api/chat, /api/upload/jobs/<id>/events) ocupam uma thread, não o worker
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.getenv('GUNICORN_THREADS', 8))
 worker_connections = 1000
 max_requests = 1000
 max_requests_jitter = 50
@@ -48,5 +50,10 @@ proc_name = 'riviera_ingestor'
 def when_ready(server):
     print("✅ Servidor Gunicorn iniciado com sucesso")
 
+def post_worker_init(worker):
+    # Consumidores da fila durável, uma vez por worker (INGESTION_JOB_WORKERS=0: só python -m api.worker consome)
+    from api.index import get_queue_worker
+    get_queue_worker()
+
 def on_exit(server):
     print("🛑 Servidor Gunicorn finalizado")
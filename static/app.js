@@ -203,13 +203,24 @@ document
         body: formData,
       });
 
-      const data = await response.json();
+      let data = await response.json();
+
+      // Upload enfileirado (202): acompanhar o job até terminar
+      if (response.status === 202 && data.job_id) {
+        const job = await acompanharJobUpload(data.job_id);
+        data = {
+          status: job.processados.length ? "success" : "error",
+          total: job.processados.length,
+          erros: job.erros,
+        };
+      }
 
       if (data.status === "success") {
         mostrarMensagem(
           "#mensagem-upload",
-          "success",
-          `${data.total} arquivo(s) carregado(s) com sucesso!`
+          data.erros?.length ? "warning" : "success",
+          `${data.total} arquivo(s) processado(s) com sucesso!` +
+            (data.erros?.length ? ` Erros: ${data.erros.join(", ")}` : "")
         );
         arquivosSelecionados = [];
         document.getElementById("fileInput").value = "";
@@ -236,6 +247,39 @@ document
     esconderLoading("#mensagem-upload");
   });
 
+// Progresso do job de upload via SSE (com polling se o stream cair)
+function acompanharJobUpload(jobId) {
+  const atualizar = (job) => {
+    document.querySelector("#mensagem-upload").innerHTML =
+      `<div class="loading"></div> Processando ${job.concluidos}/${job.total} PDF(s)...`;
+  };
+
+  return new Promise((resolve) => {
+    const fonte = new EventSource(`${API_BASE}/upload/jobs/${jobId}/events`);
+
+    fonte.addEventListener("progress", (e) => atualizar(JSON.parse(e.data)));
+    fonte.addEventListener("done", (e) => {
+      fonte.close();
+      resolve(JSON.parse(e.data));
+    });
+    fonte.onerror = () => {
+      // Fim normal do stream (JOB_EVENTS_MAX_SECONDS): o EventSource reconecta sozinho
+      if (fonte.readyState === EventSource.CONNECTING) return;
+      fonte.close();
+      const consultar = async () => {
+        const { job } = await fetchDados(`/upload/jobs/${jobId}`);
+        if (job.status === "concluido") {
+          resolve(job);
+        } else {
+          atualizar(job);
+          setTimeout(consultar, 2000);
+        }
+      };
+      consultar();
+    };
+  });
+}
+
 document.getElementById("btn-limpar")?.addEventListener("click", function () {
   arquivosSelecionados = [];
   document.getElementById("fileInput").value = "";
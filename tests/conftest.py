@@ -0,0 +1,29 @@
+"""
+Configuração comum dos testes.
+
+api.index cria o cliente OpenAI e inicializa o SQLite na importação: a
+chave é fictícia (nenhum teste chama a API) e o banco fica em um diretório
+temporário, nunca em data/historico_riviera.db.
+"""
+
+import os
+import atexit
+import shutil
+import tempfile
+
+import pytest
+
+os.environ.setdefault('OPENAI_API_KEY', 'test')
+_pasta_banco = tempfile.mkdtemp(prefix='riviera_testes_')
+atexit.register(shutil.rmtree, _pasta_banco, ignore_errors=True)
+os.environ['DATABASE_PATH'] = os.path.join(_pasta_banco, 'historico.db')
+
+from api import index
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Banco SQLite vazio por teste"""
+    caminho = str(tmp_path / 'teste.db')
+    monkeypatch.setenv('DATABASE_PATH', caminho)
+    assert index.init_db()
+    return caminho
@@ -0,0 +1,91 @@
+"""Cache de análises por conteúdo do PDF: hit sem OpenAI, chave com modelo/versão e LRU"""
+
+import pytest
+
+from api import index
+from api.index import AnalysisCache, analysis_cache_key
+
+@pytest.fixture
+def cache(db, monkeypatch):
+    cache = AnalysisCache(max_bytes=10000)
+    monkeypatch.setattr(index, 'analysis_cache', cache)
+    monkeypatch.setattr(index, 'ANALYSIS_CACHE_ENABLED', True)
+    return cache
+
+@pytest.fixture
+def analise_contada(cache, monkeypatch):
+    """Extração e análise falsas; conta quantas vezes a análise rodou"""
+    chamadas = []
+    monkeypatch.setattr(index, 'iter_pdf_page_groups', lambda file, **kwargs: iter(['SALDO FINAL 1.200,00']))
+    
+    def analisar(page_groups, model, document_type='relatório financeiro'):
+        grupos = list(page_groups)
+        chamadas.append((model, grupos))
+        return {'codigo_obra': '616', 'saldo_final': 1200.0}
+    
+    monkeypatch.setattr(index, 'analyze_with_cascade', analisar)
+    return chamadas
+
+def pdf(tmp_path, nome, conteudo):
+    caminho = tmp_path / nome
+    caminho.write_bytes(b'%PDF-1.4\n' + conteudo)
+    return str(caminho)
+
+def test_hit_miss_e_tipos(cache):
+    assert cache.get('analise:x') is None
+    cache.set('analise:x', {'codigo_obra': '616'})
+    cache.set('paginas:x', 'texto extraído', tipo='texto')
+    
+    assert cache.get('analise:x') == {'codigo_obra': '616'}
+    assert cache.get('paginas:x') == 'texto extraído'
+    info = cache.info()
+    assert (info['hits'], info['misses'], info['writes'], info['entries']) == (2, 1, 2, 2)
+
+def test_lru_remove_as_acessadas_ha_mais_tempo(cache):
+    cache.max_bytes = 2500
+    cache.set('a', 'a' * 1000, tipo='texto')
+    cache.set('b', 'b' * 1000, tipo='texto')
+    assert cache.get('a')  # 'a' passa a ser a mais recente
+    
+    cache.set('c', 'c' * 1000, tipo='texto')
+    
+    assert cache.get('b') is None
+    assert cache.get('a') and cache.get('c')
+    assert cache.info()['evictions'] == 1
+    assert cache.set('grande', 'x' * 3000, tipo='texto') is False
+
+def test_reenvio_do_mesmo_pdf_nao_chama_a_openai(tmp_path, analise_contada):
+    caminho = pdf(tmp_path, 'posicao.pdf', b'setembro')
+    copia = pdf(tmp_path, 'posicao_copia.pdf', b'setembro')
+    
+    primeira = index.analyze_pdf_document(caminho, 'gpt-5')
+    report = {}
+    segunda = index.analyze_pdf_document(copia, 'gpt-5', report=report)
+    
+    assert len(analise_contada) == 1
+    assert segunda == primeira
+    assert report['cache'] is True
+
+def test_outro_modelo_ou_outro_pdf_nao_usam_a_mesma_entrada(tmp_path, analise_contada):
+    caminho = pdf(tmp_path, 'posicao.pdf', b'setembro')
+    
+    index.analyze_pdf_document(caminho, 'gpt-5')
+    index.analyze_pdf_document(caminho, 'gpt-4o')
+    index.analyze_pdf_document(pdf(tmp_path, 'outubro.pdf', b'outubro'), 'gpt-5')
+    
+    assert [modelo for modelo, _ in analise_contada] == ['gpt-5', 'gpt-4o', 'gpt-5']
+
+def test_chave_muda_com_a_versao_do_prompt(monkeypatch):
+    antes = analysis_cache_key('abc', 'gpt-5', 'pypdf2', 60000)
+    monkeypatch.setattr(index, 'ANALYSIS_PROMPT_VERSION', 'nova')
+    
+    assert analysis_cache_key('abc', 'gpt-5', 'pypdf2', 60000) != antes
+
+def test_texto_extraido_reaproveitado_para_outro_modelo(tmp_path, analise_contada, monkeypatch):
+    caminho = pdf(tmp_path, 'posicao.pdf', b'setembro')
+    index.analyze_pdf_document(caminho, 'gpt-5')
+    
+    monkeypatch.setattr(index, 'iter_pdf_page_groups', lambda file, **kwargs: pytest.fail('PDF extraído de novo'))
+    index.analyze_pdf_document(caminho, 'gpt-4o')
+    
+    assert analise_contada[1] == ('gpt-4o', ['SALDO FINAL 1.200,00'])
@@ -0,0 +1,90 @@
+"""Motor assíncrono: chamadas em voo limitadas pelo semáforo e contexto de quem submeteu"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from api import index
+from api.index import AsyncAnalysisEngine
+
+class ClienteFalso:
+    """AsyncOpenAI falso: cada chamada demora 'atraso' segundos"""
+    
+    def __init__(self, atraso=0.05):
+        self.atraso = atraso
+        self.chamadas = []
+        self.responses = SimpleNamespace(create=self.responses_create)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.chat_create))
+    
+    async def responses_create(self, **params):
+        self.chamadas.append(('responses', params))
+        await asyncio.sleep(self.atraso)
+        return SimpleNamespace(output_text='{"obras": []}', status='completed',
+                               usage=SimpleNamespace(input_tokens=100, output_tokens=10, input_tokens_details=None))
+    
+    async def chat_create(self, **params):
+        self.chamadas.append(('chat', params))
+        await asyncio.sleep(self.atraso)
+        mensagem = SimpleNamespace(content='{"obras": []}')
+        return SimpleNamespace(choices=[SimpleNamespace(message=mensagem, finish_reason='stop')],
+                               usage=SimpleNamespace(prompt_tokens=50, completion_tokens=5, prompt_tokens_details=None))
+
+@pytest.fixture
+def motor(monkeypatch):
+    monkeypatch.setattr(index, 'OPENAI_HEDGE_ENABLED', False)
+    engine = AsyncAnalysisEngine(max_concurrency=2)
+    engine.client = ClienteFalso()
+    yield engine
+    engine.loop.call_soon_threadsafe(engine.loop.stop)
+    engine.thread.join(timeout=5)
+
+def mensagens(texto):
+    return [{'role': 'system', 'content': 'prefixo'}, {'role': 'user', 'content': texto}]
+
+def test_concorrencia_limitada_pelo_semaforo(motor):
+    futures = [motor.submit(motor.request(mensagens(f"doc {n}"), 'gpt-4o', 500)) for n in range(6)]
+    resultados = [future.result(timeout=10) for future in futures]
+    
+    assert all(error is None and response.choices[0].message.content == '{"obras": []}'
+               for response, error in resultados)
+    info = motor.info()
+    assert info['completed'] == 6
+    assert info['peak_in_flight'] == 2
+    assert info['in_flight'] == 0
+
+def test_gpt5_vai_pela_responses_api(motor):
+    response, error = motor.submit(motor.request(mensagens('doc'), 'gpt-5', 500)).result(timeout=10)
+    
+    assert error is None
+    assert response.usage['input_tokens'] == 100
+    api, params = motor.client.chamadas[0]
+    assert api == 'responses' and params['max_output_tokens'] == 500
+
+def test_medidor_de_quem_submeteu_recebe_o_uso(motor):
+    meter = index.UsageMeter()
+    token = index.openai_usage_meter.set(meter)
+    try:
+        future = motor.submit(motor.request(mensagens('doc'), 'gpt-4o', 500))
+    finally:
+        index.openai_usage_meter.reset(token)
+    future.result(timeout=10)
+    
+    assert (meter.calls, meter.input_tokens, meter.output_tokens) == (1, 50, 5)
+
+def test_erro_definitivo_nao_repete(motor):
+    class ErroHTTP(Exception):
+        status_code = 400
+    
+    async def falhar(**params):
+        motor.client.chamadas.append(('chat', params))
+        raise ErroHTTP('requisição inválida')
+    
+    motor.client.chat.completions.create = falhar
+    
+    response, error = motor.submit(motor.request(mensagens('doc'), 'gpt-4o', 500)).result(timeout=10)
+    
+    assert response is None
+    assert 'requisição inválida' in error and error.transient is False
+    assert len(motor.client.chamadas) == 1
+    assert motor.info()['errors'] == 1
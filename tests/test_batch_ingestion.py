@@ -0,0 +1,96 @@
+"""Ingestão em lote: listagem das execuções e partes sem resposta no lote"""
+
+import json
+
+import pytest
+
+from api import batch, index
+from api.batch import BatchIngestion
+
+def linha_saida(custom_id, obras):
+    corpo = {
+        'id': 'chatcmpl-teste', 'object': 'chat.completion', 'created': 0, 'model': 'gpt-5',
+        'choices': [{
+            'index': 0, 'finish_reason': 'stop',
+            'message': {'role': 'assistant', 'content': json.dumps(obras)}
+        }]
+    }
+    return {'custom_id': custom_id, 'response': {'status_code': 200, 'body': corpo}, 'error': None}
+
+class BackendFalso:
+    """Backend de lote com as linhas de saída fixas (uma parte pode faltar)"""
+    
+    name = 'falso'
+    resumable = False
+    
+    def __init__(self, saida):
+        self.saida = saida
+    
+    def results(self, batch_id):
+        yield from self.saida
+
+@pytest.fixture
+def execucao(tmp_path):
+    """Execução enviada com um documento em duas partes (d0-t0-p0 e d0-t0-p1)"""
+    entrada = tmp_path / 'lote_1.jsonl'
+    entrada.write_text(''.join(
+        json.dumps({'custom_id': cid, 'method': 'POST', 'url': '/v1/chat/completions', 'body': {}}) + '\n'
+        for cid in ('d0-t0-p0', 'd0-t0-p1')
+    ))
+    return {
+        'run_id': 'lote_teste', 'backend': 'falso', 'model': 'gpt-5', 'status': 'enviado', 'criado_em': 0,
+        'lotes': [{'batch_id': 'b1', 'arquivo': str(entrada), 'status': 'completed'}],
+        'documentos': [{
+            'filename': 'a.pdf', 'status': 'pendente', 'cache_key': 'x', 'pdf_hash': 'h1',
+            'itens': [{'partes': ['d0-t0-p0', 'd0-t0-p1']}]
+        }]
+    }
+
+@pytest.fixture
+def sem_efeitos(db, monkeypatch):
+    monkeypatch.setattr(batch, 'ANALYSIS_CACHE_ENABLED', False)
+
+def ingestao(tmp_path, saida):
+    return BatchIngestion(BackendFalso(saida), str(tmp_path / 'lotes'), poll_interval=60)
+
+def test_parte_sem_linha_e_refeita_em_tempo_real(tmp_path, execucao, sem_efeitos, monkeypatch):
+    refeitas = []
+    
+    def executar(linha):
+        refeitas.append(linha['custom_id'])
+        return linha_saida(linha['custom_id'], [{'codigo_obra': '616', 'despesas': [{'valor': 5.0}]}])
+    
+    monkeypatch.setattr(batch, 'execute_batch_line', executar)
+    saida = [linha_saida('d0-t0-p0', [{'codigo_obra': '616', 'competencia': '09/2025', 'despesas': [{'valor': 10.0}]}])]
+    ingestao(tmp_path, saida)._finalize(execucao)
+    
+    assert refeitas == ['d0-t0-p1']
+    doc, = execucao['documentos']
+    assert doc['status'] == 'success'
+    assert doc['codigo_obra'] == '616'
+    # A ingestão em massa pula o PDF gravado pelo lote
+    assert index.ingested_pdf_hashes(['h1']) == {'h1'}
+
+def test_parte_que_falha_de_novo_e_identificada(tmp_path, execucao, sem_efeitos, monkeypatch):
+    monkeypatch.setattr(batch, 'execute_batch_line', lambda linha: {
+        'custom_id': linha['custom_id'], 'response': None, 'error': {'code': 'RateLimitError', 'message': '429'}
+    })
+    saida = [
+        linha_saida('d0-t0-p0', [{'codigo_obra': '616'}]),
+        {'custom_id': 'd0-t0-p1', 'response': {'status_code': 500, 'body': {'error': 'falha interna'}}, 'error': None}
+    ]
+    ingestao(tmp_path, saida)._finalize(execucao)
+    
+    doc, = execucao['documentos']
+    assert doc['status'] == 'error'
+    assert 'd0-t0-p1' in doc['message']
+    assert 'falha interna' in doc['message']
+
+def test_list_runs_sem_caminhos_nem_itens(tmp_path, execucao):
+    batch = ingestao(tmp_path, [])
+    execucao['documentos'][0]['caminho'] = '/tmp/a.pdf'
+    batch.runs[execucao['run_id']] = execucao
+    
+    resumo, = batch.list_runs()
+    assert resumo['run_id'] == 'lote_teste'
+    assert resumo['documentos'] == [{'filename': 'a.pdf', 'status': 'pendente', 'cache_key': 'x', 'pdf_hash': 'h1'}]
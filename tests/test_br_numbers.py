@@ -0,0 +1,96 @@
+"""Normalização de números, datas e competências no padrão brasileiro"""
+
+import pytest
+
+from api.index import (
+    parse_br_number, parse_br_date, parse_competencia, normalize_br_value, normalize_br_text,
+    normalize_layout_text, coerce_analysis_numbers, parse_tsv_tables
+)
+
+@pytest.mark.parametrize('valor, esperado', [
+    ('7.319.162,16', 7319162.16),
+    ('82,60', 82.60),
+    ('(82,60)', -82.60),
+    ('82,60-', -82.60),
+    ('-R$ 1,00', -1.00),
+    ('R$ 1.234,56', 1234.56),
+    ('1234.56', 1234.56),
+    (10, 10.0),
+    ('abc', None),
+    (None, None),
+])
+def test_parse_br_number(valor, esperado):
+    assert parse_br_number(valor) == esperado
+
+@pytest.mark.parametrize('valor, esperado', [
+    ('31/08/2025', '2025-08-31'),
+    ('31/08/25', '2025-08-31'),
+    ('31/02/2025', None),
+    ('08/2025', None),
+])
+def test_parse_br_date(valor, esperado):
+    assert parse_br_date(valor) == esperado
+
+@pytest.mark.parametrize('texto, esperado', [
+    ('COMPETÊNCIA: SETEMBRO 25', '09/2025'),
+    ('SET/25', '09/2025'),
+    ('SETEMBRO DE 2025', '09/2025'),
+    ('SET 2025', '09/2025'),
+    ('REF. 09/2025', '09/2025'),
+    ('MÊS: OUT/24', '10/2024'),
+    # Sem rótulo nem separador, 'JUN 15' é data de lançamento, não competência
+    ('15 JUN 15 PAGTO', None),
+    ('SETEMBRO 25', None),
+])
+def test_parse_competencia(texto, esperado):
+    assert parse_competencia(normalize_layout_text(texto)) == esperado
+
+def test_normalize_br_value():
+    assert normalize_br_value('1.000,50') == 1000.50
+    assert normalize_br_value('(200,00)') == -200.00
+    assert normalize_br_value('01/09/2025') == '2025-09-01'
+    assert normalize_br_value('SET/2025') == '09/2025'
+    assert normalize_br_value('616') == '616'
+    assert normalize_br_value(3.5) == 3.5
+
+def test_normalize_br_text():
+    texto = normalize_br_text('DESPESAS 7.319.162,16\nESTORNO (82,60)\nAJUSTE 82,60-\nCOMPETENCIA SETEMBRO 25\nEM 31/08/2025')
+    
+    assert texto.splitlines() == [
+        'DESPESAS 7319162.16',
+        'ESTORNO -82.60',
+        'AJUSTE -82.60',
+        'COMPETENCIA SETEMBRO 25 [09/2025]',
+        'EM 31/08/2025',
+    ]
+
+def test_parse_tsv_tables_tipa_as_celulas():
+    texto = (
+        'RELATÓRIO\n'
+        '[TABELA p.1 #1]\n'
+        'DATA\tDESCRIÇÃO\tVALOR\n'
+        '01/09/2025\tMaterial\t1.000,50\n'
+        '02/09/2025\tEstorno\t(82,60)\n'
+        'rodapé'
+    )
+    
+    tabela, = parse_tsv_tables(texto)
+    assert tabela['cabecalho'] == ['DATA', 'DESCRIÇÃO', 'VALOR']
+    assert tabela['linhas'] == [
+        {'DATA': '2025-09-01', 'DESCRIÇÃO': 'Material', 'VALOR': 1000.50},
+        {'DATA': '2025-09-02', 'DESCRIÇÃO': 'Estorno', 'VALOR': -82.60},
+    ]
+
+def test_coerce_analysis_numbers():
+    analysis = [{
+        'saldo_final': '1.234,56',
+        'despesas': [{'valor': '(82,60)'}],
+        'aportes_pool': {'valor_total_pool': '5.483.433,37'},
+        'competencia': '09/2025'
+    }]
+    
+    coerce_analysis_numbers(analysis)
+    assert analysis[0]['saldo_final'] == 1234.56
+    assert analysis[0]['despesas'][0]['valor'] == -82.60
+    assert analysis[0]['aportes_pool']['valor_total_pool'] == 5483433.37
+    assert analysis[0]['competencia'] == '09/2025'
@@ -0,0 +1,49 @@
+"""Partes do orçamento de saída no caminho síncrono (analyze_with_openai)"""
+
+import asyncio
+import threading
+
+import pytest
+
+from api import index
+
+class MotorFalso:
+    """get_async_engine() que executa a corrotina na hora e conta as submissões"""
+    
+    def __init__(self):
+        self.submetidas = 0
+    
+    def submit(self, coro):
+        self.submetidas += 1
+        return index.completed_future(asyncio.run(coro))
+
+@pytest.fixture
+def partes(monkeypatch):
+    monkeypatch.setattr(index, 'planned_output_budget', lambda texto, model: (1500, ['parte A', 'parte B', 'parte C']))
+    
+    async def analisar_async(texto, document_type, model, max_tokens=None):
+        return [{'codigo_obra': '616', 'despesas': [{'valor': float(len(texto)), 'descricao': texto}]}]
+    
+    monkeypatch.setattr(index, 'analyze_text_part_async', analisar_async)
+
+def test_partes_vao_pelo_motor_assincrono(partes, monkeypatch):
+    motor = MotorFalso()
+    monkeypatch.setattr(index, 'OPENAI_ASYNC_ENABLED', True)
+    monkeypatch.setattr(index, 'get_async_engine', lambda: motor)
+    antes = threading.active_count()
+    
+    obra, = index.analyze_with_openai('documento', 'relatório', 'gpt-5')
+    
+    assert motor.submetidas == 3
+    assert threading.active_count() == antes  # Nenhum pool próprio por chamada
+    assert [d['descricao'] for d in obra['despesas']] == ['parte A', 'parte B', 'parte C']
+
+def test_sem_motor_assincrono_partes_em_sequencia(partes, monkeypatch):
+    chamadas = []
+    monkeypatch.setattr(index, 'OPENAI_ASYNC_ENABLED', False)
+    monkeypatch.setattr(index, 'analyze_text_part', lambda texto, document_type, model, max_tokens=None: (
+        chamadas.append((texto, threading.current_thread().name)) or [{'codigo_obra': '616', 'saldo_final': 1.0}]
+    ))
+    
+    index.analyze_with_openai('documento', 'relatório', 'gpt-5')
+    assert chamadas == [(p, threading.current_thread().name) for p in ('parte A', 'parte B', 'parte C')]
@@ -0,0 +1,101 @@
+"""Cascata de modelos: modelo rápido primeiro, escalonamento só do chunk reprovado"""
+
+import pytest
+
+from api import index
+from api.index import analyze_chunk_cascade, cascade_route, check_saldo_identity, validate_analysis_result
+
+OBRA_OK = {
+    'codigo_obra': '616', 'saldo_inicial': 1000.0, 'receitas_total': 500.0,
+    'despesas_total': 300.0, 'saldo_final': 1200.0
+}
+OBRA_SALDO_ERRADO = {**OBRA_OK, 'saldo_final': 1900.0}
+
+@pytest.fixture
+def cascata(monkeypatch):
+    """analyze_with_openai falso com uma resposta por modelo; registra as chamadas"""
+    monkeypatch.setattr(index, 'MODEL_CASCADE_ENABLED', True)
+    monkeypatch.setattr(index, 'MODEL_CASCADE_FAST_MODEL', '')
+    monkeypatch.setattr(index, 'cascade_stats', {})
+    chamadas = []
+    respostas = {}
+    
+    def analisar(texto, document_type, model):
+        chamadas.append((model, texto))
+        resposta = respostas[model]
+        if isinstance(resposta, Exception):
+            raise resposta
+        return [dict(resposta)]
+    
+    monkeypatch.setattr(index, 'analyze_with_openai', analisar)
+    return respostas, chamadas
+
+def test_rota_da_cascata(monkeypatch):
+    monkeypatch.setattr(index, 'MODEL_CASCADE_ENABLED', True)
+    monkeypatch.setattr(index, 'MODEL_CASCADE_FAST_MODEL', '')
+    assert cascade_route('gpt-5') == ['gpt-5-mini', 'gpt-5']
+    assert cascade_route('gpt-3.5-turbo') == ['gpt-3.5-turbo']
+    
+    monkeypatch.setattr(index, 'MODEL_CASCADE_ENABLED', False)
+    assert cascade_route('gpt-5') == ['gpt-5']
+
+def test_validacao_confere_o_saldo():
+    assert check_saldo_identity(OBRA_OK) == (True, 0.0)
+    assert check_saldo_identity(OBRA_SALDO_ERRADO) == (False, 700.0)
+    assert check_saldo_identity({'codigo_obra': '616', 'saldo_final': 'não_informado'}) == (None, None)
+    
+    assert validate_analysis_result([OBRA_OK]) == (True, [])
+    ok, motivos = validate_analysis_result([OBRA_SALDO_ERRADO])
+    assert not ok and 'saldo não fecha' in motivos[0]
+    assert validate_analysis_result([]) == (False, ['nenhuma obra extraída'])
+
+def test_modelo_rapido_aceito_nao_escala(cascata):
+    respostas, chamadas = cascata
+    respostas['gpt-5-mini'] = OBRA_OK
+    
+    analysis = analyze_chunk_cascade('chunk 1', 'relatório', ['gpt-5-mini', 'gpt-5'])
+    
+    assert [m for m, _ in chamadas] == ['gpt-5-mini']
+    assert analysis[0]['metodo_extracao'] == 'llm:gpt-5-mini'
+    stats = index.cascade_info()['gpt-5-mini>gpt-5']
+    assert stats['chunks'] == 1 and stats['escalations'] == 0
+
+def test_chunk_reprovado_vai_para_o_modelo_pedido(cascata):
+    respostas, chamadas = cascata
+    respostas.update({'gpt-5-mini': OBRA_SALDO_ERRADO, 'gpt-5': OBRA_OK})
+    
+    analysis = analyze_chunk_cascade('chunk 2', 'relatório', ['gpt-5-mini', 'gpt-5'])
+    
+    # O mesmo chunk (só ele) é reenviado
+    assert chamadas == [('gpt-5-mini', 'chunk 2'), ('gpt-5', 'chunk 2')]
+    assert analysis[0]['metodo_extracao'] == 'llm:gpt-5'
+    stats = index.cascade_info()['gpt-5-mini>gpt-5']
+    assert stats['escalations'] == 1
+    assert stats['escalation_rate'] == 1.0
+    assert stats['tiers']['gpt-5-mini']['rejected'] == 1
+    assert stats['tiers']['gpt-5']['accepted'] == 1
+
+def test_erro_no_modelo_rapido_escala(cascata):
+    respostas, chamadas = cascata
+    respostas.update({'gpt-5-mini': ValueError('JSON inválido'), 'gpt-5': OBRA_OK})
+    
+    analysis = analyze_chunk_cascade('chunk 3', 'relatório', ['gpt-5-mini', 'gpt-5'])
+    
+    assert [m for m, _ in chamadas] == ['gpt-5-mini', 'gpt-5']
+    assert analysis[0]['codigo_obra'] == '616'
+
+def test_ultimo_nivel_sempre_aceito(cascata):
+    respostas, chamadas = cascata
+    respostas.update({'gpt-5-mini': OBRA_SALDO_ERRADO, 'gpt-5': OBRA_SALDO_ERRADO})
+    
+    analysis = analyze_chunk_cascade('chunk 4', 'relatório', ['gpt-5-mini', 'gpt-5'])
+    
+    assert analysis[0]['metodo_extracao'] == 'llm:gpt-5'
+    assert len(chamadas) == 2
+
+def test_erro_no_ultimo_nivel_propaga(cascata):
+    respostas, _ = cascata
+    respostas.update({'gpt-5-mini': ValueError('timeout'), 'gpt-5': ValueError('timeout')})
+    
+    with pytest.raises(ValueError):
+        analyze_chunk_cascade('chunk 5', 'relatório', ['gpt-5-mini', 'gpt-5'])
@@ -0,0 +1,100 @@
+"""Cache de respostas do /api/chat: chave normalizada, TTL e LRU por bytes"""
+
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from api import index
+from api.index import ChatResponseCache
+
+def payload(texto):
+    return {'choices': [{'message': {'content': texto}}], 'model': 'gpt-5'}
+
+@pytest.fixture
+def relogio(monkeypatch):
+    agora = [1000.0]
+    monkeypatch.setattr(index, 'time', SimpleNamespace(time=lambda: agora[0]))
+    return agora
+
+def test_chave_ignora_espacos_crlf_e_ordem_dos_campos():
+    a = ChatResponseCache.key('gpt-5', [{'role': 'user', 'content': '  Saldo da obra 616?\r\nCompetência 09/2025  \n'}], 500)
+    b = ChatResponseCache.key('gpt-5', [{'content': 'Saldo da obra 616?\nCompetência 09/2025', 'role': 'user'}], 500)
+    
+    assert a == b
+    assert a != ChatResponseCache.key('gpt-4o', [{'role': 'user', 'content': 'Saldo da obra 616?'}], 500)
+    assert a != ChatResponseCache.key('gpt-5', [{'role': 'user', 'content': 'Saldo da obra 616?'}], 600)
+
+def test_entrada_expira_pelo_ttl(relogio):
+    cache = ChatResponseCache(ttl=60, max_bytes=10000)
+    cache.set('k', payload('resposta'))
+    
+    relogio[0] += 30
+    assert cache.get('k') == (payload('resposta'), 30.0)
+    
+    relogio[0] += 31
+    assert cache.get('k') is None
+    assert cache.info()['expired'] == 1
+    assert cache.info()['entries'] == 0
+
+def test_lru_descarta_a_usada_ha_mais_tempo(relogio):
+    tamanho = len(json.dumps(payload('a'), ensure_ascii=False).encode('utf-8'))
+    cache = ChatResponseCache(ttl=60, max_bytes=tamanho * 2)
+    cache.set('a', payload('a'))
+    cache.set('b', payload('b'))
+    
+    assert cache.get('a')  # 'a' passa a ser a mais recente
+    cache.set('c', payload('c'))
+    
+    assert cache.get('b') is None
+    assert cache.get('a') and cache.get('c')
+    info = cache.info()
+    assert info['evictions'] == 1
+    assert info['size_bytes'] <= info['max_bytes']
+
+def test_payload_maior_que_o_limite_nao_entra():
+    cache = ChatResponseCache(ttl=60, max_bytes=10)
+    
+    assert cache.set('k', payload('resposta longa')) is False
+    assert cache.info()['entries'] == 0
+
+@pytest.fixture
+def chat(monkeypatch):
+    """Cliente do Flask com a OpenAI falsa contando as chamadas"""
+    chamadas = []
+    
+    def openai(messages, model, max_tokens, schema=None):
+        chamadas.append(messages)
+        resposta = SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=f"resposta {len(chamadas)}"), finish_reason='stop')],
+            usage=None
+        )
+        return resposta, None
+    
+    monkeypatch.setattr(index, 'process_openai_request', openai)
+    monkeypatch.setattr(index, 'CHAT_CACHE_ENABLED', True)
+    monkeypatch.setattr(index, 'chat_cache', ChatResponseCache(60, 10000))
+    return index.app.test_client(), chamadas
+
+def test_pergunta_repetida_volta_do_cache(chat):
+    cliente, chamadas = chat
+    corpo = {'model': 'gpt-5', 'messages': [{'role': 'user', 'content': 'Qual o saldo da obra 616?'}]}
+    
+    primeira = cliente.post('/api/chat', json=corpo).get_json()
+    segunda = cliente.post('/api/chat', json=corpo).get_json()
+    
+    assert len(chamadas) == 1
+    assert primeira['cached'] is False and primeira['cache_age'] is None
+    assert segunda['cached'] is True and segunda['cache_age'] >= 0
+    assert segunda['choices'] == primeira['choices']
+
+def test_cache_false_forca_nova_chamada(chat):
+    cliente, chamadas = chat
+    corpo = {'model': 'gpt-5', 'messages': [{'role': 'user', 'content': 'Qual o saldo da obra 616?'}]}
+    
+    cliente.post('/api/chat', json=corpo)
+    resposta = cliente.post('/api/chat', json={**corpo, 'cache': False}).get_json()
+    
+    assert len(chamadas) == 2
+    assert resposta['cached'] is False
+    assert resposta['choices'][0]['message']['content'] == 'resposta 2'
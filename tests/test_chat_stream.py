@@ -0,0 +1,104 @@
+"""/api/chat em server-sent events: pedaços conforme chegam e metadados no evento final"""
+
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from api import index
+from api.index import CompatResponse, ChatResponseCache, process_openai_stream, stream_event_parts
+
+def eventos_sse(corpo):
+    """[(evento, dados)] de um corpo text/event-stream (comentários ignorados)"""
+    eventos = []
+    for bloco in corpo.split('\n\n'):
+        linhas = dict(l.split(': ', 1) for l in bloco.splitlines() if not l.startswith(':') and ': ' in l)
+        if 'event' in linhas:
+            eventos.append((linhas['event'], json.loads(linhas['data'])))
+    return eventos
+
+@pytest.fixture
+def stream(monkeypatch):
+    """process_openai_stream falso: entrega os pedaços configurados"""
+    config = {'pedacos': ['O saldo ', 'da obra 616 ', 'é R$ 1.200,00.'], 'erro': None, 'chamadas': 0}
+    
+    def falso(messages, model, max_tokens, schema=None, on_delta=None):
+        config['chamadas'] += 1
+        if config['erro']:
+            return None, config['erro']
+        for pedaco in config['pedacos']:
+            on_delta(pedaco)
+        return CompatResponse(''.join(config['pedacos']), 'stop', {'output_tokens': 12}), None
+    
+    monkeypatch.setattr(index, 'process_openai_stream', falso)
+    monkeypatch.setattr(index, 'CHAT_CACHE_ENABLED', True)
+    monkeypatch.setattr(index, 'chat_cache', ChatResponseCache(60, 10000))
+    return config
+
+def pergunta(**extra):
+    return {'model': 'gpt-5', 'messages': [{'role': 'user', 'content': 'Saldo da obra 616?'}], 'stream': True, **extra}
+
+def test_pedacos_e_evento_final(stream):
+    resposta = index.app.test_client().post('/api/chat', json=pergunta())
+    
+    assert resposta.mimetype == 'text/event-stream'
+    corpo = resposta.get_data(as_text=True)
+    assert corpo.startswith(': stream iniciado')
+    eventos = eventos_sse(corpo)
+    assert [e for e, _ in eventos] == ['delta', 'delta', 'delta', 'done']
+    assert ''.join(d['content'] for e, d in eventos if e == 'delta') == 'O saldo da obra 616 é R$ 1.200,00.'
+    
+    final = eventos[-1][1]
+    assert final['model'] == 'gpt-5'
+    assert final['choices'][0]['message']['content'] == 'O saldo da obra 616 é R$ 1.200,00.'
+    assert final['processing_time'] >= 0 and final['first_token_time'] is not None
+    assert final['cached'] is False and final['finish_reason'] == 'stop'
+
+def test_accept_event_stream_tambem_ativa(stream):
+    resposta = index.app.test_client().post('/api/chat', json={**pergunta(), 'stream': False},
+                                            headers={'Accept': 'text/event-stream'})
+    assert resposta.mimetype == 'text/event-stream'
+
+def test_repeticao_vem_do_cache_em_um_evento(stream):
+    cliente = index.app.test_client()
+    cliente.post('/api/chat', json=pergunta()).get_data()
+    
+    eventos = eventos_sse(cliente.post('/api/chat', json=pergunta()).get_data(as_text=True))
+    
+    assert stream['chamadas'] == 1
+    assert [e for e, _ in eventos] == ['delta', 'done']
+    assert eventos[-1][1]['cached'] is True
+
+def test_erro_da_openai_vira_evento_error(stream):
+    stream['erro'] = 'HTTP 500'
+    
+    eventos = eventos_sse(index.app.test_client().post('/api/chat', json=pergunta()).get_data(as_text=True))
+    
+    assert eventos == [('error', {'error': 'Erro na API OpenAI: HTTP 500'})]
+
+def test_partes_dos_eventos_das_duas_apis():
+    delta = SimpleNamespace(type='response.output_text.delta', delta='Saldo')
+    fim = SimpleNamespace(type='response.completed', response=SimpleNamespace(usage='uso'))
+    assert stream_event_parts('responses', delta) == ('Saldo', None, None)
+    assert stream_event_parts('responses', fim) == (None, 'uso', 'stop')
+    
+    pedaco = SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content='Saldo'), finish_reason=None)], usage=None)
+    assert stream_event_parts('chat', pedaco) == ('Saldo', None, None)
+    assert stream_event_parts('chat', SimpleNamespace(choices=[], usage='uso')) == (None, 'uso', None)
+
+def test_queda_no_meio_devolve_o_texto_parcial(monkeypatch):
+    def eventos(**params):
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content='Saldo '), finish_reason=None)])
+        raise ConnectionError('conexão caiu')
+    
+    cliente = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=eventos)))
+    monkeypatch.setattr(index, 'openai_client', cliente)
+    monkeypatch.setattr(index, 'OPENAI_ASYNC_ENABLED', False)
+    recebidos = []
+    
+    response, error = process_openai_stream([{'role': 'user', 'content': 'oi'}], 'gpt-4o', 100, on_delta=recebidos.append)
+    
+    assert error is None
+    assert recebidos == ['Saldo ']
+    assert response.choices[0].message.content == 'Saldo '
+    assert response.choices[0].finish_reason == 'interrupted'
@@ -0,0 +1,112 @@
+"""Limite adaptativo (AIMD) de PDFs em paralelo a partir das chamadas OpenAI"""
+
+import threading
+
+import httpx
+import pytest
+from openai import APITimeoutError
+
+from api import concurrency, index
+from api.concurrency import AdaptiveConcurrencyLimiter
+
+class ErroHTTP(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+def limitador(initial=2, minimo=1, maximo=8, cooldown=0.0):
+    return AdaptiveConcurrencyLimiter(initial, minimo, maximo, 0.5, 2.0, cooldown)
+
+def ocupar(limiter):
+    """Todas as vagas em uso (o limite é o gargalo)"""
+    for _ in range(int(limiter.limit) - limiter.in_flight):
+        assert limiter.acquire()
+
+def test_aumento_aditivo_com_todas_as_vagas_em_uso():
+    limiter = limitador(initial=2)
+    ocupar(limiter)
+    
+    limiter.on_success('modelo-aimd-1', 1.0)
+    assert limiter.limit == 2.5
+    
+    # +1/limite por sucesso: uma vaga a mais a cada ~'limite' sucessos
+    limiter.on_success('modelo-aimd-1', 1.0)
+    limiter.on_success('modelo-aimd-1', 1.0)
+    assert int(limiter.limit) == 3
+    
+    info = limiter.info()
+    assert info['increases'] == 1
+    assert info['decisions'][-1]['de'] == 2.9
+
+def test_sem_aumento_com_vagas_livres():
+    limiter = limitador(initial=4)
+    assert limiter.acquire()
+    
+    limiter.on_success('modelo-aimd-2', 1.0)
+    assert limiter.limit == 4.0
+
+def test_chamada_lenta_mantem_o_limite(monkeypatch):
+    monkeypatch.setattr(concurrency, 'ADAPTIVE_MIN_SAMPLES', 3)
+    for _ in range(5):
+        index.openai_latency.record('modelo-aimd-3', 2.0)
+    limiter = limitador(initial=2)
+    ocupar(limiter)
+    
+    limiter.on_success('modelo-aimd-3', 10.0)  # > 2 × p50
+    
+    assert limiter.limit == 2.0
+    assert limiter.info()['holds'] == 1
+
+@pytest.mark.parametrize('erro, motivo', [
+    (ErroHTTP(429), '429 rate limit'),
+    (ErroHTTP(503), 'sobrecarga 503'),
+    (APITimeoutError(request=httpx.Request('POST', 'https://api.openai.com/v1/responses')), 'timeout'),
+])
+def test_reducao_multiplicativa_em_congestionamento(erro, motivo):
+    limiter = limitador(initial=8)
+    
+    limiter.on_error(erro)
+    
+    assert limiter.limit == 4.0
+    assert limiter.info()['decisions'][-1]['motivo'] == motivo
+
+def test_erros_que_nao_sao_congestionamento_nao_reduzem():
+    limiter = limitador(initial=8)
+    
+    limiter.on_error(ErroHTTP(400))
+    limiter.on_error(ValueError('JSON inválido'))
+    
+    assert limiter.limit == 8.0
+
+def test_falhas_juntas_reduzem_uma_vez_no_cooldown():
+    limiter = limitador(initial=8, cooldown=60)
+    
+    for _ in range(5):
+        limiter.on_error(ErroHTTP(429))
+    
+    assert limiter.limit == 4.0
+    assert limiter.info()['decreases'] == 1
+
+def test_limite_respeita_minimo_e_maximo():
+    limiter = limitador(initial=2, minimo=2, maximo=3)
+    
+    limiter.on_error(ErroHTTP(429))
+    assert limiter.limit == 2.0
+    
+    for _ in range(10):
+        ocupar(limiter)
+        limiter.on_success('modelo-aimd-4', 1.0)
+    assert limiter.limit == 3.0
+
+def test_acquire_espera_uma_vaga():
+    limiter = limitador(initial=1)
+    assert limiter.acquire()
+    parar = threading.Event()
+    parar.set()
+    
+    # Sem vaga e com stop_event disparado: desiste em vez de esperar
+    assert limiter.acquire(parar) is False
+    
+    limiter.release()
+    assert limiter.acquire(parar) is True
+    assert limiter.info()['in_flight'] == 1
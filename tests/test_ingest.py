@@ -0,0 +1,76 @@
+"""Ingestão em massa (python -m api.ingest): coleta de diretórios/ZIPs e retomada por hash"""
+
+import zipfile
+
+import pytest
+
+from api import index, ingest
+
+def pdf(caminho, conteudo):
+    caminho.parent.mkdir(parents=True, exist_ok=True)
+    caminho.write_bytes(b'%PDF-1.4\n' + conteudo)
+    return caminho
+
+def test_collect_pdfs_diretorio_recursivo_e_zip(tmp_path):
+    pdf(tmp_path / 'entrada' / 'jan' / 'a.pdf', b'a')
+    pdf(tmp_path / 'entrada' / 'B.PDF', b'b')
+    pdf(tmp_path / 'entrada' / '.oculto.pdf', b'x')
+    (tmp_path / 'entrada' / 'notas.txt').write_text('ignorar')
+    
+    with zipfile.ZipFile(tmp_path / 'fev.zip', 'w') as zf:
+        zf.writestr('pasta/c.pdf', b'%PDF-1.4\nc')
+        zf.writestr('outra/c.pdf', b'%PDF-1.4\nc2')
+        zf.writestr('__MACOSX/pasta/._c.pdf', b'lixo')
+        zf.writestr('leia.txt', b'ignorar')
+    
+    temp = tmp_path / 'temp'
+    temp.mkdir()
+    documentos = ingest.collect_pdfs([tmp_path / 'entrada', tmp_path / 'fev.zip'], str(temp))
+    
+    nomes = [nome for _, nome in documentos]
+    assert nomes == ['B.PDF', 'jan/a.pdf', 'fev.zip:pasta/c.pdf', 'fev.zip:outra/c.pdf']
+    # Nomes iguais em pastas diferentes do ZIP não colidem no disco
+    assert len({caminho for caminho, _ in documentos}) == 4
+
+@pytest.fixture
+def analise_falsa(db, monkeypatch):
+    """process_single_pdf sem extração nem OpenAI"""
+    monkeypatch.setattr(index, 'analyze_pdf_document', lambda *args, **kwargs: {
+        'codigo_obra': '616', 'competencia': '09/2025', 'movimentos': []
+    })
+
+def test_retomada_pula_pdfs_gravados_fora_do_pipeline(tmp_path, analise_falsa, monkeypatch):
+    mensagens = []
+    monkeypatch.setattr(ingest, 'log', lambda msg: mensagens.append(msg))
+    entrada = tmp_path / 'entrada'
+    gravado = pdf(entrada / 'a.pdf', b'a')
+    pdf(entrada / 'copia.pdf', b'a')
+    
+    # Caminho da fila / PIPELINE_ENABLED=False também registra o hash
+    resultado = index.process_single_pdf(str(gravado), 'gpt-5')
+    assert resultado['status'] == 'success'
+    assert index.ingested_pdf_hashes([index.hash_pdf_file(str(gravado))])
+    
+    assert ingest.main([str(entrada)]) == 0
+    assert any('0 para ingerir | 2 pulado(s)' in msg for msg in mensagens)
+
+def test_force_nao_pula(tmp_path, analise_falsa, monkeypatch):
+    entrada = tmp_path / 'entrada'
+    index.process_single_pdf(str(pdf(entrada / 'a.pdf', b'a')), 'gpt-5')
+    
+    enviados = []
+    
+    class PipelineFalso:
+        def __init__(self, *args):
+            pass
+        
+        def submit(self, caminho, *args, filename=None):
+            enviados.append(filename)
+            return index.completed_future({'status': 'success', 'filename': filename, 'tempo_total': 0.0})
+        
+        def info(self):
+            return {'stages': {}, 'bottleneck': None}
+    
+    monkeypatch.setattr(ingest, 'IngestionPipeline', PipelineFalso)
+    assert ingest.main([str(entrada), '--force']) == 0
+    assert enviados == ['a.pdf']
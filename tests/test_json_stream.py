@@ -0,0 +1,82 @@
+"""JsonItemStream e repair_truncated_json: respostas em pedaços e JSON cortado"""
+
+from api.index import JsonItemStream, repair_truncated_json
+
+def feed_em_pedacos(parser, texto, tamanho=7):
+    itens = []
+    for i in range(0, len(texto), tamanho):
+        itens += parser.feed(texto[i:i + tamanho])
+    return itens
+
+def test_obras_entregues_conforme_fecham():
+    texto = '{"obras": [{"codigo_obra": "601"}, {"codigo_obra": "603"}]}'
+    parser = JsonItemStream()
+    
+    assert parser.feed(texto[:35]) == [{'codigo_obra': '601'}]
+    assert parser.feed(texto[35:]) == [{'codigo_obra': '603'}]
+    assert parser.finish() == [{'codigo_obra': '601'}, {'codigo_obra': '603'}]
+
+def test_lista_pura_com_texto_antes_e_depois():
+    parser = JsonItemStream()
+    feed_em_pedacos(parser, 'Segue o JSON:\n```json\n[{"codigo_obra": "1"}, {"codigo_obra": "2"}]\n```')
+    
+    assert parser.finish() == [{'codigo_obra': '1'}, {'codigo_obra': '2'}]
+
+def test_obra_solta():
+    parser = JsonItemStream()
+    parser.feed('{"codigo_obra": "616", "saldo_final": 10}')
+    
+    assert parser.finish() == {'codigo_obra': '616', 'saldo_final': 10}
+
+def test_chaves_dentro_de_strings_nao_fecham_objetos():
+    parser = JsonItemStream()
+    feed_em_pedacos(parser, '[{"descricao": "NF {123} ] \\"x\\"", "codigo_obra": "601"}]', tamanho=3)
+    
+    assert parser.finish() == [{'descricao': 'NF {123} ] "x"', 'codigo_obra': '601'}]
+
+def test_valores_brasileiros_convertidos_nas_obras():
+    parser = JsonItemStream()
+    parser.feed('[{"codigo_obra": "601", "saldo_final": "1.234,56", "despesas": [{"valor": "(82,60)"}]}]')
+    
+    obra = parser.finish()[0]
+    assert obra['saldo_final'] == 1234.56
+    assert obra['despesas'][0]['valor'] == -82.60
+
+def test_resposta_truncada_mantem_obras_completas_e_recupera_a_parcial():
+    texto = ('{"obras": [{"codigo_obra": "601"}, {"codigo_obra": "603", "despesas": '
+             '[{"descricao": "a", "valor": 10}, {"descricao": "b", "val')
+    parser = JsonItemStream()
+    feed_em_pedacos(parser, texto)
+    
+    obras = parser.finish(truncated=True)
+    assert [o['codigo_obra'] for o in obras] == ['601', '603']
+    assert obras[1]['despesas'] == [{'descricao': 'a', 'valor': 10}]
+    assert obras[1]['qualidade_extracao'].startswith('⚠️ Parcial')
+    assert 'resposta truncada' in obras[1]['validacoes']['alertas'][0]
+
+def test_obra_solta_truncada():
+    parser = JsonItemStream()
+    parser.feed('{"codigo_obra": "616", "despesas": [{"valor": 1}, {"valor": 2}, {"val')
+    
+    obra = parser.finish()
+    assert obra['codigo_obra'] == '616'
+    assert obra['despesas'] == [{'valor': 1}, {'valor': 2}]
+    assert 'JSON incompleto' in obra['validacoes']['alertas'][0]
+
+def test_sem_json():
+    parser = JsonItemStream()
+    parser.feed('Não consegui ler o documento.')
+    
+    assert parser.finish() is None
+
+def test_repair_descarta_elemento_de_lista_pela_metade():
+    assert repair_truncated_json('{"a": 1, "l": [{"x": 1}, {"x": 2}, {"x"') == {'a': 1, 'l': [{'x': 1}, {'x': 2}]}
+
+def test_repair_ignora_delimitadores_em_strings():
+    assert repair_truncated_json('{"a": "tem } e ] aqui", "b": [1, 2') == {'a': 'tem } e ] aqui', 'b': [1]}
+
+def test_repair_json_completo_volta_inteiro():
+    assert repair_truncated_json('{"a": [1, 2], "b": {"c": null}} resto') == {'a': [1, 2], 'b': {'c': None}}
+
+def test_repair_sem_objeto():
+    assert repair_truncated_json('sem json') is None
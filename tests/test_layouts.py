@@ -0,0 +1,101 @@
+"""Fast path de layouts conhecidos: fingerprint do cabeçalho, regras e volta para o LLM"""
+
+import pytest
+
+from api import index
+from api.index import fingerprint_document, match_layout, run_layout_fast_path
+
+CABECALHO = (
+    'DETALHAMENTO DE DESPESAS - OBRA 616 - Fiação Enterrada\n'
+    'COMPETÊNCIA: SETEMBRO/2025\n'
+    'APORTES RECEBIDOS NO POOL 10.000,00\n'
+    'DESPESAS DE TODAS AS OBRAS 4.000,00\n'
+)
+TABELA = (
+    'DATA        FORNECEDOR          DESCRIÇÃO                 VALOR\n'
+    '01/09/2025  Casa do Cabo        Material elétrico       1.000,00\n'
+    '02/09/2025  Construtora X       Mão de obra               500,00\n'
+)
+DESPESAS = CABECALHO + TABELA + 'TOTAL                                                   1.500,00\n'
+
+def layout(nome):
+    return next(l for l in index.LAYOUT_REGISTRY if l['nome'] == nome)
+
+def test_fingerprint_do_cabecalho_escolhe_o_layout():
+    assert match_layout(fingerprint_document(DESPESAS)) is layout('despesas_v1')
+
+def test_mesmos_marcadores_com_outro_cabecalho_nao_casam():
+    outro = CABECALHO + 'DATA    HISTÓRICO    VALOR\n01/09/2025  Material  1.000,00\nTOTAL  1.000,00\n'
+    assert match_layout(fingerprint_document(outro)) is None
+
+def test_fast_path_despesas_por_colunas():
+    result = run_layout_fast_path(layout('despesas_v1'), DESPESAS)
+    
+    assert result['codigo_obra'] == '616'
+    assert result['competencia'] == '09/2025'
+    assert [(d['fornecedor'], d['descricao'], d['valor']) for d in result['despesas']] == [
+        ('Casa do Cabo', 'Material elétrico', 1000.0),
+        ('Construtora X', 'Mão de obra', 500.0),
+    ]
+    assert result['despesas_total'] == 1500.0
+    assert result['aportes_pool']['taxa_rateio_percentual'] == 0.375
+    assert result['aportes_pool']['valor_rateado_esta_obra'] == 3750.0
+    assert result['metodo_extracao'] == 'layout:despesas_v1'
+
+@pytest.mark.parametrize('texto, motivo', [
+    (DESPESAS.replace('TOTAL                                                   1.500,00',
+                      'TOTAL                                                   1.900,00'), 'total diferente'),
+    (DESPESAS.replace('APORTES RECEBIDOS NO POOL 10.000,00\n', ''), 'sem aportes do pool'),
+    (DESPESAS.replace('COMPETÊNCIA: SETEMBRO/2025\n', ''), 'sem competência'),
+])
+def test_sem_validacao_volta_para_o_llm(texto, motivo):
+    assert run_layout_fast_path(layout('despesas_v1'), texto) is None, motivo
+
+@pytest.fixture
+def llm_registrado(monkeypatch):
+    """analyze_pdf_stream falso: registra os grupos e quantos já tinham sido lidos no primeiro"""
+    registro = {'grupos': [], 'lidos_no_primeiro': None}
+    lidos = [0]
+    
+    def stream(page_groups, document_type=None, model=None):
+        for grupo in page_groups:
+            if registro['lidos_no_primeiro'] is None:
+                registro['lidos_no_primeiro'] = lidos[0]
+            registro['grupos'].append(grupo)
+        yield {'codigo_obra': '616', 'metodo_extracao': 'llm'}
+    
+    def grupos(*textos):
+        for texto in textos:
+            lidos[0] += 1
+            yield texto
+    
+    monkeypatch.setattr(index, 'analyze_pdf_stream', stream)
+    return registro, grupos
+
+def test_layout_conhecido_resolve_sem_llm(llm_registrado):
+    registro, grupos = llm_registrado
+    analysis = index.analyze_page_groups(grupos(CABECALHO + TABELA, 'TOTAL   1.500,00\n'), 'gpt-5')
+    
+    assert analysis['metodo_extracao'] == 'layout:despesas_v1'
+    assert registro['grupos'] == []
+
+def test_validacao_falha_repete_os_grupos_para_o_llm(llm_registrado):
+    registro, grupos = llm_registrado
+    textos = [CABECALHO + TABELA, 'TOTAL   9.999,00\n']
+    
+    analysis = index.analyze_page_groups(grupos(*textos), 'gpt-5')
+    assert analysis['metodo_extracao'] == 'llm'
+    assert registro['grupos'] == textos
+
+def test_documento_acima_do_limite_segue_em_streaming(llm_registrado, monkeypatch):
+    registro, grupos = llm_registrado
+    monkeypatch.setattr(index, 'LAYOUT_FAST_PATH_MAX_CHARS', 1000)
+    monkeypatch.setattr(index, 'run_layout_fast_path', lambda *args, **kwargs: pytest.fail('texto acima do limite'))
+    textos = [CABECALHO + TABELA] + [f"{n:02d}/09/2025  Fornecedor  Item {n}  100,00\n" * 5 for n in range(1, 30)]
+    
+    analysis = index.analyze_page_groups(grupos(*textos), 'gpt-5')
+    
+    assert analysis['metodo_extracao'] == 'llm'
+    assert registro['grupos'] == textos
+    # Só o necessário para passar do limite foi juntado antes do LLM começar
+    assert registro['lidos_no_primeiro'] <= 5 < len(textos)
@@ -0,0 +1,70 @@
+"""Junção das análises parciais de um PDF dividido em grupos de páginas"""
+
+from api.index import merge_partial_analyses, merge_obra_parts
+
+def test_chunk_unico_volta_sem_alteracao():
+    analise = [{'codigo_obra': '616', 'despesas_total': '1.000,00'}]
+    assert merge_partial_analyses([analise]) is analise
+
+def test_continuacao_sem_codigo_vai_para_ultima_obra():
+    analises = [
+        [{'codigo_obra': '616', 'saldo_inicial': 100.0, 'despesas': [{'valor': 10.0}], 'qualidade_extracao': '✅ boa'}],
+        [{'codigo_obra': 'não_informado', 'saldo_final': 50.0, 'despesas': [{'valor': '20,50'}],
+          'qualidade_extracao': '⚠️ parcial'}],
+    ]
+    
+    obra, = merge_partial_analyses(analises)
+    assert obra['codigo_obra'] == '616'
+    assert obra['despesas'] == [{'valor': 10.0}, {'valor': 20.5}]
+    assert obra['despesas_total'] == 30.5
+    assert obra['saldo_inicial'] == 100.0
+    assert obra['saldo_final'] == 50.0
+    assert obra['qualidade_extracao'] == '⚠️ parcial'
+
+def test_obras_diferentes_ficam_separadas_na_ordem():
+    analises = [
+        [{'codigo_obra': '616', 'despesas_total': 10.0}, {'codigo_obra': '620', 'despesas_total': 5.0}],
+        [{'codigo_obra': '616', 'despesas_total': 2.0}],
+    ]
+    
+    obras = merge_partial_analyses(analises)
+    assert [o['codigo_obra'] for o in obras] == ['616', '620']
+    assert obras[0]['despesas_total'] == 12.0
+    assert obras[1]['despesas_total'] == 5.0
+
+def test_partes_antes_da_primeira_obra_pertencem_a_ela():
+    analises = [
+        [{'codigo_obra': None, 'despesas': [{'valor': 1.0}]}],
+        [{'codigo_obra': '616', 'despesas': [{'valor': 2.0}]}],
+    ]
+    
+    obra, = merge_partial_analyses(analises)
+    assert obra['codigo_obra'] == '616'
+    assert obra['despesas_total'] == 3.0
+
+def test_sem_nenhum_codigo_vira_uma_obra():
+    obra, = merge_partial_analyses([[{'saldo_final': 1.0}], [{'saldo_final': 2.0}]])
+    assert obra['saldo_final'] == 2.0
+
+def test_pool_recalculado_sobre_despesas_unidas():
+    pool = {'valor_total_pool': 1000.0, 'despesas_todas_obras': 200.0, 'despesas_esta_obra': 30.0}
+    obra = merge_obra_parts([
+        {'codigo_obra': '616', 'despesas': [{'valor': 30.0}], 'aportes_pool': pool},
+        {'despesas': [{'valor': 20.0}], 'aportes_pool': {'valor_total_pool': None}},
+    ])
+    
+    assert obra['aportes_pool']['despesas_esta_obra'] == 50.0
+    assert obra['aportes_pool']['taxa_rateio_percentual'] == 0.25
+    assert obra['aportes_pool']['valor_rateado_esta_obra'] == 250.0
+    # O pool da primeira parte não é alterado
+    assert pool['despesas_esta_obra'] == 30.0
+
+def test_alertas_e_observacoes_sem_repeticao():
+    obra = merge_obra_parts([
+        {'validacoes': {'alertas': ['a', 'b']}, 'observacoes': 'x'},
+        {'validacoes': {'alertas': ['b', 'c']}, 'observacoes': 'x'},
+        {'observacoes': 'y'},
+    ])
+    
+    assert obra['validacoes']['alertas'] == ['a', 'b', 'c']
+    assert obra['observacoes'] == 'x | y'
@@ -0,0 +1,99 @@
+"""Servidor OpenAI simulado (api.mock_llm): formatos das duas APIs, replay e injeção de falhas"""
+
+import json
+import random
+
+import pytest
+
+from api import mock_llm
+
+MENSAGENS = [
+    {'role': 'system', 'content': 'Auditor financeiro. Responda em JSON. ' * 200},
+    {'role': 'user', 'content': 'DOCUMENTO A PROCESSAR:\nOBRA 616 SETEMBRO/2025'}
+]
+
+@pytest.fixture
+def cliente(monkeypatch):
+    monkeypatch.setitem(mock_llm.MOCK_CONFIG, 'latency', 'fixed:0')
+    monkeypatch.setitem(mock_llm.MOCK_CONFIG, 'error_429', 0)
+    monkeypatch.setitem(mock_llm.MOCK_CONFIG, 'error_500', 0)
+    monkeypatch.setitem(mock_llm.MOCK_CONFIG, 'timeout_rate', 0)
+    monkeypatch.setitem(mock_llm.MOCK_CONFIG, 'replay_dir', '')
+    monkeypatch.setitem(mock_llm.MOCK_CONFIG, 'upstream', '')
+    monkeypatch.setattr(mock_llm, '_prefixos_vistos', set())
+    return mock_llm.app.test_client()
+
+@pytest.mark.parametrize('spec', ['fixed:0.5', 'uniform:0.2,1.5', 'normal:0.8,0.2', 'lognormal:0,0.5', 'exponential:1'])
+def test_distribuicoes_de_latencia(spec):
+    amostra = mock_llm.parse_latency(spec)
+    valores = [amostra(random.Random(n)) for n in range(20)]
+    assert all(v >= 0 for v in valores)
+
+def test_distribuicao_desconhecida():
+    with pytest.raises(ValueError):
+        mock_llm.parse_latency('gamma:1,2')
+
+def test_responses_com_schema_devolve_obras(cliente):
+    resposta = cliente.post('/v1/responses', json={
+        'model': 'gpt-5', 'input': MENSAGENS, 'max_output_tokens': 16000,
+        'text': {'format': {'type': 'json_schema', 'name': 'analise'}}
+    }).get_json()
+    
+    assert resposta['status'] == 'completed'
+    texto = resposta['output'][0]['content'][0]['text']
+    obra, = json.loads(texto)['obras']
+    assert obra['codigo_obra'] == '616'
+    assert resposta['usage']['input_tokens'] > 0
+
+def test_prefixo_repetido_conta_tokens_cacheados(cliente):
+    corpo = {'model': 'gpt-4o', 'messages': MENSAGENS}
+    
+    primeira = cliente.post('/v1/chat/completions', json=corpo).get_json()
+    segunda = cliente.post('/v1/chat/completions', json=corpo).get_json()
+    
+    assert primeira['usage']['prompt_tokens_details']['cached_tokens'] == 0
+    assert segunda['usage']['prompt_tokens_details']['cached_tokens'] > 0
+    assert segunda['choices'][0]['finish_reason'] == 'stop'
+
+def test_max_tokens_curto_trunca_a_resposta(cliente):
+    resposta = cliente.post('/v1/responses', json={'model': 'gpt-5', 'input': MENSAGENS, 'max_output_tokens': 20}).get_json()
+    
+    assert resposta['status'] == 'incomplete'
+    assert len(resposta['output'][0]['content'][0]['text']) <= 80
+
+def test_replay_pelo_hash_do_prompt(cliente, tmp_path, monkeypatch):
+    monkeypatch.setitem(mock_llm.MOCK_CONFIG, 'replay_dir', str(tmp_path))
+    gravacao = {'content': '{"obras": [{"codigo_obra": "601"}]}', 'usage': {'input_tokens': 1234}}
+    (tmp_path / f"{mock_llm.prompt_hash(MENSAGENS)}.json").write_text(json.dumps(gravacao))
+    
+    resposta = cliente.post('/v1/responses', json={'model': 'gpt-5', 'input': MENSAGENS}).get_json()
+    
+    assert resposta['output'][0]['content'][0]['text'] == gravacao['content']
+    assert resposta['usage']['input_tokens'] == 1234
+
+def test_429_injetado_com_retry_after(cliente, monkeypatch):
+    monkeypatch.setitem(mock_llm.MOCK_CONFIG, 'error_429', 1.0)
+    monkeypatch.setitem(mock_llm.MOCK_CONFIG, 'retry_after', 2)
+    
+    resposta = cliente.post('/v1/chat/completions', json={'model': 'gpt-4o', 'messages': MENSAGENS})
+    
+    assert resposta.status_code == 429
+    assert resposta.headers['Retry-After'] == '2'
+
+def test_500_injetado(cliente, monkeypatch):
+    monkeypatch.setitem(mock_llm.MOCK_CONFIG, 'error_500', 1.0)
+    
+    assert cliente.post('/v1/responses', json={'model': 'gpt-5', 'input': MENSAGENS}).status_code == 500
+
+def test_streaming_do_chat_com_usage(cliente):
+    resposta = cliente.post('/v1/chat/completions', json={
+        'model': 'gpt-4o', 'messages': [{'role': 'user', 'content': 'Qual o saldo?'}],
+        'stream': True, 'stream_options': {'include_usage': True}
+    })
+    eventos = [l[len('data: '):] for l in resposta.get_data(as_text=True).splitlines() if l.startswith('data: ')]
+    
+    assert eventos[-1] == '[DONE]'
+    pedacos = [json.loads(e) for e in eventos[:-1]]
+    texto = ''.join(p['choices'][0]['delta'].get('content', '') for p in pedacos if p['choices'])
+    assert texto.startswith('Resposta simulada')
+    assert pedacos[-1]['usage']['completion_tokens'] > 0
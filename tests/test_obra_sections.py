@@ -0,0 +1,105 @@
+"""Relatórios consolidados (várias obras): divisão por seção, em streaming"""
+
+import re
+from contextlib import contextmanager
+
+import pytest
+
+from api import index
+from api.index import split_obra_sections, ObraSectionStream
+
+TITULO = 'RELATÓRIO CONSOLIDADO - OBRAS 601, 603 E 604\nCOMPETÊNCIA: SETEMBRO/2025\n'
+
+def secao(codigo, linhas):
+    return f"OBRA {codigo} - Obra {codigo}\n" + ''.join(f"Despesa {codigo}.{n} 1.000,00\n" for n in range(linhas))
+
+def test_split_obra_sections():
+    texto = TITULO + '603 - Resumo 2.000,00\n' + secao('601', 3) + secao('603', 2) + secao('601', 1)
+    secoes = split_obra_sections(texto)
+    
+    assert secoes['codigos'] == ['601', '603', '604']
+    # Linha de quadro-resumo é contexto, não seção
+    assert '603 - Resumo 2.000,00' in secoes['preambulo']
+    assert [c for c, _ in secoes['secoes']] == ['601', '603']
+    assert secoes['secoes'][0][1].count('Despesa 601') == 4
+
+@pytest.fixture
+def analise_registrada(monkeypatch):
+    """analysis_submitter falso: registra os textos enviados e quantos grupos já tinham sido lidos"""
+    enviados = []
+    lidos = [0]
+    
+    @contextmanager
+    def submitter(model, document_type, max_workers):
+        def submit(texto):
+            codigo = re.search(r'\[SEÇÃO DA OBRA (\w+)', texto).group(1)
+            enviados.append((codigo, lidos[0], texto))
+            valores = [{'valor': 1000.0} for _ in re.findall(r'^Despesa', texto, re.M)]
+            return index.completed_future([{'codigo_obra': codigo, 'despesas': valores}])
+        yield submit
+    
+    def grupos(*textos):
+        for texto in textos:
+            lidos[0] += 1
+            yield texto
+    
+    monkeypatch.setattr(index, 'analysis_submitter', submitter)
+    monkeypatch.setattr(index, 'LAYOUT_FAST_PATH_ENABLED', False)
+    return enviados, grupos
+
+def test_secoes_sao_enviadas_conforme_fecham(analise_registrada):
+    enviados, grupos = analise_registrada
+    textos = [TITULO + secao('601', 3), secao('603', 3), secao('604', 3), secao('601', 2)]
+    
+    analysis, restante = index.analyze_obra_sections_stream(['601', '603', '604'], grupos(*textos), 'gpt-5')
+    
+    assert restante is None
+    # A seção 601 sai quando começa a 603 (2º grupo), antes de o documento terminar
+    assert [(codigo, lidos) for codigo, lidos, _ in enviados] == [('601', 2), ('603', 3), ('604', 4), ('601', 4)]
+    assert 'COMPETÊNCIA: SETEMBRO/2025' in enviados[1][2]
+    obras = {obra['codigo_obra']: obra for obra in analysis}
+    assert obras['601']['despesas_total'] == 5000.0
+    assert obras['603']['despesas_total'] == 3000.0
+
+def test_trecho_maior_que_o_limite_segue_em_partes(analise_registrada, monkeypatch):
+    enviados, grupos = analise_registrada
+    monkeypatch.setattr(index, 'OBRA_SECTION_MAX_CHARS', 400)
+    textos = [TITULO + secao('601', 2)] + [secao('603', 2)] + [f"Despesa 603.x{n} 1.000,00\n" * 5 for n in range(6)]
+    
+    analysis, _ = index.analyze_obra_sections_stream(['601', '603'], grupos(*textos), 'gpt-5')
+    
+    partes_603 = [texto for codigo, _, texto in enviados if codigo == '603']
+    assert len(partes_603) > 1
+    # Cada parte fica perto do limite, não do tamanho da seção
+    assert all(len(texto) < 400 + 200 for texto in partes_603)
+    obras = {obra['codigo_obra']: obra for obra in analysis}
+    assert obras['603']['despesas_total'] == 32000.0
+
+def test_sem_segunda_obra_volta_para_o_caminho_simples(analise_registrada):
+    enviados, grupos = analise_registrada
+    textos = [TITULO + secao('601', 3), secao('601', 2)]
+    
+    analysis, restante = index.analyze_obra_sections_stream(['601', '603', '604'], grupos(*textos), 'gpt-5')
+    
+    assert analysis is None and not enviados
+    assert list(restante) == textos
+
+def test_limite_sem_secoes_devolve_o_lido_e_o_restante(analise_registrada, monkeypatch):
+    enviados, grupos = analise_registrada
+    monkeypatch.setattr(index, 'OBRA_SECTION_MAX_CHARS', 100)
+    textos = [TITULO + 'x' * 80, 'y' * 80, 'z' * 80]
+    
+    gerador = grupos(*textos)
+    analysis, restante = index.analyze_obra_sections_stream(['601', '603'], gerador, 'gpt-5')
+    
+    assert analysis is None and not enviados
+    assert list(restante) == textos
+
+def test_stream_preambulo_com_quadro_resumo():
+    secoes = ObraSectionStream(['601', '603'], 10000)
+    fechados = secoes.feed(TITULO + '601 - Resumo 1,00\n603 - Resumo 2,00\n' + secao('601', 1))
+    fechados += secoes.feed(secao('603', 1))
+    fechados += secoes.finish()
+    
+    assert [c for c, _ in fechados] == ['601', '603']
+    assert '603 - Resumo 2,00' in secoes.contexto()['preambulo']
@@ -0,0 +1,84 @@
+"""Orçamento de saída: estimativa de tokens, max_tokens pelo documento e divisão em partes"""
+
+import pytest
+
+from api import index
+from api.index import (
+    chat_output_budget, count_value_rows, estimate_tokens, plan_output_budget, planned_output_budget,
+    split_for_budget
+)
+
+CABECALHO = 'DETALHAMENTO DE DESPESAS - OBRA 616 - Fiação Enterrada\nCOMPETÊNCIA: SETEMBRO/2025\n'
+
+def despesas(n):
+    return CABECALHO + '\n'.join(f"{d % 28 + 1:02d}/09/2025  Fornecedor {d}  Item {d}  1.{d % 1000:03d},00" for d in range(n))
+
+@pytest.fixture(autouse=True)
+def limites(monkeypatch):
+    monkeypatch.setattr(index, 'OUTPUT_BUDGET_ENABLED', True)
+    monkeypatch.setattr(index, 'OUTPUT_TOKENS_PER_ROW', 45)
+    monkeypatch.setattr(index, 'OUTPUT_TOKENS_PER_OBRA', 600)
+    monkeypatch.setattr(index, 'OUTPUT_BUDGET_MIN', 1500)
+    monkeypatch.setattr(index, 'OUTPUT_BUDGET_MAX', 16000)
+
+def test_estimativa_de_tokens():
+    assert estimate_tokens('') == 0
+    assert estimate_tokens('saldo') == 2
+    assert estimate_tokens('1.234,56') == 5  # 1 . 234 , 56
+    assert estimate_tokens('Despesas da obra') > estimate_tokens('obra')
+
+def test_documento_pequeno_usa_o_minimo_em_uma_parte():
+    plano = plan_output_budget(despesas(5), 'gpt-4o')
+    
+    assert plano['linhas_valor'] == 5
+    assert plano['obras'] == 1
+    assert plano['max_tokens'] == 1500
+    assert plano['partes'] == 1
+
+def test_orcamento_cresce_com_as_linhas_de_valor():
+    plano = plan_output_budget(despesas(100), 'gpt-4o')
+    
+    assert plano['max_tokens'] == int((100 * 45 + 600) * 1.25)
+    assert plano['partes'] == 1
+
+def test_saida_acima_do_teto_divide_em_partes():
+    plano = plan_output_budget(despesas(600), 'gpt-4o')
+    
+    # 600 linhas × 45 tokens passam do teto de saída do gpt-4o (16384 / OUTPUT_BUDGET_MAX)
+    assert plano['max_tokens'] == 16000
+    assert plano['partes'] == 3
+
+def test_entrada_maior_que_o_contexto_divide_em_partes():
+    plano = plan_output_budget(despesas(60) + '\nObservações gerais do período. ' * 2000, 'gpt-4')
+    
+    assert plano['input_tokens'] > index.MODEL_TOKEN_LIMITS['gpt-4']['context']
+    assert plano['partes'] > 1
+
+def test_partes_levam_o_cabecalho_e_todas_as_linhas():
+    texto = despesas(600)
+    
+    max_tokens, partes = planned_output_budget(texto, 'gpt-4o')
+    
+    assert max_tokens == 16000
+    assert 2 <= len(partes) <= 4
+    assert partes[0].startswith(CABECALHO.strip())
+    assert all(p.startswith('[PARTE ') and 'OBRA 616' in p for p in partes[1:])
+    assert sum(count_value_rows(p) for p in partes) == 600
+
+def test_titulo_sem_valores_vai_junto_da_primeira_parte():
+    texto = CABECALHO + '\n\n' + despesas(200)[len(CABECALHO):]
+    
+    partes = split_for_budget(texto, 4)
+    
+    assert count_value_rows(partes[0]) > 0
+    assert partes[0].startswith('DETALHAMENTO DE DESPESAS')
+
+def test_orcamento_desligado_mantem_o_padrao(monkeypatch):
+    monkeypatch.setattr(index, 'OUTPUT_BUDGET_ENABLED', False)
+    assert planned_output_budget(despesas(600), 'gpt-4o') == (6000, [despesas(600)])
+
+def test_chat_limitado_pela_janela_e_pela_saida_do_modelo():
+    assert chat_output_budget([{'role': 'user', 'content': 'Resumo'}], 'gpt-4o', 50000)[0] == 16384
+    
+    max_tokens, entrada = chat_output_budget([{'role': 'user', 'content': 'texto ' * 30000}], 'gpt-4', 2000)
+    assert max_tokens == int(8192 * 0.95) - entrada < 0
@@ -0,0 +1,62 @@
+"""Classificador de páginas: capas, assinaturas e repetições saem antes do prompt"""
+
+import pytest
+
+from api import index
+from api.index import classify_page, iter_pdf_page_groups, iter_relevant_pages
+
+ASSINATURAS = 'Declaramos que as informações acima conferem.\nAssinatura do responsável técnico\n______________'
+POSICAO = 'POSIÇÃO FINANCEIRA - SETEMBRO/2025\nSALDO INICIAL 10.000,00\nDESPESAS 4.000,00\nSALDO FINAL 6.000,00'
+
+@pytest.mark.parametrize('texto, relevante, motivo', [
+    ('   \n ', False, 'vazia'),
+    ('[TABELA p.2 #1]\nDATA\tVALOR\n01/09/2025\t10,00', True, 'tabela'),
+    (POSICAO, True, 'valores'),
+    ('Total do período: 1.234,56', True, 'termos financeiros'),
+    ('Relatório mensal da OBRA 616 - Fiação Enterrada', True, 'identificação da obra'),
+    (ASSINATURAS, False, 'assinatura/legenda'),
+    ('Riviera de São Lourenço\nRelatório de prestação de contas', False, 'sem dados financeiros'),
+])
+def test_classify_page(texto, relevante, motivo):
+    assert classify_page(texto) == (relevante, motivo)
+
+def test_pagina_repetida_sem_valores_e_descartada():
+    vistas = set()
+    rodape = 'Praias SP Administradora de Recursos\nRelatório de prestação de contas - página 1'
+    
+    assert classify_page(rodape, vistas) == (False, 'sem dados financeiros')
+    assert classify_page(rodape.replace('página 1', 'página 2'), vistas) == (False, 'repetida')
+    # Páginas com valores nunca contam como repetição
+    assert classify_page(POSICAO, vistas)[0]
+    assert classify_page(POSICAO, vistas)[0]
+
+def test_relatorio_do_descarte():
+    report = {}
+    paginas = ['Capa\nRelatório de prestação de contas', POSICAO, ASSINATURAS, '']
+    
+    mantidas = list(iter_relevant_pages(paginas, report))
+    
+    assert mantidas == [POSICAO]
+    assert report['paginas_total'] == 4
+    assert report['paginas_descartadas'] == 3
+    assert report['tokens_descartados'] > 0
+    assert report['motivos'] == {'sem dados financeiros': 1, 'assinatura/legenda': 1, 'vazia': 1}
+
+def test_documento_sem_pagina_relevante_mantem_a_primeira():
+    report = {}
+    capa = 'Capa\nRelatório de prestação de contas'
+    
+    assert list(iter_relevant_pages([capa, ASSINATURAS], report)) == [capa]
+    assert report['paginas_descartadas'] == 1
+
+def test_grupos_de_paginas_sem_boilerplate(monkeypatch):
+    paginas = [ASSINATURAS, POSICAO, ASSINATURAS]
+    monkeypatch.setattr(index, 'iter_pdf_pages', lambda file, extractor=None, pool=None: iter(paginas))
+    monkeypatch.setattr(index, 'PAGE_FILTER_ENABLED', True)
+    report = {}
+    
+    assert list(iter_pdf_page_groups('relatorio.pdf', report=report)) == [POSICAO]
+    assert report['paginas_descartadas'] == 2
+    
+    monkeypatch.setattr(index, 'PAGE_FILTER_ENABLED', False)
+    assert list(iter_pdf_page_groups('relatorio.pdf')) == ['\n'.join(paginas)]
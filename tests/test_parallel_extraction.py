@@ -0,0 +1,84 @@
+"""Extração em paralelo por faixas de páginas: ordem original, janela limitada e modo automático"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import PyPDF2
+import pytest
+
+from api import index
+from api.index import iter_pdf_pages
+
+@pytest.fixture
+def pdf_branco(tmp_path):
+    def criar(paginas):
+        writer = PyPDF2.PdfWriter()
+        for _ in range(paginas):
+            writer.add_blank_page(width=595, height=842)
+        caminho = tmp_path / f"branco_{paginas}.pdf"
+        with open(caminho, 'wb') as f:
+            writer.write(f)
+        return str(caminho)
+    return criar
+
+@pytest.fixture
+def faixas(monkeypatch):
+    """extract_page_range falso: faixas pares demoram mais (terminam fora de ordem); registra as faixas em voo"""
+    registro = {'faixas': [], 'em_voo': 0, 'max_em_voo': 0}
+    lock = threading.Lock()
+    
+    def extrair(pdf_path, start, end, extractor='pypdf2'):
+        with lock:
+            registro['faixas'].append((start, end))
+            registro['em_voo'] += 1
+            registro['max_em_voo'] = max(registro['max_em_voo'], registro['em_voo'])
+        time.sleep(0.02 if start % 2 == 0 else 0.001)
+        with lock:
+            registro['em_voo'] -= 1
+        return [f"{extractor} p{i}" for i in range(start, end)]
+    
+    monkeypatch.setattr(index, 'extract_page_range', extrair)
+    monkeypatch.setattr(index, 'PDF_PROCESS_CHUNK_PAGES', 1)
+    monkeypatch.setattr(index, 'PDF_PROCESS_WORKERS', 2)
+    return registro
+
+def test_paginas_voltam_na_ordem_original(pdf_branco, faixas, monkeypatch):
+    monkeypatch.setattr(index, 'PDF_PROCESS_CHUNK_PAGES', 3)
+    
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        paginas = list(iter_pdf_pages(pdf_branco(10), extractor='tables', pool=pool))
+    
+    assert paginas == [f"tables p{i}" for i in range(10)]
+    assert faixas['faixas'] == [(0, 3), (3, 6), (6, 9), (9, 10)]
+
+def test_so_workers_faixas_em_voo(pdf_branco, faixas):
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        paginas = iter_pdf_pages(pdf_branco(12), pool=pool)
+        assert next(paginas) == 'pypdf2 p0'
+        # A próxima faixa só sai quando o consumidor pega uma
+        assert len(faixas['faixas']) <= 3
+        assert len(list(paginas)) == 11
+    
+    assert faixas['max_em_voo'] <= 2
+
+def test_modo_auto_pdf_pequeno_fica_no_processo(pdf_branco, faixas, monkeypatch):
+    monkeypatch.setattr(index, 'PDF_EXTRACTION_MODE', 'auto')
+    monkeypatch.setattr(index, 'PDF_PROCESS_MIN_PAGES', 40)
+    monkeypatch.setattr(index, 'get_extraction_pool', lambda: pytest.fail('pool de processos para PDF pequeno'))
+    
+    assert list(iter_pdf_pages(pdf_branco(3), extractor='pypdf2')) == ['', '', '']
+    assert faixas['faixas'] == []
+
+def test_modo_auto_pdf_grande_usa_o_pool(pdf_branco, faixas, monkeypatch):
+    monkeypatch.setattr(index, 'PDF_EXTRACTION_MODE', 'auto')
+    monkeypatch.setattr(index, 'PDF_PROCESS_MIN_PAGES', 5)
+    
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        monkeypatch.setattr(index, 'get_extraction_pool', lambda: pool)
+        paginas = list(iter_pdf_pages(pdf_branco(6), extractor='pypdf2'))
+    
+    assert paginas == [f"pypdf2 p{i}" for i in range(6)]
+
+def test_extract_page_range_no_processo(pdf_branco):
+    assert index.extract_page_range(pdf_branco(4), 1, 3) == ['', '']
@@ -0,0 +1,69 @@
+"""Pipeline de ingestão em estágios: ordem dos grupos, resultados e métricas por estágio"""
+
+import time
+
+import pytest
+
+from api import pipeline
+from api.pipeline import IngestionPipeline
+
+@pytest.fixture
+def pipeline_falso(db, monkeypatch, tmp_path):
+    """Extração lenta (0,15s por grupo) e análise instantânea, sem cache"""
+    recebidos = {}
+    
+    def extrair(path, max_chars=None, extractor=None, report=None, pool=None):
+        for n in range(3):
+            time.sleep(0.15)
+            yield f"{path} grupo {n} " + 'x' * 20
+    
+    def analisar(page_groups, model, document_type):
+        grupos = list(page_groups)
+        recebidos[grupos[0].split()[0]] = grupos
+        return {'codigo_obra': '616', 'competencia': '09/2025', 'movimentos': []}
+    
+    monkeypatch.setattr(pipeline, 'ANALYSIS_CACHE_ENABLED', False)
+    monkeypatch.setattr(pipeline, 'MODEL_CASCADE_ENABLED', False)
+    monkeypatch.setattr(pipeline, 'iter_pdf_page_groups', extrair)
+    monkeypatch.setattr(pipeline, 'analyze_page_groups', analisar)
+    
+    caminhos = []
+    for nome in ('a', 'b', 'c'):
+        caminho = tmp_path / f"{nome}.pdf"
+        caminho.write_bytes(b'%PDF-1.4\n' + nome.encode())
+        caminhos.append(str(caminho))
+    return IngestionPipeline(extract_workers=1, analysis_workers=2, queue_size=2), caminhos, recebidos
+
+def test_resultados_e_grupos_em_ordem(pipeline_falso):
+    pipeline, caminhos, recebidos = pipeline_falso
+    futures = [pipeline.submit(caminho, 'gpt-5') for caminho in caminhos]
+    resultados = [future.result(timeout=10) for future in futures]
+    
+    assert [r['filename'] for r in resultados] == ['a.pdf', 'b.pdf', 'c.pdf']
+    assert all(r['status'] == 'success' for r in resultados)
+    for caminho in caminhos:
+        assert [g.split()[2] for g in recebidos[caminho]] == ['0', '1', '2']
+    assert set(resultados[0]['tempos']) >= {'fila_extracao', 'extracao', 'fila_analise', 'analise', 'gravacao'}
+
+def test_extracao_lenta_e_o_gargalo(pipeline_falso):
+    pipeline, caminhos, _ = pipeline_falso
+    for future in [pipeline.submit(caminho, 'gpt-5') for caminho in caminhos]:
+        future.result(timeout=10)
+    
+    info = pipeline.info()
+    extracao, analise = info['stages']['extracao'], info['stages']['analise']
+    assert info['bottleneck'] == 'extracao'
+    assert extracao['processed'] == analise['processed'] == 3
+    assert extracao['busy_seconds'] >= 1.2
+    # A análise só esperou a extração: tempo bloqueado, não ocupação
+    assert analise['busy_seconds'] < 0.2
+    assert analise['blocked_seconds'] >= 0.5
+    assert analise['utilization'] < extracao['utilization']
+
+def test_analise_so_recebe_o_documento_com_o_primeiro_grupo(pipeline_falso):
+    pipeline, caminhos, _ = pipeline_falso
+    future = pipeline.submit(caminhos[0], 'gpt-5')
+    
+    time.sleep(0.08)  # Extração ainda no primeiro grupo
+    assert pipeline.info()['stages']['analise']['in_progress'] == 0
+    assert future.result(timeout=10)['tempos']['fila_analise'] >= 0
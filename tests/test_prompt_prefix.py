@@ -0,0 +1,58 @@
+"""Prefixo fixo do prompt (cache de prompt da OpenAI) e contagem de tokens cacheados"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from api import index
+from api.index import build_analysis_messages, openai_request_params, record_openai_usage
+
+@pytest.fixture(autouse=True)
+def estatisticas_limpas(monkeypatch):
+    monkeypatch.setattr(index, 'openai_usage_stats', {})
+
+def test_documento_vai_por_ultimo_depois_do_prefixo_fixo():
+    setembro = build_analysis_messages('OBRA 616 SETEMBRO/2025 SALDO 1.000,00')
+    outubro = build_analysis_messages('OBRA 601 OUTUBRO/2025 SALDO 2.000,00')
+    
+    assert setembro[0] == outubro[0] == {'role': 'system', 'content': index.ANALYSIS_SYSTEM_PROMPT}
+    assert setembro[-1]['role'] == 'user'
+    assert setembro[-1]['content'].startswith('DOCUMENTO A PROCESSAR:\n')
+    assert 'OBRA 616' in setembro[-1]['content']
+    assert 'OBRA 616' not in setembro[0]['content']
+
+def test_responses_e_chat_mandam_o_mesmo_prefixo():
+    messages = build_analysis_messages('OBRA 616 SETEMBRO/2025 SALDO 1.000,00')
+    
+    api_responses, responses = openai_request_params(messages, 'gpt-5', 4000)
+    api_chat, chat = openai_request_params(messages, 'gpt-4o', 4000)
+    
+    assert (api_responses, api_chat) == ('responses', 'chat')
+    assert responses['input'] == chat['messages'] == messages
+
+def test_tokens_cacheados_das_duas_apis():
+    responses = SimpleNamespace(input_tokens=5000, output_tokens=800,
+                                input_tokens_details=SimpleNamespace(cached_tokens=4096))
+    chat = SimpleNamespace(prompt_tokens=3000, completion_tokens=500,
+                           prompt_tokens_details=SimpleNamespace(cached_tokens=2048))
+    
+    assert record_openai_usage('gpt-5', responses) == {
+        'input_tokens': 5000, 'cached_tokens': 4096, 'uncached_tokens': 904, 'output_tokens': 800
+    }
+    assert record_openai_usage('gpt-4o', chat)['uncached_tokens'] == 952
+    assert record_openai_usage('gpt-4o', SimpleNamespace(prompt_tokens=100, completion_tokens=10))['cached_tokens'] == 0
+    
+    info = index.openai_usage_info()
+    assert info['gpt-5']['cached_ratio'] == round(4096 / 5000, 4)
+    assert info['gpt-4o']['calls'] == 2
+    assert info['gpt-4o']['cached_tokens'] == 2048
+
+def test_medidor_do_contexto_soma_o_uso():
+    meter = index.UsageMeter()
+    token = index.openai_usage_meter.set(meter)
+    try:
+        record_openai_usage('gpt-5', SimpleNamespace(input_tokens=100, output_tokens=20, input_tokens_details=None))
+    finally:
+        index.openai_usage_meter.reset(token)
+    
+    assert (meter.calls, meter.input_tokens, meter.output_tokens) == (1, 100, 20)
@@ -0,0 +1,117 @@
+"""Retentativas com backoff e jitter (Retry-After) e requisições de reserva (hedging)"""
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from openai import APIConnectionError
+
+from api import index
+from api.index import AsyncAnalysisEngine, RetryPolicy
+
+class ErroHTTP(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers=headers or {})
+
+def resposta_chat(texto='ok'):
+    mensagem = SimpleNamespace(content=texto)
+    return SimpleNamespace(choices=[SimpleNamespace(message=mensagem, finish_reason='stop')], usage=None)
+
+@pytest.mark.parametrize('erro, repetir', [
+    (ErroHTTP(429), True),
+    (ErroHTTP(500), True),
+    (ErroHTTP(408), True),
+    (APIConnectionError(request=httpx.Request('POST', 'https://api.openai.com/v1/chat/completions')), True),
+    (ErroHTTP(400), False),
+    (ValueError('JSON inválido'), False),
+])
+def test_erros_transitorios(erro, repetir):
+    assert RetryPolicy(3, 1.0, 30.0).is_retryable(erro) is repetir
+
+def test_backoff_exponencial_com_jitter():
+    politica = RetryPolicy(5, 1.0, 8.0)
+    
+    for attempt, teto in [(0, 1.0), (1, 2.0), (2, 4.0), (5, 8.0)]:
+        esperas = [politica.delay(attempt, ErroHTTP(503)) for _ in range(50)]
+        assert all(0 <= e <= teto for e in esperas)
+
+def test_retry_after_do_servidor_e_respeitado():
+    politica = RetryPolicy(3, 0.5, 30.0)
+    
+    assert politica.retry_after(ErroHTTP(429, {'retry-after': '7'})) == 7.0
+    assert politica.retry_after(ErroHTTP(429, {'retry-after-ms': '1500'})) == 1.5
+    assert politica.retry_after(ErroHTTP(429)) is None
+    assert all(7.0 <= politica.delay(0, ErroHTTP(429, {'retry-after': '7'})) <= 7.5 for _ in range(20))
+    # Nunca acima do teto configurado
+    assert politica.delay(0, ErroHTTP(429, {'retry-after': '600'})) <= 30.5
+
+@pytest.fixture
+def openai_falso(monkeypatch):
+    """openai_client síncrono com respostas em fila; time.sleep registrado"""
+    respostas = []
+    esperas = []
+    
+    def criar(**params):
+        resposta = respostas.pop(0)
+        if isinstance(resposta, Exception):
+            raise resposta
+        return resposta
+    
+    cliente = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=criar)))
+    monkeypatch.setattr(index, 'openai_client', cliente)
+    monkeypatch.setattr(index, 'time', SimpleNamespace(time=time.time, sleep=esperas.append))
+    monkeypatch.setattr(index, 'OPENAI_HEDGE_ENABLED', False)
+    monkeypatch.setattr(index, 'retry_policy', RetryPolicy(2, 1.0, 30.0))
+    return respostas, esperas
+
+def test_429_repetido_ate_dar_certo(openai_falso):
+    respostas, esperas = openai_falso
+    respostas.extend([ErroHTTP(429, {'retry-after': '3'}), ErroHTTP(503), resposta_chat('saldo ok')])
+    
+    response, error = index.process_openai_request([{'role': 'user', 'content': 'oi'}], 'gpt-4o', 100)
+    
+    assert error is None
+    assert response.choices[0].message.content == 'saldo ok'
+    assert len(esperas) == 2 and 3.0 <= esperas[0] <= 4.0
+
+def test_desiste_depois_de_max_retries(openai_falso):
+    respostas, esperas = openai_falso
+    respostas.extend([ErroHTTP(500), ErroHTTP(500), ErroHTTP(500)])
+    
+    response, error = index.process_openai_request([{'role': 'user', 'content': 'oi'}], 'gpt-4o', 100)
+    
+    assert response is None
+    assert error.transient is True
+    assert len(esperas) == 2
+
+def test_hedge_dispara_reserva_quando_passa_do_p95(monkeypatch):
+    monkeypatch.setattr(index, 'OPENAI_HEDGE_ENABLED', True)
+    monkeypatch.setattr(index, 'OPENAI_HEDGE_MIN_SAMPLES', 5)
+    for _ in range(10):
+        index.openai_latency.record('gpt-4o-hedge', 0.05)
+    chamadas = []
+    
+    async def criar(**params):
+        chamadas.append(params)
+        # Primeira chamada presa; a reserva responde rápido
+        await asyncio.sleep(5 if len(chamadas) == 1 else 0.01)
+        return resposta_chat(f"chamada {len(chamadas)}")
+    
+    engine = AsyncAnalysisEngine(max_concurrency=4)
+    engine.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=criar)))
+    try:
+        inicio = time.time()
+        response, error = engine.submit(
+            engine.request([{'role': 'user', 'content': 'oi'}], 'gpt-4o-hedge', 100)
+        ).result(timeout=10)
+    finally:
+        engine.loop.call_soon_threadsafe(engine.loop.stop)
+    
+    assert error is None
+    assert response.choices[0].message.content == 'chamada 2'
+    assert time.time() - inicio < 2
+    assert engine.info()['hedges'] == 1 and engine.info()['hedge_wins'] == 1
@@ -0,0 +1,87 @@
+"""Extração página a página: grupos liberados antes do fim do PDF e análises em voo limitadas"""
+
+import PyPDF2
+
+from api import index
+from api.index import analyze_pdf_stream, iter_pdf_page_groups, iter_pdf_pages, split_text_chunks
+
+def paginas_contadas(monkeypatch, paginas):
+    """iter_pdf_pages falso: registra quantas páginas já foram lidas"""
+    lidas = [0]
+    
+    def paginas_falsas(file, extractor=None, pool=None):
+        for texto in paginas:
+            lidas[0] += 1
+            yield texto
+    
+    monkeypatch.setattr(index, 'iter_pdf_pages', paginas_falsas)
+    monkeypatch.setattr(index, 'PAGE_FILTER_ENABLED', False)
+    return lidas
+
+def test_primeiro_grupo_sai_sem_esperar_a_ultima_pagina(monkeypatch):
+    lidas = paginas_contadas(monkeypatch, [f"Página {n} " + 'x' * 40 for n in range(100)])
+    
+    grupos = iter_pdf_page_groups('relatorio.pdf', max_chars=120)
+    primeiro = next(grupos)
+    
+    assert primeiro.startswith('Página 0')
+    assert lidas[0] <= 3
+    assert len(list(grupos)) + 1 == 50
+    assert lidas[0] == 100
+
+def test_grupos_respeitam_o_limite_de_caracteres(monkeypatch):
+    paginas_contadas(monkeypatch, ['a' * 30, 'b' * 30, 'c' * 30, 'd' * 250])
+    
+    grupos = list(iter_pdf_page_groups('relatorio.pdf', max_chars=100))
+    
+    assert grupos[0] == '\n'.join(['a' * 30, 'b' * 30, 'c' * 30])
+    assert all(len(g) <= 100 for g in grupos)
+    assert ''.join(grupos[1:]) == 'd' * 250
+
+def test_tabela_grande_repete_titulo_e_cabecalho():
+    linhas = [f"0{n}/09/2025\tFornecedor {n}\t{n}00,00" for n in range(1, 10)]
+    tabela = '[TABELA p.1 #1]\nDATA\tFORNECEDOR\tVALOR\n' + '\n'.join(linhas)
+    
+    pedacos = split_text_chunks(tabela, 120)
+    
+    assert len(pedacos) > 1
+    assert all(p.startswith('[TABELA p.1 #1]\nDATA\tFORNECEDOR\tVALOR\n') for p in pedacos)
+    assert all(len(p) <= 120 for p in pedacos)
+    corpo = [l for p in pedacos for l in p.splitlines()[2:]]
+    assert corpo == linhas
+
+def test_pdf_real_sai_uma_pagina_por_vez(tmp_path, monkeypatch):
+    monkeypatch.setattr(index, 'PDF_EXTRACTION_MODE', 'single')
+    writer = PyPDF2.PdfWriter()
+    for _ in range(3):
+        writer.add_blank_page(width=595, height=842)
+    caminho = tmp_path / 'branco.pdf'
+    with open(caminho, 'wb') as f:
+        writer.write(f)
+    
+    paginas = iter_pdf_pages(str(caminho), extractor='pypdf2')
+    
+    assert next(paginas) == ''
+    assert list(paginas) == ['', '']
+
+def test_analise_em_streaming_limita_grupos_em_voo(monkeypatch):
+    monkeypatch.setattr(index, 'OPENAI_ASYNC_ENABLED', False)
+    monkeypatch.setattr(index, 'MODEL_CASCADE_ENABLED', False)
+    monkeypatch.setattr(index, 'analyze_with_openai', lambda texto, document_type, model: texto.splitlines()[-1])
+    lidos = [0]
+    lidos_no_primeiro = []
+    
+    def grupos():
+        for n in range(20):
+            lidos[0] += 1
+            yield f"Grupo {n:02d} com texto\nresultado {n}"
+    
+    resultados = []
+    for resultado in analyze_pdf_stream(grupos(), model='gpt-5', max_workers=2):
+        if not resultados:
+            lidos_no_primeiro.append(lidos[0])
+        resultados.append(resultado)
+    
+    # Resultados na ordem das páginas, com no máximo max_workers (+1 lido) grupos na memória
+    assert resultados == [f"resultado {n}" for n in range(20)]
+    assert lidos_no_primeiro[0] <= 3
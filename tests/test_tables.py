@@ -0,0 +1,142 @@
+"""Extrator 'tables': tabelas financeiras em TSV, células tipadas e colunas do cabeçalho"""
+
+from api import index
+from api.index import (
+    extract_page_with_tables, find_layout_header, parse_despesas_tables,
+    parse_despesas_text, parse_tsv_tables, table_to_tsv
+)
+
+DESPESAS_TABELA = [
+    ['DATA', None, 'FORNECEDOR', 'DESCRIÇÃO', 'VALOR'],
+    ['01/09/2025', None, 'Casa do\nCabo', 'Material   elétrico', '1.000,00'],
+    ['02/09/2025', '', 'Construtora X', 'Mão de obra', '500,00'],
+    ['TOTAL', None, '', '', '1.500,00'],
+]
+
+def layout(nome):
+    return next(l for l in index.LAYOUT_REGISTRY if l['nome'] == nome)
+
+class TabelaFalsa:
+    def __init__(self, linhas, bbox):
+        self.linhas = linhas
+        self.bbox = bbox
+    
+    def extract(self):
+        return self.linhas
+
+class PaginaFalsa:
+    """Página do pdfplumber: o texto fora das tabelas recortadas via outside_bbox"""
+    
+    def __init__(self, texto, tabelas, page_number=3, recortes=()):
+        self.texto = texto
+        self.tabelas = tabelas
+        self.page_number = page_number
+        self.recortes = list(recortes)
+    
+    def find_tables(self):
+        return self.tabelas
+    
+    def outside_bbox(self, bbox):
+        return PaginaFalsa(self.texto, self.tabelas, self.page_number, self.recortes + [bbox])
+    
+    def extract_text(self):
+        return self.texto + (f" (sem {len(self.recortes)} tabela(s))" if self.recortes else '')
+
+def test_tsv_descarta_colunas_vazias_e_normaliza_celulas():
+    is_financial, linhas = table_to_tsv(DESPESAS_TABELA)
+    
+    assert is_financial
+    assert linhas == [
+        'DATA\tFORNECEDOR\tDESCRIÇÃO\tVALOR',
+        '01/09/2025\tCasa do Cabo\tMaterial elétrico\t1.000,00',
+        '02/09/2025\tConstrutora X\tMão de obra\t500,00',
+        'TOTAL\t\t\t1.500,00',
+    ]
+
+def test_tabela_sem_valores_nem_palavras_chave_nao_e_financeira():
+    is_financial, linhas = table_to_tsv([['Nome', 'Cargo'], ['Ana', 'Engenheira'], [None, None]])
+    
+    assert not is_financial
+    assert linhas == ['Nome\tCargo', 'Ana\tEngenheira']
+    assert table_to_tsv([[None, ''], []]) == (False, [])
+
+def test_pagina_com_tabela_financeira_vira_bloco_tsv():
+    financeira = TabelaFalsa(DESPESAS_TABELA, (0, 100, 500, 300))
+    assinaturas = TabelaFalsa([['Nome', 'Cargo'], ['Ana', 'Engenheira']], (0, 400, 500, 450))
+    pagina = PaginaFalsa('DETALHAMENTO DE DESPESAS', [assinaturas, financeira])
+    
+    texto = extract_page_with_tables(pagina)
+    
+    # Só a tabela financeira sai do texto corrido e vira TSV, com o número dela na página
+    assert texto.splitlines()[0] == 'DETALHAMENTO DE DESPESAS (sem 1 tabela(s))'
+    assert '[TABELA p.3 #2]\nDATA\tFORNECEDOR\tDESCRIÇÃO\tVALOR' in texto
+    assert '#1' not in texto
+
+def test_falha_ao_detectar_tabelas_mantem_o_texto():
+    class PaginaSemTabelas(PaginaFalsa):
+        def find_tables(self):
+            raise ValueError('layout inválido')
+    
+    assert extract_page_with_tables(PaginaSemTabelas('Saldo inicial 10,00', [])) == 'Saldo inicial 10,00'
+
+def test_celulas_do_tsv_sao_tipadas():
+    texto = (
+        'Cabeçalho da página\n'
+        '[TABELA p.1 #1]\n'
+        'DATA\tCOMPETÊNCIA\tOBRA\tVALOR\t\n'
+        '01/09/2025\tSETEMBRO/2025\t616\t(1.234,56)\tx\n'
+        'fim da tabela\n'
+        '02/09/2025\tfora\t617\t1,00\n'
+    )
+    
+    tabelas = parse_tsv_tables(texto)
+    
+    assert len(tabelas) == 1
+    assert tabelas[0]['titulo'] == 'TABELA p.1 #1'
+    assert tabelas[0]['cabecalho'] == ['DATA', 'COMPETÊNCIA', 'OBRA', 'VALOR', 'coluna_5']
+    assert tabelas[0]['linhas'] == [{
+        'DATA': '2025-09-01', 'COMPETÊNCIA': '09/2025', 'OBRA': '616',
+        'VALOR': -1234.56, 'coluna_5': 'x'
+    }]
+
+def test_despesas_das_tabelas_tsv():
+    _, linhas = table_to_tsv(DESPESAS_TABELA)
+    texto = '[TABELA p.1 #1]\n' + '\n'.join(linhas)
+    
+    despesas, total = parse_despesas_tables(layout('despesas_v1'), texto)
+    
+    assert [(d['fornecedor'], d['descricao'], d['valor']) for d in despesas] == [
+        ('Casa do Cabo', 'Material elétrico', 1000.0),
+        ('Construtora X', 'Mão de obra', 500.0),
+    ]
+    assert total == 1500.0
+
+def test_cabecalho_tsv_nao_tem_posicoes_de_coluna():
+    texto = 'Obra 616\nDATA\tFORNECEDOR\tDESCRIÇÃO\tVALOR\n'
+    assert find_layout_header(layout('despesas_v1'), texto) == (1, None)
+    assert parse_despesas_text(layout('despesas_v1'), texto) == ([], None)
+
+def test_colunas_do_texto_recortadas_pelas_posicoes_do_cabecalho():
+    texto = (
+        'Obra 616\n'
+        'DATA        FORNECEDOR          DESCRIÇÃO                 VALOR\n'
+        '01/09/2025  Casa do Cabo        Material elétrico       1.000,00\n'
+        '            continuação da descrição sem valor\n'
+        '02/09/2025  Construtora X       Mão de obra               500,00\n'
+        'TOTAL                                                   1.500,00\n'
+        '03/09/2025  Depois do total     Ignorado                   10,00\n'
+    )
+    
+    inicio, spans = find_layout_header(layout('despesas_v1'), texto)
+    assert inicio == 1
+    assert spans == [('data', 0), ('fornecedor', 12), ('descricao', 32), ('valor', 58)]
+    
+    despesas, total = parse_despesas_text(layout('despesas_v1'), texto)
+    assert [(d['fornecedor'], d['descricao'], d['valor']) for d in despesas] == [
+        ('Casa do Cabo', 'Material elétrico', 1000.0),
+        ('Construtora X', 'Mão de obra', 500.0),
+    ]
+    assert total == 1500.0
+
+def test_texto_sem_o_cabecalho_do_layout():
+    assert find_layout_header(layout('despesas_v1'), 'DATA  HISTÓRICO  VALOR\n') == (None, None)
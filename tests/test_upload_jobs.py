@@ -0,0 +1,104 @@
+"""Upload assíncrono: 202 com job_id, polling do estado e progresso em server-sent events"""
+
+import io
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from api import index, jobs
+from api.jobs import WorkQueue
+
+@pytest.fixture
+def fila(db, tmp_path, monkeypatch):
+    """Fila em banco temporário sem consumidores: o teste conclui os itens"""
+    fila = WorkQueue(lease_seconds=60, max_tentativas=2, retry_delay=0, pasta=str(tmp_path / 'jobs'))
+    monkeypatch.setattr(index, 'work_queue', fila)
+    monkeypatch.setattr(index, 'JOBS_FOLDER', str(tmp_path / 'jobs'))
+    monkeypatch.setattr(index, 'INGESTION_JOB_WORKERS', 0)
+    monkeypatch.setattr(jobs, 'ingest_pdf', lambda *args, **kwargs: pytest.fail('PDF processado na requisição'))
+    return fila
+
+def enviar(cliente, *nomes):
+    arquivos = [(io.BytesIO(b'%PDF-1.4\n' + b'x' * 100), nome) for nome in nomes]
+    return cliente.post('/api/upload', data={'files': arquivos, 'model': 'gpt-4o'}, content_type='multipart/form-data')
+
+def concluir(fila, status='success'):
+    item = fila.claim('teste')
+    return fila.finish(item, 'teste', {'status': status, 'message': 'falhou', 'codigo_obra': '616'})
+
+def eventos_sse(corpo):
+    eventos = []
+    for bloco in corpo.split('\n\n'):
+        linhas = dict(l.split(': ', 1) for l in bloco.splitlines() if ': ' in l and not l.startswith(':'))
+        if 'event' in linhas:
+            eventos.append((linhas['event'], json.loads(linhas['data'])))
+    return eventos
+
+def test_upload_responde_202_sem_processar(fila):
+    resposta = enviar(index.app.test_client(), 'setembro.pdf', 'outubro.pdf')
+    
+    assert resposta.status_code == 202
+    corpo = resposta.get_json()
+    assert corpo['total'] == 2
+    assert corpo['status_url'] == f"/api/upload/jobs/{corpo['job_id']}"
+    
+    job = fila.job_snapshot(corpo['job_id'])
+    assert job['status'] == 'na_fila'
+    assert job['model'] == 'gpt-4o'
+    assert [a['filename'] for a in job['arquivos']] == ['setembro.pdf', 'outubro.pdf']
+
+def test_polling_acompanha_o_progresso(fila):
+    cliente = index.app.test_client()
+    job_id = enviar(cliente, 'setembro.pdf', 'outubro.pdf').get_json()['job_id']
+    
+    concluir(fila)
+    job = cliente.get(f"/api/upload/jobs/{job_id}").get_json()['job']
+    assert (job['status'], job['concluidos'], job['progresso']) == ('processando', 1, 0.5)
+    assert job['processados'][0]['codigo_obra'] == '616'
+    
+    concluir(fila, 'error')
+    job = cliente.get(f"/api/upload/jobs/{job_id}").get_json()['job']
+    assert job['status'] == 'concluido'
+    assert job['erros'] == ['outubro.pdf: falhou']
+    assert job['processing_time'] is not None
+
+def test_job_inexistente_responde_404(fila):
+    cliente = index.app.test_client()
+    
+    assert cliente.get('/api/upload/jobs/nao-existe').status_code == 404
+    assert cliente.get('/api/upload/jobs/nao-existe/events').status_code == 404
+
+def test_stream_manda_progresso_e_fecha_no_done(fila, monkeypatch):
+    cliente = index.app.test_client()
+    job_id = enviar(cliente, 'setembro.pdf', 'outubro.pdf').get_json()['job_id']
+    # Cada espera do stream conclui um item
+    monkeypatch.setattr(index, 'time', SimpleNamespace(time=time.time, sleep=lambda s: concluir(fila)))
+    
+    resposta = cliente.get(f"/api/upload/jobs/{job_id}/events")
+    corpo = resposta.get_data(as_text=True)
+    
+    assert resposta.mimetype == 'text/event-stream'
+    assert corpo.startswith(f"retry: {index.JOB_EVENTS_RETRY_MS}")
+    eventos = eventos_sse(corpo)
+    assert [e for e, _ in eventos] == ['progress', 'progress', 'done']
+    assert [d['concluidos'] for _, d in eventos] == [0, 1, 2]
+
+def test_stream_sem_mudanca_manda_keep_alive(fila, monkeypatch):
+    cliente = index.app.test_client()
+    job_id = enviar(cliente, 'setembro.pdf').get_json()['job_id']
+    relogio = SimpleNamespace(agora=1000.0)
+    
+    def dormir(segundos):
+        relogio.agora += segundos
+    
+    monkeypatch.setattr(index, 'time', SimpleNamespace(time=lambda: relogio.agora, sleep=dormir))
+    monkeypatch.setattr(index, 'JOB_EVENTS_POLL_INTERVAL', 10)
+    monkeypatch.setattr(index, 'JOB_EVENTS_KEEPALIVE', 15)
+    monkeypatch.setattr(index, 'JOB_EVENTS_MAX_SECONDS', 60)
+    
+    corpo = cliente.get(f"/api/upload/jobs/{job_id}/events").get_data(as_text=True)
+    
+    assert [e for e, _ in eventos_sse(corpo)] == ['progress']
+    assert corpo.count(': keep-alive') == 2
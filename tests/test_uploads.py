@@ -0,0 +1,72 @@
+"""Uploads gravados em disco com MAX_FILE_SIZE aplicado durante a leitura"""
+
+import io
+import os
+
+import pytest
+
+from api import index
+from api.index import SpooledUpload
+
+@pytest.fixture
+def cliente(tmp_path, monkeypatch):
+    monkeypatch.setattr(index, 'UPLOAD_FOLDER', str(tmp_path))
+    monkeypatch.setattr(index, 'MAX_FILE_SIZE', 1024)
+    return index.app.test_client()
+
+def pdf(tamanho, nome='relatorio.pdf'):
+    return io.BytesIO(b'%PDF-1.4\n' + b'x' * tamanho), nome
+
+def test_spooled_upload_para_de_gravar_no_limite(tmp_path, monkeypatch):
+    monkeypatch.setattr(index, 'UPLOAD_FOLDER', str(tmp_path))
+    upload = SpooledUpload(100, 'grande.pdf')
+    
+    for _ in range(50):
+        upload.write(b'x' * 10)
+    upload.flush()
+    
+    assert upload.too_large
+    assert upload.size == 500
+    assert os.path.getsize(upload.path) == 0
+    
+    upload.close()
+    assert not os.path.exists(upload.path)
+
+def test_analise_de_pdf_acima_do_limite_responde_413(cliente, monkeypatch):
+    monkeypatch.setattr(index, 'analyze_pdf_document', lambda *args, **kwargs: pytest.fail('PDF acima do limite analisado'))
+    
+    resposta = cliente.post('/api/analyze-pdf', data={'file': pdf(4096)}, content_type='multipart/form-data')
+    
+    assert resposta.status_code == 413
+    assert resposta.get_json()['status'] == 'error'
+
+def test_upload_so_com_arquivos_grandes_responde_413(cliente, monkeypatch):
+    monkeypatch.setattr(index, 'enqueue_upload_job', lambda *args, **kwargs: pytest.fail('job criado'))
+    
+    resposta = cliente.post('/api/upload', data={'files': [pdf(4096, 'a.pdf'), pdf(2048, 'b.pdf')]},
+                            content_type='multipart/form-data')
+    
+    assert resposta.status_code == 413
+    assert len(resposta.get_json()['erros']) == 2
+
+def test_upload_misto_aceita_os_pdfs_dentro_do_limite(cliente, monkeypatch):
+    enviados = []
+    
+    def enqueue(arquivos, model, extractor=None, chunk_size=None, erros=None):
+        enviados.extend(f.filename for f in arquivos)
+        return {'job_id': 'job-1', 'total': len(arquivos)}
+    
+    monkeypatch.setattr(index, 'enqueue_upload_job', enqueue)
+    
+    resposta = cliente.post('/api/upload', data={'files': [pdf(4096, 'grande.pdf'), pdf(100, 'pequeno.pdf')]},
+                            content_type='multipart/form-data')
+    
+    assert resposta.status_code == 202
+    assert enviados == ['pequeno.pdf']
+    assert [e.split(' - ')[0] for e in resposta.get_json()['erros']] == ['grande.pdf']
+
+def test_upload_sem_pdf_valido_continua_400(cliente):
+    resposta = cliente.post('/api/upload', data={'files': [(io.BytesIO(b'texto'), 'notas.txt')]},
+                            content_type='multipart/form-data')
+    
+    assert resposta.status_code == 400
@@ -0,0 +1,94 @@
+"""Fila durável de ingestão: leases, retomada, limite de tentativas e limpeza"""
+
+import os
+import sqlite3
+
+import pytest
+
+from api.jobs import WorkQueue
+
+@pytest.fixture
+def pasta(tmp_path):
+    """JOBS_FOLDER com o PDF do job1"""
+    (tmp_path / 'job1').mkdir()
+    (tmp_path / 'job1' / '0000.pdf').write_bytes(b'%PDF-1.4')
+    return tmp_path
+
+@pytest.fixture
+def fila(db, pasta):
+    fila = WorkQueue(lease_seconds=60, max_tentativas=2, retry_delay=0, pasta=str(pasta))
+    fila.enqueue_job('job1', 'gpt-5', 'pypdf2', None, [('a.pdf', str(pasta / 'job1' / '0000.pdf'))])
+    return fila
+
+def vencer_lease(db, item_id):
+    with sqlite3.connect(db) as conn:
+        conn.execute('UPDATE fila_ingestao SET lease_expira = 0 WHERE id = ?', (item_id,))
+
+def test_claim_reserva_um_item_por_vez(fila):
+    item = fila.claim('w1')
+    assert item['filename'] == 'a.pdf'
+    assert item['model'] == 'gpt-5'
+    assert item['tentativas'] == 1
+    assert fila.claim('w2') is None
+    assert fila.heartbeat(item['id'], 'w1')
+
+def test_lease_vencido_e_retomado_por_outro_worker(fila, db):
+    antigo = fila.claim('w1')
+    vencer_lease(db, antigo['id'])
+    
+    novo = fila.claim('w2')
+    assert novo['id'] == antigo['id']
+    assert novo['tentativas'] == 2
+    assert fila.stats['leases_expired'] == 1
+    
+    # O dono antigo perdeu o item: heartbeat e resultado são descartados
+    assert not fila.heartbeat(antigo['id'], 'w1')
+    assert fila.finish(antigo, 'w1', {'status': 'success'}) is None
+    assert fila.finish(novo, 'w2', {'status': 'success'}) == 'final'
+    assert fila.job_snapshot('job1')['status'] == 'concluido'
+
+def test_desistencia_apos_max_tentativas(fila, db, pasta):
+    for worker in ('w1', 'w2'):
+        item = fila.claim(worker)
+        vencer_lease(db, item['id'])
+    
+    assert fila.claim('w3') is None
+    # Ninguém chama finish() de um item abandonado: o PDF sai na desistência
+    assert not os.path.exists(pasta / 'job1')
+    snapshot = fila.job_snapshot('job1')
+    arquivo, = snapshot['arquivos']
+    assert arquivo['status'] == 'error'
+    assert 'Desistência após 2 tentativa(s)' in arquivo['message']
+    assert snapshot['status'] == 'concluido'
+
+def test_erro_transitorio_volta_para_a_fila_ate_o_limite(fila):
+    erro = {'status': 'error', 'message': 'timeout', 'retryable': True}
+    
+    item = fila.claim('w1')
+    assert fila.finish(item, 'w1', erro) == 'retry'
+    
+    item = fila.claim('w1')
+    assert item['tentativas'] == 2
+    assert fila.finish(item, 'w1', erro) == 'final'
+    assert fila.job_snapshot('job1')['arquivos'][0]['status'] == 'error'
+
+def test_erro_definitivo_nao_volta_para_a_fila(fila):
+    item = fila.claim('w1')
+    assert fila.finish(item, 'w1', {'status': 'error', 'message': 'PDF inválido'}) == 'final'
+    assert fila.claim('w1') is None
+    assert fila.stats['failed'] == 1
+
+def test_prune_apaga_registros_e_pasta_do_job(fila, pasta):
+    item = fila.claim('w1')
+    assert fila.finish(item, 'w1', {'status': 'success'}) == 'final'
+    (pasta / 'job1' / 'sobra.tmp').write_bytes(b'')
+    
+    assert fila.prune(ttl=60) == 0
+    assert fila.prune(ttl=-1) == 1
+    assert fila.job_snapshot('job1') is None
+    assert not os.path.exists(pasta / 'job1')
+
+def test_prune_mantem_jobs_em_andamento(fila, pasta):
+    fila.claim('w1')
+    assert fila.prune(ttl=-1) == 0
+    assert os.path.exists(pasta / 'job1' / '0000.pdf')